@@ -114,6 +114,23 @@ DEFAULT_ORDER_EXPANSION = (
     "directDiscounts[*]"
 )
 
+
+class OrderReadProfiles:
+    """
+    Order expansions by what the reader uses, pass one as `expand` to the order reads of CommercetoolsAPIClient.
+
+    Line items (with their state references by ID), return info and custom fields come back in every profile, only
+    what a profile lists is expanded on top of that.
+    """
+
+    # IDs, versions, line items and return info, e.g. to find a line item or its fulfillment state ID
+    MINIMAL = ()
+    # Adds the order workflow state, e.g. for sanctions
+    FULFILLMENT = ("state",)
+    # Everything order history shows, including the line item fulfillment state names
+    HISTORY = (*DEFAULT_ORDER_EXPANSION, "lineItems[*].state[*].state.obj")
+
+
 PAYMENT_STATUS_INTERFACE_CODE_SUCCEEDED = "succeeded"
 
 EDX_STRIPE_PAYMENT_INTERFACE_NAME = "stripe_edx"
@@ -2,14 +2,17 @@
 API clients for commercetools app.
 """
 
+import contextvars
 import datetime
+import itertools
 import logging
 import re
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 from functools import wraps
 from types import SimpleNamespace
-from typing import Generic, List, NamedTuple, Optional, Tuple, TypedDict, TypeVar, Union
+from typing import Any, Callable, Generic, Iterator, List, NamedTuple, Optional, Tuple, TypedDict, TypeVar, Union
 
 import requests
 from commercetools import Client, CommercetoolsError
@@ -68,8 +71,10 @@ from commercetools.platform.models import (
     TypeDraft,
     TypeResourceIdentifier
 )
+from commercetools.platform.models.error import ErrorResponse
 from commercetools.platform.models.state import State as LineItemState
 from django.conf import settings
+from django.db import DatabaseError
 from openedx_filters.exceptions import OpenEdxFilterException
 from tenacity import retry, retry_if_exception_type
 from tenacity.stop import stop_after_attempt
@@ -85,19 +90,33 @@ from commerce_coordinator.apps.commercetools.catalog_info.constants import (
     EDX_STRIPE_PAYMENT_INTERFACE_NAME,
     IOS_IAP,
     EdXFieldNames,
+    OrderReadProfiles,
     TwoUKeys
 )
-from commerce_coordinator.apps.commercetools.catalog_info.edx_utils import get_attribute_value
+from commerce_coordinator.apps.commercetools.catalog_info.edx_utils import (
+    get_attribute_value,
+    get_edx_line_item,
+    get_edx_line_item_state
+)
 from commerce_coordinator.apps.commercetools.catalog_info.foundational_types import TwoUCustomTypes
+from commerce_coordinator.apps.commercetools.constants import CT_VERSION_CONFLICT_MAX_REPLAYS
+from commerce_coordinator.apps.commercetools.graphql import ORDER_DETAILS_QUERY, order_details_from_graphql
+from commerce_coordinator.apps.commercetools.http_api_client import mount_commercetools_adapters
+from commerce_coordinator.apps.commercetools.lazy import lazy_page
+from commerce_coordinator.apps.commercetools.models import CustomerIndex
 from commerce_coordinator.apps.commercetools.utils import (
+    ct_datetime,
     find_latest_refund,
     find_refund_transaction,
+    get_current_version_from_error,
     get_refund_transaction_id_from_order,
     get_unprocessed_return_item_ids_from_order,
     handle_commercetools_error,
+    is_concurrent_modification_error,
     translate_refund_status_to_transaction_status
 )
 from commerce_coordinator.apps.core.constants import ORDER_HISTORY_PER_SYSTEM_REQ_LIMIT
+from commerce_coordinator.apps.core.instrumentation import outbound_attempt
 
 logger = logging.getLogger(__name__)
 
@@ -112,6 +131,7 @@ class PaginatedResult(Generic[T]):
     results: List[T]
     total: int
     offset: int
+    source_system: Optional[str] = None  # The order management system the results come from, when known
 
     def __init__(self, results: List[T], total: int, offset: int) -> None:
         super().__init__()
@@ -199,6 +219,8 @@ class CommercetoolsAPIClient:
             token_url=config["authUrl"],
             project_key=config["projectKey"],
         )
+        # noinspection PyProtectedMember
+        mount_commercetools_adapters(self.base_client._http_client, config["apiUrl"])
         self.enable_retries = enable_retries
 
     def conditional_retry(method):  # pylint: disable=no-self-argument
@@ -207,17 +229,92 @@ class CommercetoolsAPIClient:
         @wraps(method)
         def _conditional_retry(self, *args, **kwargs):
             if self.enable_retries:
+                attempts = itertools.count()
+
+                def _attempt(*a, **kw):
+                    # Calls of a retry are recorded as such in the outbound metrics
+                    with outbound_attempt(next(attempts)):
+                        return method(*a, **kw)  # pylint: disable=not-callable
+
                 return retry(
                     stop=stop_after_attempt(3),
                     wait=wait_incrementing(start=2, increment=2),
                     retry=retry_if_exception_type(CommercetoolsError),
                     reraise=True,
-                )(method)(self, *args, **kwargs)
+                )(_attempt)(self, *args, **kwargs)
             else:
                 return method(self, *args, **kwargs)  # pylint: disable=not-callable
 
         return _conditional_retry
 
+    def update_with_replay(
+        self,
+        resource: str,
+        resource_id: str,
+        version: int,
+        actions: list,
+        revalidate: Optional[Callable[[Any], list]] = None,
+        fetch: Optional[Callable[[str], Any]] = None,
+        max_replays: int = CT_VERSION_CONFLICT_MAX_REPLAYS,
+    ):
+        """
+        Apply update actions to a resource, replaying them if another writer changed it first.
+
+        A version conflict (409 ConcurrentModification) carries the resource's current version, and the actions are
+        sent again at that version, up to ``max_replays`` times, rather than failing the caller. When the error doesn't
+        say, the resource is re-fetched for it.
+
+        Actions that only hold for the state they were built against (a state transition, adding a return or a
+        transaction) need ``revalidate``: the current resource is then always re-fetched, and
+        ``revalidate(current)`` returns the actions that still apply to it. If none do, the current resource is
+        returned without an update.
+
+        Args:
+            resource (str): Name of the endpoint on the commercetools Client, e.g. "orders", "customers" or "payments"
+            resource_id (str): ID of the resource
+            version (int): Version the actions were built against
+            actions (list): Update actions
+            revalidate (callable): Rebuilds the actions against the current resource
+            fetch (callable): Fetches the current resource by ID, the endpoint's get_by_id by default
+
+        Returns:
+            The updated resource, or the current one if no action was left to apply
+        Raises:
+            CommercetoolsError: For any other error, or a conflict that outlasts the replays
+        """
+        endpoint = getattr(self.base_client, resource)
+        fetch = fetch or endpoint.get_by_id
+
+        replays = 0
+
+        while True:
+            try:
+                return endpoint.update_by_id(id=resource_id, version=version, actions=actions)
+            except CommercetoolsError as err:
+                if replays >= max_replays or not is_concurrent_modification_error(err):
+                    raise
+                current_version = get_current_version_from_error(err)
+
+            replays += 1
+            logger.info(
+                f"[CommercetoolsAPIClient] - Version conflict updating {resource} {resource_id} at version {version}, "
+                f"replaying ({replays}/{max_replays})"
+            )
+
+            if revalidate or current_version is None:
+                current = fetch(resource_id)
+                version = current.version
+
+                if revalidate:
+                    actions = revalidate(current)
+                    if not actions:
+                        logger.info(
+                            f"[CommercetoolsAPIClient] - Nothing left to update on {resource} {resource_id}"
+                        )
+                        return current
+            else:
+                version = current_version
+
     def ensure_custom_type_exists(self, type_def: TypeDraft):
         """
         Ensures a custom type exists within CoCo
@@ -270,7 +367,8 @@ class CommercetoolsAPIClient:
                 "Custom Type)"
             )
 
-        ret = self.base_client.customers.update_by_id(
+        ret = self.update_with_replay(
+            "customers",
             customer.id,
             customer.version,
             actions=[
@@ -288,6 +386,8 @@ class CommercetoolsAPIClient:
             ],
         )
 
+        self._record_customer_index(lms_user_id, ret)
+
         return ret
 
     @conditional_retry
@@ -300,6 +400,8 @@ class CommercetoolsAPIClient:
         """
         Get a Commercetools Customer by their LMS User ID or Username
 
+        By LMS User ID, the local CustomerIndex is tried first, and kept up to date from the custom field query.
+
         Args:
             lms_user_id: edX LMS User ID
             lms_username: edX LMS Username
@@ -311,6 +413,10 @@ class CommercetoolsAPIClient:
             ValueError: If more than one customer is found.
         """
         if lms_user_id:
+            customer = self._get_indexed_customer(lms_user_id)
+            if customer:
+                return customer
+
             user = lms_user_id
             user_message = f"with LMS user id: {user}"
             user_field = EdXFieldNames.LMS_USER_ID
@@ -351,7 +457,56 @@ class CommercetoolsAPIClient:
             return None
         else:
             logger.info(f"[CommercetoolsAPIClient] - Customer found {user_message}")
-            return results.results[0]
+            customer = results.results[0]
+
+            if lms_user_id:
+                self._record_customer_index(lms_user_id, customer)
+
+            return customer
+
+    @staticmethod
+    def _record_customer_index(lms_user_id, customer: Customer):
+        """ Point the CustomerIndex entry of an LMS User ID at `customer`, the index being a hint this can't fail on """
+        try:
+            CustomerIndex.record(lms_user_id, customer)
+        except DatabaseError as err:
+            logger.exception(
+                f"[CommercetoolsAPIClient] - Unable to index customer {customer.id} for LMS user {lms_user_id}: {err}"
+            )
+
+    def _get_indexed_customer(self, lms_user_id: int) -> Optional[Customer]:
+        """
+        Get the Customer the CustomerIndex has for an LMS User ID, if it still belongs to that LMS user
+
+        Stale entries (the customer is gone, or no longer has this LMS User ID) are dropped.
+
+        Returns:
+            Customer if indexed and verified, None otherwise
+        """
+        entry = CustomerIndex.objects.filter(lms_user_id=lms_user_id).first()
+
+        if entry is None:
+            return None
+
+        try:
+            customer = self.get_customer_by_id(entry.customer_id)
+        except CommercetoolsError as err:
+            if getattr(err.response, 'status_code', None) != 404:
+                raise
+            customer = None
+
+        if not (customer and customer.custom and
+                str(customer.custom.fields.get(EdXFieldNames.LMS_USER_ID)) == str(lms_user_id)):
+            logger.info(f"[CommercetoolsAPIClient] - Dropping stale customer index entry: {entry}")
+            entry.delete()
+            return None
+
+        if customer.version != entry.customer_version:
+            entry.customer_version = customer.version
+            entry.save(update_fields=['customer_version', 'modified'])
+
+        logger.info(f"[CommercetoolsAPIClient] - Customer found with LMS user id: {lms_user_id} (indexed)")
+        return customer
 
     def get_customer_by_lms_user_id(self, lms_user_id: int) -> Optional[Customer]:
         """
@@ -380,6 +535,12 @@ class CommercetoolsAPIClient:
         logger.info(f"[CommercetoolsAPIClient] - Attempting to find order with id: {order_id}")
         return self.base_client.orders.get_by_id(order_id, expand=list(expand))
 
+    def _get_order_for_update(self, order_id: str) -> Order:
+        """
+        Fetch an order for `update_with_replay` to revalidate against, updates don't return expansions either.
+        """
+        return self.get_order_by_id(order_id, expand=OrderReadProfiles.MINIMAL)
+
     def get_order_by_number(self, order_number: str, expand: ExpandList = DEFAULT_ORDER_EXPANSION) -> Order:
         """
         Fetch an order by the Order Number (Human readable order number)
@@ -393,6 +554,72 @@ class CommercetoolsAPIClient:
         logger.info(f"[CommercetoolsAPIClient] - Attempting to find order with number {order_number}")
         return self.base_client.orders.get_by_order_number(order_number, expand=list(expand))
 
+    def iter_query(
+        self,
+        resource: str,
+        where: Optional[List[str]] = None,
+        keyset: str = "id",
+        page_size: int = 500,
+        expand: Optional[ExpandList] = None,
+        projection: Optional[Callable[[Any], Any]] = None,
+    ) -> Iterator[Any]:
+        """
+        Yield every result of a query, one page at a time, using keyset pagination.
+
+        Pages are requested with ``id > :last`` (or ``(createdAt, id) > :last`` when ``keyset`` is "createdAt")
+        instead of offsets, so they don't need totals and aren't limited by the offset ceiling. While the caller
+        processes a page, the next one is fetched on a background thread; at most two pages are held in memory.
+
+        Args:
+            resource (str): Name of the queryable endpoint on the commercetools Client, e.g. "orders" or
+                "discount_codes".
+            where (list): Query predicates, combined with the keyset predicate.
+            keyset (str): "id" or "createdAt".
+            page_size (int): Number of results per request.
+            expand (list): Fields to expand.
+            projection (callable): Applied to each result before it is yielded, to keep only what the caller needs.
+
+        Yields:
+            The results, or their projections, in keyset order.
+        """
+        if keyset not in ("id", "createdAt"):
+            raise ValueError(f"Unsupported keyset {keyset}, use 'id' or 'createdAt'")
+
+        endpoint = getattr(self.base_client, resource)
+        sort = ["id asc"] if keyset == "id" else ["createdAt asc", "id asc"]
+
+        def fetch_page(last):
+            predicates = list(where or [])
+            if last is not None and keyset == "id":
+                predicates.append(f'id > "{last.id}"')
+            elif last is not None:
+                created_at = ct_datetime(last.created_at)
+                predicates.append(
+                    f'(createdAt > "{created_at}" or (createdAt = "{created_at}" and id > "{last.id}"))'
+                )
+
+            return endpoint.query(
+                where=predicates or None,
+                sort=sort,
+                limit=page_size,
+                with_total=False,
+                expand=list(expand) if expand else None,
+            ).results
+
+        with ThreadPoolExecutor(max_workers=1) as prefetcher:
+            page = fetch_page(None)
+            while page:
+                # Fetched in a copy of the caller's context, so the prefetch keeps the caller's outbound priority
+                next_page = (
+                    prefetcher.submit(contextvars.copy_context().run, fetch_page, page[-1])
+                    if len(page) == page_size else None
+                )
+
+                for result in page:
+                    yield projection(result) if projection else result
+
+                page = next_page.result() if next_page else None
+
     def get_orders(
         self,
         customer_id: str,
@@ -401,6 +628,7 @@ class CommercetoolsAPIClient:
         expand: ExpandList = DEFAULT_ORDER_EXPANSION,
         order_state="Complete",
         cutoff_in_days: int | None = None,
+        lazy: bool = False,
     ) -> PaginatedResult[Order]:
         """
         Call commercetools API overview endpoint for data about historical orders.
@@ -410,6 +638,8 @@ class CommercetoolsAPIClient:
             offset (int): Pagination Offset
             limit (int): Maximum number of results
             expand: List of Order Parameters to expand
+            lazy (bool): Return the orders as `LazyModel`s, deserialized only as their fields are read, for callers
+                that don't use all of them, see `commercetools.lazy`
 
         Returns:
             PaginatedResult[Order]: Dictionary representation of JSON returned from API
@@ -429,19 +659,66 @@ class CommercetoolsAPIClient:
             ).date()
             order_clauses.append(f'createdAt > "{cutoff_date}"')
 
+        sort = ["completedAt desc", "lastModifiedAt desc"]
+
         start_time = datetime.datetime.now()
-        values = self.base_client.orders.query(
-            where=order_clauses,
-            sort=["completedAt desc", "lastModifiedAt desc"],
-            limit=limit,
-            offset=offset,
-            expand=list(expand),
-        )
+        if lazy:
+            values = SimpleNamespace(**self._query_lazy("orders", Order, {
+                "where": order_clauses, "sort": sort, "limit": limit, "offset": offset, "expand": list(expand),
+            }))
+        else:
+            values = self.base_client.orders.query(
+                where=order_clauses,
+                sort=sort,
+                limit=limit,
+                offset=offset,
+                expand=list(expand),
+            )
         duration = (datetime.datetime.now() - start_time).total_seconds()
         logger.info(f"[Performance Check] get_orders call took {duration} seconds")
 
         return PaginatedResult(values.results, values.total, values.offset)
 
+    def _sdk_session_request(self, method: str, path: str, **kwargs):
+        """
+        Send a request to `path` of the API through the SDK's authenticated session, for responses the SDK would
+        deserialize (or endpoints it has no service for).
+        """
+        # noinspection PyProtectedMember
+        url = f"{self.base_client._base_url}{path}"  # pylint: disable=protected-access
+        # noinspection PyProtectedMember
+        return self.base_client._http_client.request(  # pylint: disable=protected-access
+            method, url, timeout=settings.REQUEST_READ_TIMEOUT_SECONDS, **kwargs
+        )
+
+    def _query_lazy(self, resource: str, model: type, params: dict) -> dict:
+        """
+        Query a resource endpoint like the SDK does, but return its results as `LazyModel`s.
+
+        Args:
+            resource (str): Endpoint path, e.g. "orders"
+            model (type): SDK model class of the results, e.g. Order
+            params (dict): Query parameters, as the API names them
+
+        Returns:
+            dict: The paged query response, see `lazy_page`
+        """
+        # The SDK deserializes responses before returning them, so get through its authenticated session
+        response = self._sdk_session_request("GET", resource, params=params)
+
+        if response.status_code != 200:
+            try:
+                body = response.json()
+            except ValueError:
+                # Not an API error, e.g. the HTML of a gateway timeout
+                body = {"message": f"{resource} query failed with status {response.status_code}"}
+            error = ErrorResponse.deserialize({"statusCode": response.status_code, **body})
+            raise CommercetoolsError(
+                error.message, body.get("errors", []), error, response.headers.get("X-Correlation-ID")
+            )
+
+        return lazy_page(response.content, model)
+
     def get_orders_for_customer(
         self,
         edx_lms_user_id: int | None,
@@ -451,6 +728,7 @@ class CommercetoolsAPIClient:
         email=None,
         username: str | None = None,
         cutoff_in_days: int | None = None,
+        lazy: bool = False,
     ) -> (PaginatedResult[Order], Customer):
         """
 
@@ -458,6 +736,7 @@ class CommercetoolsAPIClient:
             edx_lms_user_id (object):
             offset:
             limit:
+            lazy: Return the orders as `LazyModel`s, see `get_orders`
         """
         if not customer_id:
             customer = self.get_customer_by_lms_user(
@@ -482,16 +761,56 @@ class CommercetoolsAPIClient:
             customer_id,
             offset,
             limit,
-            expand=[*DEFAULT_ORDER_EXPANSION, "lineItems[*].state[*].state.obj"],
+            expand=OrderReadProfiles.HISTORY,
             cutoff_in_days=cutoff_in_days,
+            lazy=lazy,
         )
 
         return orders, customer
 
+    def get_order_details(
+        self,
+        order_id: Optional[str] = None,
+        order_number: Optional[str] = None,
+    ) -> Optional[Tuple[Order, Optional[Customer]]]:
+        """
+        Fetch an order, its customer and its payments in a single GraphQL request, see `commercetools.graphql`.
+
+        Args:
+            order_id (str): Order ID (UUID), or
+            order_number (str): Order Number (Human readable order number)
+
+        Returns:
+            Tuple[Order, Customer]: Order (with its payments expanded) and customer objects, or None if the order
+                wasn't found or the request failed, for the caller to fall back to the REST reads.
+        """
+        variables = {'id': order_id} if order_id else {'orderNumber': order_number}
+
+        try:
+            # The SDK has no GraphQL service, so post through its authenticated session
+            response = self._sdk_session_request(
+                "POST", "graphql", json={'query': ORDER_DETAILS_QUERY, 'variables': variables}
+            )
+            response.raise_for_status()
+            body = response.json()
+
+            if body.get('errors'):
+                logger.warning(f"[CommercetoolsAPIClient] - GraphQL order details for {variables} failed with "
+                               f"errors: {body['errors']}")
+                return None
+
+            return order_details_from_graphql(body.get('data'))
+        except Exception as err:  # pylint: disable=broad-exception-caught
+            logger.warning(f"[CommercetoolsAPIClient] - GraphQL order details for {variables} failed with "
+                           f"error: {err}")
+            return None
+
     def get_order_and_customer_by_order_id(self, order_id, logging_context=None) -> Tuple[Order, Customer]:
         """
         Get order and customer information from CommercetoolsAPIClient.
 
+        Both come from one GraphQL request when it succeeds, see `get_order_details`, else from the REST reads.
+
         Args:
             order_id (str): Order ID (UUID)
             logging_context (str): Context for logging
@@ -499,6 +818,11 @@ class CommercetoolsAPIClient:
         Returns:
             Tuple[Order, Customer]: Order and customer objects
         """
+        details = self.get_order_details(order_id=order_id)
+
+        if details and details[1]:
+            return details
+
         try:
             order = self.get_order_by_id(order_id)
         except Exception as err:  # pragma no cover
@@ -570,8 +894,10 @@ class CommercetoolsAPIClient:
         Returns False if an error occurs or the payment is attached.
         """
         try:
+            # Only whether one exists matters, so don't fetch every cart holding the payment
             carts = self.base_client.carts.query(
-                where=f'paymentInfo(payments(id="{payment.id}"))'
+                where=f'paymentInfo(payments(id="{payment.id}"))',
+                limit=1,
             ).results
             return len(carts) == 0
         except CommercetoolsError as err:
@@ -653,8 +979,18 @@ class CommercetoolsAPIClient:
 
             add_return_info_action = OrderAddReturnInfoAction(items=[return_item_draft])
 
-            returned_order = self.base_client.orders.update_by_id(
-                id=order_id, version=order_version, actions=[add_return_info_action]
+            def _revalidate(order):
+                # Another writer may have been creating this very return
+                returned_line_item_ids = {
+                    getattr(item, 'line_item_id', None)
+                    for return_info in order.return_info or []
+                    for item in return_info.items
+                }
+                return [] if order_line_item_id in returned_line_item_ids else [add_return_info_action]
+
+            returned_order = self.update_with_replay(
+                "orders", order_id, order_version, [add_return_info_action],
+                revalidate=_revalidate, fetch=self._get_order_for_update,
             )
             return returned_order
         except CommercetoolsError as err:
@@ -695,10 +1031,11 @@ class CommercetoolsAPIClient:
                     payment_state=ReturnPaymentState.NOT_REFUNDED,
                 ))
 
-            updated_order = self.base_client.orders.update_by_id(
-                id=order_id,
-                version=order_version,
-                actions=return_payment_state_actions,
+            updated_order = self.update_with_replay(
+                "orders",
+                order_id,
+                order_version,
+                return_payment_state_actions,
             )
             logger.info(f"Successfully updated return payment state to not refunded "
                         f"for enrollment code purchase - order_id: {order_id}")
@@ -744,10 +1081,11 @@ class CommercetoolsAPIClient:
                         }),
                     ))
 
-            updated_order = self.base_client.orders.update_by_id(
-                id=order.id,
-                version=order.version,
-                actions=update_actions,
+            updated_order = self.update_with_replay(
+                "orders",
+                order.id,
+                order.version,
+                update_actions,
             )
 
             logger.info(
@@ -843,10 +1181,11 @@ class CommercetoolsAPIClient:
 
             logger.info(f"Update return payment state after successful refund - payment_intent_id: {payment_intent_id}")
 
-            updated_order = self.base_client.orders.update_by_id(
-                id=order_id,
-                version=order_version,
-                actions=return_payment_state_actions + update_transaction_id_actions,
+            updated_order = self.update_with_replay(
+                "orders",
+                order_id,
+                order_version,
+                return_payment_state_actions + update_transaction_id_actions,
             )
             if transaction_id:
                 return_transaction_return_item_action = PaymentSetTransactionCustomTypeAction(
@@ -854,10 +1193,11 @@ class CommercetoolsAPIClient:
                     type=TypeResourceIdentifier(key="transactionCustomType"),
                     fields=FieldContainer({"returnItemId": ', '.join(return_line_item_return_ids)}),
                 )
-                self.base_client.payments.update_by_id(
-                    id=payment.id,
-                    version=payment.version,
-                    actions=[return_transaction_return_item_action],
+                self.update_with_replay(
+                    "payments",
+                    payment.id,
+                    payment.version,
+                    [return_transaction_return_item_action],
                 )
             logger.info("Updated transaction with return item id")
             return updated_order
@@ -938,10 +1278,18 @@ class CommercetoolsAPIClient:
                 transaction=transaction_draft
             )
 
-            returned_payment = self.base_client.payments.update_by_id(
-                id=payment_id,
-                version=payment_version,
-                actions=[add_transaction_action],
+            def _revalidate(payment):
+                # The same refund may have been recorded by another writer, e.g. its webhook and our own refund call
+                if any(transaction.interaction_id == processed_refund["id"] for transaction in payment.transactions):
+                    return []
+                return [add_transaction_action]
+
+            returned_payment = self.update_with_replay(
+                "payments",
+                payment_id,
+                payment_version,
+                [add_transaction_action],
+                revalidate=_revalidate,
             )
 
             return returned_payment
@@ -988,30 +1336,42 @@ class CommercetoolsAPIClient:
             f"from {from_state_key} to {new_state_key}"
         )
 
-        try:
+        def _actions(current_state_key):
             actions = []
             if entitlement_uuid:
-                logger.info(
-                    f"[CommercetoolsAPIClient] - Adding entitlement_uuid for order with ID {order_id} "
-                )
                 actions.append(OrderSetLineItemCustomFieldAction(
                     line_item_id=line_item_id,
                     name=TwoUKeys.LINE_ITEM_LMS_ENTITLEMENT_ID,
                     value=entitlement_uuid,
                 ))
-            if from_state_key not in (new_state_key, TwoUKeys.SUCCESS_FULFILMENT_STATE):
+            if current_state_key not in (new_state_key, TwoUKeys.SUCCESS_FULFILMENT_STATE):
                 actions.append(OrderTransitionLineItemStateAction(
                     line_item_id=line_item_id,
                     quantity=item_quantity,
-                    from_state=StateResourceIdentifier(key=from_state_key),
+                    from_state=StateResourceIdentifier(key=current_state_key),
                     to_state=StateResourceIdentifier(key=new_state_key),
                 ))
+            return actions
+
+        def _revalidate(order):
+            # The line item may have moved on, e.g. a duplicate message already fulfilled it
+            line_item = get_edx_line_item(order.line_items, line_item_id)
+            if not line_item:
+                return []
+            return _actions(self.get_state_by_id(get_edx_line_item_state(line_item)).key)
+
+        try:
+            actions = _actions(from_state_key)
+
+            if entitlement_uuid:
+                logger.info(
+                    f"[CommercetoolsAPIClient] - Adding entitlement_uuid for order with ID {order_id} "
+                )
 
             if actions:
-                return self.base_client.orders.update_by_id(
-                    id=order_id,
-                    version=order_version,
-                    actions=actions,
+                return self.update_with_replay(
+                    "orders", order_id, order_version, actions,
+                    revalidate=_revalidate, fetch=self._get_order_for_update,
                 )
             else:
                 logger.info(
@@ -1034,6 +1394,86 @@ class CommercetoolsAPIClient:
             )
             raise err
 
+    def update_line_items_on_fulfillment(self, order: Order, fulfillment_results: List[dict]) -> Order:
+        """
+        Update Commercetools order line items on fulfillment of several items in one call.
+
+        Each result moves its line item to the success or failure fulfillment state and records the LMS
+        entitlement, if any, so the whole bundle costs a single order version bump.
+
+        Args:
+            order (Order): Current order, whose version and line item states are used for the update
+            fulfillment_results (List[dict]): Outcomes with ``line_item_id``, ``item_quantity``,
+                ``is_fulfilled`` and optional ``entitlement_uuid`` keys
+        Returns (Order): Updated order object or
+        Returns (Order): Current un-updated order, when every line item already has its target state
+        Raises Exception: Error if update was unsuccessful.
+        """
+        state_keys = {}
+
+        def _actions(current_order):
+            actions = []
+
+            for result in fulfillment_results:
+                line_item_id = result['line_item_id']
+                line_item = get_edx_line_item(current_order.line_items, line_item_id)
+                if not line_item:
+                    logger.warning(
+                        f"[CommercetoolsAPIClient] - Line item {line_item_id} not found on order {order.id}, skipping"
+                    )
+                    continue
+
+                from_state_id = get_edx_line_item_state(line_item)
+                if from_state_id not in state_keys:
+                    state_keys[from_state_id] = self.get_state_by_id(from_state_id).key
+                from_state_key = state_keys[from_state_id]
+
+                new_state_key = (
+                    TwoUKeys.SUCCESS_FULFILMENT_STATE if result['is_fulfilled'] else TwoUKeys.FAILURE_FULFILMENT_STATE
+                )
+
+                if result.get('entitlement_uuid'):
+                    actions.append(OrderSetLineItemCustomFieldAction(
+                        line_item_id=line_item_id,
+                        name=TwoUKeys.LINE_ITEM_LMS_ENTITLEMENT_ID,
+                        value=result['entitlement_uuid'],
+                    ))
+                if from_state_key not in (new_state_key, TwoUKeys.SUCCESS_FULFILMENT_STATE):
+                    actions.append(OrderTransitionLineItemStateAction(
+                        line_item_id=line_item_id,
+                        quantity=result['item_quantity'],
+                        from_state=StateResourceIdentifier(key=from_state_key),
+                        to_state=StateResourceIdentifier(key=new_state_key),
+                    ))
+
+            return actions
+
+        actions = _actions(order)
+
+        if not actions:
+            logger.info(
+                f"[CommercetoolsAPIClient] - All fulfilled line items already have the correct state. "
+                f"Not attempting to transition LineItemState for order id {order.id}"
+            )
+            return order
+
+        logger.info(
+            f"[CommercetoolsAPIClient] - Updating {len(fulfillment_results)} fulfilled line items "
+            f"for order with ID {order.id} in one request"
+        )
+
+        try:
+            return self.update_with_replay(
+                "orders", order.id, order.version, actions, revalidate=_actions, fetch=self._get_order_for_update,
+            )
+        except CommercetoolsError as err:
+            handle_commercetools_error(
+                "[CommercetoolsAPIClient.update_line_items_on_fulfillment]", err,
+                f"Failed to update fulfilled LineItems of order {order.id} "
+                f"Line Item IDs: {', '.join(result['line_item_id'] for result in fulfillment_results)}"
+            )
+            raise err
+
     @conditional_retry
     def update_line_items_transition_state(
         self,
@@ -1073,22 +1513,30 @@ class CommercetoolsAPIClient:
             f"Line Item IDs: {', '.join(item.id for item in line_items)}"
         )
 
+        def _actions(items):
+            return [
+                OrderTransitionLineItemStateAction(
+                    line_item_id=item.id,
+                    quantity=item.quantity,
+                    from_state=from_state,
+                    to_state=StateResourceIdentifier(key=new_state_key),
+                )
+                for item in items
+            ]
+
+        def _revalidate(order):
+            # Only the line items still in the state we're transitioning from, a duplicate message may have moved them
+            line_item_ids = {item.id for item in line_items}
+            return _actions(
+                item for item in order.line_items
+                if item.id in line_item_ids and get_edx_line_item_state(item) == from_state_id
+            )
+
         try:
             if use_state_id or new_state_key != from_state_key:
-                actions = [
-                    OrderTransitionLineItemStateAction(
-                        line_item_id=item.id,
-                        quantity=item.quantity,
-                        from_state=from_state,
-                        to_state=StateResourceIdentifier(key=new_state_key),
-                    )
-                    for item in line_items
-                ]
-
-                return self.base_client.orders.update_by_id(
-                    id=order_id,
-                    version=order_version,
-                    actions=actions,
+                return self.update_with_replay(
+                    "orders", order_id, order_version, _actions(line_items),
+                    revalidate=_revalidate, fetch=self._get_order_for_update,
                 )
             else:
                 logger.info(
@@ -1279,6 +1727,7 @@ class CommercetoolsAPIClient:
             logger.info(
                 f"[CommercetoolsAPIClient] - Successfully created customer: {customer.id} for LMS user: {lms_user_id}"
             )
+            self._record_customer_index(lms_user_id, customer)
             return customer
         except CommercetoolsError as err:
             handle_commercetools_error(
@@ -1319,10 +1768,11 @@ class CommercetoolsAPIClient:
                 ),
             }
 
-            updated_customer = self.base_client.customers.update_by_id(
-                id=customer.id,
-                version=customer.version,
-                actions=[
+            updated_customer = self.update_with_replay(
+                "customers",
+                customer.id,
+                customer.version,
+                [
                     attr_to_update_action_map[field](value)
                     for field, value in updates.items()
                 ],
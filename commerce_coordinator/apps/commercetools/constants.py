@@ -8,6 +8,11 @@ SOURCE_SYSTEM = COMMERCETOOLS_ORDER_MANAGEMENT_SYSTEM
 
 EMAIL_NOTIFICATION_CACHE_TTL_SECS = (60 * 60 * 24) - 60  # 23hrs 59mins
 GET_PROGRAM_CACHE_TTL_SECS = 60 * 60 * 4  # 4 hours
+CT_VERSION_CONFLICT_MAX_REPLAYS = 3  # Times an update is replayed at the current version after a conflict
+CT_RATE_LIMIT_NAME = 'commercetools'  # Limiter of all calls to the commercetools API, in OUTBOUND_RATE_LIMITS
+CT_CIRCUIT_BREAKER_NAME = 'commercetools'  # Breaker of all calls to the commercetools API, in CIRCUIT_BREAKERS
+CT_HEDGED_READS_NAME = 'commercetools'  # Hedging of reads from the commercetools API, in HEDGED_READS
+CT_METRICS_SERVICE_NAME = 'commercetools'  # Service of calls to the commercetools API, in outbound metrics
 
 
 CT_ORDER_PRODUCT_TYPE_FOR_BRAZE = {
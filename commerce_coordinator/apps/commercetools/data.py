@@ -1,5 +1,7 @@
 """ Conversion methods to convert a Commercetools order in to a Legacy Ecommerce one """
 
+import threading
+from collections import OrderedDict
 from typing import List, Optional
 
 from commercetools.platform.models import Address as CTAddress
@@ -30,6 +32,8 @@ from commerce_coordinator.apps.ecommerce.data import BillingAddress, Line
 from commerce_coordinator.apps.ecommerce.data import Order as LegacyOrder
 from commerce_coordinator.apps.ecommerce.data import User
 
+ORDER_CONVERSION_LINE_ITEM_CACHE_SIZE = 10000  # Converted line items kept by order_dict_from_commercetools
+
 
 def this_or(a, b):
     return a if a else b
@@ -80,6 +84,47 @@ def convert_line_item(li: CTLineItem, order_id: str) -> Line:
     )
 
 
+def convert_line_item_to_dict(li: CTLineItem, order_id: str, attrs: dict) -> dict:
+    """
+    Same as `attrs.asdict(convert_line_item(li, order_id))`, reading the variant attributes from `attrs`.
+
+    Args:
+        li: Commercetools LineItem instance
+        order_id: ID of the order the line item belongs to
+        attrs: The line item's variant attributes by name, see `attribute_dict`
+    """
+    title = un_ls(li.name)
+    price = price_to_string(li.price, money_as_decimal_string=SEND_MONEY_AS_DECIMAL_STRING)
+    brand = attrs.get('brand-text')
+
+    return {
+        "title": title,
+        "quantity": li.quantity,
+        "line_price_excl_tax": price,
+        "course_organization": brand.get('label') if isinstance(brand, dict) else (
+            brand if isinstance(brand, str) else None
+        ),
+        "description": title,
+        "status": un_ls(li.state[0].state.obj.name),
+        "unit_price_excl_tax": price,
+        "product": {
+            "url": (
+                settings.COMMERCETOOLS_MERCHANT_CENTER_ORDERS_PAGE_URL
+                + f"/{order_id}/general/line-items/{li.id}/attributes"
+            ),
+            "title": title,
+            "expires": attrs.get("verification-upgrade-deadline"),
+            "attributeValues": [
+                {
+                    "name": "certificate_type",
+                    "code": "certificate_type",
+                    "value": attrs.get("mode"),
+                }
+            ],
+        },
+    }
+
+
 def convert_line_item_prod_id(li: CTLineItem) -> str:
     """
     Convert a Commercetools Line Item to a String for Legacy Orders
@@ -89,8 +134,12 @@ def convert_line_item_prod_id(li: CTLineItem) -> str:
     Returns: Our best guess at the product line items id.
 
     """
+    return line_item_prod_id_from_attributes(li, attribute_dict(li.variant.attributes))
+
+
+def line_item_prod_id_from_attributes(li: CTLineItem, attrs: Optional[dict]) -> str:
+    """ `convert_line_item_prod_id`, for when the line item's attribute dict is already at hand. """
     key_name = 'courserun-id'  # this could be wrong and will likely change when the catalog is 'fixed'
-    attrs = attribute_dict(li.variant.attributes)
 
     if attrs and key_name in attrs and attrs[key_name]:  # pragma no cover
         return this_or(attrs[key_name], li.product_id)
@@ -138,21 +187,8 @@ def convert_payment_info(payment_info: CTPaymentInfo) -> str:
     return "Unknown"  # This string should not be changed, we have conditional logic that depends on it on frontend.
 
 
-def order_from_commercetools(order: CTOrder, customer: CTCustomer) -> LegacyOrder:
-    """
-    Convert a Commercetools order and customer object into a LegacyOrder object.
-
-    This includes converting fields such as user info, line items, billing address,
-    payment details, discounts, and custom fields like mobileOrder.
-
-    Args:
-        order (CTOrder): The order object from Commercetools.
-        customer (CTCustomer): The customer associated with the order.
-
-    Returns:
-        LegacyOrder: A converted order object used in the legacy system.
-    """
-
+def _legacy_order_fields(order: CTOrder, order_product_ids: str) -> dict:
+    """ The fields of a LegacyOrder that are the same whether it's built as an object or a dict. """
     discounted_amount = calculate_total_discount_on_order(order)
 
     mobile_order = False
@@ -171,31 +207,31 @@ def order_from_commercetools(order: CTOrder, customer: CTCustomer) -> LegacyOrde
     ):
         payment_interface = order.payment_info.payments[-1].obj.payment_method_info.payment_interface
 
-    return LegacyOrder(
-        user=convert_customer(customer),
-        lines=[convert_line_item(li, order.id) for li in order.line_items],
-        billing_address=convert_address(order.billing_address),
+    direct_discounts = (
+        convert_direct_discount(order.direct_discounts)
+        if hasattr(order, 'direct_discounts')
+        else None
+    )
+
+    return dict(
         date_placed=order.last_modified_at,
         total_excl_tax=typed_money_to_string(order.total_price, money_as_decimal_string=SEND_MONEY_AS_DECIMAL_STRING),
         number=order.order_number,
+        basket_discounts=direct_discounts,
+        contains_credit_seat="True",
         currency=order.total_price.currency_code,
-        payment_processor=payment_interface,
-        status=order.order_state.value,
         dashboard_url=settings.LMS_DASHBOARD_URL,
-        mobile_order=mobile_order,
-        order_product_ids=", ".join([convert_line_item_prod_id(x) for x in order.line_items]),
-        basket_discounts=(
-            convert_direct_discount(order.direct_discounts)
-            if hasattr(order, 'direct_discounts')
-            else None
-        ),
-        contains_credit_seat="True",
         discount=typed_money_to_string(discounted_amount,
                                        money_as_decimal_string=SEND_MONEY_AS_DECIMAL_STRING)
         if order.discount_on_total_price else None,  # NYI
+        mobile_order=mobile_order,
         enable_hoist_order_history="False",  # ?
         enterprise_learner_portal_url="about:blank",
+        order_product_ids=order_product_ids,
+        payment_processor=payment_interface,
+        payment_method=convert_payment_info(order.payment_info),
         product_tracking=None,
+        status=order.order_state.value,
         total_before_discounts_incl_tax=typed_money_to_string(
             typed_money_add(
                 typed_money_add(
@@ -208,7 +244,117 @@ def order_from_commercetools(order: CTOrder, customer: CTCustomer) -> LegacyOrde
         ),
         vouchers=this_or(
             convert_discount_code_info(order.discount_codes) if hasattr(order, 'discount_codes') else None,
-            convert_direct_discount(order.direct_discounts) if hasattr(order, 'direct_discounts') else None
+            direct_discounts
         ),
-        payment_method=convert_payment_info(order.payment_info)
     )
+
+
+def order_from_commercetools(order: CTOrder, customer: CTCustomer) -> LegacyOrder:
+    """
+    Convert a Commercetools order and customer object into a LegacyOrder object.
+
+    This includes converting fields such as user info, line items, billing address,
+    payment details, discounts, and custom fields like mobileOrder.
+
+    Args:
+        order (CTOrder): The order object from Commercetools.
+        customer (CTCustomer): The customer associated with the order.
+
+    Returns:
+        LegacyOrder: A converted order object used in the legacy system.
+    """
+    return LegacyOrder(
+        user=convert_customer(customer),
+        lines=[convert_line_item(li, order.id) for li in order.line_items],
+        billing_address=convert_address(order.billing_address),
+        **_legacy_order_fields(order, ", ".join([convert_line_item_prod_id(x) for x in order.line_items])),
+    )
+
+
+class _LineItemCache:
+    """
+    Bounded LRU of converted line items.
+
+    Keyed by order ID and version along with the line item ID, as any change to an order (line item states
+    included) bumps its version. Entries are shared, so they must not be modified.
+    """
+
+    def __init__(self, max_size=ORDER_CONVERSION_LINE_ITEM_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+_line_item_cache = _LineItemCache()
+
+
+def order_dict_from_commercetools(order: CTOrder, customer: CTCustomer) -> dict:
+    """
+    Convert a Commercetools order and customer straight to the dict `attrs.asdict(order_from_commercetools(...))`
+    would give, for responses.
+
+    Each line item's variant attributes are read into a dict once, rather than scanned per attribute, converted
+    line items are cached until the order changes, and no intermediate LegacyOrder is built (so its validators
+    aren't run).
+
+    Args:
+        order (CTOrder): The order object from Commercetools.
+        customer (CTCustomer): The customer associated with the order.
+
+    Returns:
+        dict: The order in the legacy ecommerce format.
+    """
+    lines = []
+    product_ids = []
+
+    for li in order.line_items:
+        key = (order.id, order.version, li.id)
+        cached = _line_item_cache.get(key)
+
+        if cached is None:
+            attrs = attribute_dict(li.variant.attributes) or {}
+            cached = (convert_line_item_to_dict(li, order.id, attrs), line_item_prod_id_from_attributes(li, attrs))
+            _line_item_cache.put(key, cached)
+
+        lines.append(cached[0])
+        product_ids.append(cached[1])
+
+    address = order.billing_address
+    fields = _legacy_order_fields(order, ", ".join(product_ids))
+
+    return {
+        "date_placed": fields.pop("date_placed"),
+        "user": {
+            "username": customer.custom.fields[EdXFieldNames.LMS_USER_NAME],
+            "email": customer.email,
+        },
+        "total_excl_tax": fields.pop("total_excl_tax"),
+        "lines": lines,
+        "number": fields.pop("number"),
+        "basket_discounts": fields.pop("basket_discounts"),
+        "billing_address": {
+            "first_name": address.first_name,
+            "last_name": address.last_name,
+            "line1": f"{address.street_number} {address.street_name}",
+            "line2": address.additional_street_info,
+            "city": address.city,
+            "state": address.state,
+            "postcode": address.postal_code,
+            "country": address.country,
+        } if address else None,
+        **fields,
+    }
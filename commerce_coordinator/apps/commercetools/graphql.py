@@ -0,0 +1,144 @@
+"""
+Single request GraphQL reads of commercetools orders, adapted to the platform SDK models the REST reads return.
+
+An order, its customer and its payments take three REST calls (or two, with the payments expanded). The GraphQL API
+resolves them in one request, selecting only the fields that order conversion (`order_from_commercetools`), the refund
+pipeline (`FetchOrderDetailsByOrderID`), the Segment/Braze property builders and the fulfillment tasks read.
+
+GraphQL responses are shaped differently from REST ones, so `to_rest` rewrites them before they're deserialized:
+
+- `fooRef` (a Reference) and its resolved sibling `foo` become the REST reference `foo` with `obj` set
+- `fooRefs` and `foos` likewise become a list of REST references
+- `fooAllLocales` lists become the LocalizedString dict `foo`
+- `customFieldsRaw` becomes `fields`, `attributesRaw` becomes `attributes`
+- `__typename` becomes `type`, which the SDK uses to pick subtypes, e.g. of ReturnItem
+"""
+from typing import Any, Optional, Tuple
+
+from commercetools.platform.models import Customer, Order
+
+ORDER_DETAILS_QUERY = """
+fragment Money on BaseMoney { type currencyCode centAmount fractionDigits }
+
+fragment Custom on CustomFieldsType { typeRef { typeId id } type { key } customFieldsRaw { name value } }
+
+query OrderDetails($id: String, $orderNumber: String) {
+  order(id: $id, orderNumber: $orderNumber) {
+    id version orderNumber customerId customerEmail createdAt lastModifiedAt completedAt orderState
+    stateRef { typeId id } state { id key }
+    cartRef { typeId id }
+    totalPrice { ...Money }
+    taxedPrice { totalNet { ...Money } totalGross { ...Money } totalTax { ...Money } }
+    discountOnTotalPrice { discountedAmount { ...Money } }
+    discountCodes { state discountCodeRef { typeId id } discountCode { id code } }
+    directDiscounts { id value { type } }
+    billingAddress {
+      firstName lastName streetName streetNumber additionalStreetInfo postalCode city state country
+    }
+    custom { ...Custom }
+    lineItems {
+      id productId productKey quantity
+      nameAllLocales { locale value }
+      productTypeRef { typeId id } productType { key name }
+      variant { id sku key images { url } attributesRaw { name value } }
+      price { id value { ...Money } discounted { value { ...Money } discountRef { typeId id } } }
+      totalPrice { ...Money }
+      discountedPricePerQuantity {
+        quantity
+        discountedPrice {
+          value { ...Money }
+          includedDiscounts { discountRef { typeId id } discountedAmount { ...Money } }
+        }
+      }
+      state { quantity stateRef { typeId id } state { id key nameAllLocales { locale value } } }
+      custom { ...Custom }
+    }
+    paymentInfo {
+      paymentRefs { typeId id }
+      payments {
+        id key version createdAt lastModifiedAt interfaceId
+        amountPlanned { ...Money }
+        paymentMethodInfo { paymentInterface method nameAllLocales { locale value } }
+        paymentStatus { interfaceCode interfaceText }
+        transactions { id timestamp type amount { ...Money } interactionId state custom { ...Custom } }
+        custom { ...Custom }
+      }
+    }
+    returnInfo {
+      returnTrackingId returnDate
+      items {
+        __typename id quantity shipmentState paymentState comment createdAt lastModifiedAt
+        custom { ...Custom }
+        ... on LineItemReturnItem { lineItemId }
+        ... on CustomLineItemReturnItem { customLineItemId }
+      }
+    }
+    customer { id version email firstName lastName custom { ...Custom } }
+  }
+}
+"""
+
+
+def to_rest(value: Any) -> Any:
+    """ Rewrite a GraphQL response value to the shape the REST API returns it in, see the module docstring. """
+    if isinstance(value, list):
+        return [to_rest(item) for item in value]
+
+    if not isinstance(value, dict):
+        return value
+
+    result = {}
+
+    for key, item in value.items():
+        if key == '__typename':
+            result['type'] = item
+        elif key.endswith('AllLocales'):
+            result[key[:-len('AllLocales')]] = {entry['locale']: entry['value'] for entry in item or []}
+        elif key == 'customFieldsRaw':
+            result['fields'] = {field['name']: field['value'] for field in item or []}
+        elif key == 'attributesRaw':
+            result['attributes'] = item
+        elif key.endswith('Refs'):
+            name = f'{key[:-len("Refs")]}s'
+            resolved = value.get(name) or [None] * len(item or [])
+            result[name] = [_reference(ref, obj) for ref, obj in zip(item or [], resolved)]
+        elif key.endswith('Ref'):
+            name = key[:-len('Ref')]
+            result[name] = _reference(item, value.get(name))
+        elif f'{key}Ref' in value or (key.endswith('s') and f'{key[:-1]}Refs' in value):
+            continue  # Resolved objects are folded in to their reference above
+        else:
+            result[key] = to_rest(item)
+
+    return result
+
+
+def _reference(ref: Optional[dict], obj: Optional[dict]) -> Optional[dict]:
+    if ref is None:
+        return None
+
+    reference = {'typeId': ref['typeId'], 'id': ref['id']}
+
+    if obj is not None:
+        reference['obj'] = to_rest(obj)
+
+    return reference
+
+
+def order_details_from_graphql(data: Optional[dict]) -> Optional[Tuple[Order, Optional[Customer]]]:
+    """
+    Adapt the `data` of an ORDER_DETAILS_QUERY response to SDK models.
+
+    Returns: (Order, Customer or None for guest orders), or None if the order wasn't found
+    """
+    order = (data or {}).get('order')
+
+    if not order:
+        return None
+
+    customer = order.pop('customer', None)
+
+    return (
+        Order.deserialize(to_rest(order)),
+        Customer.deserialize(to_rest(customer)) if customer else None,
+    )
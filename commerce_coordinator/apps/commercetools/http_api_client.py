@@ -2,27 +2,57 @@
 API clients for commerceetool app.
 """
 import logging
-import time
 from typing import Dict, List, Optional, Union
 
 import requests
 from django.conf import settings
 from edx_django_utils.cache import TieredCache
 
-from commerce_coordinator.apps.commercetools.constants import GET_PROGRAM_CACHE_TTL_SECS
+from commerce_coordinator.apps.commercetools.constants import (
+    CT_CIRCUIT_BREAKER_NAME,
+    CT_HEDGED_READS_NAME,
+    CT_METRICS_SERVICE_NAME,
+    CT_RATE_LIMIT_NAME,
+    GET_PROGRAM_CACHE_TTL_SECS
+)
+from commerce_coordinator.apps.core.circuit_breaker import get_circuit_breaker, mount_circuit_breaker
+from commerce_coordinator.apps.core.hedging import get_hedger, mount_hedging
+from commerce_coordinator.apps.core.instrumentation import instrument_session
 from commerce_coordinator.apps.core.memcache import safe_key
+from commerce_coordinator.apps.core.rate_limit import get_rate_limiter, mount_rate_limiter
+from commerce_coordinator.apps.core.retry import RetryPolicy
 
 logger = logging.getLogger(__name__)
 
 
+def mount_commercetools_adapters(session: requests.Session, api_url: str):
+    """
+    Rate limit, hedge the reads of, and circuit break the calls `session` makes to the commercetools API at `api_url`,
+    and record them in the outbound metrics. See core.rate_limit, core.hedging, core.circuit_breaker and
+    core.instrumentation.
+    """
+    # Innermost first: every attempt (hedges too) is rate limited, and calls the breaker fails are never attempted
+    mount_rate_limiter(session, api_url, get_rate_limiter(CT_RATE_LIMIT_NAME))
+    mount_hedging(session, api_url, get_hedger(CT_HEDGED_READS_NAME))
+    mount_circuit_breaker(session, api_url, get_circuit_breaker(CT_CIRCUIT_BREAKER_NAME))
+    instrument_session(session, CT_METRICS_SERVICE_NAME)
+
+
 class CTCustomAPIClient:
     """Custom Commercetools API Client using requests."""
 
-    def __init__(self):
+    def __init__(self, session: Optional[requests.Session] = None):
         """
         Initialize the Commercetools client with configuration from Django settings.
+
+        Args:
+            session (Optional[requests.Session]): Session used for every HTTP call, e.g. to share connections
+                between threads or to plug in a fake transport. Defaults to a new session. Calls to the API are
+                protected in either, see ``mount_commercetools_adapters``.
         """
         self.config = settings.COMMERCETOOLS_CONFIG
+        self.http = session or requests.Session()
+        mount_commercetools_adapters(self.http, self.config['apiUrl'])
         self.access_token = self._get_access_token()
 
     def _get_access_token(self) -> str:
@@ -39,7 +69,7 @@ class CTCustomAPIClient:
             "scope": self.config['scopes'],
         }
 
-        response = requests.post(auth_url, auth=auth, data=data, timeout=settings.REQUEST_CONNECT_TIMEOUT_SECONDS)
+        response = self.http.post(auth_url, auth=auth, data=data, timeout=settings.REQUEST_CONNECT_TIMEOUT_SECONDS)
 
         response.raise_for_status()
         return response.json()["access_token"]
@@ -58,13 +88,16 @@ class CTCustomAPIClient:
         """
         Make an HTTP request to the Commercetools API with retry logic.
 
+        Transient failures (connection errors, timeouts, 429 and 5xx responses) are retried with exponential
+        backoff and jitter; other failures are returned as None immediately.
+
         Args:
             method (str): HTTP method (e.g., "GET", "POST").
             endpoint (str): API endpoint (e.g., "/cart-discounts").
             params (Optional[Dict]): Query parameters.
             json (Optional[Dict]): JSON payload for POST/PUT requests.
             total_retries (int): Number of retries after the first attempt.
-            base_backoff (int): Base backoff time in seconds.
+            base_backoff (int): Backoff time in seconds before the first retry, doubled for each retry after.
             log_info (str): Additional log info to be appended in error/warn logs.
             url_override (Optional[str]): Override the URL for the request.
 
@@ -77,48 +110,51 @@ class CTCustomAPIClient:
             "Content-Type": "application/json",
         }
 
-        def attempt(attempt_number: int) -> Union[Dict, List, None]:
-            try:
-                response = requests.request(
-                    method,
-                    url,
-                    headers=headers,
-                    params=params,
-                    json=json,
-                    timeout=settings.REQUEST_READ_TIMEOUT_SECONDS,
-                )
-
-                response.raise_for_status()
-                return response.json()
-            except requests.RequestException as err:
-                response = getattr(err, 'response', None)
-                if response is not None:
-                    try:
-                        response_message = response.json().get('message', 'No message provided.')
-                    except ValueError:
-                        response_message = getattr(response, 'text', None) or 'No message provided.'
-                else:
-                    response_message = str(err)
-
-                if attempt_number >= total_retries:
-                    logger.error(
-                        "CTCustomAPIClient: API request failed for endpoint: %s after attempt #%s"
-                        " with error: %s and message: %s, %s.",
-                        endpoint, attempt_number, err, response_message, log_info
-                    )
-                    return None
-
-                next_attempt = attempt_number + 1
-                next_backoff = base_backoff * next_attempt
-                logger.warning(
-                    "CTCustomAPIClient: API request failed for endpoint: %s with error: %s and message: %s, %s. "
-                    "Retrying attempt #%s in %s seconds...",
-                    endpoint, err, response_message, log_info, next_attempt, next_backoff
-                )
-                time.sleep(next_backoff)
-                return attempt(next_attempt)
-
-        return attempt(0)
+        def attempt() -> Union[Dict, List]:
+            response = self.http.request(
+                method,
+                url,
+                headers=headers,
+                params=params,
+                json=json,
+                timeout=settings.REQUEST_READ_TIMEOUT_SECONDS,
+            )
+
+            response.raise_for_status()
+            return response.json()
+
+        def log_retry(err: requests.RequestException, next_attempt: int, next_backoff: float):
+            logger.warning(
+                "CTCustomAPIClient: API request failed for endpoint: %s with error: %s and message: %s, %s. "
+                "Retrying attempt #%s in %.1f seconds...",
+                endpoint, err, self._error_message(err), log_info, next_attempt, next_backoff
+            )
+
+        retry_policy = RetryPolicy(max_retries=total_retries, base_backoff=base_backoff)
+        try:
+            return retry_policy.call(attempt, on_retry=log_retry)
+        except requests.RequestException as err:
+            logger.error(
+                "CTCustomAPIClient: API request failed for endpoint: %s after attempt #%s"
+                " with error: %s and message: %s, %s.",
+                endpoint, total_retries if retry_policy.is_retryable(err) else 0,
+                err, self._error_message(err), log_info
+            )
+            return None
+
+    @staticmethod
+    def _error_message(err: requests.RequestException) -> str:
+        """
+        Extract the most useful human-readable message from a failed request.
+        """
+        response = getattr(err, 'response', None)
+        if response is None:
+            return str(err)
+
+        try:
+            return response.json().get('message', 'No message provided.')
+        except ValueError:
+            return getattr(response, 'text', None) or 'No message provided.'
 
     def get_ct_bundle_offers_without_code(self) -> list:
         """
@@ -0,0 +1,105 @@
+"""
+Lazily hydrated commercetools models, for large responses of which only a few fields are read.
+
+The SDK deserializes a whole response through its marshmallow schemas before it's returned, building every nested
+model whether it's used or not. A `LazyModel` holds the decoded JSON instead, and deserializes a field the first time
+it's read, using the same schema field the SDK would have. Nested models are themselves lazy, so reading
+`order.line_items[0].name` builds the line item list and the name, but not the line items' prices, variants or states.
+
+A `LazyModel` is read like the model it stands in for (`isinstance` included), but it isn't one: it has none of the
+model's methods, e.g. `serialize`, use `hydrate` for a real model.
+"""
+import importlib
+import threading
+from typing import Any, Dict, Type
+
+import orjson
+from commercetools.platform import models
+from marshmallow.fields import Nested
+
+_schema_lock = threading.Lock()
+_schemas_by_model: Dict[type, Any] = {}
+
+
+def _schema_for(model: type):
+    """ The SDK schema instance for a model class, e.g. OrderSchema for Order. Schemas are reusable, so one is kept. """
+    schema = _schemas_by_model.get(model)
+
+    if schema is None:
+        with _schema_lock:
+            module = importlib.import_module(f"{models.__name__}._schemas.{model.__module__.rsplit('.', 1)[-1]}")
+            schema = _schemas_by_model.setdefault(model, getattr(module, f'{model.__name__}Schema')())
+
+    return schema
+
+
+def _model_for(schema) -> type:
+    """ The model class a schema loads, e.g. Order for OrderSchema """
+    return getattr(models, type(schema).__name__[:-len('Schema')])
+
+
+class LazyModel:
+    """
+    A commercetools model deserialized one field at a time, when the field is first read.
+
+    Args:
+        model: The SDK model class the data is of, e.g. Order
+        data: The model as decoded from the API's JSON
+    """
+
+    def __init__(self, model: Type, data: dict):
+        self._model = model
+        self._data = data
+
+    @property
+    def __class__(self):
+        return self._model
+
+    def __getattr__(self, name):
+        # Only called for attributes that aren't read yet, once read they're stored on the instance
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        field = _schema_for(self._model).fields.get(name)
+
+        if field is None:
+            raise AttributeError(f"'{self._model.__name__}' object has no attribute '{name}'")
+
+        value = _hydrate(field, self._data.get(field.data_key or name))
+        self.__dict__[name] = value
+        return value
+
+    def hydrate(self):
+        """ Deserialize the whole model, as the SDK would have. Fields changed on this instance aren't kept. """
+        return _schema_for(self._model).load(self._data)
+
+    def __repr__(self):
+        resource_id = self._data.get('id')
+        return f"<Lazy {self._model.__name__} {resource_id}>" if resource_id else f"<Lazy {self._model.__name__}>"
+
+
+def _hydrate(field, value):
+    if value is None:
+        return None
+
+    # Polymorphic fields (money, return items, ...) are small, so they're loaded in full by the SDK field
+    if not isinstance(field, Nested):
+        return field.deserialize(value)
+
+    model = _model_for(field.schema)
+
+    if field.many:
+        return [LazyModel(model, item) for item in value]
+
+    return LazyModel(model, value)
+
+
+def lazy_page(content: bytes, model: Type) -> dict:
+    """
+    Decode a paged query response, with its results as lazy `model` instances.
+
+    Returns: The response as a dict, e.g. {"limit": 20, "offset": 0, "count": 20, "total": 99, "results": [...]}
+    """
+    page = orjson.loads(content)
+    page['results'] = [LazyModel(model, result) for result in page['results']]
+    return page
@@ -0,0 +1,249 @@
+"""
+Batched product sync through commercetools import containers.
+
+Instead of one `update_by_id` per product, the desired catalog is diffed against what commercetools already has and
+only what changed is imported:
+
+- products that don't exist yet become `ProductDraftImport`s
+- products whose name, slug or description changed become `ProductImport`s (product level fields only)
+- variants whose attributes changed become `ProductVariantPatch`es holding just the changed attributes
+
+The resulting resources are posted COMMTOOLS_IMPORT_BATCH_SIZE at a time, concurrently, and the containers' import
+summaries are polled in aggregate rather than per operation.
+
+Only catalog syncs go through here. `create_commercetools_product` and `update_commercetools_product` stay on the
+platform API, as each writes one product from a hand-written draft or update actions and has nothing to batch, and
+the other `update_by_id` callers update custom types, states and single orders rather than products.
+"""
+import time
+from collections import defaultdict
+
+from commercetools.importapi.models.importcontainers import ImportContainerDraft
+from commercetools.importapi.models.importrequests import (
+    ProductDraftImportRequest,
+    ProductImportRequest,
+    ProductVariantPatchRequest
+)
+
+from commerce_coordinator.apps.core.concurrency import map_concurrently
+
+COMMTOOLS_IMPORT_BATCH_SIZE = 20  # Resources per import request, the Import API maximum
+COMMTOOLS_MAX_PER_CONTAINER = 180000  # Operations per container (limit is 200,000 but i like margins for error)
+
+# Import operations still in these states are being worked on by commercetools
+IMPORT_PENDING_STATES = ('processing', 'waitForMasterVariant')
+
+PRODUCT_FIELDS = ('name', 'slug', 'description')
+
+
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def attribute_value(value):
+    """ Reduce a platform attribute value to what an import would set, e.g. an enum to its key. """
+    if isinstance(value, dict) and 'key' in value and 'label' in value:
+        return value['key']
+    if isinstance(value, list):
+        return [attribute_value(item) for item in value]
+    return value
+
+
+def current_product_state(product):
+    """ Projection of a platform Product to the fields the sync compares, see `ProductSync.diff`. """
+    data = product.master_data.current
+    variants = [data.master_variant, *data.variants]
+
+    return {
+        'key': product.key,
+        'name': dict(data.name or {}),
+        'slug': dict(data.slug or {}),
+        'description': dict(data.description or {}) or None,
+        'variants': {
+            variant.key: {attr.name: attribute_value(attr.value) for attr in variant.attributes or []}
+            for variant in variants
+        },
+    }
+
+
+class ProductSync:
+    """
+    Diff a desired product catalog against commercetools and import the difference.
+
+    Desired products are Import API shaped dicts keyed by product key::
+
+        {
+            "key": "edx-prod-...",
+            "productType": {"typeId": "product-type", "key": "edx-course_verified"},
+            "name": {"en-US": "..."}, "slug": {"en-US": "..."}, "description": {"en-US": "..."},
+            "variants": [
+                {"key": "edx-var-...", "sku": "...", "attributes": [{"name": "...", "type": "text", "value": "..."}]}
+            ]
+        }
+
+    the first variant being the master variant for new products.
+    """
+
+    def __init__(self, import_client, container_prefix, workers=4, dry_run=False):
+        self.import_client = import_client
+        self.container_prefix = container_prefix
+        self.workers = workers
+        self.dry_run = dry_run
+        self.container_keys = []
+
+    @staticmethod
+    def diff(desired, current):
+        """
+        Work out the import resources that bring `current` in line with `desired`.
+
+        Args:
+            desired: dict of product key to desired product
+            current: iterable of `current_product_state` projections, products not in `desired` are ignored
+
+        Returns: {'product-draft': [...], 'product': [...], 'product-variant-patch': [...]}, each a list of
+                 Import API resource dicts
+        """
+        resources = defaultdict(list)
+        remaining = dict(desired)
+
+        for existing in current:
+            product = remaining.pop(existing['key'], None)
+
+            if product is None:
+                continue
+
+            if any(field in product and product[field] != existing[field] for field in PRODUCT_FIELDS):
+                resources['product'].append({
+                    'key': product['key'],
+                    'productType': product['productType'],
+                    **{field: product[field] for field in PRODUCT_FIELDS if product.get(field) is not None},
+                    'publish': True,
+                })
+
+            for variant in product['variants']:
+                existing_attributes = existing['variants'].get(variant['key'])
+
+                if existing_attributes is None:
+                    # New variants need the full product, the Import API can't add one through a patch
+                    continue
+
+                changed = {
+                    attr['name']: attr for attr in variant.get('attributes', [])
+                    if existing_attributes.get(attr['name']) != attr['value']
+                }
+
+                if changed:
+                    resources['product-variant-patch'].append({
+                        'productVariant': {'typeId': 'product-variant', 'key': variant['key']},
+                        'product': {'typeId': 'product', 'key': product['key']},
+                        'attributes': changed,
+                        'staged': False,
+                    })
+
+        for product in remaining.values():
+            master_variant, *variants = product['variants']
+            resources['product-draft'].append({
+                'key': product['key'],
+                'productType': product['productType'],
+                **{field: product[field] for field in PRODUCT_FIELDS if product.get(field) is not None},
+                'masterVariant': master_variant,
+                'variants': variants,
+                'publish': True,
+            })
+
+        return dict(resources)
+
+    def create_container(self):
+        key = f'{self.container_prefix}_{len(self.container_keys)}' if self.container_keys else self.container_prefix
+
+        print(f'Batching to new container (future items): {key}')
+
+        if not self.dry_run:
+            # No resource type, as a sync mixes drafts, products and variant patches
+            self.import_client.import_containers().post(body=ImportContainerDraft(key=key))
+
+        self.container_keys.append(key)
+        return key
+
+    def _post(self, request):
+        container_key, resource_type, batch = request
+
+        print(f'Posting {len(batch)} {resource_type} resources to {container_key}')
+
+        if self.dry_run:
+            return
+
+        if resource_type == 'product-draft':
+            endpoint = self.import_client.product_drafts()
+            body = ProductDraftImportRequest.deserialize({'type': resource_type, 'resources': batch})
+        elif resource_type == 'product':
+            endpoint = self.import_client.products()
+            body = ProductImportRequest.deserialize({'type': resource_type, 'resources': batch})
+        else:
+            endpoint = self.import_client.product_variant_patches()
+            body = ProductVariantPatchRequest.deserialize({'type': resource_type, 'patches': batch})
+
+        endpoint.import_containers().with_import_container_key_value(container_key).post(body)
+
+    def submit(self, resources):
+        """
+        Post `resources` (as returned by `diff`) in maximally sized batches, concurrently.
+
+        Returns: list of ConcurrentResult for the batches that failed to post
+        """
+        requests = []
+        container_key = None
+        in_container = COMMTOOLS_MAX_PER_CONTAINER
+
+        for resource_type in ('product-draft', 'product', 'product-variant-patch'):
+            for batch in chunked(resources.get(resource_type, []), COMMTOOLS_IMPORT_BATCH_SIZE):
+                if in_container + len(batch) > COMMTOOLS_MAX_PER_CONTAINER:
+                    container_key = self.create_container()
+                    in_container = 0
+
+                in_container += len(batch)
+                requests.append((container_key, resource_type, batch))
+
+        results = map_concurrently(self._post, requests, max_workers=self.workers)
+        return [result for result in results if not result.ok]
+
+    def wait(self, interval=5, timeout=600):
+        return wait_for_import_containers(self.import_client, self.container_keys, interval, timeout, self.workers)
+
+
+def wait_for_import_containers(import_client, container_keys, interval=5, timeout=600, workers=4):
+    """
+    Poll the import summary of every container, concurrently, until commercetools has processed them.
+
+    Returns: dict of import operation state to the number of operations in it, across all containers
+    """
+    deadline = time.monotonic() + timeout
+
+    while True:
+        results = map_concurrently(
+            lambda key: import_client.import_containers().with_import_container_key_value(key)
+            .import_summaries().get(),
+            container_keys,
+            max_workers=workers,
+        )
+
+        totals = defaultdict(int)
+
+        for result in results:
+            if not result.ok:
+                print(f'*** ERROR checking import status of {result.item} => {result.error}')
+                totals['unknown'] += 1
+                continue
+
+            for state, count in result.value.states.serialize().items():
+                totals[state] += count
+
+        print(f'Import status of {len(container_keys)} containers: {dict(totals)}')
+
+        pending = any(totals[state] for state in IMPORT_PENDING_STATES)
+
+        if not pending or time.monotonic() >= deadline:
+            return totals
+
+        time.sleep(interval)
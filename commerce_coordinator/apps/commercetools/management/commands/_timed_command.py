@@ -2,6 +2,8 @@ from datetime import datetime
 
 from django.core.management import BaseCommand
 
+from commerce_coordinator.apps.core.rate_limit import Priority, outbound_priority
+
 
 class TimedCommand(BaseCommand):
     start = datetime.now()
@@ -14,6 +16,8 @@ class TimedCommand(BaseCommand):
 
     # Django Overrides
     def execute(self, *args, **options):
-        ret_val = super().execute(*args, **options)
+        # Commands are batch work, web requests and tasks come first for the commercetools budget
+        with outbound_priority(Priority.BATCH):
+            ret_val = super().execute(*args, **options)
         self.print_reporting_time()
         return ret_val
@@ -1,10 +1,15 @@
 import json
 import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 from typing import Literal, Union
 
 from commercetools import CommercetoolsError
 from commercetools.platform.models import TypeAddEnumValueAction, TypeAddFieldDefinitionAction, TypeChangeNameAction
 
+from commerce_coordinator.apps.commercetools.utils import ct_datetime
+
 
 def yn(question: str, default: Union[Literal['y', 'n']] = "n"):
     y = "Y" if default == "y" else "y"
@@ -25,6 +30,69 @@ def yn(question: str, default: Union[Literal['y', 'n']] = "n"):
             sys.stdout.write("Please choose y or n.\n")
 
 
+class TokenBucket:
+    """
+    Token bucket rate limiter shared by any number of threads.
+
+    Allows bursts of up to ``capacity`` calls, then ``rate`` calls per second on average.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, sleeping until one is available."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            # A negative balance is the debt this caller waits out; later callers queue up behind it.
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+
+def split_date_range(date_from: str, date_to: Union[str, None], window_days: int):
+    """
+    Split the ISO date range [date_from, date_to) into consecutive windows of ``window_days``.
+
+    Naive dates are taken as UTC and a missing ``date_to`` means now. Returns ``(start, end)`` pairs formatted by
+    ``ct_datetime``.
+    """
+    start = datetime.fromisoformat(date_from)
+    end = datetime.fromisoformat(date_to) if date_to else datetime.now(timezone.utc)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+
+    windows = []
+    while start < end:
+        window_end = min(start + timedelta(days=window_days), end)
+        windows.append((ct_datetime(start), ct_datetime(window_end)))
+        start = window_end
+    return windows
+
+
+def iter_orders_created_between(ct_api_client, window, where=None, page_size=500, expand=None):
+    """
+    Yield the orders created in ``window`` that match ``where``, in (createdAt, id) keyset order.
+    """
+    window_start, window_end = window
+    return ct_api_client.iter_query(
+        "orders",
+        where=[*(where or []), f'createdAt >= "{window_start}" and createdAt < "{window_end}"'],
+        keyset="createdAt",
+        page_size=page_size,
+        expand=expand,
+    )
+
+
 def handle_custom_field_creation(ct_api_client, custom_type):
     try:
         type_key = custom_type.key
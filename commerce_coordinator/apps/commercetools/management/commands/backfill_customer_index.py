@@ -0,0 +1,82 @@
+from django.core.management.base import no_translations
+from django.db import connection
+
+from commerce_coordinator.apps.commercetools.catalog_info.constants import EdXFieldNames
+from commerce_coordinator.apps.commercetools.management.commands._ct_api_client_command import (
+    CommercetoolsAPIClientCommand
+)
+from commerce_coordinator.apps.commercetools.management.commands._product_sync import chunked
+from commerce_coordinator.apps.commercetools.models import CustomerIndex
+
+
+def customer_index_entry(customer):
+    return customer.custom.fields.get(EdXFieldNames.LMS_USER_ID), customer.id, customer.version
+
+
+class Command(CommercetoolsAPIClientCommand):
+    help = "Backfill the local LMS user ID to commercetools customer index from every customer tagged with one"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--page-size", type=int, default=500, help="Customers per query")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Index entries written at a time")
+
+    def _write(self, entries):
+        CustomerIndex.objects.bulk_create(
+            [
+                CustomerIndex(lms_user_id=lms_user_id, customer_id=customer_id, customer_version=version)
+                for lms_user_id, customer_id, version in entries
+            ],
+            update_conflicts=True,
+            # MySQL's upsert can't name the conflicting column, it updates on a clash of any unique one, which here
+            # can only be lms_user_id
+            unique_fields=['lms_user_id'] if connection.features.supports_update_conflicts_with_target else None,
+            update_fields=['customer_id', 'customer_version', 'modified'],
+        )
+
+    @no_translations
+    def handle(self, *args, **options):
+        customers = self.ct_api_client.iter_query(
+            "customers",
+            where=[f"custom(fields({EdXFieldNames.LMS_USER_ID} is defined))"],
+            page_size=options['page_size'],
+            projection=customer_index_entry,
+        )
+
+        seen = set()
+        duplicates = set()
+        batch = []
+        written = 0
+
+        for lms_user_id, customer_id, version in customers:
+            try:
+                lms_user_id = int(lms_user_id)
+            except (TypeError, ValueError):
+                print(f'*** ERROR customer {customer_id} has an invalid LMS user ID: {lms_user_id!r}')
+                continue
+
+            if lms_user_id in seen:
+                # The custom field query refuses to pick one of them, so the index mustn't either
+                duplicates.add(lms_user_id)
+                continue
+
+            seen.add(lms_user_id)
+            batch.append((lms_user_id, customer_id, version))
+
+            if len(batch) >= options['batch_size']:
+                self._write(batch)
+                written += len(batch)
+                batch = []
+                print(f'Indexed {written} customers')
+
+        if batch:
+            self._write(batch)
+            written += len(batch)
+
+        for chunk in chunked(sorted(duplicates), options['batch_size']):
+            CustomerIndex.objects.filter(lms_user_id__in=chunk).delete()
+
+        print(f'Indexed {written - len(duplicates)} customers')
+
+        if duplicates:
+            print(f'*** ERROR {len(duplicates)} LMS user IDs belong to more than one customer and were left out: '
+                  f'{", ".join(map(str, sorted(duplicates)))}')
@@ -0,0 +1,95 @@
+import copy
+import json
+import os
+import pathlib
+import timeit
+import uuid
+from types import SimpleNamespace
+
+import attrs
+from commercetools.platform.models import Order
+from django.core.management.base import no_translations
+
+from commerce_coordinator.apps.commercetools.catalog_info.constants import EdXFieldNames
+from commerce_coordinator.apps.commercetools.data import order_dict_from_commercetools, order_from_commercetools
+from commerce_coordinator.apps.commercetools.management.commands._timed_command import TimedCommand
+from commerce_coordinator.apps.core.constants import ORDER_HISTORY_PER_SYSTEM_REQ_LIMIT
+
+TEST_DATA_DIR = pathlib.Path(__file__).parent.parent.parent.resolve() / 'tests'
+
+# Bundle (program) order, recorded without line item state expansion, so we borrow the state of a course order
+BUNDLE_ORDER_FILE = TEST_DATA_DIR / 'raw_ct_program_order.json'
+EXPANDED_STATE_ORDER_FILE = TEST_DATA_DIR / 'raw_ct_order.json'
+
+
+def load_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def bundle_order_page(num_orders):
+    """ A page of `num_orders` distinct bundle orders, shaped like GetCommercetoolsOrders receives them. """
+    order = load_json(BUNDLE_ORDER_FILE)
+    state = load_json(EXPANDED_STATE_ORDER_FILE)['lineItems'][0]['state']
+
+    for li in order['lineItems']:
+        li['state'] = state
+
+    page = []
+    for _ in range(num_orders):
+        order = copy.deepcopy(order)
+        order['id'] = str(uuid.uuid4())
+        page.append(order)
+    return page
+
+
+class Command(TimedCommand):
+    help = "Benchmark converting a page of commercetools orders to the legacy order history format"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders-file", default=None,
+                            help="JSON list of recorded commercetools orders (or a query response holding them) "
+                                 "to convert instead of generated bundle orders")
+        parser.add_argument("--page-size", type=int, default=ORDER_HISTORY_PER_SYSTEM_REQ_LIMIT,
+                            help="Generated bundle orders per page")
+        parser.add_argument("--repeat", type=int, default=20, help="Times each page is converted")
+
+    @no_translations
+    def handle(self, *args, **options):
+        if options['orders_file']:
+            raw_orders = load_json(options['orders_file'])
+            if isinstance(raw_orders, dict):
+                raw_orders = raw_orders['results']
+            print(f"Using {len(raw_orders)} orders from {os.path.basename(options['orders_file'])}")
+        else:
+            raw_orders = bundle_order_page(options['page_size'])
+            print(f"Using {len(raw_orders)} generated bundle orders")
+
+        orders = [Order.deserialize(order) for order in raw_orders]
+        customer = SimpleNamespace(
+            id=str(uuid.uuid4()),
+            email='benchmark@example.com',
+            custom=SimpleNamespace(fields={EdXFieldNames.LMS_USER_NAME: 'benchmark'}),
+        )
+
+        def _asdict():
+            return [attrs.asdict(order_from_commercetools(order, customer)) for order in orders]
+
+        def _single_pass():
+            return [order_dict_from_commercetools(order, customer) for order in orders]
+
+        if _asdict() != _single_pass():
+            print("*** ERROR: the single pass conversion doesn't match attrs.asdict(order_from_commercetools)")
+            return
+
+        # The comparison above warmed the line item cache, so bump the versions to time a cold single pass
+        for order in orders:
+            order.version += 1
+
+        cold = timeit.timeit(_single_pass, number=1)
+        as_dict = timeit.timeit(_asdict, number=options['repeat']) / options['repeat']
+        cached = timeit.timeit(_single_pass, number=options['repeat']) / options['repeat']
+
+        print(f"attrs.asdict(order_from_commercetools): {as_dict * 1000:.2f}ms per page")
+        print(f"order_dict_from_commercetools, uncached: {cold * 1000:.2f}ms per page")
+        print(f"order_dict_from_commercetools, cached: {cached * 1000:.2f}ms per page")
@@ -0,0 +1,121 @@
+import itertools
+import json
+import os
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from commercetools.platform.models import Order, OrderPagedQueryResponse
+from django.core.management.base import no_translations
+
+from commerce_coordinator.apps.commercetools.catalog_info.constants import EdXFieldNames
+from commerce_coordinator.apps.commercetools.data import order_dict_from_commercetools
+from commerce_coordinator.apps.commercetools.lazy import lazy_page
+from commerce_coordinator.apps.commercetools.management.commands._timed_command import TimedCommand
+from commerce_coordinator.apps.commercetools.management.commands.benchmark_order_conversion import (
+    bundle_order_page,
+    load_json
+)
+from commerce_coordinator.apps.core.constants import ORDER_HISTORY_PER_SYSTEM_REQ_LIMIT
+
+
+def page_bodies(raw_orders, count, first_version):
+    """
+    `count` JSON bodies of an order query response holding `raw_orders`, with versions from `first_version` on, so
+    `order_dict_from_commercetools` can't reuse line items it converted for another body.
+    """
+    bodies = []
+    for i in range(count):
+        for order in raw_orders:
+            order['version'] = first_version + i
+        bodies.append(json.dumps({
+            'limit': len(raw_orders), 'offset': 0, 'count': len(raw_orders), 'total': len(raw_orders),
+            'results': raw_orders,
+        }).encode())
+    return bodies
+
+
+def eager(body):
+    return OrderPagedQueryResponse.deserialize(json.loads(body)).results
+
+
+def lazy(body):
+    return lazy_page(body, Order)['results']
+
+
+def measure(read, convert, bodies):
+    """
+    CPU seconds and peak traced bytes per page, reading and converting each body once. Memory is traced in a second
+    pass, over new bodies, as tracing slows allocations down.
+    """
+    timed = bodies()
+    start = time.process_time()
+    for body in timed:
+        convert(read(body))
+    cpu = (time.process_time() - start) / len(timed)
+
+    peak = 0
+    for body in bodies():
+        tracemalloc.start()
+        convert(read(body))
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return cpu, peak
+
+
+class Command(TimedCommand):
+    help = "Benchmark reading a page of commercetools orders eagerly (SDK models) against lazily (LazyModels)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders-file", default=None,
+                            help="JSON list of recorded commercetools orders (or a query response holding them) "
+                                 "to read instead of generated bundle orders")
+        parser.add_argument("--page-size", type=int, default=ORDER_HISTORY_PER_SYSTEM_REQ_LIMIT,
+                            help="Generated bundle orders per page")
+        parser.add_argument("--repeat", type=int, default=20, help="Times each page is read")
+
+    @no_translations
+    def handle(self, *args, **options):
+        if options['orders_file']:
+            raw_orders = load_json(options['orders_file'])
+            if isinstance(raw_orders, dict):
+                raw_orders = raw_orders['results']
+            print(f"Using {len(raw_orders)} orders from {os.path.basename(options['orders_file'])}")
+        else:
+            raw_orders = bundle_order_page(options['page_size'])
+            print(f"Using {len(raw_orders)} generated bundle orders")
+
+        repeat = options['repeat']
+        customer = SimpleNamespace(
+            email='benchmark@example.com',
+            custom=SimpleNamespace(fields={EdXFieldNames.LMS_USER_NAME: 'benchmark'}),
+        )
+
+        def _ids(orders):
+            return [order.id for order in orders]
+
+        def _history(orders):
+            return [order_dict_from_commercetools(order, customer) for order in orders]
+
+        body = page_bodies(raw_orders, 1, 1)[0]
+        if _history(eager(page_bodies(raw_orders, 1, 0)[0])) != _history(lazy(body)):
+            print("*** ERROR: order history converted from lazy orders doesn't match the eager ones")
+            return
+
+        versions = itertools.count(start=2, step=repeat)
+
+        def _new_bodies():
+            return page_bodies(raw_orders, repeat, next(versions))
+
+        def _converted_body():
+            return [body] * repeat
+
+        for name, convert, bodies in (
+            ("read only (IDs)", _ids, _new_bodies),
+            ("order history, uncached", _history, _new_bodies),
+            ("order history, cached", _history, _converted_body),
+        ):
+            for mode, read in (("eager", eager), ("lazy", lazy)):
+                cpu, peak = measure(read, convert, bodies)
+                print(f"{name}, {mode}: {cpu * 1000:.2f}ms CPU, {peak / 1024:.0f}KiB peak allocated per page")
@@ -42,25 +42,15 @@ class Command(CommercetoolsAPIClientCommand):
         self.write_attributes_to_csv(products, product_type)
 
     def fetch_products(self, product_type):
-        limit = 500
-        offset = 0
-        products = []
-
         product_type_id = PROD_PRODUCT_TYPE_ID_MAPPING.get(product_type.value)
 
-        while True:
-            products_result = self.ct_api_client.base_client.products.query(
-                limit=limit,
-                offset=offset,
-                where=f"productType(id=\"{product_type_id}\")"
-            )
-            for product in products_result.results:
-                attributes = self.extract_product_attributes(product, product_type.value)
-                products.extend(attributes)
-
-            if products_result.offset + products_result.limit >= products_result.total:
-                break
-            offset += limit
+        products = []
+        for product_rows in self.ct_api_client.iter_query(
+            "products",
+            where=[f"productType(id=\"{product_type_id}\")"],
+            projection=lambda product: self.extract_product_attributes(product, product_type.value),
+        ):
+            products.extend(product_rows)
 
         return products
 
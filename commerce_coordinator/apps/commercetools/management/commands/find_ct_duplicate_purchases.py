@@ -1,71 +1,203 @@
+import csv
 import json
-from collections import defaultdict
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import ExitStack
 
 from commerce_coordinator.apps.commercetools.management.commands._ct_api_client_command import (
     CommercetoolsAPIClientCommand
 )
+from commerce_coordinator.apps.commercetools.management.commands._utils import (
+    iter_orders_created_between,
+    split_date_range
+)
+from commerce_coordinator.apps.commercetools.utils import ct_datetime
+from commerce_coordinator.apps.core.concurrency import map_concurrently
 
 """ Those intending to use this script, please take into consideration that currently
 the script doesn't cater for the returns (refunds) and hence
 it will show the duplicates even if the user has returned the product.
  """
 
+CSV_FIELDS = ["customer_email", "sku", "order_id", "created_at", "earlier_order_id", "earlier_created_at"]
+
+
+class FirstPurchaseIndex:
+    """
+    Map of (customer, sku) to the earliest order seen for it.
+
+    Entries are kept in memory until there are more than ``max_in_memory`` of them, then moved to a SQLite
+    database so memory stays bounded however many orders are scanned.
+    """
+
+    def __init__(self, path, max_in_memory):
+        self.max_in_memory = max_in_memory
+        self.lock = threading.Lock()
+        self.memory = {}
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS first_purchase "
+            "(customer TEXT, sku TEXT, order_id TEXT, created_at TEXT, PRIMARY KEY (customer, sku))"
+        )
+
+    def _get(self, key):
+        if key in self.memory:
+            return self.memory[key]
+        row = self.db.execute(
+            "SELECT order_id, created_at FROM first_purchase WHERE customer = ? AND sku = ?", key
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def record(self, key, order_id, created_at):
+        """
+        Record a purchase and return the ``(later, earlier)`` orders if it collides with an earlier purchase.
+
+        Windows are scanned concurrently, so purchases don't arrive in date order. The index keeps the earliest
+        order and the later of the two is reported, which reports every order but the earliest exactly once.
+        """
+        with self.lock:
+            first = self._get(key)
+            purchase = (order_id, created_at)
+
+            if first is None or first[0] == order_id:
+                self.memory[key] = purchase
+                self._spill_if_full()
+                return None
+
+            if created_at < first[1]:
+                self.memory[key] = purchase
+                self._spill_if_full()
+                return first, purchase
+
+            return purchase, first
+
+    def _spill_if_full(self):
+        if len(self.memory) > self.max_in_memory:
+            self.flush()
+
+    def flush(self):
+        """Move the in-memory entries to SQLite."""
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO first_purchase VALUES (?, ?, ?, ?)",
+                ((*key, *purchase) for key, purchase in self.memory.items()),
+            )
+        self.memory.clear()
+
+    def close(self):
+        self.db.close()
+
 
 class Command(CommercetoolsAPIClientCommand):
     help = "Find duplicate purchases in commercetools"
 
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", default="2024-10-23T00:00:00",
+                            help="Scan orders created at or after this ISO date")
+        parser.add_argument("--to", dest="date_to", default=None,
+                            help="Scan orders created before this ISO date, defaults to now")
+        parser.add_argument("--window-days", type=int, default=7, help="Days of orders per scanned window")
+        parser.add_argument("--workers", type=int, default=4, help="Windows scanned concurrently")
+        parser.add_argument("--order-state", default="Complete")
+        parser.add_argument("--page-size", type=int, default=500)
+        parser.add_argument("--max-in-memory", type=int, default=100000,
+                            help="Index entries kept in memory before spilling to SQLite")
+        parser.add_argument("--output", default="duplicate_purchases.csv")
+        parser.add_argument("--checkpoint", default=None,
+                            help="Checkpoint file; rerunning with the same file resumes an interrupted scan")
+
     def handle(self, *args, **options):
+        windows = split_date_range(options["date_from"], options["date_to"], options["window_days"])
 
-        order_state = "Complete"
-        # Change for your use case
-        last_modified_at = "2024-10-23T00:00:00"
-        limit = 500
-        offset = 0
-
-        orders_result = self.ct_api_client.base_client.orders.query(
-            where=[
-                f'orderState="{order_state}"',
-                f'lastModifiedAt>"{last_modified_at}"',
-            ],
-            sort=["completedAt desc", "lastModifiedAt desc"],
-            limit=limit,
-            offset=offset,
-        )
+        checkpoint = options["checkpoint"]
+        completed = set()
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                completed = {tuple(window) for window in json.load(f)["completed_windows"]}
+            print(f"Resuming from {checkpoint}: {len(completed)} of {len(windows)} windows already scanned")
 
-        orders = orders_result.results
-
-        while orders_result.offset + orders_result.limit < orders_result.total:
-            orders_result = self.ct_api_client.base_client.orders.query(
-                where=[
-                    f'orderState="{order_state}"',
-                    'lastModifiedAt>"2024-10-23T00:00:00"',
-                ],
-                sort=["completedAt desc", "lastModifiedAt desc"],
-                limit=orders_result.limit,
-                offset=orders_result.offset + orders_result.limit,
-            )
-            orders.extend(orders_result.results)
+        self.options = options
+        self.checkpoint = checkpoint
+        self.completed = completed
+        self.output_lock = threading.Lock()
+        self.duplicates_found = 0
+
+        resuming = bool(completed) and os.path.exists(options["output"])
+        with ExitStack() as stack:
+            # Without a checkpoint the index is only needed for this run, its directory is removed at the end
+            if checkpoint:
+                index_path = f"{checkpoint}.sqlite"
+            else:
+                index_path = os.path.join(stack.enter_context(tempfile.TemporaryDirectory()), "index.sqlite")
+            self.index = FirstPurchaseIndex(index_path, options["max_in_memory"])
+            stack.callback(self.index.close)
+
+            output_file = stack.enter_context(open(options["output"], "a" if resuming else "w", newline=""))
+            self.writer = csv.DictWriter(output_file, fieldnames=CSV_FIELDS)
+            if not resuming:
+                self.writer.writeheader()
+            self.output_file = output_file
+
+            pending = [window for window in windows if window not in completed]
+            results = map_concurrently(self.scan_window, pending, max_workers=options["workers"])
+
+        failed = [result for result in results if not result.ok]
+        for result in failed:
+            print(f"Window {result.item[0]} - {result.item[1]} failed: {result.error}")
 
-        user_orders = defaultdict(lambda: defaultdict(list))
+        print(f"Scanned {len(results) - len(failed)} of {len(pending)} windows, "
+              f"found {self.duplicates_found} duplicate purchases, written to {options['output']}")
+        if failed and checkpoint:
+            print(f"Rerun with --checkpoint {checkpoint} to scan the failed windows")
 
+    def scan_window(self, window):
+        """Stream the orders created in ``window`` with keyset pagination and record their purchases."""
+        scanned = 0
+        orders = iter_orders_created_between(
+            self.ct_api_client,
+            window,
+            where=[f'orderState="{self.options["order_state"]}"'],
+            page_size=self.options["page_size"],
+        )
         for order in orders:
-            user_email = order.customer_email
-            line_items = order.line_items
-
-            for item in line_items:
-                sku = item.variant.sku
-                user_orders[user_email][sku].append(order.id)
-
-        duplicate_purchases = {}
-        for user_id, sku_orders in user_orders.items():
-            duplicates = {
-                sku: order_ids
-                for sku, order_ids in sku_orders.items()
-                if len(order_ids) > 1
-            }
-            if duplicates:
-                duplicate_purchases[user_id] = duplicates
-
-        # dump to a json file
-        with open("duplicate_purchases.json", "w") as f:
-            json.dump(duplicate_purchases, f)
+            self.record_order(order)
+            scanned += 1
+
+        self.complete_window(window)
+        print(f"Scanned {scanned} orders created between {window[0]} and {window[1]}")
+
+    def record_order(self, order):
+        customer = order.customer_email or order.customer_id
+        created_at = ct_datetime(order.created_at)
+
+        for item in order.line_items:
+            duplicate = self.index.record((customer, item.variant.sku), order.id, created_at)
+            if duplicate is None:
+                continue
+
+            (order_id, order_created_at), (earlier_order_id, earlier_created_at) = duplicate
+            with self.output_lock:
+                self.duplicates_found += 1
+                self.writer.writerow({
+                    "customer_email": customer,
+                    "sku": item.variant.sku,
+                    "order_id": order_id,
+                    "created_at": order_created_at,
+                    "earlier_order_id": earlier_order_id,
+                    "earlier_created_at": earlier_created_at,
+                })
+
+    def complete_window(self, window):
+        """Persist the index and output so far, then mark ``window`` as scanned in the checkpoint."""
+        if not self.checkpoint:
+            return
+
+        with self.index.lock:
+            self.index.flush()
+        with self.output_lock:
+            self.output_file.flush()
+            self.completed.add(window)
+            with open(self.checkpoint, "w") as f:
+                json.dump({"completed_windows": sorted(self.completed)}, f)
@@ -1,56 +1,103 @@
+import threading
+
+from commerce_coordinator.apps.commercetools.constants import SOURCE_SYSTEM
 from commerce_coordinator.apps.commercetools.management.commands._ct_api_client_command import (
     CommercetoolsAPIClientCommand
 )
+from commerce_coordinator.apps.commercetools.management.commands._utils import (
+    TokenBucket,
+    iter_orders_created_between,
+    split_date_range
+)
+from commerce_coordinator.apps.commercetools.sub_messages.tasks import fulfill_order_placed_message_signal_task
 from commerce_coordinator.apps.commercetools.utils import has_refund_transaction
+from commerce_coordinator.apps.core.concurrency import map_concurrently
 
 
 class Command(CommercetoolsAPIClientCommand):
     help = "Find Pending Fulfillment Non Refunded Orders in commercetools"
 
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", default="2024-10-23T00:00:00",
+                            help="Scan orders created at or after this ISO date")
+        parser.add_argument("--to", dest="date_to", default=None,
+                            help="Scan orders created before this ISO date, defaults to now")
+        parser.add_argument("--window-days", type=int, default=1, help="Days of orders per scanned window")
+        parser.add_argument("--workers", type=int, default=4, help="Windows scanned concurrently")
+        parser.add_argument("--order-state", default="Complete")
+        parser.add_argument("--line-item-state-id", default="bb686576-3bd5-4457-890a-d63c3d31b2ab",
+                            help="ID of the pending fulfillment line item state")
+        parser.add_argument("--page-size", type=int, default=500)
+        parser.add_argument("--redrive", action="store_true",
+                            help="Enqueue fulfill_order_placed_message_signal_task for every order found")
+        parser.add_argument("--redrive-rate", type=float, default=1,
+                            help="Maximum re-driven orders per second")
+        parser.add_argument("--order-fulfillment-forwarding", action="store_true",
+                            help="Re-drive orders through the Order Fulfillment service")
+
     def handle(self, *args, **options):
-        order_state = "Complete"
-        line_item_state_id = "bb686576-3bd5-4457-890a-d63c3d31b2ab"
+        windows = split_date_range(options["date_from"], options["date_to"], options["window_days"])
+
+        self.options = options
+        self.output_lock = threading.Lock()
+        self.redrive_limiter = TokenBucket(options["redrive_rate"])
+        self.scanned = 0
+        self.non_refunded_orders = 0
+
+        results = map_concurrently(self.scan_window, windows, max_workers=options["workers"])
 
-        # TODO: Change for your use case
-        last_modified_at = "2024-10-23T00:00:00"
-        limit = 500
-        offset = 0
+        failed = [result for result in results if not result.ok]
+        for result in failed:
+            print(f"Window {result.item[0]} - {result.item[1]} failed: {result.error}")
 
-        orders_result = self.ct_api_client.base_client.orders.query(
+        print(f"Total Orders: {self.scanned}")
+        print(f"Non-Refunded Orders: {self.non_refunded_orders}")
+        if failed:
+            print(f"{len(failed)} of {len(windows)} windows failed and were not scanned completely")
+
+    def scan_window(self, window):
+        """Stream the pending fulfillment orders created in ``window``, with their payments expanded."""
+        orders = iter_orders_created_between(
+            self.ct_api_client,
+            window,
             where=[
-                f'orderState="{order_state}"',
-                f'lastModifiedAt>"{last_modified_at}"',
-                f'lineItems(state(state(id="{line_item_state_id}")))',
+                f'orderState="{self.options["order_state"]}"',
+                f'lineItems(state(state(id="{self.options["line_item_state_id"]}")))',
             ],
-            sort=["completedAt desc", "lastModifiedAt desc"],
-            limit=limit,
-            offset=offset,
+            page_size=self.options["page_size"],
             expand=["paymentInfo.payments[*]"],
         )
 
-        orders = orders_result.results
-        non_refunded_orders = []
-
-        print(f"Total Orders: {orders_result.total}")
-
         for order in orders:
-            if order.payment_info and order.payment_info.payments:
-                payments = order.payment_info.payments
-                refund_found = False
+            with self.output_lock:
+                self.scanned += 1
 
-                for payment_ref in payments:
-                    refund_found = has_refund_transaction(payment_ref.obj)
+            if self.is_refunded(order):
+                continue
 
-                    if refund_found:
-                        break
+            with self.output_lock:
+                self.non_refunded_orders += 1
+                print(f"Order ID: {order.id}")
 
-                if not refund_found:
-                    non_refunded_orders.append(order)
-            else:
-                # Orders with no payment info are considered non-refunded
-                non_refunded_orders.append(order)
+            if self.options["redrive"]:
+                self.redrive(order)
 
-        print(f"Non-Refunded Orders: {len(non_refunded_orders)}")
+    @staticmethod
+    def is_refunded(order):
+        # Orders with no payment info are considered non-refunded
+        if not (order.payment_info and order.payment_info.payments):
+            return False
 
-        for order in non_refunded_orders:
-            print(f"Order ID: {order.id}")
+        return any(has_refund_transaction(payment_ref.obj) for payment_ref in order.payment_info.payments)
+
+    def redrive(self, order):
+        self.redrive_limiter.acquire()
+        async_result = fulfill_order_placed_message_signal_task.delay(
+            order_id=order.id,
+            line_item_state_id=self.options["line_item_state_id"],
+            source_system=SOURCE_SYSTEM,
+            message_id=f"redrive-{order.id}",
+            is_order_fulfillment_forwarding_enabled=self.options["order_fulfillment_forwarding"],
+        )
+        with self.output_lock:
+            print(f"Re-drove order {order.id}, celery task ID: {async_result.id}")
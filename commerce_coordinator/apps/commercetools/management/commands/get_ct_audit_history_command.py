@@ -1,71 +1,170 @@
 import csv
+import json
+import os
+import shutil
+import threading
 from datetime import datetime
-from time import sleep
 
 import django.conf
+import requests
 
 from commerce_coordinator.apps.commercetools.http_api_client import CTCustomAPIClient
 from commerce_coordinator.apps.commercetools.management.commands._timed_command import TimedCommand
+from commerce_coordinator.apps.commercetools.management.commands._utils import TokenBucket, split_date_range
+from commerce_coordinator.apps.core.concurrency import map_concurrently
+
+RESOURCE_TYPES = [
+    "category",
+    "customer",
+    "customer-group",
+    "product",
+    "inventory-entry",
+    "review",
+    "product-discount",
+    "product-selection",
+    "product-type",
+    "channel",
+    "store",
+    "tax-category",
+    "zone",
+    "shopping-list",
+    "payment",
+    "quote",
+    "quote-request",
+    "staged-quote",
+    "state",
+    "type",
+]
+
+CSV_FIELDS = ["Modified by", "Last modified", "Action", "Changes", "Current entity", "Entity type"]
+
+# The History API refuses offsets above this, so a window holding more records has to be split further.
+MAX_OFFSET = 10000
 
 
 class Command(TimedCommand):
     HISTORY_API_URL = "https://history.us-central1.gcp.commercetools.com/"
-    DEFAULT_COOLDOWN = 5
     RETRY_COOLDOWN = 30
     """Command to get Commercetools audit history."""
 
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="date_from", default="2025-01-01T00:00:00",
+                            help="Export changes made at or after this ISO date")
+        parser.add_argument("--to", dest="date_to", default=None,
+                            help="Export changes made before this ISO date, defaults to now")
+        parser.add_argument("--window-days", type=int, default=1, help="Days of changes per fetched window")
+        parser.add_argument("--workers", type=int, default=4, help="Windows fetched concurrently")
+        parser.add_argument("--rate", type=float, default=1,
+                            help="Average History API requests per second across all workers")
+        parser.add_argument("--page-size", type=int, default=500)
+        parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+        parser.add_argument("--output", default=None,
+                            help="Output file, defaults to audit_log_<date>.<format>. Rerunning with the same "
+                                 "output resumes an interrupted export")
+
+    def get_client(self):
+        """The History API client; override or patch to plug in another HTTP transport."""
+        return CTCustomAPIClient(session=requests.Session())
+
     def handle(self, *args, **options):
         """Handle the command."""
-        config = django.conf.settings.COMMERCETOOLS_CONFIG
-        client = CTCustomAPIClient()
-        results = []
-
-        while True:
-            print("Fetching page #", (len(results)) // 20 + 1)
-            response = client._make_request(
-                method="GET",
-                endpoint="",
-                base_backoff=self.RETRY_COOLDOWN,
-                params={
-                    "limit": 20,
-                    "date.from": "2025-01-01T00:00:00.000Z",
-                    "date.to": "now",
-                    "offset": len(results),
-                    "resourceTypes": [
-                        "category",
-                        "customer",
-                        "customer-group",
-                        "product",
-                        "inventory-entry",
-                        "review",
-                        "product-discount",
-                        "product-selection",
-                        "product-type",
-                        "channel",
-                        "store",
-                        "tax-category",
-                        "zone",
-                        "shopping-list",
-                        "payment",
-                        "quote",
-                        "quote-request",
-                        "staged-quote",
-                        "state",
-                        "type",
-                    ],
-                },
-                url_override=self.HISTORY_API_URL + config["projectKey"],
-            )
-            if response and response["results"]:
-                data = [
-                    self.map_audit_log_to_csv_row(audit_log)
-                    for audit_log in response["results"]
-                ]
-                self.write_attributes_to_csv(data, mode="a" if results else "w")
-                results.extend(data)
-                sleep(self.DEFAULT_COOLDOWN)
-            else:
-                break
+        self.options = options
+        self.client = self.get_client()
+        self.rate_limiter = TokenBucket(options["rate"], capacity=options["workers"])
+        self.url = self.HISTORY_API_URL + django.conf.settings.COMMERCETOOLS_CONFIG["projectKey"]
+
+        output = options["output"] or f"audit_log_{datetime.now().strftime('%Y%m%d')}.{options['format']}"
+        self.parts_dir = f"{output}.parts"
+        checkpoint = os.path.join(self.parts_dir, "checkpoint.json")
+        os.makedirs(self.parts_dir, exist_ok=True)
+
+        windows = split_date_range(options["date_from"], options["date_to"], options["window_days"])
+        completed = set()
+        if os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                completed = {tuple(window) for window in json.load(f)["completed_windows"]}
+            print(f"Resuming export: {len(completed)} of {len(windows)} windows already fetched")
+
+        self.checkpoint = checkpoint
+        self.completed = completed
+        self.checkpoint_lock = threading.Lock()
+
+        pending = [window for window in windows if window not in completed]
+        results = map_concurrently(self.export_window, pending, max_workers=options["workers"])
+
+        for result in results:
+            if not result.ok:
+                print(f"Window {result.item[0]} - {result.item[1]} failed: {result.error}")
+
+        if len(completed) < len(windows):
+            print(f"{len(windows) - len(completed)} windows failed, rerun with --output {output} to fetch them")
+            return
+
+        self.assemble(windows, output)
+        shutil.rmtree(self.parts_dir)
+
+    def part_path(self, window):
+        return os.path.join(self.parts_dir, f"{window[0]}.{self.options['format']}".replace(":", ""))
+
+    def export_window(self, window):
+        """Fetch every audit log of ``window`` and stream it to the window's part file."""
+        written = 0
+        with open(self.part_path(window), "w", newline="") as part:
+            writer = csv.DictWriter(part, fieldnames=CSV_FIELDS, delimiter="\t")
+
+            while True:
+                if written >= MAX_OFFSET:
+                    raise ValueError(f"more than {MAX_OFFSET} records, use a smaller --window-days")
+
+                self.rate_limiter.acquire()
+                response = self.client._make_request(  # pylint: disable=protected-access
+                    method="GET",
+                    endpoint="",
+                    base_backoff=self.RETRY_COOLDOWN,
+                    params={
+                        "limit": self.options["page_size"],
+                        "date.from": window[0],
+                        "date.to": window[1],
+                        "offset": written,
+                        "resourceTypes": RESOURCE_TYPES,
+                    },
+                    url_override=self.url,
+                )
+                if response is None:
+                    raise ValueError(f"History API request failed at offset {written}")
+
+                for audit_log in response["results"]:
+                    if self.options["format"] == "jsonl":
+                        part.write(json.dumps(audit_log) + "\n")
+                    else:
+                        writer.writerow(self.map_audit_log_to_csv_row(audit_log))
+                written += len(response["results"])
+
+                if len(response["results"]) < self.options["page_size"]:
+                    break
+
+        self.complete_window(window)
+        print(f"Fetched {written} records changed between {window[0]} and {window[1]}")
+
+    def complete_window(self, window):
+        """Mark ``window`` as fetched in the checkpoint, so an interrupted export doesn't fetch it again."""
+        with self.checkpoint_lock:
+            self.completed.add(window)
+            # Replaced in one step, so an interruption never leaves a partly written checkpoint
+            with open(f"{self.checkpoint}.tmp", "w") as f:
+                json.dump({"completed_windows": sorted(self.completed)}, f)
+            os.replace(f"{self.checkpoint}.tmp", self.checkpoint)
+
+    def assemble(self, windows, output):
+        """Concatenate the window part files, in date order, into ``output``."""
+        with open(output, "w", newline="") as output_file:
+            if self.options["format"] == "csv":
+                csv.DictWriter(output_file, fieldnames=CSV_FIELDS, delimiter="\t").writeheader()
+            for window in windows:
+                with open(self.part_path(window), newline="") as part:
+                    shutil.copyfileobj(part, output_file)
+
+        print(f"Wrote audit history of {len(windows)} windows to '{output}'")
 
     def map_audit_log_to_csv_row(self, audit_log):
         """Map audit log to csv row."""
@@ -95,17 +194,3 @@ class Command(TimedCommand):
         }
 
         return row
-
-    def write_attributes_to_csv(self, data, mode="a"):
-        """Write attributes to CSV."""
-        filename = f"audit_log_{datetime.now().strftime('%Y%m%d')}.csv"
-
-        with open(filename, mode, newline="") as output_file:
-            dict_writer = csv.DictWriter(
-                output_file, fieldnames=data[0].keys(), delimiter="\t"
-            )
-            if mode == "w":
-                dict_writer.writeheader()
-            dict_writer.writerows(data)
-
-        print(f"Wrote {len(data)} records in CSV '{filename}'")
@@ -1,12 +1,21 @@
+import contextvars
 import datetime
 import inspect
 import json
+import os
+import queue
 import re
+import struct
+import tempfile
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
+from functools import lru_cache
 from io import BytesIO
 
 import django.conf
-import urllib3
+import requests
 from commercetools import CommercetoolsError
 from commercetools.importapi import Client
 from commercetools.importapi.models import (
@@ -34,6 +43,7 @@ from dateutil import parser as dateparser
 from django.core.management.base import no_translations
 from PIL import Image as PILImage
 
+from commerce_coordinator.apps.commercetools.management.commands._product_sync import wait_for_import_containers
 from commerce_coordinator.apps.commercetools.management.commands._timed_command import TimedCommand
 
 # Notes on 'keys':
@@ -50,12 +60,18 @@ from commerce_coordinator.apps.commercetools.management.commands._timed_command
 
 # ##  ssh grmartin@theseus.sandbox.edx.org -L 9200:127.0.0.1:9200
 
-DISCO_DEBUG_ES = True  # Should we print query the query/results/pagination to the console?, This is diagnostic
+DISCO_DEBUG_ES = False  # Should we print query the query/results/pagination to the console?, This is diagnostic
 DISCO_OUTPUT_CURL = False  # Should ES Calls Output Curl Representations for debugging?
-DISCO_MAX_PER_PAGE = 1  # Max ES Results per page
+DISCO_MAX_PER_PAGE = 500  # Max ES Results per page
+DISCO_TIMEOUT = 30  # Seconds to wait on Discovery ES or a course image
 
 COMMTOOLS_MAX_PER_BATCH = 180000  # Split between 180,000 items (limit is 200,000 but i like margins for error)
-COMMTOOLS_DRAFT_GRANULARITY = 25  # How many we send to a batch container in a granular fashion
+COMMTOOLS_DRAFT_GRANULARITY = 20  # How many we send to a batch container per request (the Import API maximum)
+
+FIXTURE_IMAGE_DIMENSIONS = (378, 225)  # Size of the images served in --fixtures mode unless images.json says otherwise
+
+IMAGE_PROBE_BYTES = 16 * 1024  # Leading bytes of a course image fetched to read its dimensions from the header
+IMAGE_DIMENSION_CACHE = os.path.join(tempfile.gettempdir(), 'import_discovery_image_dimensions.json')
 
 
 def ls(string_dict) -> LocalizedString:  # forced return typehint/coercion intentional to avoid bad IDE warnings
@@ -119,9 +135,12 @@ class IdentifierProtection:
     FAILURE_IS_FATAL = True
 
     # this might need to be SQLite or something long term... but for now, in mem.
-    key_name_inventory = []
-    slug_inventory = []
-    sku_inventory = []
+    key_name_inventory = set()
+    slug_inventory = set()
+    sku_inventory = set()
+
+    # Products are built by several threads, so checking and recording an identifier must happen atomically
+    lock = threading.RLock()
 
     @staticmethod
     def fail_if_needed(message='Validation failed', force=False):
@@ -141,36 +160,39 @@ class IdentifierProtection:
     def key_or_name(self, key):
         self.must_prefix(key)
 
-        if key in self.key_name_inventory:
-            self.fail_if_needed(f"The key/name {key} is being reused.")
+        with self.lock:
+            if key in self.key_name_inventory:
+                self.fail_if_needed(f"The key/name {key} is being reused.")
 
-        if not re.match('^[A-Za-z0-9_-]{2,256}$', key):
-            self.fail_if_needed(f"The key/name {key} is not valid.")
+            if not re.match('^[A-Za-z0-9_-]{2,256}$', key):
+                self.fail_if_needed(f"The key/name {key} is not valid.")
 
-        self.key_name_inventory.append(key)
+            self.key_name_inventory.add(key)
 
         return key
 
     def sku(self, sku):
         self.must_prefix(sku)
 
-        if sku in self.sku_inventory:
-            self.fail_if_needed(f"The key/name {sku} is being reused.")
+        with self.lock:
+            if sku in self.sku_inventory:
+                self.fail_if_needed(f"The key/name {sku} is being reused.")
 
-        self.sku_inventory.append(sku)
+            self.sku_inventory.add(sku)
 
         return sku
 
     def slug(self, slug):
         self.must_prefix(slug)
 
-        if slug in self.slug_inventory:
-            self.fail_if_needed(f"The slug {slug} is being reused.")
+        with self.lock:
+            if slug in self.slug_inventory:
+                self.fail_if_needed(f"The slug {slug} is being reused.")
 
-        if not re.match('^[a-zA-Z0-9_-]{2,256}$', slug):
-            self.fail_if_needed(f"The slug {slug} is not valid.")
+            if not re.match('^[a-zA-Z0-9_-]{2,256}$', slug):
+                self.fail_if_needed(f"The slug {slug} is not valid.")
 
-        self.slug_inventory.append(slug)
+            self.slug_inventory.add(slug)
 
         return slug
 
@@ -249,8 +271,8 @@ class BatchAccumulator:
         self.num_items = 0
         return result
 
-    def increment(self):
-        self.num_items = self.num_items + 1
+    def increment(self, count=1):
+        self.num_items = self.num_items + count
 
     def need_new_container(self):
         if self.num_items >= COMMTOOLS_MAX_PER_BATCH:
@@ -386,6 +408,256 @@ class EdxCourseAttributes:
     )
 
 
+def prefetch(iterable, depth):
+    """ Iterate `iterable` in a background thread, staying at most `depth` items ahead of the consumer. """
+    items = queue.Queue(maxsize=depth)
+    done = object()
+
+    def _produce():
+        try:
+            for item in iterable:
+                items.put((item, None))
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            items.put((None, exc))
+        items.put((done, None))
+
+    # Iterated in a copy of the caller's context, so it keeps the caller's outbound priority
+    threading.Thread(target=contextvars.copy_context().run, args=(_produce,), daemon=True).start()
+
+    while True:
+        item, error = items.get()
+        if error:
+            raise error
+        if item is done:
+            return
+        yield item
+
+
+def bounded_map(executor, func, items, max_pending):
+    """
+    Submit `func(item)` to `executor` for each item, yielding `(item, future)` pairs in submission order.
+
+    At most `max_pending` calls are queued or running at once, so a slow stage holds back the stage feeding it
+    instead of buffering everything that stage produces. Waiting on each future is left to the caller. Each call
+    runs in a copy of the caller's context, so it keeps the caller's outbound priority.
+    """
+    pending = deque()
+
+    for item in items:
+        pending.append((item, executor.submit(contextvars.copy_context().run, func, item)))
+
+        if len(pending) >= max_pending:
+            yield pending.popleft()
+
+    while pending:
+        yield pending.popleft()
+
+
+class DiscoverySearch:
+    """ Discovery's Elasticsearch _search API """
+
+    def __init__(self, host, session):
+        self.host = host
+        self.session = session
+
+    def search(self, index, query):
+        if DISCO_OUTPUT_CURL:
+            print(
+                console_indent_multiline_text(
+                    f"""ES cURL: curl "{self.host}/{index}/_search?pretty=true"\\
+                                        -H 'Content-Type: application/json'\\
+                                        -d '{json.dumps(query)}'"""
+                )
+            )
+
+        # Sending JSON sets the Content-Type header, which is req'd if ES ver >= 6
+        response = self.session.get(f"{self.host}/{index}/_search", json=query, timeout=DISCO_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+
+class RecordedDiscoverySearch:
+    """
+    Discovery search over recorded ES hits, so imports can be run and benchmarked offline.
+
+    The fixture directory holds a `<index>.json` file per index, each either a recorded _search response or a list of
+    its hits. Only the queries this command sends are supported: `match_all`, or `terms` on a single field, sorted by
+    the hits' `sort` values and paginated with `search_after`.
+    """
+
+    def __init__(self, fixture_dir):
+        self.hits = {}
+
+        for index in DiscoIndex:
+            path = os.path.join(fixture_dir, f'{index.value}.json')
+
+            if not os.path.exists(path):
+                continue
+
+            with open(path) as f:
+                recorded = json.load(f)
+
+            hits = recorded['hits']['hits'] if isinstance(recorded, dict) else recorded
+
+            for hit in hits:
+                hit.setdefault('sort', [hit['_source']['id']])
+
+            self.hits[index.value] = sorted(hits, key=lambda hit: hit['sort'])
+
+    def search(self, index, query):
+        hits = self.hits.get(index, [])
+
+        if 'terms' in query['query']:
+            ((field, values),) = query['query']['terms'].items()
+            values = set(values)
+            hits = [hit for hit in hits if hit['_source'].get(field) in values]
+
+        if 'search_after' in query:
+            hits = [hit for hit in hits if hit['sort'] > query['search_after']]
+
+        return {'hits': {'hits': hits[:query['size']]}}
+
+
+def iter_discovery_pages(search, index, query, page_size=DISCO_MAX_PER_PAGE):
+    """
+    Yield every page of `index` hits matching `query`, in id order.
+
+    We're using the search_after method, as it's stable:
+        https://www.elastic.co/guide/en/elasticsearch/reference/current/paginate-search-results.html#search-after
+
+    Notes: This uses the N+1/N-1 mechanism for pagination... But it works like this: If we want 20 results, we
+           request 21... if the original result count is bigger than 20, toss the last, and we now know there is
+           more.
+    """
+    query = {**query, 'sort': [{'id': 'asc'}], 'size': page_size + 1}
+
+    while True:
+        if DISCO_DEBUG_ES:
+            print(f"ES Query {index} => {json.dumps(query)}")
+
+        hits = search.search(index, query)['hits']['hits']
+        page = hits[:page_size]
+
+        if DISCO_DEBUG_ES:
+            print(f"ES Return {index} => {len(hits)} hits, done: {len(hits) <= page_size}")
+
+        if page:
+            yield page
+
+        if len(hits) <= page_size:
+            return
+
+        query['search_after'] = page[-1]['sort']
+
+
+def _jpeg_dimensions(data):
+    """ Walk the JPEG segments up to the first Start Of Frame, which holds the dimensions. """
+    i = 2
+
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+
+        marker = data[i + 1]
+
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack('>HH', data[i + 5:i + 9])
+            return width, height
+
+        if 0xD0 <= marker <= 0xD9 or marker == 0x01:  # standalone markers have no length
+            i += 2
+        else:
+            i += 2 + struct.unpack('>H', data[i + 2:i + 4])[0]
+
+    return None
+
+
+def _webp_dimensions(data):
+    chunk = data[12:16]
+
+    if chunk == b'VP8 ' and len(data) >= 30 and data[23:26] == b'\x9d\x01\x2a':
+        width, height = struct.unpack('<HH', data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+
+    if chunk == b'VP8L' and len(data) >= 25 and data[20] == 0x2F:
+        bits = struct.unpack('<I', data[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+
+    if chunk == b'VP8X' and len(data) >= 30:
+        return int.from_bytes(data[24:27], 'little') + 1, int.from_bytes(data[27:30], 'little') + 1
+
+    return None
+
+
+def parse_image_dimensions(data):
+    """
+    Read `(width, height)` from the header of a JPEG, PNG, GIF or WebP image.
+
+    Args:
+        data: The leading bytes of the image, not necessarily all of it
+
+    Returns: `(width, height)`, or None if the format is unknown or `data` stops before the dimensions
+    """
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24 and data[12:16] == b'IHDR':
+        return struct.unpack('>II', data[16:24])
+
+    if data[:2] == b'\xff\xd8':
+        return _jpeg_dimensions(data)
+
+    if data[:6] in (b'GIF87a', b'GIF89a') and len(data) >= 10:
+        return struct.unpack('<HH', data[6:10])
+
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return _webp_dimensions(data)
+
+    return None
+
+
+class ImageDimensionCache:
+    """
+    Image dimensions by URL, kept alongside the ETag they were read for and saved as JSON between runs.
+
+    An entry with an ETag is revalidated with a conditional request, so a re-import of unchanged images only
+    transfers their headers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def get(self, url):
+        with self.lock:
+            return self.entries.get(url)
+
+    def put(self, url, etag, width, height):
+        with self.lock:
+            self.entries[url] = {'etag': etag, 'w': width, 'h': height}
+
+    def save(self):
+        if not self.path:
+            return
+
+        with self.lock, open(self.path, 'w') as f:
+            json.dump(self.entries, f)
+
+
+@lru_cache
+def render_fixture_image(width, height):
+    """ PNG bytes of a blank `width`x`height` image, served as course images in --fixtures mode. """
+    buffer = BytesIO()
+    PILImage.new('RGB', (width, height)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
 class Command(TimedCommand):
     help = "Import Discovery Courses to CommerceTools"
 
@@ -411,160 +683,400 @@ class Command(TimedCommand):
         if exit_code != ExitCode.SUCCESS:
             exit(exit_code)
 
-    @staticmethod
-    def fetch_from_discovery(index, last_sort, alter_query=None, **options):
+    def get_image_dimensions(self, url):
         """
-        Invoke Discovery's ES _search API and return it's result
+        Get the Dimensions of an image based on URL
 
         Args:
-            index: Which ES index to use
-            last_sort: The last pagination sort value from the final item in the last call
-            alter_query: A mutator that can modify the query object before it is sent
-                         (you can modify all parts of the query except pagination control)
-            **options: Options (CLI input options) from the main method (`Command.handle`)
+            url: HTTP/S URL to Resource
 
-        Returns: {'expected_num_records':int ,'response':urllib3.BaseHTTPResponse}
+        Returns (AssetDimensions): Dimensions of Image for CommerceTools
 
-        Notes: This uses the N+1/N-1 mechanism for pagination... But it works like this: If we want 20 results, we
-               request 21... if the original result count is bigger than 20, toss the last, and we now know there is
-               more.
+        Notes: Only the first IMAGE_PROBE_BYTES are requested and the dimensions are read from the image header,
+               the whole image is only downloaded (and decoded with PIL) if that isn't enough. Cached dimensions
+               are revalidated against the image's ETag.
         """
-        query_template = """
-        {
-            "query": {"match_all": {}},
-            "sort": [
-                {"id": "asc"}
-            ]
-        }
+        cached = self.image_cache.get(url)
+        headers = {'Range': f'bytes=0-{IMAGE_PROBE_BYTES - 1}'}
+
+        if cached and cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+
+        response = self.session.get(url, headers=headers, timeout=DISCO_TIMEOUT)
+
+        if response.status_code == 304:
+            return AssetDimensions(w=cached['w'], h=cached['h'])
+
+        response.raise_for_status()
+        dimensions = parse_image_dimensions(response.content)
+
+        if not dimensions:
+            if response.status_code == 206:  # we only have part of it, so get the rest
+                response = self.session.get(url, timeout=DISCO_TIMEOUT)
+                response.raise_for_status()
+
+            im = PILImage.open(BytesIO(response.content))
+            dimensions = (im.width, im.height)
+
+        self.image_cache.put(url, response.headers.get('ETag'), *dimensions)
+        return AssetDimensions(w=dimensions[0], h=dimensions[1])
+
+    def iter_courses(self):
         """
+        Yield `(course, course_runs)` for every Discovery course.
 
-        query = json.loads(query_template)
+        The runs of a whole page of courses are fetched with one (paginated) `terms` query, rather than a query
+        per course.
+        """
+        for courses in iter_discovery_pages(self.search, DiscoIndex.COURSES.value, {'query': {'match_all': {}}},
+                                            self.options['page_size']):
+            course_keys = [course['_source']['key'] for course in courses]
+            course_runs = defaultdict(list)
 
-        query['size'] = DISCO_MAX_PER_PAGE + 1  # We have to use the n-1 trick to determine if end of search.
+            for runs in iter_discovery_pages(self.search, DiscoIndex.COURSE_RUNS.value,
+                                             {'query': {'terms': {'course_key': course_keys}}},
+                                             self.options['page_size']):
+                for crun in runs:
+                    course_runs[crun['_source']['course_key']].append(crun['_source'])
 
-        if alter_query:
-            query = alter_query(query)
+            for course in courses:
+                yield course['_source'], course_runs[course['_source']['key']]
 
-        if last_sort:
-            last_sort_proper = [last_sort]
+    def build_product_draft(self, course_and_runs):
+        """ Transform a Discovery course and its runs to a ProductDraftImport, None if there is nothing to sell. """
+        course_data, course_runs = course_and_runs
 
-            if isinstance(last_sort, list):
-                last_sort_proper = last_sort
+        course_search_text = ls({'en': clean_search_text(course_data['text'])})
+        master_variant = None
+        variants = []
 
-            query['search_after'] = last_sort_proper
+        course_key = KeyGen.product(course_data['uuid'])
 
-        if DISCO_DEBUG_ES:
-            print(f"ES Query {index} => {json.dumps(query)}")
+        print(f'Processing Product (Course): {course_key} / {course_data["title"]}')
 
-        if DISCO_OUTPUT_CURL:
-            print(
-                console_indent_multiline_text(
-                    f"""ES cURL: curl "{options['discovery_host']}/{index}/_search?pretty=true"\\
-                                        -H 'Content-Type: application/json'\\
-                                        -d '{json.dumps(query)}'"""
+        for course_run_data in course_runs:
+            if not course_run_data['has_enrollable_paid_seats']:
+                continue
+
+            # Using the script start date will be more efficient
+            script_start = self.start
+            # some dates from ES aren't formatted EXACTLY as the datetime.date.fromisostring() call wants.
+
+            crun_start = dateparser.parse(
+                course_run_data['enrollment_start'] or course_run_data['start']
+            )
+            crun_end = dateparser.parse(
+                course_run_data['enrollment_end'] or course_run_data['paid_seat_enrollment_end']
+            )
+
+            variant_object = self.build_product_variant(course_data, course_search_text, course_run_data,
+                                                        crun_start, crun_end)
+
+            if is_date_between(script_start, crun_start, crun_end):
+                master_variant = variant_object
+            else:
+                variants.append(variant_object)
+
+        if len(variants) == 0 and not master_variant:
+            return None  # This explodes... as the blank variant it creates has no data. So lets skip for now.
+
+        # We need a master variant, so if we cant determine one, let's just pop one off
+        if not master_variant and len(variants) >= 1:
+            master_variant = variants.pop()
+
+        return ProductDraftImport(
+            key=course_key,
+            product_type=ProductTypeKeyReference(key=self.course_product_type_key),
+            name=ls({"en": course_data['title']}),
+            slug=ls({"en": KeyGen.product_slug(course_data['uuid'])}),
+            publish=True,
+            variants=variants,
+            master_variant=master_variant,
+        )
+
+    def build_product_variant(self, course_data, course_search_text, course_run_data, crun_start, crun_end):
+        images = []
+
+        variant_key = KeyGen.product_variant(course_run_data['slug'])
+        variant_sku = KeyGen.sku(course_run_data['first_enrollable_paid_seat_sku'])
+
+        print(f'Processing Product Variant (Course Run): {variant_key} / {variant_sku}')
+
+        # noinspection PyBroadException
+        try:
+            images.append(Image(
+                url=course_run_data['image_url'],
+                dimensions=self.get_image_dimensions(course_run_data['image_url']),
+                label="edX Course Tile Image"
+            ))
+        except Exception as _:  # pylint: disable=broad-exception-caught
+            pass
+
+        return ProductVariantDraftImport(
+            key=variant_key,
+            sku=variant_sku,
+            images=images,
+            prices=[
+                PriceDraftImport(
+                    value=TypedMoney(
+                        type=MoneyType.CENT_PRECISION,
+                        cent_amount=course_run_data['first_enrollable_paid_seat_price'] * 100,
+                        currency_code='USD'
+                    ),
+                    valid_from=crun_start,
+                    valid_until=crun_end,
+                    key=KeyGen.product_variant_price(course_run_data['first_enrollable_paid_seat_sku'])
                 )
+            ],
+            attributes=[
+                TextAttribute(
+                    name=EdxCourseAttributes.product_type_course_id.name,
+                    value=course_data['key']
+                ),
+                TextAttribute(
+                    name=EdxCourseAttributes.product_type_course_uuid.name,
+                    value=course_data['uuid']
+                ),
+                LocalizableTextAttribute(
+                    name=EdxCourseAttributes.product_type_search_text.name,
+                    value=course_search_text
+                ),
+                TextAttribute(
+                    name=EdxCourseAttributes.product_type_es_json.name,
+                    value=json.dumps(course_data)
+                ),
+                TextAttribute(
+                    name=EdxCourseAttributes.variant_course_run_id.name,
+                    value=course_run_data['key']
+                ),
+                TextAttribute(
+                    name=EdxCourseAttributes.variant_course_run_uuid.name,
+                    value=course_run_data['uuid']
+                ),
+                LocalizableTextAttribute(
+                    name=EdxCourseAttributes.variant_search_text.name,
+                    value=ls({'en': clean_search_text(course_run_data['text'])})
+                ),
+                TextAttribute(
+                    name=EdxCourseAttributes.variant_es_json.name,
+                    value=json.dumps(course_run_data)
+                ),
+                TextAttribute(
+                    name=TwoUCourseAttributes.product_type_2u_fulfillment_system.name,
+                    value="LMS"
+                ),
+                TextAttribute(
+                    name=TwoUCourseAttributes.product_type_2u_lob.name,
+                    value="edX"
+                ),
+            ]
+        )
+
+    def create_container(self):
+        """ Start a new import container (future items are batched into it) and return its key. """
+        container_key = self.accumulator.generate_container_name()
+
+        print(f'Batching to new container (future items): {container_key}')
+
+        if not self.options['dry_run']:
+            self.import_client.import_containers().post(
+                body=ImportContainerDraft(key=container_key, resource_type=ImportResourceType.PRODUCT_DRAFT)
             )
 
-        return {
-            'expected_num_records': query['size'] - 1,  # adjust for N-1
-            'response': urllib3.request(
-                'GET',
-                f"{options['discovery_host']}/{index}/_search",
-                headers={"Content-Type": "application/json"},  # Req'd if ES ver >= 6
-                body=json.dumps(query)
-            ),
-            'index': index  # debug info
-        }
+        self.container_keys.append(container_key)
+        return container_key
+
+    def post_product_drafts(self, container_key_and_drafts):
+        container_key, drafts = container_key_and_drafts
+
+        print(f'Posting {len(drafts)} Products to {container_key}')
+
+        # How to debug: uncomment below, or put a breakpoint() here and execute the following in PDB:
+        # print(json.dumps(ProductDraftImportRequest(resources=drafts).serialize()))
+
+        if not self.options['dry_run']:
+            self.import_client.product_drafts().import_containers().with_import_container_key_value(
+                container_key
+            ).post(ProductDraftImportRequest(resources=drafts))
+
+    def import_product_type(self, container_key):
+        print(f'Importing Product Type: {self.course_product_type_key}')
+
+        if self.options['dry_run']:
+            return
+
+        self.import_client.product_types().import_containers().with_import_container_key_value(container_key).post(
+            ProductTypeImportRequest(resources=[
+                ProductTypeImport(
+                    key=self.course_product_type_key,
+                    name='edX Single Course',
+                    description='A single edX LMS Course with Verification/Certification',
+                    attributes=[
+                        EdxCourseAttributes.product_type_course_id,
+                        EdxCourseAttributes.product_type_course_uuid,
+                        EdxCourseAttributes.product_type_search_text,
+                        EdxCourseAttributes.product_type_es_json,
+                        EdxCourseAttributes.variant_course_run_id,
+                        EdxCourseAttributes.variant_course_run_uuid,
+                        EdxCourseAttributes.variant_search_text,
+                        EdxCourseAttributes.variant_es_json,
+                        TwoUCourseAttributes.product_type_2u_lob,
+                        TwoUCourseAttributes.product_type_2u_fulfillment_system
+                    ]
+                )
+            ])
+        )
 
-    @staticmethod
-    def es_result_pagination_return(combined_es_result, result_key_name):
-        expected_size = combined_es_result['expected_num_records']
-        es_result = combined_es_result['response']
-        index = combined_es_result['index']
+    def run_pipeline(self, container_key):
+        """
+        Import every course through three bounded, concurrent stages:
 
-        result = es_result.json()
+        - fetch: a background thread pages courses and their runs out of Discovery
+        - transform: `workers` threads build product drafts, probing course images as they go
+        - submit: `submit_workers` threads post the drafts to the import containers, COMMTOOLS_DRAFT_GRANULARITY per
+          request
 
-        if DISCO_DEBUG_ES:
-            print(f"ES Return {index} => {result}")
+        Returns: the number of draft requests that failed to post
+        """
+        workers = self.options['workers']
+        submit_workers = self.options['submit_workers']
+        failed_posts = 0
+        drafts = []
 
-        data_records = result['hits']['hits']
-        num_original_recs = len(data_records)
+        def _submit(batch):
+            nonlocal container_key
 
-        data_records = data_records[0:expected_size]
+            if self.accumulator.need_new_container():
+                # we cant add more to this container, so build a new one for this and future batches
+                container_key = self.create_container()
 
-        pagination_control_value = None
+            self.accumulator.increment(sum(1 + len(draft.variants) for draft in batch))
+            request = (container_key, batch)
+            future = posters.submit(contextvars.copy_context().run, self.post_product_drafts, request)
+            submissions.append((request, future))
 
-        if len(data_records) > 0:
-            pagination_control_value = data_records[-1]['sort']
+        def _collect_submissions(max_pending):
+            nonlocal failed_posts
 
-        return_value = {
-            result_key_name: data_records,
-            'done': num_original_recs <= expected_size,
-            'pagination_control_value': pagination_control_value
-        }
+            while len(submissions) > max_pending:
+                (key, batch), future = submissions.popleft()
+                error = future.exception()
 
-        if DISCO_DEBUG_ES:
-            print(f"ES Pagination Result {index} => {return_value}")
+                if isinstance(error, CommercetoolsError):
+                    print(f"*** ERROR posting {len(batch)} Products to {key} => {error}")
+                    print(f"*** DETAILS => {error.errors}\n\n")
+                    failed_posts += 1
+                elif error:
+                    raise error
 
-        return return_value
+        courses = prefetch(self.iter_courses(), depth=self.options['page_size'])
+        submissions = deque()
 
-    @staticmethod
-    def get_course_runs(parent_course_key, last_sort_index=None, **options):
-        def _mutator(es_query):
-            """ Let's ensure were only getting the pertinent subset of course_runs for the subject """
+        with ThreadPoolExecutor(workers) as builders, ThreadPoolExecutor(submit_workers) as posters:
+            for (course_data, _), future in bounded_map(builders, self.build_product_draft, courses, workers * 2):
+                try:
+                    draft = future.result()
+                except Exception as exc:  # pylint: disable=broad-exception-caught
+                    print(f'*** ERROR building Product for course {course_data["key"]} => {exc}')
+                    continue
 
-            es_query['query'] = {'match': {'course_key': parent_course_key}}
+                if draft is None:
+                    continue
 
-            return es_query
+                drafts.append(draft)
 
-        return Command.es_result_pagination_return(Command.fetch_from_discovery(
-            DiscoIndex.COURSE_RUNS.value, last_sort_index, alter_query=_mutator, **options
-        ), 'runs')
+                if len(drafts) == COMMTOOLS_DRAFT_GRANULARITY:
+                    _submit(drafts)
+                    drafts = []
+                    _collect_submissions(submit_workers * 2)
 
-    @staticmethod
-    def get_courses(last_sort_index=None, **options):
-        # TODO: Determine if done to support pagination, were using the search_after method (as its stable)
-        #    https://www.elastic.co/guide/en/elasticsearch/reference/current/paginate-search-results.html#search-after
+            if drafts:
+                _submit(drafts)
 
-        return Command.es_result_pagination_return(Command.fetch_from_discovery(
-            DiscoIndex.COURSES.value, last_sort_index, **options
-        ), 'courses')
+            _collect_submissions(0)
 
-    @staticmethod
-    def get_image_dimensions(url):
-        """
-        Get the Dimensions of an image based on URL
+        return failed_posts
 
-        Args:
-            url: HTTP/S URL to Resource
+    def wait_for_import(self):
+        """ Poll the import summary of every container, concurrently, until commercetools has processed them. """
+        return wait_for_import_containers(self.import_client, self.container_keys, self.options['status_interval'],
+                                          self.options['status_timeout'], self.options['submit_workers'])
 
-        Returns (AssetDimensions): Dimensions of Image for CommerceTools
+    def serve_fixture_images(self, fixture_dir):
+        """ Serve every image this command fetches from a mock, sized per `images.json` in the fixture directory. """
+        # Only --fixtures runs need requests_mock, which production has only as a commercetools SDK dependency
+        import requests_mock  # pylint: disable=import-outside-toplevel
 
-        """
-        im = PILImage.open(BytesIO(urllib3.request('GET', url).data))
-        return AssetDimensions(w=im.width, h=im.height)
+        dimensions = {}
+        path = os.path.join(fixture_dir, 'images.json')
+
+        if os.path.exists(path):
+            with open(path) as f:
+                dimensions = json.load(f)
+
+        def _image(request, context):
+            width, height = dimensions.get(request.url, FIXTURE_IMAGE_DIMENSIONS)
+            context.headers['ETag'] = f'"{width}x{height}"'
+
+            if request.headers.get('If-None-Match') == context.headers['ETag']:
+                context.status_code = 304
+                return b''
+
+            content = render_fixture_image(width, height)
+            byte_range = re.match(r'bytes=(\d+)-(\d+)', request.headers.get('Range', ''))
+
+            if byte_range:
+                context.status_code = 206
+                return content[int(byte_range[1]):int(byte_range[2]) + 1]
+
+            return content
+
+        mocker = requests_mock.Mocker(session=self.session)
+        mocker.get(requests_mock.ANY, content=_image)
+        return mocker
 
     # Django Overrides
     def add_arguments(self, parser):
         parser.add_argument("discovery_host", nargs="?", type=str, default="http://127.0.0.1:9200")
-        pass
+        parser.add_argument("--page-size", type=int, default=DISCO_MAX_PER_PAGE, help="Discovery ES results per page")
+        parser.add_argument("--workers", type=int, default=8, help="Courses transformed concurrently")
+        parser.add_argument("--submit-workers", type=int, default=4,
+                            help="Draft requests posted to commercetools concurrently")
+        parser.add_argument("--fixtures", default=None,
+                            help="Directory of recorded Discovery hits to import from instead of Discovery, with "
+                                 "course images served by a mock")
+        parser.add_argument("--image-cache", default=IMAGE_DIMENSION_CACHE,
+                            help="JSON file of course image dimensions kept between runs ('' to not keep them)")
+        parser.add_argument("--dry-run", action="store_true", help="Build the products but don't send them")
+        parser.add_argument("--no-wait", action="store_true", help="Don't wait for commercetools to import them")
+        parser.add_argument("--status-interval", type=float, default=5, help="Seconds between import status checks")
+        parser.add_argument("--status-timeout", type=float, default=600,
+                            help="Seconds to wait for commercetools to import the products")
 
-    # noinspection PyUnreachableCode
     @no_translations
     def handle(self, *args, **options):
-
-        print("This command has been disabled as another team is building this. The file is being retained as a "
-              "reference implementation.")
-
-        exit(ExitCode.ABEND)
-
+        self.options = options
+        self.container_keys = []
         self.accumulator = BatchAccumulator(self.start)
-        container_key = self.accumulator.generate_container_name()
+        self.image_cache = ImageDimensionCache(options['image_cache'])
         config = django.conf.settings.COMMERCETOOLS_CONFIG
 
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=options['workers'])
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        if options['fixtures']:
+            print(f'Using recorded Discovery hits: {options["fixtures"]}')
+            self.search = RecordedDiscoverySearch(options['fixtures'])
+            image_server = self.serve_fixture_images(options['fixtures'])
+        else:
+            self.search = DiscoverySearch(options['discovery_host'], self.session)
+            image_server = None
+
         print(f'Using commercetools ImpEx config: {config["projectKey"]} / {config["importUrl"]}')
 
-        import_client = Client(
+        self.import_client = Client(
             client_id=config["clientId"],
             client_secret=config["clientSecret"],
             scope=config["scopes"].split(' '),
@@ -573,241 +1085,30 @@ class Command(TimedCommand):
         ).with_project_key_value(config["projectKey"])
 
         try:
-            print(f'Batching to new container (future items): {container_key}')
-
-            import_client.import_containers().post(
-                body=ImportContainerDraft(key=container_key,
-                                          resource_type=ImportResourceType.PRODUCT_DRAFT)
-            )
+            container_key = self.create_container()
         except CommercetoolsError as err:
             self.handle_commercetools_error(err, ExitCode.BAD_FIRST_CONTAINER)
 
-        container = import_client.import_containers().with_import_container_key_value(container_key).get()
-
-        print(container)
-
         try:
-            print(f'Importing Product Type: {self.course_product_type_key}')
-            import_client.product_types().import_containers().with_import_container_key_value(container_key).post(
-                ProductTypeImportRequest(resources=[
-                    ProductTypeImport(
-                        key=self.course_product_type_key,
-                        name='edX Single Course',
-                        description='A single edX LMS Course with Verification/Certification',
-                        attributes=[
-                            EdxCourseAttributes.product_type_course_id,
-                            EdxCourseAttributes.product_type_course_uuid,
-                            EdxCourseAttributes.product_type_search_text,
-                            EdxCourseAttributes.product_type_es_json,
-                            EdxCourseAttributes.variant_course_run_id,
-                            EdxCourseAttributes.variant_course_run_uuid,
-                            EdxCourseAttributes.variant_search_text,
-                            EdxCourseAttributes.variant_es_json,
-                            TwoUCourseAttributes.product_type_2u_lob,
-                            TwoUCourseAttributes.product_type_2u_fulfillment_system
-                        ]
-                    )
-                ])
-            )
+            self.import_product_type(container_key)
             self.accumulator.increment()
         except CommercetoolsError as err:
             self.handle_commercetools_error(err, ExitCode.BAD_PROD_TYPE_BATCH)
 
-        product_drafts = []
+        if image_server:
+            with image_server:
+                failed_posts = self.run_pipeline(container_key)
+        else:
+            failed_posts = self.run_pipeline(container_key)
 
-        def _post_product_drafts(drafts):
-            try:
-                print(f'Posting Products to {container_key}')
+        self.image_cache.save()
 
-                # How to debug: put a breakpoint() here and execute the following in PDB:
-                #   Or, y'know just uncomment below and comment out or bp before the post... Your call.
-                # print(json.dumps(ProductDraftImportRequest(resources=product_drafts).serialize()))
+        print(f'Submitted {self.accumulator.num_containers} containers: {", ".join(self.container_keys)}')
 
-                import_client.product_drafts().import_containers().with_import_container_key_value(container_key).post(
-                    ProductDraftImportRequest(resources=drafts)
-                )
-            except CommercetoolsError as error:
-                self.handle_commercetools_error(error, ExitCode.BAD_DRAFT_POST)
-
-        continue_courses = True
-        es_course_tracking_last_sort = None
-
-        while continue_courses:
-            es_course_tracking = self.get_courses(es_course_tracking_last_sort, **options)
-            es_course_tracking_last_sort = es_course_tracking['pagination_control_value']
-
-            continue_courses = not es_course_tracking['done']  # next run
-
-            for course in es_course_tracking['courses']:
-                course_data = course['_source']
-
-                course_search_text = ls({'en': clean_search_text(course_data['text'])})
-                master_variant = None
-                variants = []
-
-                course_key = KeyGen.product(course_data['uuid'])
-
-                print(f'Processing Product (Course): {course_key} / {course_data["title"]}')
-
-                continue_course_runs = True
-                es_course_run_tracking_last_sort = None
-
-                while continue_course_runs:
-
-                    es_course_run_tracking = self.get_course_runs(
-                        course_data['key'], es_course_run_tracking_last_sort, **options)
-
-                    es_course_run_tracking_last_sort = es_course_run_tracking['pagination_control_value']
-
-                    continue_course_runs = not es_course_run_tracking['done']  # next run
-
-                    for crun in es_course_run_tracking['runs']:
-                        course_run_data = crun['_source']
-
-                        if not course_run_data['has_enrollable_paid_seats']:
-                            continue
-
-                        # Using the script start date will be more efficient
-                        script_start = self.start
-                        # some dates from ES aren't formatted EXACTLY as the datetime.date.fromisostring() call wants.
-
-                        crun_start = dateparser.parse(
-                            course_run_data['enrollment_start'] or course_run_data['start']
-                        )
-                        crun_end = dateparser.parse(
-                            course_run_data['enrollment_end'] or course_run_data['paid_seat_enrollment_end']
-                        )
-
-                        images = []
-
-                        variant_key = KeyGen.product_variant(course_run_data['slug'])
-                        variant_sku = KeyGen.sku(course_run_data['first_enrollable_paid_seat_sku'])
-
-                        print(f'Processing Product Variant (Course Run): {variant_key} / {variant_sku}')
-
-                        # noinspection PyBroadException
-                        try:
-                            images.append(Image(
-                                url=course_run_data['image_url'],
-                                dimensions=self.get_image_dimensions(course_run_data['image_url']),
-                                label="edX Course Tile Image"
-                            ))
-                        except Exception as _:
-                            pass
-
-                        variant_object = ProductVariantDraftImport(
-                            key=variant_key,
-                            sku=variant_sku,
-                            images=images,
-                            prices=[
-                                PriceDraftImport(
-                                    value=TypedMoney(
-                                        type=MoneyType.CENT_PRECISION,
-                                        cent_amount=course_run_data['first_enrollable_paid_seat_price'] * 100,
-                                        currency_code='USD'
-                                    ),
-                                    valid_from=crun_start,
-                                    valid_until=crun_end,
-                                    key=KeyGen.product_variant_price(course_run_data['first_enrollable_paid_seat_sku'])
-                                )
-                            ],
-                            attributes=[
-                                TextAttribute(
-                                    name=EdxCourseAttributes.product_type_course_id.name,
-                                    value=course_data['key']
-                                ),
-                                TextAttribute(
-                                    name=EdxCourseAttributes.product_type_course_uuid.name,
-                                    value=course_data['uuid']
-                                ),
-                                LocalizableTextAttribute(
-                                    name=EdxCourseAttributes.product_type_search_text.name,
-                                    value=course_search_text
-                                ),
-                                TextAttribute(
-                                    name=EdxCourseAttributes.product_type_es_json.name,
-                                    value=json.dumps(course_data)
-                                ),
-                                TextAttribute(
-                                    name=EdxCourseAttributes.variant_course_run_id.name,
-                                    value=course_run_data['key']
-                                ),
-                                TextAttribute(
-                                    name=EdxCourseAttributes.variant_course_run_uuid.name,
-                                    value=course_run_data['uuid']
-                                ),
-                                LocalizableTextAttribute(
-                                    name=EdxCourseAttributes.variant_search_text.name,
-                                    value=ls({'en': clean_search_text(course_run_data['text'])})
-                                ),
-                                TextAttribute(
-                                    name=EdxCourseAttributes.variant_es_json.name,
-                                    value=json.dumps(course_run_data)
-                                ),
-                                TextAttribute(
-                                    name=TwoUCourseAttributes.product_type_2u_fulfillment_system.name,
-                                    value="LMS"
-                                ),
-                                TextAttribute(
-                                    name=TwoUCourseAttributes.product_type_2u_lob.name,
-                                    value="edX"
-                                ),
-                            ]
-                        )
-                        self.accumulator.increment()
-
-                        if is_date_between(script_start, crun_start, crun_end):
-                            master_variant = variant_object
-                        else:
-                            variants.append(variant_object)
-
-                should_publish = True
-
-                if len(variants) == 0 and not master_variant:
-                    should_publish = False
-
-                if not should_publish:
-                    continue  # This explodes... as the blank variant it creates has no data. So lets skip for now.
-
-                # We need a master variant, so if we cant determine one, let's just pop one off
-                if not master_variant and len(variants) >= 1:
-                    master_variant = variants.pop()
-
-                self.accumulator.increment()
-                product_drafts.append(ProductDraftImport(
-                    key=course_key,
-                    product_type=ProductTypeKeyReference(key=self.course_product_type_key),
-                    name=ls({"en": course_data['title']}),
-                    slug=ls({"en": KeyGen.product_slug(course_data['uuid'])}),
-                    publish=should_publish,
-                    variants=variants,
-                    master_variant=master_variant,
-                ))
-
-                if not continue_courses:  # were done, and we don't need a new container
-                    _post_product_drafts(product_drafts)
-                    return  # were done
-
-                if self.accumulator.need_new_container():
-                    # were not done yet, but we cant add more, so post, clear and build a new container
-                    _post_product_drafts(product_drafts)
-
-                    product_drafts = []
-
-                    container_key = self.accumulator.generate_container_name()
-
-                    print(f'Batching to new container (future items): {container_key}')
-
-                    try:
-                        import_client.import_containers().post(
-                            body=ImportContainerDraft(key=container_key,
-                                                      resource_type=ImportResourceType.PRODUCT_DRAFT)
-                        )
-                    except CommercetoolsError as err:
-                        self.handle_commercetools_error(err, ExitCode.BAD_BATCH_CONTAINER)
-
-                if len(product_drafts) == COMMTOOLS_DRAFT_GRANULARITY:
-                    # we have decided max payloads to the container should be COMMTOOLS_DRAFT_GRANULARITY
-                    _post_product_drafts(product_drafts)
-
-                    product_drafts = []
+        if failed_posts:
+            print(f'*** {failed_posts} draft requests failed to post')
+            self.print_reporting_time()
+            exit(ExitCode.BAD_DRAFT_POST)
+
+        if not (options['dry_run'] or options['no_wait']):
+            self.wait_for_import()
@@ -36,7 +36,8 @@ class Command(CommercetoolsAPIClientCommand):
         tup = self.ct_api_client.get_orders_for_customer(
             edx_lms_user_id=edx_lms_user_id,
             limit=MAX_RESULTS + 1,
-            offset=offset
+            offset=offset,
+            lazy=True,
         )
 
         ret = tup[0]
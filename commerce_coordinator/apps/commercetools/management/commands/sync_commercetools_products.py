@@ -0,0 +1,66 @@
+import json
+
+import django.conf
+from commercetools.importapi import Client
+
+from commerce_coordinator.apps.commercetools.management.commands._ct_api_client_command import (
+    CommercetoolsAPIClientCommand
+)
+from commerce_coordinator.apps.commercetools.management.commands._product_sync import ProductSync, current_product_state
+
+
+class Command(CommercetoolsAPIClientCommand):
+    help = "Sync commercetools products to a JSON file of desired products, importing only what changed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("products_file", type=str,
+                            help="JSON list of Import API shaped products, see ProductSync for the format")
+        parser.add_argument("--workers", type=int, default=8, help="Import requests posted concurrently")
+        parser.add_argument("--page-size", type=int, default=500, help="Products per catalog query")
+        parser.add_argument("--dry-run", action="store_true", help="Work out the changes but don't import them")
+        parser.add_argument("--no-wait", action="store_true", help="Don't wait for commercetools to import them")
+        parser.add_argument("--status-interval", type=float, default=5, help="Seconds between import status checks")
+        parser.add_argument("--status-timeout", type=float, default=600,
+                            help="Seconds to wait for commercetools to import the changes")
+
+    def handle(self, *args, **options):
+        with open(options['products_file']) as f:
+            desired = {product['key']: product for product in json.load(f)}
+
+        print(f'Comparing {len(desired)} products to the catalog')
+
+        current = self.ct_api_client.iter_query(
+            "products", page_size=options['page_size'], projection=current_product_state
+        )
+        resources = ProductSync.diff(desired, current)
+
+        print('Changes: ' + (', '.join(f'{len(items)} {kind}' for kind, items in resources.items()) or 'none'))
+
+        if not resources:
+            return
+
+        config = django.conf.settings.COMMERCETOOLS_CONFIG
+        import_client = Client(
+            client_id=config["clientId"],
+            client_secret=config["clientSecret"],
+            scope=config["scopes"].split(' '),
+            url=config["importUrl"],
+            token_url=config["authUrl"],
+        ).with_project_key_value(config["projectKey"])
+
+        sync = ProductSync(
+            import_client,
+            f'edx-container-product_sync_{self.start.strftime("%Y_%m_%d_%H_%M_%S")}',
+            workers=options['workers'],
+            dry_run=options['dry_run'],
+        )
+        failures = sync.submit(resources)
+
+        for failure in failures:
+            container_key, resource_type, batch = failure.item
+            print(f'*** ERROR posting {len(batch)} {resource_type} resources to {container_key} => {failure.error}')
+
+        print(f'Submitted to {len(sync.container_keys)} containers: {", ".join(sync.container_keys)}')
+
+        if not (options['dry_run'] or options['no_wait']):
+            sync.wait(options['status_interval'], options['status_timeout'])
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.24 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerIndex',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lms_user_id', models.IntegerField(unique=True)),
+                ('customer_id', models.CharField(max_length=36)),
+                ('customer_version', models.PositiveIntegerField()),
+                ('modified', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'customer index',
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+""" Commercetools models. """
+
+from django.db import models
+
+
+class CustomerIndex(models.Model):
+    """
+    Local index of LMS user ID to Commercetools Customer.
+
+    Commercetools can only find a customer by LMS user ID through a custom field query, which it can't serve from an
+    index, so we keep the mapping here. It's only ever a hint: `CommercetoolsAPIClient.get_customer_by_lms_user`
+    fetches the customer by ID and checks the LMS user ID still matches before using an entry.
+
+    .. no_pii:
+    """
+    lms_user_id = models.IntegerField(unique=True)
+    customer_id = models.CharField(max_length=36)
+    customer_version = models.PositiveIntegerField()
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'customer index'
+
+    def __str__(self):
+        return f'LMS user {self.lms_user_id} => CT customer {self.customer_id} v{self.customer_version}'
+
+    @classmethod
+    def record(cls, lms_user_id, customer):
+        """ Point `lms_user_id` at `customer`, replacing any existing entry. """
+        return cls.objects.update_or_create(
+            lms_user_id=lms_user_id,
+            defaults={'customer_id': customer.id, 'customer_version': customer.version},
+        )[0]
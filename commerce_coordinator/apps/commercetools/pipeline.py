@@ -5,7 +5,6 @@ import decimal
 from datetime import datetime
 from logging import getLogger
 
-import attrs
 from commercetools import CommercetoolsError
 from commercetools.platform.models import ReturnPaymentState
 from django.conf import settings
@@ -16,6 +15,7 @@ from requests import HTTPError
 from commerce_coordinator.apps.commercetools.catalog_info.constants import (
     EDX_PAYPAL_PAYMENT_INTERFACE_NAME,
     EDX_STRIPE_PAYMENT_INTERFACE_NAME,
+    OrderReadProfiles,
     TwoUKeys
 )
 from commerce_coordinator.apps.commercetools.catalog_info.edx_utils import (
@@ -24,8 +24,9 @@ from commerce_coordinator.apps.commercetools.catalog_info.edx_utils import (
 )
 from commerce_coordinator.apps.commercetools.clients import CommercetoolsAPIClient
 from commerce_coordinator.apps.commercetools.constants import COMMERCETOOLS_ORDER_MANAGEMENT_SYSTEM
-from commerce_coordinator.apps.commercetools.data import order_from_commercetools
+from commerce_coordinator.apps.commercetools.data import order_dict_from_commercetools
 from commerce_coordinator.apps.commercetools.utils import create_retired_fields, has_full_refund_transaction
+from commerce_coordinator.apps.core.circuit_breaker import CircuitOpenError
 from commerce_coordinator.apps.core.constants import PipelineCommand
 from commerce_coordinator.apps.core.exceptions import InvalidFilterType
 from commerce_coordinator.apps.rollout.utils import (
@@ -55,6 +56,10 @@ class GetCommercetoolsOrders(PipelineStep):
         if not is_redirect_to_commercetools_enabled_for_user(request):
             return PipelineCommand.CONTINUE.value
 
+        offset = params.get("offsets", {}).get(
+            COMMERCETOOLS_ORDER_MANAGEMENT_SYSTEM, params["page"] * params["page_size"]
+        )
+
         try:
             ct_api_client = CommercetoolsAPIClient()
             ct_orders = ct_api_client.get_orders_for_customer(
@@ -63,17 +68,18 @@ class GetCommercetoolsOrders(PipelineStep):
                 username=params["username"],
                 edx_lms_user_id=params["edx_lms_user_id"],
                 limit=params["page_size"],
-                offset=params["page"] * params["page_size"],
+                offset=offset,
                 cutoff_in_days=params["cutoff_in_days"],
+                lazy=True,
             )
 
             # noinspection PyTypeChecker
-            converted_orders = [attrs.asdict(order_from_commercetools(x, ct_orders[1]))
+            converted_orders = [order_dict_from_commercetools(x, ct_orders[1])
                                 for x in ct_orders[0].results]
 
-            order_data.append(
-                ct_orders[0].rebuild(converted_orders)
-            )
+            order_set = ct_orders[0].rebuild(converted_orders)
+            order_set.source_system = COMMERCETOOLS_ORDER_MANAGEMENT_SYSTEM
+            order_data.append(order_set)
 
             return {
                 "order_data": order_data
@@ -87,6 +93,16 @@ class GetCommercetoolsOrders(PipelineStep):
         except HTTPError as err:
             log.exception(f"[{type(self).__name__}] HTTP Error: {err}")
             return PipelineCommand.CONTINUE.value
+        except CircuitOpenError as err:
+            log.warning(f"[{type(self).__name__}] Skipping commercetools orders: {err}")
+            # An empty set, so the history is served without them and resumes from the same offset on the next page
+            order_data.append({
+                'results': [], 'offset': offset, 'total': offset, 'unavailable': True,
+                'source_system': COMMERCETOOLS_ORDER_MANAGEMENT_SYSTEM,
+            })
+            return {
+                "order_data": order_data
+            }
 
 
 class FetchOrderDetailsByOrderNumber(PipelineStep):
@@ -194,7 +210,8 @@ class FetchOrderDetailsByOrderID(PipelineStep):
             }
 
             if payment:
-                ct_payment = ct_api_client.get_payment_by_key(payment.interface_id)
+                # The order read expands its payments, so this is the current payment resource already
+                ct_payment = payment
                 refund_amount, ct_transaction_interaction_id = get_edx_refund_info(
                     ct_payment, ct_order, filtered_line_item_ids)
                 ret_val['amount_in_dollars'] = refund_amount
@@ -246,7 +263,7 @@ class CreateReturnForCommercetoolsOrder(PipelineStep):
 
         try:
             ct_api_client = CommercetoolsAPIClient()
-            order = ct_api_client.get_order_by_id(order_id=order_id)
+            order = ct_api_client.get_order_by_id(order_id=order_id, expand=OrderReadProfiles.MINIMAL)
 
             if not is_commercetools_line_item_already_created(order, order_line_item_id):
                 returned_order = ct_api_client.create_return_for_order(
@@ -39,6 +39,7 @@ def fulfillment_completed_update_ct_line_item(**kwargs):
         order_id=kwargs["order_id"],
         line_item_id=kwargs["line_item_id"],
         to_state_key=to_state_key,
+        lms_user_id=kwargs.get("lms_user_id"),
     )
 
     return async_result.id
@@ -23,7 +23,9 @@ def fulfill_order_placed_message_signal(**kwargs):
         line_item_state_id=kwargs['line_item_state_id'],
         source_system=kwargs['source_system'],
         message_id=kwargs['message_id'],
-        is_order_fulfillment_forwarding_enabled=kwargs['is_order_fulfillment_forwarding_enabled']
+        is_order_fulfillment_forwarding_enabled=kwargs['is_order_fulfillment_forwarding_enabled'],
+        is_bundle_fulfillment_chord_enabled=kwargs['is_bundle_fulfillment_chord_enabled'],
+        is_bulk_fulfillment_enabled=kwargs['is_bulk_fulfillment_enabled']
     )
     return async_result.id
 
@@ -2,9 +2,10 @@
 Commercetools Subscription Message tasks (Celery)
 """
 
-from celery import Task, shared_task
+from celery import Task, chord, group, shared_task
 from celery.utils.log import get_task_logger
 from commercetools import CommercetoolsError
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from edx_django_utils.cache import TieredCache
 from iso4217 import Currency
@@ -13,6 +14,7 @@ from requests import RequestException
 from commerce_coordinator.apps.commercetools.catalog_info.constants import (
     EDX_PAYPAL_PAYMENT_INTERFACE_NAME,
     EDX_STRIPE_PAYMENT_INTERFACE_NAME,
+    OrderReadProfiles,
     TwoUKeys
 )
 from commerce_coordinator.apps.commercetools.catalog_info.edx_utils import (
@@ -53,10 +55,17 @@ from commerce_coordinator.apps.commercetools.utils import (
     prepare_segment_event_properties,
     send_order_confirmation_email
 )
+from commerce_coordinator.apps.core.cache import bump_order_history_generation
 from commerce_coordinator.apps.core.memcache import safe_key
 from commerce_coordinator.apps.core.segment import track
 from commerce_coordinator.apps.lms.clients import LMSAPIClient
-from commerce_coordinator.apps.order_fulfillment.clients import OrderFulfillmentAPIClient
+from commerce_coordinator.apps.lms.tasks import (
+    fulfill_order_placed_send_enroll_in_course_task,
+    fulfill_order_placed_send_entitlement_task,
+    fulfill_order_placed_send_line_items_task,
+    fulfillment_outcome
+)
+from commerce_coordinator.apps.order_fulfillment.tasks import fulfill_order_bulk_task, fulfill_order_task
 
 User = get_user_model()
 
@@ -65,6 +74,45 @@ User = get_user_model()
 logger = get_task_logger(__name__)
 
 
+# Fulfillment payload fields that the LMS entitlement task does not take
+ENTITLEMENT_TASK_EXCLUDED_FIELDS = ('date_placed', 'provider_id', 'source_system')
+
+
+def send_order_confirmation_email_once(order_id, lms_user_id, user_email, canvas_entry_properties):
+    """
+    Send the order confirmation email unless it has already been sent for this order.
+    """
+    cache_key = safe_key(key=order_id, key_prefix='send_order_confirmation_email', version='1')
+
+    cache_entry = TieredCache.get_cached_response(cache_key)
+
+    if not cache_entry.is_found:  # pragma no cover
+        send_order_confirmation_email(lms_user_id, user_email, canvas_entry_properties)
+        TieredCache.set_all_tiers(cache_key, value="SENT", django_cache_timeout=EMAIL_NOTIFICATION_CACHE_TTL_SECS)
+
+
+def lms_fulfillment_task_kwargs(payload, is_entitlement):
+    """
+    Keyword arguments of the LMS enrollment or entitlement task for one validated line item payload.
+    """
+    if is_entitlement:
+        return {key: value for key, value in payload.items() if key not in ENTITLEMENT_TASK_EXCLUDED_FIELDS}
+    return dict(payload)
+
+
+def lms_fulfillment_signature(payload, is_entitlement):
+    """
+    Celery signature of the LMS fulfillment task for one line item of a bundle fulfillment chord.
+
+    The task leaves the Commercetools line item update to the chord callback and returns its outcome instead.
+    """
+    task = (
+        fulfill_order_placed_send_entitlement_task if is_entitlement
+        else fulfill_order_placed_send_enroll_in_course_task
+    )
+    return task.s(**lms_fulfillment_task_kwargs(payload, is_entitlement), defer_completion_update=True)
+
+
 class FulfillOrderPlacedTaskAfterReturn(Task):    # pylint: disable=abstract-method
     """
     Base class for fulfill_order_placed_message_signal_task
@@ -91,10 +139,23 @@ def fulfill_order_placed_message_signal_task(
     line_item_state_id,
     source_system,
     message_id,
-    is_order_fulfillment_forwarding_enabled
+    is_order_fulfillment_forwarding_enabled,
+    is_bundle_fulfillment_chord_enabled=False,
+    is_bulk_fulfillment_enabled=False
 ):    # pylint: disable=too-many-statements
 
-    """Celery task for fulfilling an order placed message."""
+    """
+    Celery task for fulfilling an order placed message.
+
+    When ``is_bundle_fulfillment_chord_enabled`` is set, the line items of a program bundle are fulfilled by a
+    Celery chord: a group of LMS tasks whose callback writes every line item state to Commercetools in one
+    update and sends the confirmation email. Chords need a result backend, without ``CELERY_RESULT_BACKEND`` the
+    line items are fulfilled one by one.
+
+    When ``is_bulk_fulfillment_enabled`` is set, the line items of an order with several are fulfilled (or forwarded
+    to the Order Fulfillment service) by one task making the calls concurrently, instead of by the receivers of the
+    per-item signals.
+    """
 
     tag = "fulfill_order_placed_message_signal_task"
 
@@ -135,6 +196,26 @@ def fulfill_order_placed_message_signal_task(
         from_state_id=line_item_state_id,
         new_state_key=TwoUKeys.PROCESSING_FULFILMENT_STATE
     )
+    bump_order_history_generation(lms_user_id)
+
+    use_fulfillment_chord = (
+        is_bundle_fulfillment_chord_enabled
+        and not is_order_fulfillment_forwarding_enabled
+        and check_is_bundle(get_edx_items(order))
+    )
+    if use_fulfillment_chord and not settings.CELERY_RESULT_BACKEND:
+        logger.warning(f'[CT-{tag}] Bundle fulfillment chord enabled but no CELERY_RESULT_BACKEND is configured, '
+                       f'fulfilling the line items of order {order_id} one by one, message id: {message_id}')
+        use_fulfillment_chord = False
+    fulfillment_signatures = []
+
+    # Orders with several line items are fulfilled by one task making the fulfillment calls together
+    use_bulk_fulfillment = (
+        is_bulk_fulfillment_enabled
+        and not use_fulfillment_chord
+        and len(get_edx_items(order)) > 1
+    )
+    bulk_fulfillments, bulk_enrollments, bulk_entitlements = [], [], []
 
     for item in get_edx_items(order):
         logger.debug(f'[CT-{tag}] processing edX order {order_id}, line item {item.variant.sku}, '
@@ -201,7 +282,10 @@ def fulfill_order_placed_message_signal_task(
                 'message_id': message_id,
                 'celery_task_id': self.request.id,
             }
-            OrderFulfillmentAPIClient().fulfill_order(payload, logging_data)
+            if use_bulk_fulfillment:
+                bulk_fulfillments.append([payload, logging_data])
+            else:
+                fulfill_order_task.delay(payload, logging_data)
 
         else:
             logger.info(f"[CT-{tag}] Order Fulfillment Redirection Flag [NOT ENABLED]."
@@ -213,7 +297,13 @@ def fulfill_order_placed_message_signal_task(
             serializer.is_valid(raise_exception=True)  # pragma no cover
             payload = serializer.validated_data
 
-            if bundle_id:
+            if use_fulfillment_chord:
+                fulfillment_signatures.append(lms_fulfillment_signature(payload, is_entitlement=bool(bundle_id)))
+            elif use_bulk_fulfillment:
+                (bulk_entitlements if bundle_id else bulk_enrollments).append(
+                    lms_fulfillment_task_kwargs(payload, is_entitlement=bool(bundle_id))
+                )
+            elif bundle_id:
                 fulfill_order_placed_send_entitlement_signal.send_robust(
                     sender=fulfill_order_placed_message_signal_task,
                     **payload
@@ -227,6 +317,11 @@ def fulfill_order_placed_message_signal_task(
         product_information = extract_ct_product_information_for_braze_canvas(item)
         canvas_entry_properties["products"].append(product_information)
 
+    if bulk_fulfillments:
+        fulfill_order_bulk_task.delay(bulk_fulfillments)
+    elif use_bulk_fulfillment:
+        fulfill_order_placed_send_line_items_task.delay(bulk_enrollments, bulk_entitlements)
+
     is_mobile_order = False
     if hasattr(order, 'custom') and hasattr(order.custom, 'fields'):
         is_mobile_order = order.custom.fields.get(TwoUKeys.ORDER_MOBILE_ORDER, False)
@@ -234,13 +329,30 @@ def fulfill_order_placed_message_signal_task(
 
     canvas_entry_properties.update({'hide_receipt_cta': is_mobile_order or is_enrollment_code_order})
 
-    cache_key = safe_key(key=order_id, key_prefix='send_order_confirmation_email', version='1')
+    if use_fulfillment_chord:
+        logger.info(f'[CT-{tag}] Fulfilling {len(fulfillment_signatures)} bundle line items of order {order_id} '
+                    f'with a chord, message id: {message_id}')
 
-    cache_entry = TieredCache.get_cached_response(cache_key)
-
-    if not cache_entry.is_found:  # pragma no cover
-        send_order_confirmation_email(lms_user_id, customer.email, canvas_entry_properties)
-        TieredCache.set_all_tiers(cache_key, value="SENT", django_cache_timeout=EMAIL_NOTIFICATION_CACHE_TTL_SECS)
+        callback = fulfill_order_placed_bundle_completed_task.s(
+            order_id=order_id,
+            message_id=message_id,
+            lms_user_id=lms_user_id,
+            user_email=customer.email,
+            canvas_entry_properties=canvas_entry_properties
+        )
+        # The callback doesn't run if a header task fails for good, the errback then fails the bundle's line items
+        callback.on_error(fulfill_order_placed_bundle_failed_task.s(
+            order_id=order_id,
+            message_id=message_id,
+            lms_user_id=lms_user_id,
+            line_items=[
+                {'line_item_id': signature.kwargs['line_item_id'], 'item_quantity': signature.kwargs['item_quantity']}
+                for signature in fulfillment_signatures
+            ]
+        ))
+        chord(group(fulfillment_signatures))(callback)
+    else:
+        send_order_confirmation_email_once(order_id, lms_user_id, customer.email, canvas_entry_properties)
 
     logger.info(f'[CT-{tag}] Finished order {order_id}, '
                 f'line item {line_item_state_id}, source system {source_system}, message id: {message_id}')
@@ -248,6 +360,74 @@ def fulfill_order_placed_message_signal_task(
     return True
 
 
+@shared_task(
+    bind=True,
+    autoretry_for=(RequestException, CommercetoolsError),
+    retry_kwargs={'max_retries': 5, 'countdown': 300}  # waiting 5 minutes between retries, to cover time during outage
+)
+def fulfill_order_placed_bundle_completed_task(
+    self,  # pylint: disable=unused-argument
+    fulfillment_results,
+    order_id,
+    message_id,
+    lms_user_id,
+    user_email,
+    canvas_entry_properties
+):
+    """
+    Chord callback for the LMS fulfillment tasks of a program bundle.
+
+    Writes every line item outcome to Commercetools in one order update and sends the confirmation email.
+    """
+    tag = "fulfill_order_placed_bundle_completed_task"
+
+    fulfilled_count = sum(1 for result in fulfillment_results if result['is_fulfilled'])
+    logger.info(f'[CT-{tag}] Bundle fulfillment finished for order {order_id}, '
+                f'{fulfilled_count} of {len(fulfillment_results)} line items fulfilled, message id: {message_id}')
+
+    client = CommercetoolsAPIClient()
+    order = client.get_order_by_id(order_id, expand=OrderReadProfiles.FULFILLMENT)
+    client.update_line_items_on_fulfillment(order, fulfillment_results)
+    bump_order_history_generation(lms_user_id)
+
+    send_order_confirmation_email_once(order_id, lms_user_id, user_email, canvas_entry_properties)
+
+    logger.info(f'[CT-{tag}] Finished order {order_id}, message id: {message_id}')
+
+    return True
+
+
+@shared_task
+def fulfill_order_placed_bundle_failed_task(
+    request,
+    exc,
+    traceback,  # pylint: disable=unused-argument
+    order_id,
+    message_id,
+    lms_user_id,
+    line_items
+):
+    """
+    Chord error callback for the LMS fulfillment tasks of a program bundle, run instead of the chord callback when
+    one of them failed for good.
+
+    Moves every line item of the bundle to the failure state in one order update, so the order isn't left pending.
+    """
+    tag = "fulfill_order_placed_bundle_failed_task"
+
+    logger.error(f'[CT-{tag}] Bundle fulfillment failed for order {order_id}, task {request.id}: {exc!r}, '
+                 f'message id: {message_id}')
+
+    client = CommercetoolsAPIClient()
+    order = client.get_order_by_id(order_id, expand=OrderReadProfiles.FULFILLMENT)
+    client.update_line_items_on_fulfillment(
+        order, [fulfillment_outcome(line_item, is_fulfilled=False) for line_item in line_items]
+    )
+    bump_order_history_generation(lms_user_id)
+
+    return True
+
+
 # noinspection DuplicatedCode
 @shared_task(autoretry_for=(RequestException, CommercetoolsError), retry_kwargs={'max_retries': 5, 'countdown': 3})
 def fulfill_order_sanctioned_message_signal_task(
@@ -262,7 +442,7 @@ def fulfill_order_sanctioned_message_signal_task(
 
     client = CommercetoolsAPIClient()
     try:
-        order = client.get_order_by_id(order_id)
+        order = client.get_order_by_id(order_id, expand=OrderReadProfiles.FULFILLMENT)
     except CommercetoolsError as err:  # pragma no cover
         logger.error(f'[CT-{tag}] Order not found: {order_id} with CT error {err}, {err.errors}, '
                      f'message id: {message_id}')
@@ -288,6 +468,7 @@ def fulfill_order_sanctioned_message_signal_task(
         logger.info(f'[CT-{tag}] calling lms to deactivate user {lms_user_name}, message id: {message_id}.')
 
         LMSAPIClient().deactivate_user(lms_user_name, message_id)
+        bump_order_history_generation(get_edx_lms_user_id(customer))
 
         logger.info(f'[CT-{tag}] Finished sanctions for {order_id}, message id: {message_id}')
         return True
@@ -341,20 +522,11 @@ def fulfill_order_returned_signal_task(order_id, return_items, message_id):
 
     client = CommercetoolsAPIClient()
 
-    try:
-        order = client.get_order_by_id(order_id)
-
-    except CommercetoolsError as err:  # pragma no cover
-        logger.error(f'[CT-{tag}] Order not found: {order_id} with CT error {err}, {err.errors}'
-                     f', message id: {message_id}')
-        raise err
-
-    try:
-        customer = client.get_customer_by_id(order.customer_id)
-    except CommercetoolsError as err:  # pragma no cover
-        logger.error(f'[CT-{tag}] Customer not found: {order.customer_id} for order {order_id} with '
-                     f'CT error {err}, {err.errors}, message id: {message_id}')
-        raise err
+    logging_context = {
+        'tag': tag,
+        'message_id': message_id
+    }
+    order, customer = client.get_order_and_customer_by_order_id(order_id, logging_context)
 
     if not (customer and order and is_edx_lms_order(order)):  # pragma no cover
         logger.info(f'[CT-{tag}] order {order_id} is not an edX order, message id: {message_id}')
@@ -466,6 +638,8 @@ def fulfill_order_returned_signal_task(order_id, return_items, message_id):
             return_line_item_return_ids=return_line_item_return_ids,
         )
 
+    bump_order_history_generation(lms_user_id)
+
     logger.info(f'[CT-{tag}] Finished return for order: {order_id}, line item: {return_line_item_ids}, '
                 f'message id: {message_id}')
 
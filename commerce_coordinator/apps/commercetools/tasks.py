@@ -7,13 +7,15 @@ from celery.utils.log import get_task_logger
 from commercetools import CommercetoolsError
 from commercetools.platform.models import Payment
 from django.conf import settings
+from edx_django_utils.monitoring import set_custom_attribute
 from iso4217 import Currency
 from requests import RequestException
 
 from commerce_coordinator.apps.commercetools.catalog_info.constants import (
     EDX_ANDROID_IAP_PAYMENT_INTERFACE_NAME,
     EDX_IOS_IAP_PAYMENT_INTERFACE_NAME,
-    EDX_PAYPAL_PAYMENT_INTERFACE_NAME
+    EDX_PAYPAL_PAYMENT_INTERFACE_NAME,
+    OrderReadProfiles
 )
 from commerce_coordinator.apps.commercetools.catalog_info.edx_utils import (
     check_is_bundle,
@@ -26,13 +28,17 @@ from commerce_coordinator.apps.commercetools.catalog_info.edx_utils import (
     get_line_item_lms_entitlement_id
 )
 from commerce_coordinator.apps.commercetools.catalog_info.utils import get_line_item_attribute, get_product_data
+from commerce_coordinator.apps.core.cache import bump_order_history_generation
+from commerce_coordinator.apps.core.concurrency import map_concurrently
 from commerce_coordinator.apps.core.memcache import safe_key
 from commerce_coordinator.apps.core.segment import track
 from commerce_coordinator.apps.core.tasks import TASK_LOCK_RETRY, acquire_task_lock, release_task_lock
 from commerce_coordinator.apps.ecommerce.clients import EcommerceAPIClient
 from commerce_coordinator.apps.iap.signals import revoke_line_mobile_order_signal
-from commerce_coordinator.apps.order_fulfillment.clients import OrderFulfillmentAPIClient
-from commerce_coordinator.apps.order_fulfillment.exceptions import OrderFulfillmentRevokeLineError
+from commerce_coordinator.apps.order_fulfillment.clients import (
+    ORDER_FULFILLMENT_RETRY_POLICY,
+    OrderFulfillmentAPIClient
+)
 from commerce_coordinator.apps.order_fulfillment.serializers import OrderRevokeLineRequestSerializer
 
 from .clients import CommercetoolsAPIClient, Refund
@@ -59,10 +65,14 @@ def fulfillment_completed_update_ct_line_item_task(
     entitlement_uuid,
     order_id,
     line_item_id,
-    to_state_key
+    to_state_key,
+    lms_user_id=None
 ):
     """
     Task for updating order line item on fulfillment completion via Commercetools API.
+
+    ``lms_user_id`` is the order's customer, whose order history is invalidated; it's looked up from the order when
+    the sender doesn't know it.
     """
     tag = "fulfillment_completed_update_ct_line_item_task"
     task_key = safe_key(key=order_id, key_prefix=tag, version='1')
@@ -86,7 +96,8 @@ def fulfillment_completed_update_ct_line_item_task(
                 'entitlement_uuid': entitlement_uuid,
                 'order_id': order_id,
                 'line_item_id': line_item_id,
-                'to_state_key': to_state_key
+                'to_state_key': to_state_key,
+                'lms_user_id': lms_user_id,
             },
             countdown=TASK_LOCK_RETRY
         )
@@ -94,7 +105,7 @@ def fulfillment_completed_update_ct_line_item_task(
 
     try:
         client = CommercetoolsAPIClient()
-        order = client.get_order_by_id(order_id)
+        order = client.get_order_by_id(order_id, expand=OrderReadProfiles.FULFILLMENT)
         current_order_version = order.version
 
         line_item = get_edx_line_item(order.line_items, line_item_id)
@@ -124,6 +135,14 @@ def fulfillment_completed_update_ct_line_item_task(
         f'[CT-{tag}] Line item {line_item_id} updated for order {order_id}' + entitlement_info
     )
 
+    # The line item is updated, so failing to invalidate the customer's order history mustn't retry the task
+    try:
+        if lms_user_id is None:
+            lms_user_id = get_edx_lms_user_id(client.get_customer_by_id(order.customer_id))
+        bump_order_history_generation(lms_user_id)
+    except Exception as exc:  # pylint: disable=broad-exception-caught
+        logger.warning(f'[CT-{tag}] Unable to invalidate order history for order {order_id}: {exc}')
+
     return updated_order
 
 
@@ -380,11 +399,50 @@ def refund_from_mobile_task(
         raise err
 
 
+def _revoke_line_request(order, line_item, customer, lms_user_id, lms_user_username):
+    """
+    Build the Order Fulfillment revoke_line payload and logging data for one order line item.
+
+    Returns:
+        tuple: The validated payload and the logging data.
+    """
+    course_mode = get_line_item_attribute(line_item, "mode")
+    course_run_key = get_edx_product_course_run_key(line_item, course_mode)
+
+    entitlement_uuid = get_line_item_lms_entitlement_id(line_item)
+
+    logging_data = {
+        "order_id": order.id,
+        "line_item_id": line_item.id,
+        "customer_id": customer.id,
+        "course_run_key": course_run_key,
+        "entitlement_uuid": entitlement_uuid,
+        "lms_user_id": lms_user_id,
+        "lms_user_name": lms_user_username,
+        "course_mode": course_mode,
+    }
+
+    lob = get_lob_from_variant_attr(line_item.variant) or "edx"
+    serializer_data = {
+        "edx_lms_username": lms_user_username,
+        "course_run_key": course_run_key,
+        "course_mode": course_mode,
+        "lob": lob,
+    }
+    if entitlement_uuid is not None:
+        serializer_data["entitlement_uuid"] = entitlement_uuid
+    serializer = OrderRevokeLineRequestSerializer(data=serializer_data)
+    serializer.is_valid(raise_exception=True)
+
+    return serializer.data, logging_data
+
+
 @shared_task(
-    autoretry_for=(CommercetoolsError, OrderFulfillmentRevokeLineError),
+    bind=True,
+    autoretry_for=(CommercetoolsError,),
     retry_kwargs={"max_retries": 5, "countdown": 3},
 )
-def revoke_line_items_task(order_id: str, return_items: list):
+def revoke_line_items_task(self, order_id: str, return_items: list):
     """
     Celery task to unenroll a user from one or multiple courses based on the order ID and list of line item IDs. If
     there is an associated entitlement, it will also be expired.
@@ -394,7 +452,9 @@ def revoke_line_items_task(order_id: str, return_items: list):
     - Resolve LMS user from Commercetools customer.
     - Determine the line items to be revoked based on return item IDs.
     - Get the course run key (and entitlement UUID if applicable) from each line item.
-    - Call the Order Fulfillment API to revoke each enrollment/entitlement.
+    - Call the Order Fulfillment API to revoke each enrollment/entitlement, concurrently.
+    - If only some line items failed, retry each of them in its own task. Failures a retry can't fix (e.g. a 4xx
+      response) are only logged.
 
     Args:
         order_id (str): The ID of the order.
@@ -425,7 +485,7 @@ def revoke_line_items_task(order_id: str, return_items: list):
             continue
         item_to_revoke = line_items_by_id.get(line_item_id)
         if item_to_revoke:
-            return_line_items.append(item_to_revoke)
+            return_line_items.append((item, item_to_revoke))
 
     if not return_line_items:
         logger.info(
@@ -433,68 +493,72 @@ def revoke_line_items_task(order_id: str, return_items: list):
         )
         return True
 
+    revocations = [
+        (return_item, *_revoke_line_request(order, line_item, customer, lms_user_id, lms_user_username))
+        for return_item, line_item in return_line_items
+    ]
+
     fulfillment_client = OrderFulfillmentAPIClient()
 
-    for line_item in return_line_items:
-        course_mode = get_line_item_attribute(line_item, "mode")
-        course_run_key = get_edx_product_course_run_key(line_item, course_mode)
-
-        entitlement_uuid = get_line_item_lms_entitlement_id(line_item)
-
-        logging_data = {
-            "order_id": order.id,
-            "line_item_id": line_item.id,
-            "customer_id": customer.id,
-            "course_run_key": course_run_key,
-            "entitlement_uuid": entitlement_uuid,
-            "lms_user_id": lms_user_id,
-            "lms_user_name": lms_user_username,
-            "course_mode": course_mode,
-        }
-
-        lob = get_lob_from_variant_attr(line_item.variant) or "edx"
-        serializer_data = {
-            "edx_lms_username": lms_user_username,
-            "course_run_key": course_run_key,
-            "course_mode": course_mode,
-            "lob": lob,
-        }
-        if entitlement_uuid is not None:
-            serializer_data["entitlement_uuid"] = entitlement_uuid
-        serializer = OrderRevokeLineRequestSerializer(data=serializer_data)
-        serializer.is_valid(raise_exception=True)
-
-        revoke_response = fulfillment_client.revoke_line(
-            payload=serializer.data,
-            logging_data=logging_data,
-        )
-        if revoke_response is None:
-            logger.error(
-                f"[CT-{tag}] Order Fulfillment revoke_line returned no response after client retries | "
-                f"{logging_data}"
-            )
-            raise OrderFulfillmentRevokeLineError(
-                f"revoke_line failed for order {order.id} line_item_id={line_item.id}"
+    # Each revoke_line call is an independent request to the Order Fulfillment service, so refunding a bundle
+    # doesn't have to wait for its courses one after the other.
+    results = map_concurrently(
+        lambda revocation: fulfillment_client.revoke_line(payload=revocation[1], logging_data=revocation[2]),
+        revocations,
+    )
+
+    failed = [result for result in results if not result.ok or result.value is None]
+
+    for result in results:
+        _, payload, logging_data = result.item
+        if result.error is not None:
+            logger.error(f"[CT-{tag}] revoke_line failed with error: {result.error} | {logging_data}")
+        elif result.value is None:
+            logger.error(f"[CT-{tag}] Order Fulfillment revoke_line was rejected by the service | {logging_data}")
+        else:
+            logger.info(
+                f"[CT-{tag}] Successfully called revoke_line for user {lms_user_username} "
+                f"on course {payload['course_run_key']} line_item_id={logging_data['line_item_id']}"
             )
 
-        logger.info(
-            f"[CT-{tag}] Successfully called revoke_line for user {lms_user_username} "
-            f"on course {course_run_key} line_item_id={line_item.id}"
-        )
+    set_custom_attribute("revoke_line_items_revoked", len(results) - len(failed))
+    set_custom_attribute("revoke_line_items_failed", len(failed))
 
     logger.info(
         f"[CT-{tag}] Finished revoke task for order_id {order_id}, "
-        f"revoked {len(return_line_items)} line item(s) for user {lms_user_username}"
+        f"revoked {len(results) - len(failed)} of {len(results)} line item(s) for user {lms_user_username}"
     )
 
-    return True
+    # Only transient errors are retried. A revoke the service rejected (revoke_line returns None for a
+    # non-retryable response, e.g. a 4xx) or another non-retryable error won't succeed on retry, it's only logged.
+    retryable = [
+        result for result in failed
+        if result.error is not None and ORDER_FULFILLMENT_RETRY_POLICY.is_retryable(result.error)
+    ]
+    if len(retryable) < len(failed):
+        logger.warning(f"[CT-{tag}] Not retrying {len(failed) - len(retryable)} line item(s) of order_id {order_id} "
+                       f"that were rejected or failed with non-retryable errors")
+
+    if retryable and len(retryable) == len(results):
+        # Nothing was revoked, so retrying the whole task is the same as retrying each line item.
+        ORDER_FULFILLMENT_RETRY_POLICY.retry_task_or_raise(self, retryable[0].error)
+
+    for result in retryable:
+        # Retry only the line items that failed, each in its own task, so revoked courses aren't revoked again.
+        revoke_line_items_task.apply_async(
+            kwargs={"order_id": order_id, "return_items": [result.item[0]]},
+            countdown=ORDER_FULFILLMENT_RETRY_POLICY.backoff(self.request.retries, result.error),
+        )
+
+    return not failed
 
 
 @shared_task(
+    bind=True,
     autoretry_for=(CommercetoolsError,),
     retry_kwargs={"max_retries": 5, "countdown": 3},
 )
-def revoke_line_mobile_order_task(payment_id: str):
+def revoke_line_mobile_order_task(self, payment_id: str):
     """
     Celery task to unenroll a user from a course based on the given payment ID in mobile order.
 
@@ -543,10 +607,13 @@ def revoke_line_mobile_order_task(payment_id: str):
     })
     serializer.is_valid(raise_exception=True)
 
-    OrderFulfillmentAPIClient().revoke_line(
-        payload=serializer.validated_data,
-        logging_data=logging_data,
-    )
+    try:
+        OrderFulfillmentAPIClient().revoke_line(
+            payload=serializer.validated_data,
+            logging_data=logging_data,
+        )
+    except RequestException as exc:
+        ORDER_FULFILLMENT_RETRY_POLICY.retry_task_or_raise(self, exc)
 
     logger.info(f"[CT-{tag}] Successfully called revoke_line for user {lms_user_username} "
                 f"on course {course_run_key} and {logging_data}")
@@ -49,6 +49,7 @@ class MonkeyPatchedGetOrderTestCase(TestCase):
             username=None,
             limit=ORDER_HISTORY_PER_SYSTEM_REQ_LIMIT,
             cutoff_in_days=None,
+            lazy=False,
         ) -> (PaginatedResult[CTOrder], CTCustomer):
             return (
                 PaginatedResult(self.orders, len(self.orders), offset),
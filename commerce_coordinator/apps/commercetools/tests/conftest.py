@@ -195,6 +195,14 @@ def gen_program_order(uuid_id) -> Order:
         return Order.deserialize(obj)
 
 
+def gen_graphql_order_details() -> dict:
+    """
+    Generate the data of an ORDER_DETAILS_QUERY response from a json file, an order with its customer and payment
+    """
+    with open(os.path.join(pathlib.Path(__file__).parent.resolve(), 'raw_ct_graphql_order_details.json')) as f:
+        return json.load(f)
+
+
 def gen_payment():
     return Payment(
         id=uuid4_str(),
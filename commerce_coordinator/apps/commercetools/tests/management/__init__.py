@@ -0,0 +1 @@
+""" Commercetools management command tests """
@@ -0,0 +1,79 @@
+"""Tests for the backfill_customer_index management command."""
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+from commerce_coordinator.apps.commercetools.catalog_info.constants import EdXFieldNames
+from commerce_coordinator.apps.commercetools.management.commands.backfill_customer_index import Command
+from commerce_coordinator.apps.commercetools.models import CustomerIndex
+
+
+def gen_customer(customer_id, lms_user_id, version=1):
+    return SimpleNamespace(
+        id=customer_id,
+        version=version,
+        custom=SimpleNamespace(fields={EdXFieldNames.LMS_USER_ID: lms_user_id}),
+    )
+
+
+@override_settings(COMMERCETOOLS_CONFIG={**settings.COMMERCETOOLS_CONFIG, 'importUrl': 'https://localhost'})
+@patch('commerce_coordinator.apps.commercetools.management.commands._ct_api_client_command.CommercetoolsAPIClient')
+class BackfillCustomerIndexCommandTests(TestCase):
+    """Tests for the backfill_customer_index command."""
+
+    def run_command(self, mock_client, customers, batch_size=2):
+        mock_client.return_value.iter_query.side_effect = (
+            lambda resource, where, page_size, projection: map(projection, customers)
+        )
+        Command().handle(page_size=500, batch_size=batch_size)
+
+    def index(self):
+        return {
+            entry.lms_user_id: (entry.customer_id, entry.customer_version)
+            for entry in CustomerIndex.objects.all()
+        }
+
+    def test_customers_are_indexed_in_batches(self, mock_client):
+        customers = [gen_customer(f'customer-{i}', str(i), version=i) for i in range(1, 6)]
+
+        with patch.object(CustomerIndex.objects, 'bulk_create', wraps=CustomerIndex.objects.bulk_create) as mock_bulk:
+            self.run_command(mock_client, customers)
+
+        self.assertEqual(self.index(), {i: (f'customer-{i}', i) for i in range(1, 6)})
+        self.assertEqual([len(call.args[0]) for call in mock_bulk.call_args_list], [2, 2, 1])
+
+    def test_existing_entry_is_replaced(self, mock_client):
+        CustomerIndex.objects.create(lms_user_id=1, customer_id='old-customer', customer_version=7)
+
+        self.run_command(mock_client, [gen_customer('customer-1', '1', version=2)])
+
+        self.assertEqual(self.index(), {1: ('customer-1', 2)})
+
+    def test_invalid_lms_user_id_is_skipped(self, mock_client):
+        self.run_command(mock_client, [gen_customer('customer-1', 'not-a-number'), gen_customer('customer-2', '2')])
+
+        self.assertEqual(self.index(), {2: ('customer-2', 1)})
+
+    def test_lms_user_id_of_several_customers_is_left_out(self, mock_client):
+        CustomerIndex.objects.create(lms_user_id=1, customer_id='customer-1', customer_version=1)
+
+        self.run_command(mock_client, [
+            gen_customer('customer-1', '1'),
+            gen_customer('customer-2', '2'),
+            gen_customer('customer-3', '1'),
+        ])
+
+        self.assertEqual(self.index(), {2: ('customer-2', 1)})
+
+    @patch('commerce_coordinator.apps.commercetools.management.commands.backfill_customer_index.connection')
+    def test_upsert_without_conflict_target(self, mock_connection, mock_client):
+        """Check backends like MySQL, that can't name the conflicting column, aren't given one."""
+        mock_connection.features.supports_update_conflicts_with_target = False
+
+        with patch.object(CustomerIndex.objects, 'bulk_create') as mock_bulk:
+            self.run_command(mock_client, [gen_customer('customer-1', '1')])
+
+        self.assertTrue(mock_bulk.call_args.kwargs['update_conflicts'])
+        self.assertIsNone(mock_bulk.call_args.kwargs['unique_fields'])
@@ -0,0 +1,146 @@
+"""Tests for the find_ct_duplicate_purchases management command."""
+import csv
+import json
+import os
+from datetime import datetime, timezone
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+from commerce_coordinator.apps.commercetools.management.commands.find_ct_duplicate_purchases import (
+    Command,
+    FirstPurchaseIndex
+)
+
+WINDOWS_FROM = "2024-01-01T00:00:00"
+WINDOWS_TO = "2024-01-15T00:00:00"
+
+
+def gen_order(order_id, day, skus, customer_email="buyer@example.com"):
+    return SimpleNamespace(
+        id=order_id,
+        customer_email=customer_email,
+        customer_id=None,
+        created_at=datetime(2024, 1, day, tzinfo=timezone.utc),
+        line_items=[SimpleNamespace(variant=SimpleNamespace(sku=sku)) for sku in skus],
+    )
+
+
+class FirstPurchaseIndexTests(TestCase):
+    """Tests for FirstPurchaseIndex."""
+
+    def setUp(self):
+        self.index = FirstPurchaseIndex(":memory:", max_in_memory=1)
+
+    def tearDown(self):
+        self.index.close()
+
+    def test_later_purchase_is_reported(self):
+        self.assertIsNone(self.index.record(("buyer", "sku-1"), "order-1", "2024-01-01"))
+        self.assertIsNone(self.index.record(("buyer", "sku-1"), "order-1", "2024-01-01"))
+
+        self.assertEqual(
+            self.index.record(("buyer", "sku-1"), "order-2", "2024-01-02"),
+            (("order-2", "2024-01-02"), ("order-1", "2024-01-01")),
+        )
+
+    def test_earlier_purchase_replaces_the_first(self):
+        self.index.record(("buyer", "sku-1"), "order-2", "2024-01-02")
+
+        # Windows are scanned concurrently, so an earlier order can be seen last
+        self.assertEqual(
+            self.index.record(("buyer", "sku-1"), "order-1", "2024-01-01"),
+            (("order-2", "2024-01-02"), ("order-1", "2024-01-01")),
+        )
+        self.assertEqual(
+            self.index.record(("buyer", "sku-1"), "order-3", "2024-01-03"),
+            (("order-3", "2024-01-03"), ("order-1", "2024-01-01")),
+        )
+
+    def test_entries_spill_to_sqlite(self):
+        self.index.record(("buyer", "sku-1"), "order-1", "2024-01-01")
+        self.index.record(("buyer", "sku-2"), "order-2", "2024-01-01")
+
+        self.assertEqual(self.index.memory, {})
+        self.assertEqual(
+            self.index.record(("buyer", "sku-1"), "order-3", "2024-01-02"),
+            (("order-3", "2024-01-02"), ("order-1", "2024-01-01")),
+        )
+
+
+@override_settings(COMMERCETOOLS_CONFIG={**settings.COMMERCETOOLS_CONFIG, 'importUrl': 'https://localhost'})
+@patch('commerce_coordinator.apps.commercetools.management.commands._ct_api_client_command.CommercetoolsAPIClient')
+class FindDuplicatePurchasesCommandTests(TestCase):
+    """Tests for the find_ct_duplicate_purchases command."""
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(self.directory.cleanup)
+        self.output = os.path.join(self.directory.name, "duplicates.csv")
+        self.orders = {
+            "2024-01-01T00:00:00.000Z": [gen_order("order-1", 2, ["sku-1", "sku-2"])],
+            "2024-01-08T00:00:00.000Z": [gen_order("order-2", 9, ["sku-1"]), gen_order("order-3", 10, ["sku-3"])],
+        }
+
+    def run_command(self, mock_client, **options):
+        mock_client.return_value.iter_query.side_effect = (
+            lambda resource, where, **kwargs: iter(self.orders[where[-1].split('"')[1]])
+        )
+        command = Command()
+        command.handle(**{
+            "date_from": WINDOWS_FROM,
+            "date_to": WINDOWS_TO,
+            "window_days": 7,
+            "workers": 2,
+            "order_state": "Complete",
+            "page_size": 500,
+            "max_in_memory": 100000,
+            "output": self.output,
+            "checkpoint": None,
+            **options,
+        })
+        with open(self.output, newline="") as f:
+            return list(csv.DictReader(f))
+
+    def test_duplicates_are_written(self, mock_client):
+        index_directories = []
+
+        def temporary_directory():
+            directory = TemporaryDirectory()  # pylint: disable=consider-using-with
+            index_directories.append(directory.name)
+            return directory
+
+        with patch("tempfile.TemporaryDirectory", side_effect=temporary_directory):
+            rows = self.run_command(mock_client)
+
+        self.assertEqual(rows, [{
+            "customer_email": "buyer@example.com",
+            "sku": "sku-1",
+            "order_id": "order-2",
+            "created_at": "2024-01-09T00:00:00.000Z",
+            "earlier_order_id": "order-1",
+            "earlier_created_at": "2024-01-02T00:00:00.000Z",
+        }])
+        # The index of a run without checkpoint is removed with its directory
+        self.assertEqual(len(index_directories), 1)
+        self.assertFalse(os.path.exists(index_directories[0]))
+
+    def test_resume_from_checkpoint(self, mock_client):
+        checkpoint = os.path.join(self.directory.name, "checkpoint.json")
+        first_window = ["2024-01-01T00:00:00.000Z", "2024-01-08T00:00:00.000Z"]
+        self.run_command(mock_client, checkpoint=checkpoint)
+
+        with open(checkpoint) as f:
+            self.assertEqual(len(json.load(f)["completed_windows"]), 2)
+
+        with open(checkpoint, "w") as f:
+            json.dump({"completed_windows": [first_window]}, f)
+        mock_client.return_value.iter_query.reset_mock()
+        rows = self.run_command(mock_client, checkpoint=checkpoint)
+
+        # Only the remaining window is scanned, its duplicate found against the index of the first run
+        mock_client.return_value.iter_query.assert_called_once()
+        self.assertEqual([row["order_id"] for row in rows], ["order-2", "order-2"])
@@ -0,0 +1,123 @@
+"""Tests for the get_ct_audit_history_command management command."""
+import itertools
+import json
+import os
+import threading
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlsplit
+
+import requests_mock
+from django.conf import settings
+from django.test import TestCase
+
+from commerce_coordinator.apps.commercetools.management.commands._utils import TokenBucket
+from commerce_coordinator.apps.commercetools.management.commands.get_ct_audit_history_command import Command
+from commerce_coordinator.apps.commercetools.tests.management.test_utils import FakeClock
+
+HISTORY_URL = Command.HISTORY_API_URL + settings.COMMERCETOOLS_CONFIG["projectKey"]
+RECORDS_PER_WINDOW = 3
+PAGE_SIZE = 2
+WINDOWS = [f"2025-01-0{day}T00:00:00.000Z" for day in range(1, 5)]
+
+
+class GetAuditHistoryCommandTests(TestCase):
+    """Tests for the get_ct_audit_history_command command, against a mocked History API."""
+
+    workers = 4
+
+    def setUp(self):
+        directory = TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        self.output = os.path.join(directory.name, "audit_log.jsonl")
+        self.checkpoint = os.path.join(f"{self.output}.parts", "checkpoint.json")
+        self.failing_window = None
+
+        self.clock = FakeClock()
+        clock_patcher = patch('commerce_coordinator.apps.commercetools.management.commands._utils.time', self.clock)
+        clock_patcher.start()
+        self.addCleanup(clock_patcher.stop)
+
+        # Importing commercetools.testing makes mockers case sensitive, so this one always is
+        self.mocker = requests_mock.Mocker(case_sensitive=True)
+        self.mocker.start()
+        self.addCleanup(self.mocker.stop)
+        self.mocker.post(f"{settings.COMMERCETOOLS_CONFIG['authUrl']}/oauth/token", json={"access_token": "token"})
+        self.mocker.get(HISTORY_URL, json=self.history_page)
+
+    def history_page(self, request, context):
+        """ A page of RECORDS_PER_WINDOW records per window, or a 400 for the failing window """
+        params = parse_qs(urlsplit(request.url).query)
+        window_start, offset = params["date.from"][0], int(params["offset"][0])
+
+        if window_start == self.failing_window:
+            context.status_code = 400
+            return {"message": "Bad request"}
+
+        return {"results": [
+            {"id": f"{window_start}-{index}"} for index in range(offset, min(offset + PAGE_SIZE, RECORDS_PER_WINDOW))
+        ]}
+
+    def history_requests(self):
+        """ (window start, offset) of each History API request """
+        return [
+            (request.qs["date.from"][0], int(request.qs["offset"][0]))
+            for request in self.mocker.request_history if request.method == "GET"
+        ]
+
+    def run_command(self):
+        Command().handle(
+            date_from="2025-01-01T00:00:00",
+            date_to="2025-01-05T00:00:00",
+            window_days=1,
+            workers=self.workers,
+            rate=2,
+            page_size=PAGE_SIZE,
+            format="jsonl",
+            output=self.output,
+        )
+
+    def test_windows_are_fetched_concurrently_at_the_rate(self):
+        acquire = TokenBucket.acquire
+        calls = itertools.count()
+        # Held until every worker is about to request its first page, which fails the export unless they all run at once
+        barrier = threading.Barrier(self.workers, timeout=5)
+
+        def acquire_together(bucket):
+            if next(calls) < self.workers:
+                barrier.wait()
+            acquire(bucket)
+
+        with patch.object(TokenBucket, "acquire", acquire_together):
+            self.run_command()
+
+        self.assertEqual(
+            sorted(self.history_requests()),
+            [(window, offset) for window in WINDOWS for offset in (0, PAGE_SIZE)],
+        )
+        # The first page of each worker is a burst, the other pages wait their turn at 2 requests per second
+        self.assertEqual(sorted(self.clock.sleeps), [0.5, 1.0, 1.5, 2.0])
+
+        with open(self.output) as f:
+            ids = [json.loads(line)["id"] for line in f]
+        self.assertEqual(ids, [f"{window}-{index}" for window in WINDOWS for index in range(RECORDS_PER_WINDOW)])
+        self.assertFalse(os.path.exists(f"{self.output}.parts"))
+
+    def test_completed_windows_are_checkpointed_as_they_finish(self):
+        self.failing_window = WINDOWS[2]
+
+        self.run_command()
+
+        # The other windows are in the checkpoint though one failed, so a rerun only fetches the failed one
+        with open(self.checkpoint) as f:
+            completed = [window[0] for window in json.load(f)["completed_windows"]]
+        self.assertEqual(completed, [WINDOWS[0], WINDOWS[1], WINDOWS[3]])
+        self.assertFalse(os.path.exists(self.output))
+
+        self.failing_window = None
+        self.mocker.reset_mock()
+        self.run_command()
+
+        self.assertEqual(self.history_requests(), [(WINDOWS[2], 0), (WINDOWS[2], PAGE_SIZE)])
+        with open(self.output) as f:
+            self.assertEqual(len(f.readlines()), len(WINDOWS) * RECORDS_PER_WINDOW)
@@ -0,0 +1,187 @@
+"""Tests for the image header parsing and image dimension cache of the import_discovery command."""
+import json
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+import ddt
+import requests
+from django.test import TestCase
+
+from commerce_coordinator.apps.commercetools.management.commands.import_discovery import (
+    FIXTURE_IMAGE_DIMENSIONS,
+    Command,
+    ImageDimensionCache,
+    bounded_map,
+    parse_image_dimensions,
+    prefetch
+)
+from commerce_coordinator.apps.core.rate_limit import (
+    AdaptiveRateLimiter,
+    InMemoryRateLimitStore,
+    Priority,
+    outbound_priority
+)
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00\x00\x00\x0dIHDR' + struct.pack('>II', 640, 480) + b'\x08\x02\x00\x00\x00'
+GIF = b'GIF89a' + struct.pack('<HH', 640, 480) + b'\x00' * 6
+
+
+def jpeg(sof_marker, width=640, height=480):
+    """A JPEG header with an APP0 and a DHT segment ahead of the Start Of Frame segment `sof_marker`."""
+    app0 = b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00' + b'\x00' * 9
+    dht = b'\xff\xc4' + struct.pack('>H', 5) + b'\x00' * 3
+    sof = bytes([0xFF, sof_marker]) + struct.pack('>HBHH', 17, 8, height, width) + b'\x00' * 12
+    return b'\xff\xd8' + app0 + dht + sof
+
+
+def webp(chunk, payload):
+    """A RIFF WebP container holding the single chunk `chunk`."""
+    body = b'WEBP' + chunk + struct.pack('<I', len(payload)) + payload
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+
+# Lossy: frame tag, start code, then 14 bit dimensions whose top 2 bits are the scale
+WEBP_VP8 = webp(b'VP8 ', b'\x00\x00\x00\x9d\x01\x2a' + struct.pack('<HH', 640 | 0x4000, 480 | 0x8000) + b'\x00' * 4)
+# Lossless: signature byte, then the 14 bit width - 1 and height - 1
+WEBP_VP8L = webp(b'VP8L', b'\x2f' + struct.pack('<I', (640 - 1) | (480 - 1) << 14) + b'\x00' * 4)
+# Extended: flags, reserved bytes, then the 24 bit canvas width - 1 and height - 1
+WEBP_VP8X = webp(b'VP8X', b'\x10\x00\x00\x00' + (640 - 1).to_bytes(3, 'little') + (480 - 1).to_bytes(3, 'little'))
+
+
+@ddt.ddt
+class ParseImageDimensionsTests(TestCase):
+    """Tests for parse_image_dimensions"""
+
+    @ddt.data(PNG, GIF, WEBP_VP8, WEBP_VP8L, WEBP_VP8X)
+    def test_reads_header_dimensions(self, data):
+        self.assertEqual(tuple(parse_image_dimensions(data)), (640, 480))
+
+    @ddt.data(0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF)
+    def test_reads_jpeg_start_of_frame_variants(self, sof_marker):
+        self.assertEqual(parse_image_dimensions(jpeg(sof_marker)), (640, 480))
+
+    def test_skips_jpeg_fill_bytes(self):
+        data = jpeg(0xC0)
+        data = data[:2] + b'\xff\xff' + data[2:]
+
+        self.assertEqual(parse_image_dimensions(data), (640, 480))
+
+    @ddt.data(0xC4, 0xC8, 0xCC)
+    def test_jpeg_segments_that_are_not_frames_are_skipped(self, marker):
+        segment = bytes([0xFF, marker]) + struct.pack('>HBHH', 17, 8, 1, 1) + b'\x00' * 10
+        data = b'\xff\xd8' + segment + jpeg(0xC0)[2:]
+
+        self.assertEqual(parse_image_dimensions(data), (640, 480))
+
+    def test_jpeg_without_segment_marker_is_not_parsed(self):
+        self.assertIsNone(parse_image_dimensions(b'\xff\xd8\x00' + jpeg(0xC0)[2:]))
+
+    @ddt.data(
+        (PNG, 20),
+        (GIF, 8),
+        (jpeg(0xC0), 30),
+        (WEBP_VP8, 28),
+        (WEBP_VP8L, 22),
+        (WEBP_VP8X, 27),
+    )
+    @ddt.unpack
+    def test_truncated_header_is_not_parsed(self, data, length):
+        self.assertIsNone(parse_image_dimensions(data[:length]))
+
+    @ddt.data(b'', b'BM' + b'\x00' * 30, webp(b'ALPH', b'\x00' * 16))
+    def test_unknown_format_is_not_parsed(self, data):
+        self.assertIsNone(parse_image_dimensions(data))
+
+
+class ImageDimensionCacheTests(TestCase):
+    """Tests for ImageDimensionCache and how get_image_dimensions revalidates its entries"""
+
+    url = 'https://images.example.com/course.png'
+
+    def setUp(self):
+        directory = TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.path = os.path.join(self.directory, 'images.json')
+
+    def test_saved_entries_are_loaded(self):
+        cache = ImageDimensionCache(self.path)
+        cache.put(self.url, '"a"', 640, 480)
+        cache.save()
+
+        self.assertEqual(ImageDimensionCache(self.path).get(self.url), {'etag': '"a"', 'w': 640, 'h': 480})
+
+    def test_cache_without_path_is_not_saved(self):
+        cache = ImageDimensionCache('')
+        cache.put(self.url, '"a"', 640, 480)
+        cache.save()
+
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def _command(self):
+        command = Command()
+        command.session = requests.Session()
+        command.image_cache = ImageDimensionCache(None)
+        return command
+
+    def test_miss_reads_header_and_hit_is_revalidated(self):
+        with open(self.path, 'w') as f:
+            json.dump({self.url: [640, 480]}, f)
+        command = self._command()
+
+        with command.serve_fixture_images(self.directory) as mocker:
+            miss = command.get_image_dimensions(self.url)
+            with patch.object(ImageDimensionCache, 'put') as mock_put:
+                hit = command.get_image_dimensions(self.url)
+
+        self.assertEqual((miss.w, miss.h), (640, 480))
+        self.assertEqual((hit.w, hit.h), (640, 480))
+        self.assertEqual(command.image_cache.get(self.url), {'etag': '"640x480"', 'w': 640, 'h': 480})
+        mock_put.assert_not_called()
+
+        first, second = mocker.request_history
+        self.assertNotIn('If-None-Match', first.headers)
+        self.assertEqual(second.headers['If-None-Match'], '"640x480"')
+
+    def test_changed_image_is_fetched_again(self):
+        command = self._command()
+        command.image_cache.put(self.url, '"1x1"', 1, 1)
+
+        with command.serve_fixture_images(self.directory):
+            dimensions = command.get_image_dimensions(self.url)
+
+        self.assertEqual((dimensions.w, dimensions.h), FIXTURE_IMAGE_DIMENSIONS)
+        width, height = FIXTURE_IMAGE_DIMENSIONS
+        self.assertEqual(command.image_cache.get(self.url)['etag'], f'"{width}x{height}"')
+
+
+@patch.object(AdaptiveRateLimiter, '_try_acquire', autospec=True, return_value=True)
+class WorkerPriorityTests(TestCase):
+    """Tests that the calls import_discovery makes from worker threads are charged to the caller's priority"""
+
+    def setUp(self):
+        self.limiter = AdaptiveRateLimiter('test', 10, InMemoryRateLimitStore())
+
+    def call(self, item):
+        self.limiter.acquire()  # as the rate limited transport adapter does for every request
+        return item
+
+    def charged_priorities(self, mock_try_acquire):
+        return [call.args[1] for call in mock_try_acquire.call_args_list]
+
+    def test_bounded_map(self, mock_try_acquire):
+        with ThreadPoolExecutor(2) as executor, outbound_priority(Priority.BATCH):
+            results = [future.result() for _, future in bounded_map(executor, self.call, range(4), 2)]
+
+        self.assertEqual(results, [0, 1, 2, 3])
+        self.assertEqual(self.charged_priorities(mock_try_acquire), [Priority.BATCH] * 4)
+
+    def test_prefetch(self, mock_try_acquire):
+        with outbound_priority(Priority.BATCH):
+            results = list(prefetch(map(self.call, range(3)), depth=1))
+
+        self.assertEqual(results, [0, 1, 2])
+        self.assertEqual(self.charged_priorities(mock_try_acquire), [Priority.BATCH] * 3)
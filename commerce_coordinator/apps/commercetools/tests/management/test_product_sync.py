@@ -0,0 +1,144 @@
+"""Tests for the diff-based product sync of the commercetools management commands."""
+from types import SimpleNamespace
+
+from django.test import TestCase
+
+from commerce_coordinator.apps.commercetools.management.commands._product_sync import ProductSync, current_product_state
+
+PRODUCT_TYPE = {"typeId": "product-type", "key": "edx-course_verified"}
+
+
+def desired_product(key="edx-prod-1", name="Course", variants=None, **fields):
+    return {
+        "key": key,
+        "productType": PRODUCT_TYPE,
+        "name": {"en-US": name},
+        "slug": {"en-US": key},
+        "variants": variants if variants is not None else [
+            {"key": f"{key}-var", "sku": key, "attributes": [{"name": "duration", "type": "text", "value": "6 weeks"}]}
+        ],
+        **fields,
+    }
+
+
+def current_state(key="edx-prod-1", name="Course", variants=None, description=None):
+    return {
+        "key": key,
+        "name": {"en-US": name},
+        "slug": {"en-US": key},
+        "description": description,
+        "variants": variants if variants is not None else {f"{key}-var": {"duration": "6 weeks"}},
+    }
+
+
+class ProductSyncDiffTests(TestCase):
+    """Tests for ProductSync.diff"""
+
+    def test_unchanged_product_has_no_changes(self):
+        self.assertEqual(ProductSync.diff({"edx-prod-1": desired_product()}, [current_state()]), {})
+
+    def test_new_product_becomes_draft(self):
+        master = {"key": "edx-prod-2-a", "sku": "a", "attributes": []}
+        variant = {"key": "edx-prod-2-b", "sku": "b", "attributes": []}
+        product = desired_product("edx-prod-2", variants=[master, variant])
+
+        resources = ProductSync.diff({"edx-prod-2": product}, [current_state()])
+
+        self.assertEqual(resources, {"product-draft": [{
+            "key": "edx-prod-2",
+            "productType": PRODUCT_TYPE,
+            "name": {"en-US": "Course"},
+            "slug": {"en-US": "edx-prod-2"},
+            "masterVariant": master,
+            "variants": [variant],
+            "publish": True,
+        }]})
+
+    def test_changed_product_field_becomes_product_import(self):
+        product = desired_product(name="Renamed", description={"en-US": "About"})
+
+        resources = ProductSync.diff({"edx-prod-1": product}, [current_state()])
+
+        self.assertEqual(resources, {"product": [{
+            "key": "edx-prod-1",
+            "productType": PRODUCT_TYPE,
+            "name": {"en-US": "Renamed"},
+            "slug": {"en-US": "edx-prod-1"},
+            "description": {"en-US": "About"},
+            "publish": True,
+        }]})
+
+    def test_fields_missing_from_desired_product_are_not_compared(self):
+        current = current_state(description={"en-US": "Kept as is"})
+
+        self.assertEqual(ProductSync.diff({"edx-prod-1": desired_product()}, [current]), {})
+
+    def test_changed_attributes_become_variant_patch(self):
+        price = {"name": "price", "type": "text", "value": "100"}
+        product = desired_product(variants=[{"key": "edx-prod-1-var", "sku": "edx-prod-1", "attributes": [
+            {"name": "duration", "type": "text", "value": "6 weeks"},
+            price,
+        ]}])
+        current = current_state(variants={"edx-prod-1-var": {"duration": "6 weeks", "price": "90"}})
+
+        resources = ProductSync.diff({"edx-prod-1": product}, [current])
+
+        self.assertEqual(resources, {"product-variant-patch": [{
+            "productVariant": {"typeId": "product-variant", "key": "edx-prod-1-var"},
+            "product": {"typeId": "product", "key": "edx-prod-1"},
+            "attributes": {"price": price},
+            "staged": False,
+        }]})
+
+    def test_new_variant_of_existing_product_is_not_patched(self):
+        product = desired_product(variants=[{"key": "edx-prod-1-new", "sku": "new", "attributes": [
+            {"name": "duration", "type": "text", "value": "8 weeks"}
+        ]}])
+
+        self.assertEqual(ProductSync.diff({"edx-prod-1": product}, [current_state()]), {})
+
+    def test_products_not_desired_are_ignored(self):
+        current = [current_state("edx-prod-9", name="Retired"), current_state()]
+
+        self.assertEqual(ProductSync.diff({"edx-prod-1": desired_product()}, current), {})
+
+    def test_changes_of_many_products_are_grouped_by_resource_type(self):
+        desired = {key: desired_product(key, name="Renamed") for key in ("edx-prod-1", "edx-prod-2", "edx-prod-3")}
+        current = [current_state("edx-prod-1"), current_state("edx-prod-2")]
+
+        resources = ProductSync.diff(desired, iter(current))
+
+        self.assertEqual([product["key"] for product in resources["product"]], ["edx-prod-1", "edx-prod-2"])
+        self.assertEqual([product["key"] for product in resources["product-draft"]], ["edx-prod-3"])
+
+
+class CurrentProductStateTests(TestCase):
+    """Tests for current_product_state"""
+
+    def test_projects_platform_product(self):
+        def attribute(name, value):
+            return SimpleNamespace(name=name, value=value)
+
+        master = SimpleNamespace(key="edx-prod-1-var", attributes=[
+            attribute("duration", "6 weeks"),
+            attribute("level", {"key": "intro", "label": {"en-US": "Introductory"}}),
+            attribute("languages", [{"key": "en", "label": "English"}, {"key": "es", "label": "Spanish"}]),
+        ])
+        product = SimpleNamespace(key="edx-prod-1", master_data=SimpleNamespace(current=SimpleNamespace(
+            name={"en-US": "Course"},
+            slug={"en-US": "edx-prod-1"},
+            description=None,
+            master_variant=master,
+            variants=[SimpleNamespace(key="edx-prod-1-other", attributes=None)],
+        )))
+
+        self.assertEqual(current_product_state(product), {
+            "key": "edx-prod-1",
+            "name": {"en-US": "Course"},
+            "slug": {"en-US": "edx-prod-1"},
+            "description": None,
+            "variants": {
+                "edx-prod-1-var": {"duration": "6 weeks", "level": "intro", "languages": ["en", "es"]},
+                "edx-prod-1-other": {},
+            },
+        })
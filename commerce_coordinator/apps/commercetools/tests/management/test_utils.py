@@ -0,0 +1,138 @@
+"""Tests for the helpers of the Commercetools management commands."""
+import threading
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from commerce_coordinator.apps.commercetools.management.commands._utils import (
+    TokenBucket,
+    iter_orders_created_between,
+    split_date_range
+)
+
+
+class FakeClock:
+    """ Stands in for the time module: sleeping advances the clock instead of blocking """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+        self.lock = threading.Lock()
+
+    def monotonic(self):
+        with self.lock:
+            return self.now
+
+    def sleep(self, seconds):
+        with self.lock:
+            self.sleeps.append(seconds)
+
+    def advance(self, seconds):
+        with self.lock:
+            self.now += seconds
+
+
+class TokenBucketTests(TestCase):
+    """Tests for TokenBucket."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = patch('commerce_coordinator.apps.commercetools.management.commands._utils.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_up_to_capacity_without_waiting(self):
+        bucket = TokenBucket(rate=2, capacity=3)
+
+        for _ in range(3):
+            bucket.acquire()
+
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_callers_beyond_capacity_wait_their_turn(self):
+        bucket = TokenBucket(rate=2, capacity=1)
+
+        for _ in range(4):
+            bucket.acquire()
+
+        # Each caller waits out the debt of the ones queued before it, at 2 tokens per second
+        self.assertEqual(self.clock.sleeps, [0.5, 1.0, 1.5])
+
+    def test_tokens_refill_over_time(self):
+        bucket = TokenBucket(rate=2, capacity=2)
+        bucket.acquire()
+        bucket.acquire()
+
+        self.clock.advance(0.5)
+        bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+
+        # Refills stop at the capacity, however long the bucket was idle
+        self.clock.advance(60)
+        for _ in range(3):
+            bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [0.5])
+
+    def test_concurrent_callers_share_the_rate(self):
+        bucket = TokenBucket(rate=10, capacity=1)
+
+        threads = [threading.Thread(target=bucket.acquire) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(sorted(self.clock.sleeps), [0.1, 0.2, 0.3, 0.4])
+
+
+class SplitDateRangeTests(TestCase):
+    """Tests for split_date_range."""
+
+    def test_windows_cover_the_range(self):
+        windows = split_date_range("2024-01-01T00:00:00", "2024-01-20T12:00:00", 7)
+
+        self.assertEqual(windows, [
+            ("2024-01-01T00:00:00.000Z", "2024-01-08T00:00:00.000Z"),
+            ("2024-01-08T00:00:00.000Z", "2024-01-15T00:00:00.000Z"),
+            ("2024-01-15T00:00:00.000Z", "2024-01-20T12:00:00.000Z"),
+        ])
+
+    def test_dates_are_converted_to_utc(self):
+        windows = split_date_range("2024-01-01T02:00:00+02:00", "2024-01-02T00:00:00", 7)
+
+        self.assertEqual(windows, [("2024-01-01T00:00:00.000Z", "2024-01-02T00:00:00.000Z")])
+
+    def test_empty_range(self):
+        self.assertEqual(split_date_range("2024-01-02", "2024-01-01", 7), [])
+
+    def test_range_ends_now_by_default(self):
+        windows = split_date_range("2024-01-01", None, 10000)
+
+        self.assertEqual(len(windows), 1)
+        self.assertEqual(windows[0][0], "2024-01-01T00:00:00.000Z")
+
+
+class IterOrdersCreatedBetweenTests(TestCase):
+    """Tests for iter_orders_created_between."""
+
+    def test_window_is_a_keyset_query(self):
+        client = Mock()
+        client.iter_query.return_value = iter(["order-1", "order-2"])
+
+        orders = iter_orders_created_between(
+            client,
+            ("2024-01-01T00:00:00.000Z", "2024-01-08T00:00:00.000Z"),
+            where=['orderState="Complete"'],
+            page_size=100,
+        )
+
+        self.assertEqual(list(orders), ["order-1", "order-2"])
+        client.iter_query.assert_called_once_with(
+            "orders",
+            where=[
+                'orderState="Complete"',
+                'createdAt >= "2024-01-01T00:00:00.000Z" and createdAt < "2024-01-08T00:00:00.000Z"',
+            ],
+            keyset="createdAt",
+            page_size=100,
+            expand=None,
+        )
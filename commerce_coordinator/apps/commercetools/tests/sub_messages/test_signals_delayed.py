@@ -27,7 +27,9 @@ class FulfillOrderPlacedMessageSignalTest(CoordinatorSignalReceiverTestCase):
         'line_item_state_id': uuid4_str(),
         'source_system': SOURCE_SYSTEM,
         'message_id': uuid4_str(),
-        'is_order_fulfillment_forwarding_enabled': False
+        'is_order_fulfillment_forwarding_enabled': False,
+        'is_bundle_fulfillment_chord_enabled': False,
+        'is_bulk_fulfillment_enabled': False
     }
 
     def test_correct_arguments_passed(self, mock_task):
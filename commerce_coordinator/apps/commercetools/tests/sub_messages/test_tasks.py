@@ -1,18 +1,21 @@
 """Commercetools Task Tests"""
 import logging
 from unittest import TestCase
-from unittest.mock import MagicMock, Mock, call, patch
+from unittest.mock import ANY, MagicMock, Mock, patch
 
 from commercetools import CommercetoolsError
 from commercetools.platform.models import Order as CTOrder
 from commercetools.platform.models import ReturnInfo as CTReturnInfo
 from commercetools.platform.models import ReturnPaymentState as CTReturnPaymentState
+from django.test import override_settings
 from edx_django_utils.cache import TieredCache
 
-from commerce_coordinator.apps.commercetools.catalog_info.constants import TwoUKeys
+from commerce_coordinator.apps.commercetools.catalog_info.constants import OrderReadProfiles, TwoUKeys
 from commerce_coordinator.apps.commercetools.clients import CommercetoolsAPIClient
 from commerce_coordinator.apps.commercetools.constants import SOURCE_SYSTEM
 from commerce_coordinator.apps.commercetools.sub_messages.tasks import (
+    fulfill_order_placed_bundle_completed_task,
+    fulfill_order_placed_bundle_failed_task,
     fulfill_order_placed_message_signal_task,
     fulfill_order_returned_signal_task,
     fulfill_order_sanctioned_message_signal_task
@@ -194,7 +197,7 @@ class FulfillOrderPlacedMessageSignalTaskTests(TestCase):
         _lms_signal
     ):
         """
-        Test fulfill_order_placed_message_signal_task calls OrderFulfillmentAPIClient
+        Test fulfill_order_placed_message_signal_task enqueues fulfill_order_task
         when is_order_fulfillment_forwarding_enabled is True.
 
         """
@@ -206,23 +209,18 @@ class FulfillOrderPlacedMessageSignalTaskTests(TestCase):
         mock_values = _ct_client_init.return_value
         mock_tasks_client.return_value = mock_values
 
-        mock_client_instance = MagicMock()
-        mock_client_instance.fulfill_order.return_value = None
-
         with patch(
-            'commerce_coordinator.apps.commercetools.sub_messages.tasks.OrderFulfillmentAPIClient'
-        ) as mock_client_class:
-            mock_client_class.return_value = mock_client_instance
-
+            'commerce_coordinator.apps.commercetools.sub_messages.tasks.fulfill_order_task'
+        ) as mock_fulfill_order_task:
             payload = mock_values.example_payload.copy()
             payload['is_order_fulfillment_forwarding_enabled'] = True
 
             # pylint: disable = no-value-for-parameter
             fulfill_order_placed_message_signal_task(*self.unpack_for_uut(payload))
 
-            mock_client_instance.fulfill_order.assert_called_once()
+            mock_fulfill_order_task.delay.assert_called_once()
 
-            called_args = mock_client_instance.fulfill_order.call_args[0]
+            called_args = mock_fulfill_order_task.delay.call_args[0]
             called_payload = called_args[0]
 
             self.assertIn('course_id', called_payload)
@@ -355,6 +353,204 @@ class FulfillOrderPlacedMessageSignalTaskTests(TestCase):
         canvas_entry_properties = mock_send_email.call_args[0][2]
         self.assertFalse(canvas_entry_properties.get('hide_receipt_cta'))
 
+    @override_settings(CELERY_RESULT_BACKEND='redis://localhost:6379/0')
+    @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.send_order_confirmation_email')
+    @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.chord')
+    @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.check_is_bundle', return_value=True)
+    @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.CommercetoolsAPIClient')
+    def test_bundle_fulfilled_with_chord(
+            self,
+            mock_tasks_client,
+            _mock_is_bundle,
+            mock_chord,
+            mock_send_email,
+            ct_client_init: CommercetoolsAPIClientMock,
+            lms_signal
+    ):
+        """Test that bundle line items are fulfilled by a chord instead of per-item signals."""
+        mock_values = ct_client_init.return_value
+        mock_tasks_client.return_value = mock_values
+
+        ret_val = self.get_uut()(*self.unpack_for_uut(mock_values.example_payload), True)
+        self.assertTrue(ret_val)
+
+        lms_signal.assert_not_called()
+        mock_chord.assert_called_once()
+        header = mock_chord.call_args[0][0]
+        self.assertEqual(len(header.tasks), 1)
+        self.assertTrue(header.tasks[0].kwargs['defer_completion_update'])
+
+        callback = mock_chord.return_value.call_args[0][0]
+        self.assertEqual(callback.kwargs['order_id'], mock_values.order_id)
+        [errback] = callback.options['link_error']
+        self.assertEqual(errback['task'], fulfill_order_placed_bundle_failed_task.name)
+        self.assertEqual(errback['kwargs']['line_items'], [
+            {key: header.tasks[0].kwargs[key] for key in ('line_item_id', 'item_quantity')}
+        ])
+
+        # The confirmation email is left to the chord callback
+        mock_send_email.assert_not_called()
+
+    @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.send_order_confirmation_email')
+    @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.chord')
+    @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.check_is_bundle', return_value=True)
+    @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.CommercetoolsAPIClient')
+    def test_bundle_without_result_backend_fulfilled_per_item(
+            self,
+            mock_tasks_client,
+            _mock_is_bundle,
+            mock_chord,
+            mock_send_email,
+            ct_client_init: CommercetoolsAPIClientMock,
+            lms_signal
+    ):
+        """Test that a bundle isn't fulfilled by a chord when there's no result backend to gather its results."""
+        mock_values = ct_client_init.return_value
+        mock_tasks_client.return_value = mock_values
+
+        ret_val = self.get_uut()(*self.unpack_for_uut(mock_values.example_payload), True)
+        self.assertTrue(ret_val)
+
+        mock_chord.assert_not_called()
+        lms_signal.assert_called_once()
+        mock_send_email.assert_called_once()
+
+    @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.fulfill_order_placed_send_line_items_task')
+    @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.get_edx_items',
+           side_effect=lambda order: order.line_items * 2)
+    @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.CommercetoolsAPIClient')
+    def test_multiple_line_items_fulfilled_together(
+            self,
+            mock_tasks_client,
+            _mock_edx_items,
+            mock_line_items_task,
+            ct_client_init: CommercetoolsAPIClientMock,
+            lms_signal
+    ):
+        """Test that the LMS line items of a multi-course order are sent to one task instead of per-item signals."""
+        mock_values = ct_client_init.return_value
+        mock_tasks_client.return_value = mock_values
+
+        # pylint: disable=no-value-for-parameter
+        ret_val = self.get_uut()(*self.unpack_for_uut(mock_values.example_payload), is_bulk_fulfillment_enabled=True)
+        self.assertTrue(ret_val)
+
+        lms_signal.assert_not_called()
+        mock_line_items_task.delay.assert_called_once()
+        enrollments, entitlements = mock_line_items_task.delay.call_args[0]
+        self.assertEqual(len(enrollments), 2)
+        self.assertEqual(entitlements, [])
+
+    @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.fulfill_order_placed_send_line_items_task')
+    @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.get_edx_items',
+           side_effect=lambda order: order.line_items * 2)
+    @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.CommercetoolsAPIClient')
+    def test_multiple_line_items_fulfilled_per_item_by_default(
+            self,
+            mock_tasks_client,
+            _mock_edx_items,
+            mock_line_items_task,
+            ct_client_init: CommercetoolsAPIClientMock,
+            lms_signal
+    ):
+        """Test that the LMS line items of a multi-course order are signalled one by one without the bulk flag."""
+        mock_values = ct_client_init.return_value
+        mock_tasks_client.return_value = mock_values
+
+        ret_val = self.get_uut()(*self.unpack_for_uut(mock_values.example_payload))  # pylint: disable=E1120
+        self.assertTrue(ret_val)
+
+        self.assertEqual(lms_signal.call_count, 2)
+        mock_line_items_task.delay.assert_not_called()
+
+    @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.fulfill_order_task')
+    @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.fulfill_order_bulk_task')
+    @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.User.objects.get')
+    @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.get_edx_items',
+           side_effect=lambda order: order.line_items * 2)
+    @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.CommercetoolsAPIClient')
+    def test_multiple_line_items_forwarded_together(
+            self,
+            mock_tasks_client,
+            _mock_edx_items,
+            mock_user_get,
+            mock_bulk_task,
+            mock_single_task,
+            ct_client_init: CommercetoolsAPIClientMock,
+            _lms_signal
+    ):
+        """Test that a multi-course order is forwarded to the Order Fulfillment service by one task."""
+        mock_user_get.return_value.username = 'test-username'
+        mock_values = ct_client_init.return_value
+        mock_tasks_client.return_value = mock_values
+        payload = {**mock_values.example_payload, 'is_order_fulfillment_forwarding_enabled': True}
+
+        # pylint: disable=no-value-for-parameter
+        self.get_uut()(*self.unpack_for_uut(payload), is_bulk_fulfillment_enabled=True)
+
+        mock_single_task.delay.assert_not_called()
+        mock_bulk_task.delay.assert_called_once()
+        fulfillments = mock_bulk_task.delay.call_args[0][0]
+        self.assertEqual(len(fulfillments), 2)
+        self.assertEqual(fulfillments[0][0]['edx_lms_username'], 'test-username')
+
+
+@patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.send_order_confirmation_email')
+@patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.CommercetoolsAPIClient',
+       new_callable=CommercetoolsAPIClientMock)
+class FulfillOrderPlacedBundleCompletedTaskTests(TestCase):
+    """Tests for the fulfill_order_placed_bundle_completed_task chord callback"""
+
+    def test_single_update_and_email(self, ct_client_init: CommercetoolsAPIClientMock, mock_send_email):
+        mock_values = ct_client_init.return_value
+        fulfillment_results = [
+            {'line_item_id': uuid4_str(), 'item_quantity': 1, 'is_fulfilled': True, 'entitlement_uuid': uuid4_str()},
+            {'line_item_id': uuid4_str(), 'item_quantity': 1, 'is_fulfilled': False, 'entitlement_uuid': None},
+        ]
+
+        # pylint: disable=no-value-for-parameter
+        ret_val = fulfill_order_placed_bundle_completed_task(
+            fulfillment_results,
+            order_id=mock_values.order_id,
+            message_id=uuid4_str(),
+            lms_user_id=1,
+            user_email='test@example.com',
+            canvas_entry_properties={'products': []}
+        )
+
+        self.assertTrue(ret_val)
+        mock_values.update_line_items_on_fulfillment.assert_called_once_with(
+            mock_values.expected_order, fulfillment_results
+        )
+        mock_send_email.assert_called_once_with(1, 'test@example.com', {'products': []})
+        self.assertTrue(TieredCache.get_cached_response(mock_values.cache_key).is_found)
+
+
+@patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.CommercetoolsAPIClient',
+       new_callable=CommercetoolsAPIClientMock)
+class FulfillOrderPlacedBundleFailedTaskTests(TestCase):
+    """Tests for the fulfill_order_placed_bundle_failed_task chord error callback"""
+
+    def test_line_items_failed(self, ct_client_init: CommercetoolsAPIClientMock):
+        mock_values = ct_client_init.return_value
+        line_item_id = uuid4_str()
+
+        ret_val = fulfill_order_placed_bundle_failed_task(
+            Mock(id=uuid4_str()),
+            ValueError('LMS fulfillment failed'),
+            None,
+            order_id=mock_values.order_id,
+            message_id=uuid4_str(),
+            lms_user_id=1,
+            line_items=[{'line_item_id': line_item_id, 'item_quantity': 2}]
+        )
+
+        self.assertTrue(ret_val)
+        mock_values.update_line_items_on_fulfillment.assert_called_once_with(
+            mock_values.expected_order,
+            [{'line_item_id': line_item_id, 'item_quantity': 2, 'is_fulfilled': False, 'entitlement_uuid': None}]
+        )
+
 
 @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.LMSAPIClient.deactivate_user',
        return_value=None)
@@ -383,7 +579,9 @@ class OrderSanctionedMessageSignalTaskTests(TestCase):
         mock_values = _ct_client_init.return_value
         _ = self.get_uut()(*self.unpack_for_uut(mock_values.example_payload))
 
-        mock_values.order_mock.assert_called_once_with(mock_values.expected_order.id)
+        mock_values.order_mock.assert_called_once_with(
+            mock_values.expected_order.id, expand=OrderReadProfiles.FULFILLMENT
+        )
         mock_values.customer_mock.assert_called_once_with(mock_values.expected_customer.id)
 
     @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.is_edx_lms_order',
@@ -398,7 +596,7 @@ class OrderSanctionedMessageSignalTaskTests(TestCase):
         ret_val = self.get_uut()(*self.unpack_for_uut(mock_values.example_payload))
 
         self.assertTrue(ret_val)
-        mock_values.order_mock.assert_called_once_with(mock_values.order_id)
+        mock_values.order_mock.assert_called_once_with(mock_values.order_id, expand=OrderReadProfiles.FULFILLMENT)
         mock_values.customer_mock.assert_called_once_with(mock_values.customer_id)
 
     @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.get_edx_order_workflow_state_key',
@@ -413,7 +611,7 @@ class OrderSanctionedMessageSignalTaskTests(TestCase):
         ret_val = self.get_uut()(*self.unpack_for_uut(mock_values.example_payload))
 
         self.assertTrue(ret_val)
-        mock_values.order_mock.assert_called_once_with(mock_values.order_id)
+        mock_values.order_mock.assert_called_once_with(mock_values.order_id, expand=OrderReadProfiles.FULFILLMENT)
         mock_values.customer_mock.assert_called_once_with(mock_values.customer_id)
 
     @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.get_edx_is_sanctioned',
@@ -427,7 +625,7 @@ class OrderSanctionedMessageSignalTaskTests(TestCase):
 
         ret_val = self.get_uut()(*self.unpack_for_uut(mock_values.example_payload))
         self.assertFalse(ret_val)
-        mock_values.order_mock.assert_called_once_with(mock_values.order_id)
+        mock_values.order_mock.assert_called_once_with(mock_values.order_id, expand=OrderReadProfiles.FULFILLMENT)
         mock_values.customer_mock.assert_called_once_with(mock_values.customer_id)
 
     @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.get_edx_is_sanctioned',
@@ -441,7 +639,7 @@ class OrderSanctionedMessageSignalTaskTests(TestCase):
 
         ret_val = self.get_uut()(*self.unpack_for_uut(mock_values.example_payload))
         self.assertTrue(ret_val)
-        mock_values.order_mock.assert_called_once_with(mock_values.order_id)
+        mock_values.order_mock.assert_called_once_with(mock_values.order_id, expand=OrderReadProfiles.FULFILLMENT)
         mock_values.customer_mock.assert_called_once_with(mock_values.customer_id)
 
 
@@ -469,6 +667,7 @@ class OrderReturnedMessageSignalTaskTests(TestCase):
             {
                 '__init__': lambda _: None,
                 'get_order_by_id': self.mock.get_order_by_id,
+                'get_order_and_customer_by_order_id': self.mock.get_order_and_customer_by_order_id,
                 'get_customer_by_id': self.mock.get_customer_by_id,
                 'get_payment_by_key': self.mock.get_payment_by_key,
                 'create_return_for_order': self.mock.create_return_for_order,
@@ -514,8 +713,8 @@ class OrderReturnedMessageSignalTaskTests(TestCase):
         ret_val = self.get_uut()(*self.unpack_for_uut(self.mock.example_payload))
 
         self.assertTrue(ret_val)
-        mock_values.order_mock.assert_has_calls([call(mock_values.order_id), call(order_id=mock_values.order_id)])
-        mock_values.customer_mock.assert_called_once_with(mock_values.customer_id)
+        mock_values.get_order_and_customer_by_order_id.assert_called_once_with(mock_values.order_id, ANY)
+        mock_values.order_mock.assert_any_call(order_id=mock_values.order_id)
 
     @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.is_edx_lms_order')
     @patch('commerce_coordinator.apps.stripe.pipeline.StripeAPIClient')
@@ -550,8 +749,8 @@ class OrderReturnedMessageSignalTaskTests(TestCase):
         ret_val = self.get_uut()(*self.unpack_for_uut(self.mock.example_payload))
 
         self.assertTrue(ret_val)
-        mock_values.order_mock.assert_has_calls([call(mock_values.order_id), call(order_id=mock_values.order_id)])
-        mock_values.customer_mock.assert_called_once_with(mock_values.customer_id)
+        mock_values.get_order_and_customer_by_order_id.assert_called_once_with(mock_values.order_id, ANY)
+        mock_values.order_mock.assert_any_call(order_id=mock_values.order_id)
         _stripe_api_mock.return_value.refund_payment_intent.assert_called_once()
 
     @patch('commerce_coordinator.apps.commercetools.sub_messages.tasks.get_edx_psp_payment_id')
@@ -690,8 +889,7 @@ class FulfillOrderReturnedSignalTaskTests(TestCase):
         ret_val = self.get_uut()(*self.unpack_for_uut(payload))
 
         self.assertTrue(ret_val)
-        mock_values.order_mock.assert_called_once_with(mock_values.order_id)
-        mock_values.customer_mock.assert_called_once_with(mock_values.customer_id)
+        mock_values.get_order_and_customer_by_order_id.assert_called_once_with(mock_values.order_id, ANY)
         self.mock_revoke_line_send.assert_called_once_with(
             sender=fulfill_order_returned_signal_task,
             order_id=payload["order_id"],
@@ -703,27 +901,26 @@ class FulfillOrderReturnedSignalTaskTests(TestCase):
         Check calling uut when order is not found.
         """
         mock_values = _ct_client_init.return_value
-        mock_values.get_order_by_id.side_effect = CommercetoolsError(
+        mock_values.get_order_and_customer_by_order_id.side_effect = CommercetoolsError(
             message="Order not found", response={}, errors="Order not found")
         with self.assertRaises(CommercetoolsError):
             self.get_uut()(*self.unpack_for_uut(mock_values.example_payload))
 
         self.mock_revoke_line_send.assert_not_called()
-        mock_values.order_mock.assert_called_once_with(mock_values.order_id)
+        mock_values.get_order_and_customer_by_order_id.assert_called_once_with(mock_values.order_id, ANY)
 
     def test_customer_not_found(self, _ct_client_init: CommercetoolsAPIClientMock, _run_filter_mock):
         """
         Check calling uut when customer is not found.
         """
         mock_values = _ct_client_init.return_value
-        mock_values.get_customer_by_id.side_effect = CommercetoolsError(
+        mock_values.get_order_and_customer_by_order_id.side_effect = CommercetoolsError(
             message="Customer not found", response={}, errors="Customer not found")
         with self.assertRaises(CommercetoolsError):
             self.get_uut()(*self.unpack_for_uut(mock_values.example_payload))
 
         self.mock_revoke_line_send.assert_not_called()
-        mock_values.order_mock.assert_called_once_with(mock_values.order_id)
-        mock_values.customer_mock.assert_called_once_with(mock_values.customer_id)
+        mock_values.get_order_and_customer_by_order_id.assert_called_once_with(mock_values.order_id, ANY)
 
     def test_not_edx_order(self, _ct_client_init: CommercetoolsAPIClientMock, _run_filter_mock):
         """
@@ -736,8 +933,7 @@ class FulfillOrderReturnedSignalTaskTests(TestCase):
 
         self.assertTrue(ret_val)
         self.mock_revoke_line_send.assert_not_called()
-        mock_values.order_mock.assert_called_once_with(mock_values.order_id)
-        mock_values.customer_mock.assert_called_once_with(mock_values.customer_id)
+        mock_values.get_order_and_customer_by_order_id.assert_called_once_with(mock_values.order_id, ANY)
 
     def test_refund_successful(self, _ct_client_init: CommercetoolsAPIClientMock, _run_filter_mock):
         """
@@ -749,8 +945,7 @@ class FulfillOrderReturnedSignalTaskTests(TestCase):
         ret_val = self.get_uut()(*self.unpack_for_uut(payload))
 
         self.assertTrue(ret_val)
-        mock_values.order_mock.assert_called_once_with(mock_values.order_id)
-        mock_values.customer_mock.assert_called_once_with(mock_values.customer_id)
+        mock_values.get_order_and_customer_by_order_id.assert_called_once_with(mock_values.order_id, ANY)
         self.mock_revoke_line_send.assert_called_once_with(
             sender=fulfill_order_returned_signal_task,
             order_id=payload["order_id"],
@@ -771,8 +966,7 @@ class FulfillOrderReturnedSignalTaskTests(TestCase):
         ret_val = self.get_uut()(*self.unpack_for_uut(payload))
 
         self.assertTrue(ret_val)
-        mock_values.order_mock.assert_called_once_with(mock_values.order_id)
-        mock_values.customer_mock.assert_called_once_with(mock_values.customer_id)
+        mock_values.get_order_and_customer_by_order_id.assert_called_once_with(mock_values.order_id, ANY)
         self.mock_revoke_line_send.assert_called_once_with(
             sender=fulfill_order_returned_signal_task,
             order_id=payload["order_id"],
@@ -789,5 +983,4 @@ class FulfillOrderReturnedSignalTaskTests(TestCase):
             self.get_uut()(*self.unpack_for_uut(mock_values.example_payload))
 
         self.mock_revoke_line_send.assert_not_called()
-        mock_values.order_mock.assert_called_once_with(mock_values.order_id)
-        mock_values.customer_mock.assert_called_once_with(mock_values.customer_id)
+        mock_values.get_order_and_customer_by_order_id.assert_called_once_with(mock_values.order_id, ANY)
@@ -1,6 +1,9 @@
 """ Commercetools API Client(s) Testing """
 
-from datetime import datetime
+import re
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
 from unittest.mock import MagicMock, Mock
 
 import pytest
@@ -33,20 +36,29 @@ from commercetools.platform.models import (
 from commercetools.platform.models import Type as CustomType
 from commercetools.platform.models import TypeDraft as CustomTypeDraft
 from commercetools.platform.models import TypeReference
+from django.db import DatabaseError
 from django.test import TestCase
 from mock import patch
 from openedx_filters.exceptions import OpenEdxFilterException
 from requests import Response
 
-from commerce_coordinator.apps.commercetools.catalog_info.constants import EdXFieldNames, TwoUKeys
+from commerce_coordinator.apps.commercetools.catalog_info.constants import (
+    DEFAULT_ORDER_EXPANSION,
+    EdXFieldNames,
+    OrderReadProfiles,
+    TwoUKeys
+)
 from commerce_coordinator.apps.commercetools.catalog_info.foundational_types import TwoUCustomTypes
-from commerce_coordinator.apps.commercetools.clients import OrderWithReturnInfo, PaginatedResult
+from commerce_coordinator.apps.commercetools.clients import CommercetoolsAPIClient, OrderWithReturnInfo, PaginatedResult
+from commerce_coordinator.apps.commercetools.lazy import LazyModel
+from commerce_coordinator.apps.commercetools.models import CustomerIndex
 from commerce_coordinator.apps.commercetools.tests.conftest import (
     DEFAULT_EDX_LMS_USER_ID,
     APITestingSet,
     gen_cart,
     gen_customer,
     gen_example_customer,
+    gen_graphql_order_details,
     gen_line_item_state,
     gen_order,
     gen_order_history,
@@ -56,6 +68,12 @@ from commerce_coordinator.apps.commercetools.tests.conftest import (
     gen_return_item
 )
 from commerce_coordinator.apps.core.constants import ORDER_HISTORY_PER_SYSTEM_REQ_LIMIT
+from commerce_coordinator.apps.core.rate_limit import (
+    AdaptiveRateLimiter,
+    InMemoryRateLimitStore,
+    Priority,
+    outbound_priority
+)
 from commerce_coordinator.apps.core.tests.utils import uuid4_str
 
 
@@ -185,6 +203,42 @@ class ClientTests(TestCase):
             ret_val = self.client_set.client.get_customer_by_lms_user_id(id_num)
 
             self.assertEqual(ret_val.custom.fields[EdXFieldNames.LMS_USER_ID], f"{id_num}")
+            self.assertEqual(CustomerIndex.objects.get(lms_user_id=id_num).customer_id, customer.id)
+
+    def test_get_customer_by_lms_user_id_indexed(self):
+        id_num = 127
+        type_val = self.client_set.client.ensure_custom_type_exists(TwoUCustomTypes.CUSTOMER_TYPE_DRAFT)
+        customer = gen_example_customer()
+        customer.custom.fields[EdXFieldNames.LMS_USER_ID] = f"{id_num}"
+        customer.custom.type.id = type_val.id
+
+        self.client_set.backend_repo.customers.add_existing(customer)
+        CustomerIndex.objects.create(lms_user_id=id_num, customer_id=customer.id, customer_version=0)
+
+        with patch.object(self.client_set.client.base_client.customers, 'query') as query_mock:
+            ret_val = self.client_set.client.get_customer_by_lms_user_id(id_num)
+
+        self.assertEqual(ret_val.id, customer.id)
+        query_mock.assert_not_called()
+        self.assertEqual(CustomerIndex.objects.get(lms_user_id=id_num).customer_version, customer.version)
+
+    def test_get_customer_by_lms_user_id_stale_index(self):
+        id_num = 127
+        type_val = self.client_set.client.ensure_custom_type_exists(TwoUCustomTypes.CUSTOMER_TYPE_DRAFT)
+        customer = gen_example_customer()
+        customer.custom.fields[EdXFieldNames.LMS_USER_ID] = "128"
+        customer.custom.type.id = type_val.id
+
+        self.client_set.backend_repo.customers.add_existing(customer)
+        CustomerIndex.objects.create(lms_user_id=id_num, customer_id=customer.id, customer_version=customer.version)
+
+        with patch.object(self.client_set.client.base_client.customers, 'query') as query_mock:
+            query_mock.return_value = CustomerPagedQueryResponse(limit=2, count=0, total=0, offset=0, results=[])
+            ret_val = self.client_set.client.get_customer_by_lms_user_id(id_num)
+
+        self.assertIsNone(ret_val)
+        query_mock.assert_called_once()
+        self.assertFalse(CustomerIndex.objects.filter(lms_user_id=id_num).exists())
 
     def test_get_customer_by_lms_user_id_should_fail_on_more_than_1(self):
         id_num = 127
@@ -233,6 +287,26 @@ class ClientTests(TestCase):
             result = self.client_set.client.get_order_by_number(order_number)
             self.assertEqual(result, expected_order)
 
+    def test_get_order_by_id_read_profiles(self):
+        base_url = self.client_set.get_base_url_from_client()
+        order_id = "mock_order_id"
+        expected_order = gen_order(order_id)
+
+        with requests_mock.Mocker(real_http=True, case_sensitive=False) as mocker:
+            mocker.get(
+                f"{base_url}orders/{order_id}",
+                json=expected_order.serialize()
+            )
+
+            self.client_set.client.get_order_by_id(order_id, expand=OrderReadProfiles.MINIMAL)
+            self.assertNotIn('expand', mocker.last_request.qs)
+
+            self.client_set.client.get_order_by_id(order_id, expand=OrderReadProfiles.FULFILLMENT)
+            self.assertEqual(mocker.last_request.qs['expand'], ['state'])
+
+            self.client_set.client.get_order_by_id(order_id)
+            self.assertEqual(len(mocker.last_request.qs['expand']), len(DEFAULT_ORDER_EXPANSION))
+
     def test_get_customer_by_id(self):
         base_url = self.client_set.get_base_url_from_client()
         expected_customer = gen_example_customer()
@@ -426,6 +500,63 @@ class ClientTests(TestCase):
             self.assertEqual(ret_orders[0].next_offset(), params['limit'])
             self.assertEqual(ret_orders[0].offset, params['offset'])
 
+    def test_get_orders_lazy(self):
+        base_url = self.client_set.get_base_url_from_client()
+        order = gen_order(uuid4_str())
+
+        with requests_mock.Mocker(real_http=True, case_sensitive=False) as mocker:
+            mocker.get(
+                f"{base_url}orders",
+                json=OrderPagedQueryResponse(limit=2, count=1, total=3, offset=2, results=[order]).serialize()
+            )
+
+            ret_orders = self.client_set.client.get_orders(order.customer_id, offset=2, limit=2, lazy=True)
+
+            self.assertEqual(ret_orders.total, 3)
+            self.assertEqual(ret_orders.offset, 2)
+            self.assertIsInstance(ret_orders.results[0], LazyModel)
+            self.assertIsInstance(ret_orders.results[0], Order)
+            self.assertEqual(ret_orders.results[0].id, order.id)
+            self.assertEqual(ret_orders.results[0].line_items[0].name, order.line_items[0].name)
+
+            query = mocker.last_request.qs
+            self.assertEqual(query['limit'], ['2'])
+            self.assertEqual(query['offset'], ['2'])
+            self.assertEqual(len(query['where']), 2)
+            self.assertEqual(query['sort'], ['completedat desc', 'lastmodifiedat desc'])
+
+    def test_get_orders_lazy_error(self):
+        base_url = self.client_set.get_base_url_from_client()
+
+        with requests_mock.Mocker(real_http=True, case_sensitive=False) as mocker:
+            mocker.get(
+                f"{base_url}orders",
+                json={
+                    "statusCode": 400,
+                    "message": "Malformed parameter: where",
+                    "errors": [{"code": "InvalidInput", "message": "Malformed parameter: where"}],
+                },
+                status_code=400
+            )
+
+            with self.assertRaises(CommercetoolsError) as cm:
+                self.client_set.client.get_orders(uuid4_str(), lazy=True)
+
+            self.assertEqual(str(cm.exception), "Malformed parameter: where")
+            self.assertEqual(cm.exception.errors[0]["code"], "InvalidInput")
+
+    def test_get_orders_lazy_error_without_json_body(self):
+        base_url = self.client_set.get_base_url_from_client()
+
+        with requests_mock.Mocker(real_http=True, case_sensitive=False) as mocker:
+            mocker.get(f"{base_url}orders", text="<html>502 Bad Gateway</html>", status_code=502)
+
+            with self.assertRaises(CommercetoolsError) as cm:
+                self.client_set.client.get_orders(uuid4_str(), lazy=True)
+
+            self.assertEqual(cm.exception.response.status_code, 502)
+            self.assertEqual(cm.exception.errors, [])
+
     def test_create_return_for_order_success(self):
         base_url = self.client_set.get_base_url_from_client()
 
@@ -458,9 +589,8 @@ class ClientTests(TestCase):
             "message": "Could not create return for order mock_order_id",
             "errors": [
                 {
-                    "code": "ConcurrentModification",
-                    "message": "Object [mock_order_id] has a "
-                               "different version than expected. Expected: 2 - Actual: 1.",
+                    "code": "InvalidOperation",
+                    "message": "The update is not allowed for order [mock_order_id].",
                 },
             ],
             "response": {},
@@ -652,9 +782,8 @@ class ClientTests(TestCase):
             "message": "Could not create return for order mock_order_id",
             "errors": [
                 {
-                    "code": "ConcurrentModification",
-                    "message": "Object [mock_order_id] has a "
-                               "different version than expected. Expected: 2 - Actual: 1.",
+                    "code": "InvalidOperation",
+                    "message": "The update is not allowed for order [mock_order_id].",
                 },
             ],
             "response": {},
@@ -733,9 +862,8 @@ class ClientTests(TestCase):
             "message": "Could not create return for order mock_order_id",
             "errors": [
                 {
-                    "code": "ConcurrentModification",
-                    "message": "Object [mock_order_id] has a "
-                               "different version than expected. Expected: 2 - Actual: 1."
+                    "code": "InvalidOperation",
+                    "message": "The update is not allowed for order [mock_order_id]."
                 },
             ],
             "response": {},
@@ -820,9 +948,8 @@ class ClientTests(TestCase):
             "message": "Could not create return for order mock_order_id",
             "errors": [
                 {
-                    "code": "ConcurrentModification",
-                    "message": "Object [mock_order_id] has a "
-                               "different version than expected. Expected: 2 - Actual: 1."
+                    "code": "InvalidOperation",
+                    "message": "The update is not allowed for order [mock_order_id]."
                 },
             ],
             "response": {},
@@ -892,6 +1019,62 @@ class ClientTests(TestCase):
             self.assertEqual(result.id, mock_order.id)
             self.assertEqual(result.version, mock_order.version)
 
+    @patch('commerce_coordinator.apps.commercetools.clients.CommercetoolsAPIClient.get_state_by_id')
+    def test_update_line_items_on_fulfillment_single_update(self, mock_state_by_id):
+        base_url = self.client_set.get_base_url_from_client()
+
+        mock_order = gen_order("mock_order_id")
+        mock_line_item_state = gen_line_item_state()
+        mock_line_item_state.key = TwoUKeys.PROCESSING_FULFILMENT_STATE
+        mock_order.line_items[0].state[0].state = mock_line_item_state
+        mock_state_by_id.return_value = mock_line_item_state
+
+        fulfillment_results = [
+            {'line_item_id': mock_order.line_items[0].id, 'item_quantity': 1, 'is_fulfilled': True,
+             'entitlement_uuid': 'mock-entitlement-uuid'},
+            {'line_item_id': 'missing-line-item-id', 'item_quantity': 1, 'is_fulfilled': False,
+             'entitlement_uuid': None},
+        ]
+
+        with requests_mock.Mocker(real_http=True, case_sensitive=False) as mocker:
+            mocker.post(
+                f"{base_url}orders/{mock_order.id}",
+                json=mock_order.serialize(),
+                status_code=200
+            )
+
+            self.client_set.client.update_line_items_on_fulfillment(mock_order, fulfillment_results)
+
+            self.assertEqual(mocker.call_count, 1)
+            actions = mocker.last_request.json()['actions']
+
+        self.assertEqual(
+            [action['action'] for action in actions],
+            ['setLineItemCustomField', 'transitionLineItemState']
+        )
+        self.assertEqual(actions[0]['value'], 'mock-entitlement-uuid')
+        self.assertEqual(actions[1]['toState']['key'], TwoUKeys.SUCCESS_FULFILMENT_STATE)
+        mock_state_by_id.assert_called_once()
+
+    @patch('commerce_coordinator.apps.commercetools.clients.CommercetoolsAPIClient.get_state_by_id')
+    def test_update_line_items_on_fulfillment_already_fulfilled(self, mock_state_by_id):
+        mock_order = gen_order("mock_order_id")
+        mock_line_item_state = gen_line_item_state()
+        mock_line_item_state.key = TwoUKeys.SUCCESS_FULFILMENT_STATE
+        mock_state_by_id.return_value = mock_line_item_state
+
+        fulfillment_results = [
+            {'line_item_id': item.id, 'item_quantity': item.quantity, 'is_fulfilled': True, 'entitlement_uuid': None}
+            for item in mock_order.line_items
+        ]
+
+        with requests_mock.Mocker(real_http=True, case_sensitive=False) as mocker:
+            result = self.client_set.client.update_line_items_on_fulfillment(mock_order, fulfillment_results)
+
+            self.assertEqual(mocker.call_count, 0)
+
+        self.assertIs(result, mock_order)
+
     def test_update_customer_with_anonymized_fields(self):
         base_url = self.client_set.get_base_url_from_client()
         mock_retired_first_name = "retired_user_b90b0331d08e19eaef586"
@@ -1064,6 +1247,27 @@ class ClientTests(TestCase):
             )
             self.assertTrue(result)
 
+    @patch.object(CustomerIndex, 'record', side_effect=DatabaseError('database is locked'))
+    def test_create_customer_when_index_unavailable(self, _mock_record):
+        """Test a customer is still created when it can't be added to the customer index"""
+        base_url = self.client_set.get_base_url_from_client()
+        mock_customer = gen_customer("test@example.com", "test_user")
+
+        with requests_mock.Mocker(real_http=True, case_sensitive=False) as mocker:
+            mocker.post(f"{base_url}customers", json={"customer": mock_customer.serialize()}, status_code=201)
+
+            with self.assertLogs('commerce_coordinator.apps.commercetools.clients', level='ERROR') as logs:
+                result = self.client_set.client.create_customer(
+                    email="test@example.com",
+                    first_name="John",
+                    last_name="",
+                    lms_user_id=DEFAULT_EDX_LMS_USER_ID,
+                    lms_username="test_user",
+                )
+
+        self.assertEqual(result.id, mock_customer.id)
+        self.assertIn("Unable to index customer", logs.output[0])
+
     def test_create_customer(self):
         """Test creating a customer with lms user info"""
         base_url = self.client_set.get_base_url_from_client()
@@ -1539,9 +1743,13 @@ class ClientTests(TestCase):
             self.assertEqual(request_body["paymentState"], "Paid")
             self.assertEqual(request_body["shipmentState"], "Shipped")
 
+    @patch('commerce_coordinator.apps.commercetools.clients.CommercetoolsAPIClient.get_order_details',
+           return_value=None)
     @patch('commerce_coordinator.apps.commercetools.clients.CommercetoolsAPIClient.get_order_by_id')
     @patch('commerce_coordinator.apps.commercetools.clients.CommercetoolsAPIClient.get_customer_by_id')
-    def test_get_order_and_customer_by_order_id_success(self, mock_get_customer_by_id, mock_get_order_by_id):
+    def test_get_order_and_customer_by_order_id_success(
+        self, mock_get_customer_by_id, mock_get_order_by_id, _mock_get_order_details
+    ):
         order = MagicMock(spec=Order)
         customer = MagicMock(spec=Customer)
         order.id = "order-abc"
@@ -1556,17 +1764,23 @@ class ClientTests(TestCase):
         mock_get_order_by_id.assert_called_once_with("order-abc")
         mock_get_customer_by_id.assert_called_once_with("customer-123")
 
+    @patch('commerce_coordinator.apps.commercetools.clients.CommercetoolsAPIClient.get_order_details',
+           return_value=None)
     @patch('commerce_coordinator.apps.commercetools.clients.CommercetoolsAPIClient.get_order_by_id')
-    def test_get_order_and_customer_by_order_id_order_not_found(self, mock_get_order_by_id):
+    def test_get_order_and_customer_by_order_id_order_not_found(self, mock_get_order_by_id, _mock_get_order_details):
         mock_get_order_by_id.side_effect = Exception("Order not found")
         with pytest.raises(Exception) as exc:
             self.client_set.client.get_order_and_customer_by_order_id("order-xyz", logging_context="ctx")
         assert "Order not found" in str(exc.value)
         mock_get_order_by_id.assert_called_once_with("order-xyz")
 
+    @patch('commerce_coordinator.apps.commercetools.clients.CommercetoolsAPIClient.get_order_details',
+           return_value=None)
     @patch('commerce_coordinator.apps.commercetools.clients.CommercetoolsAPIClient.get_order_by_id')
     @patch('commerce_coordinator.apps.commercetools.clients.CommercetoolsAPIClient.get_customer_by_id')
-    def test_get_order_and_customer_by_order_id_customer_not_found(self, mock_get_customer_by_id, mock_get_order_by_id):
+    def test_get_order_and_customer_by_order_id_customer_not_found(
+        self, mock_get_customer_by_id, mock_get_order_by_id, _mock_get_order_details
+    ):
         order = MagicMock(spec=Order)
         order.customer_id = "customer-999"
         mock_get_order_by_id.return_value = order
@@ -1577,6 +1791,44 @@ class ClientTests(TestCase):
         mock_get_order_by_id.assert_called_once_with("order-xyz")
         mock_get_customer_by_id.assert_called_once_with("customer-999")
 
+    def test_get_order_details(self):
+        base_url = self.client_set.get_base_url_from_client()
+
+        with requests_mock.Mocker(real_http=True, case_sensitive=False) as mocker:
+            mocker.post(f"{base_url}graphql", json={"data": gen_graphql_order_details()})
+
+            order, customer = self.client_set.client.get_order_details(order_number="2U-123456")
+
+            self.assertEqual(mocker.last_request.json()["variables"], {"orderNumber": "2U-123456"})
+            self.assertEqual(order.id, "order-id")
+            self.assertEqual(order.payment_info.payments[0].obj.interface_id, "pi_123")
+            self.assertEqual(customer.id, "customer-id")
+
+    def test_get_order_details_failure(self):
+        base_url = self.client_set.get_base_url_from_client()
+
+        with requests_mock.Mocker(real_http=True, case_sensitive=False) as mocker:
+            mocker.post(f"{base_url}graphql", json={"data": None, "errors": [{"message": "Boom"}]})
+            self.assertIsNone(self.client_set.client.get_order_details(order_id="order-id"))
+
+            mocker.post(f"{base_url}graphql", status_code=503)
+            self.assertIsNone(self.client_set.client.get_order_details(order_id="order-id"))
+
+    @patch('commerce_coordinator.apps.commercetools.clients.CommercetoolsAPIClient.get_order_by_id')
+    @patch('commerce_coordinator.apps.commercetools.clients.CommercetoolsAPIClient.get_customer_by_id')
+    def test_get_order_and_customer_by_order_id_graphql(self, mock_get_customer_by_id, mock_get_order_by_id):
+        base_url = self.client_set.get_base_url_from_client()
+
+        with requests_mock.Mocker(real_http=True, case_sensitive=False) as mocker:
+            mocker.post(f"{base_url}graphql", json={"data": gen_graphql_order_details()})
+
+            order, customer = self.client_set.client.get_order_and_customer_by_order_id("order-id")
+
+        self.assertEqual(order.id, "order-id")
+        self.assertEqual(customer.id, "customer-id")
+        mock_get_order_by_id.assert_not_called()
+        mock_get_customer_by_id.assert_not_called()
+
     def test_get_dangling_payment_returns_true(self):
         payment = gen_payment()
         self.client_set.backend_repo.payments.add_existing(payment)
@@ -1586,6 +1838,7 @@ class ClientTests(TestCase):
 
         result = self.client_set.client.is_dangling_payment(payment)
         self.assertTrue(result)
+        self.assertEqual(self.client_set.client.base_client.carts.query.call_args.kwargs['limit'], 1)
 
     def test_get_dangling_payment_returns_false_when_attached_to_cart(self):
         payment = gen_payment()
@@ -2025,3 +2278,163 @@ class PaginatedResultsTest(TestCase):
 
         self.assertEqual(paginated.has_more(), False)
         self.assertEqual(paginated.next_offset(), 10)
+
+
+def _conflict(current_version=None):
+    error = {"code": "ConcurrentModification", "message": "Object has a different version than expected."}
+    if current_version is not None:
+        error["currentVersion"] = current_version
+    return CommercetoolsError("Version conflict", [error], {})
+
+
+class UpdateWithReplayTest(TestCase):
+    """Tests for CommercetoolsAPIClient.update_with_replay"""
+
+    def setUp(self):
+        super().setUp()
+        with patch('commerce_coordinator.apps.commercetools.clients.Client'):
+            self.client = CommercetoolsAPIClient()
+        self.orders = self.client.base_client.orders
+
+    def test_replays_at_version_from_error(self):
+        self.orders.update_by_id.side_effect = [_conflict(5), _conflict(6), 'updated']
+
+        result = self.client.update_with_replay("orders", "order-id", 4, ['action'])
+
+        self.assertEqual(result, 'updated')
+        self.assertEqual([c.kwargs['version'] for c in self.orders.update_by_id.call_args_list], [4, 5, 6])
+        self.orders.get_by_id.assert_not_called()
+
+    def test_refetches_version_when_error_doesnt_say(self):
+        self.orders.update_by_id.side_effect = [_conflict(), 'updated']
+        self.orders.get_by_id.return_value = SimpleNamespace(version=9)
+
+        self.client.update_with_replay("orders", "order-id", 4, ['action'])
+
+        self.assertEqual(self.orders.update_by_id.call_args.kwargs['version'], 9)
+
+    def test_revalidates_actions_against_current_resource(self):
+        current = SimpleNamespace(version=7)
+        fetch = Mock(return_value=current)
+        revalidate = Mock(return_value=['still valid'])
+        self.orders.update_by_id.side_effect = [_conflict(7), 'updated']
+
+        self.client.update_with_replay(
+            "orders", "order-id", 4, ['a', 'still valid'], revalidate=revalidate, fetch=fetch
+        )
+
+        fetch.assert_called_once_with("order-id")
+        revalidate.assert_called_once_with(current)
+        self.assertEqual(self.orders.update_by_id.call_args.kwargs, {
+            'id': "order-id", 'version': 7, 'actions': ['still valid']
+        })
+
+    def test_nothing_left_to_apply_returns_current(self):
+        current = SimpleNamespace(version=7)
+        self.orders.update_by_id.side_effect = [_conflict(7)]
+        self.orders.get_by_id.return_value = current
+
+        result = self.client.update_with_replay("orders", "order-id", 4, ['action'], revalidate=lambda _: [])
+
+        self.assertIs(result, current)
+        self.assertEqual(self.orders.update_by_id.call_count, 1)
+
+    def test_gives_up_after_max_replays(self):
+        self.orders.update_by_id.side_effect = _conflict(5)
+
+        with self.assertRaises(CommercetoolsError):
+            self.client.update_with_replay("orders", "order-id", 4, ['action'], max_replays=2)
+
+        self.assertEqual(self.orders.update_by_id.call_count, 3)
+
+    def test_other_errors_are_not_replayed(self):
+        self.orders.update_by_id.side_effect = CommercetoolsError(
+            "Invalid", [{"code": "InvalidOperation", "message": "Invalid"}], {}
+        )
+
+        with self.assertRaises(CommercetoolsError):
+            self.client.update_with_replay("orders", "order-id", 4, ['action'])
+
+        self.assertEqual(self.orders.update_by_id.call_count, 1)
+
+
+class IterQueryTest(TestCase):
+    """Tests for CommercetoolsAPIClient.iter_query"""
+
+    def setUp(self):
+        super().setUp()
+        with patch('commerce_coordinator.apps.commercetools.clients.Client'):
+            self.client = CommercetoolsAPIClient()
+        self.results = [
+            SimpleNamespace(id=f"id-{index:02d}", created_at=datetime(2025, 1, 1, index // 2, tzinfo=timezone.utc))
+            for index in range(7)
+        ]
+
+    def query(self, where, sort, limit, with_total, expand):  # pylint: disable=unused-argument
+        """Fake query endpoint honouring the id keyset predicate."""
+        remaining = self.results
+        for predicate in where or []:
+            match = re.search(r'id > "(.*?)"\)*$', predicate)
+            if match:
+                remaining = [result for result in remaining if result.id > match.group(1)]
+        return SimpleNamespace(results=remaining[:limit])
+
+    def test_pages_by_id_keyset(self):
+        self.client.base_client.discount_codes.query.side_effect = self.query
+
+        results = list(self.client.iter_query("discount_codes", where=['isActive=true'], page_size=3))
+
+        self.assertEqual(results, self.results)
+        calls = self.client.base_client.discount_codes.query.call_args_list
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(calls[0].kwargs['where'], ['isActive=true'])
+        self.assertEqual(calls[1].kwargs['where'], ['isActive=true', 'id > "id-02"'])
+        self.assertEqual(calls[2].kwargs['sort'], ['id asc'])
+        self.assertFalse(calls[2].kwargs['with_total'])
+
+    def test_pages_by_created_at_keyset_with_projection(self):
+        self.client.base_client.orders.query.side_effect = self.query
+
+        ids = list(self.client.iter_query("orders", keyset="createdAt", page_size=4, projection=lambda o: o.id))
+
+        self.assertEqual(ids, [result.id for result in self.results])
+        calls = self.client.base_client.orders.query.call_args_list
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(
+            calls[1].kwargs['where'],
+            ['(createdAt > "2025-01-01T01:00:00.000Z" or (createdAt = "2025-01-01T01:00:00.000Z" and id > "id-03"))']
+        )
+        self.assertEqual(calls[1].kwargs['sort'], ['createdAt asc', 'id asc'])
+
+    def test_next_page_prefetched_while_current_is_processed(self):
+        self.client.base_client.orders.query.side_effect = self.query
+        iterator = self.client.iter_query("orders", page_size=5)
+
+        next(iterator)
+        # The second page is requested before the caller is done with the first one.
+        for _ in range(50):
+            if self.client.base_client.orders.query.call_count == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.client.base_client.orders.query.call_count, 2)
+        self.assertEqual(len(list(iterator)), 6)
+
+    @patch.object(AdaptiveRateLimiter, '_try_acquire', autospec=True, return_value=True)
+    def test_prefetched_pages_are_charged_to_callers_priority(self, mock_try_acquire):
+        limiter = AdaptiveRateLimiter('test', 10, InMemoryRateLimitStore())
+
+        def query(**kwargs):
+            limiter.acquire()  # as the rate limited transport adapter does for every request
+            return self.query(**kwargs)
+
+        self.client.base_client.orders.query.side_effect = query
+
+        with outbound_priority(Priority.BATCH):
+            results = list(self.client.iter_query("orders", page_size=3))
+
+        self.assertEqual(len(results), 7)
+        self.assertEqual([call.args[1] for call in mock_try_acquire.call_args_list], [Priority.BATCH] * 3)
+
+    def test_unsupported_keyset(self):
+        with self.assertRaises(ValueError):
+            list(self.client.iter_query("orders", keyset="lastModifiedAt"))
@@ -3,6 +3,7 @@ from datetime import datetime
 from typing import List, Optional
 from unittest import TestCase
 
+import attrs
 import ddt
 from commercetools.platform.models import Address as CTAddress
 from commercetools.platform.models import AuthenticationMode as CTAuthenticationMode
@@ -31,6 +32,7 @@ from commerce_coordinator.apps.commercetools.data import (
     convert_line_item,
     convert_line_item_prod_id,
     convert_payment_info,
+    order_dict_from_commercetools,
     order_from_commercetools
 )
 from commerce_coordinator.apps.commercetools.tests.conftest import gen_customer, gen_order
@@ -293,3 +295,22 @@ class TestCTOrderConversionToLegacyOrders(TestCase):
 
         self.assertIsInstance(ret, LegacyOrder)
         self.assertEqual(ret.currency, order.total_price.currency_code)
+
+    def test_order_dict_from_commercetools_matches_asdict(self):
+        customer = gen_customer("hiya@text.example", "jim_34")
+
+        for order in [gen_order(uuid4_str()), gen_order(uuid4_str(), with_discount=False)]:
+            self.assertEqual(
+                order_dict_from_commercetools(order, customer),
+                attrs.asdict(order_from_commercetools(order, customer))
+            )
+
+    def test_order_dict_from_commercetools_caches_line_items(self):
+        order = gen_order(uuid4_str())
+        customer = gen_customer("hiya@text.example", "jim_34")
+
+        first = order_dict_from_commercetools(order, customer)
+        self.assertIs(order_dict_from_commercetools(order, customer)['lines'][0], first['lines'][0])
+
+        order.version += 1
+        self.assertIsNot(order_dict_from_commercetools(order, customer)['lines'][0], first['lines'][0])
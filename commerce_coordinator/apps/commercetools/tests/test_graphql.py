@@ -0,0 +1,95 @@
+""" Commercetools GraphQL adaptation tests """
+from unittest import TestCase
+
+from commercetools.platform.models import LineItemReturnItem, TransactionType
+
+from commerce_coordinator.apps.commercetools.catalog_info.constants import EdXFieldNames, TwoUKeys
+from commerce_coordinator.apps.commercetools.graphql import order_details_from_graphql, to_rest
+from commerce_coordinator.apps.commercetools.tests.conftest import gen_graphql_order_details
+
+
+class ToRestTests(TestCase):
+    """ Tests for to_rest """
+
+    def test_reference_with_resolved_object(self):
+        self.assertEqual(
+            to_rest({"stateRef": {"typeId": "state", "id": "s"}, "state": {"id": "s", "key": "k"}}),
+            {"state": {"typeId": "state", "id": "s", "obj": {"id": "s", "key": "k"}}}
+        )
+
+    def test_reference_without_resolved_object(self):
+        self.assertEqual(to_rest({"cartRef": {"typeId": "cart", "id": "c"}}), {"cart": {"typeId": "cart", "id": "c"}})
+        self.assertEqual(to_rest({"cartRef": None}), {"cart": None})
+
+    def test_reference_list(self):
+        self.assertEqual(
+            to_rest({"payments": [{"id": "p"}], "paymentRefs": [{"typeId": "payment", "id": "p"}]}),
+            {"payments": [{"typeId": "payment", "id": "p", "obj": {"id": "p"}}]}
+        )
+
+    def test_localized_strings_custom_fields_and_attributes(self):
+        self.assertEqual(
+            to_rest({
+                "nameAllLocales": [{"locale": "en-US", "value": "Name"}],
+                "customFieldsRaw": [{"name": "a", "value": 1}],
+                "attributesRaw": [{"name": "b", "value": 2}],
+                "__typename": "LineItemReturnItem",
+                "plain": [{"nested": True}],
+            }),
+            {
+                "name": {"en-US": "Name"},
+                "fields": {"a": 1},
+                "attributes": [{"name": "b", "value": 2}],
+                "type": "LineItemReturnItem",
+                "plain": [{"nested": True}],
+            }
+        )
+
+
+class OrderDetailsFromGraphQLTests(TestCase):
+    """ Tests for order_details_from_graphql """
+
+    def test_order_and_customer(self):
+        order, customer = order_details_from_graphql(gen_graphql_order_details())
+
+        self.assertEqual(order.id, "order-id")
+        self.assertEqual(order.version, 7)
+        self.assertEqual(order.state.obj.key, TwoUKeys.SDN_SANCTIONED_ORDER_STATE)
+        self.assertEqual(order.cart.id, "cart-id")
+        self.assertEqual(order.taxed_price.total_gross.currency_code, "USD")
+        self.assertEqual(order.discount_codes[0].discount_code.obj.code, "SAVE10")
+        self.assertEqual(order.custom.fields, {TwoUKeys.ORDER_MOBILE_ORDER: False})
+
+        line_item = order.line_items[0]
+        self.assertEqual(line_item.name, {"en-US": "Demo Course"})
+        self.assertEqual(line_item.product_type.obj.key, "edx_course")
+        self.assertEqual(line_item.variant.attributes[0].value, {"key": "verified", "label": "Verified"})
+        self.assertEqual(line_item.state[0].state.id, "line-item-state-id")
+        self.assertEqual(line_item.state[0].state.obj.name, {"en-US": "Fulfilled"})
+        self.assertEqual(line_item.custom.fields[TwoUKeys.LINE_ITEM_LMS_ENTITLEMENT_ID], "entitlement-id")
+
+        payment = order.payment_info.payments[0]
+        self.assertEqual(payment.id, "payment-id")
+        self.assertEqual(payment.obj.interface_id, "pi_123")
+        self.assertEqual(payment.obj.payment_status.interface_code, "succeeded")
+        self.assertEqual(payment.obj.transactions[0].type, TransactionType.CHARGE)
+
+        return_item = order.return_info[0].items[0]
+        self.assertIsInstance(return_item, LineItemReturnItem)
+        self.assertEqual(return_item.line_item_id, "line-item-id")
+
+        self.assertEqual(customer.email, "ada@example.com")
+        self.assertEqual(customer.custom.fields[EdXFieldNames.LMS_USER_NAME], "ada")
+
+    def test_guest_order(self):
+        data = gen_graphql_order_details()
+        data["order"]["customer"] = None
+
+        order, customer = order_details_from_graphql(data)
+
+        self.assertEqual(order.id, "order-id")
+        self.assertIsNone(customer)
+
+    def test_order_not_found(self):
+        self.assertIsNone(order_details_from_graphql({"order": None}))
+        self.assertIsNone(order_details_from_graphql(None))
@@ -2,6 +2,7 @@
 
 from unittest.mock import patch
 
+import requests
 import requests_mock
 from django.test import TestCase
 from edx_django_utils.cache import TieredCache
@@ -79,18 +80,38 @@ class TestCTCustomAPIClient(TestCase):
             response = self.client._make_request("GET", "product-projections")  # pylint: disable=protected-access
             self.assertEqual(response, mock_response)
 
+    def test_make_request_uses_injected_session(self):
+        """Test that requests go through the session the client was created with."""
+        session = requests.Session()
+        adapter = requests_mock.Adapter()
+        session.mount("https://", adapter)
+        adapter.register_uri(
+            "GET",
+            f"{self.client.config['apiUrl']}/{self.client.config['projectKey']}/product-projections",
+            json={"results": []},
+        )
+        self.client.http = session
+
+        response = self.client._make_request("GET", "product-projections")  # pylint: disable=protected-access
+
+        self.assertEqual(response, {"results": []})
+        self.assertEqual(adapter.call_count, 1)
+        self.assertEqual(adapter.last_request.headers["Authorization"], "Bearer mock_access_token")
+
     def test_make_request_failure(self):
-        with requests_mock.Mocker() as mocker:
+        """Test that a non-retryable error is returned as None without retrying."""
+        with requests_mock.Mocker() as mocker, patch("time.sleep", return_value=None) as mock_sleep:
             mocker.get(
                 f"{self.client.config['apiUrl']}/{self.client.config['projectKey']}/product-projections",
                 status_code=404,
                 json={"message": "Not Found"}
             )
 
-            with patch("requests.Response.raise_for_status", side_effect=HTTPError("404 Client Error")):
-                # pylint: disable=protected-access
-                response = self.client._make_request("GET", "product-projections")
-                self.assertIsNone(response)
+            response = self.client._make_request("GET", "product-projections")  # pylint: disable=protected-access
+            self.assertIsNone(response)
+
+            self.assertEqual(mocker.call_count, 1)
+            mock_sleep.assert_not_called()
 
     def test_make_request_retries_and_fails(self):
         """Test that the function retries the correct number of times and fails."""
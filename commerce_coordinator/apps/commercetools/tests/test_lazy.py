@@ -0,0 +1,79 @@
+""" Commercetools lazy model tests """
+import json
+from unittest import TestCase
+
+from commercetools.platform.models import LineItem, Order, OrderState
+
+from commerce_coordinator.apps.commercetools.data import order_dict_from_commercetools
+from commerce_coordinator.apps.commercetools.lazy import LazyModel, lazy_page
+from commerce_coordinator.apps.commercetools.tests.conftest import gen_customer, gen_order
+from commerce_coordinator.apps.core.tests.utils import uuid4_str
+
+
+class LazyModelTests(TestCase):
+    """ Tests for LazyModel """
+
+    def setUp(self):
+        super().setUp()
+        self.order = gen_order(uuid4_str())
+        self.lazy_order = LazyModel(Order, self.order.serialize())
+
+    def test_reads_like_the_model(self):
+        self.assertIsInstance(self.lazy_order, Order)
+        self.assertEqual(self.lazy_order.id, self.order.id)
+        self.assertEqual(self.lazy_order.created_at, self.order.created_at)
+        self.assertEqual(self.lazy_order.order_state, OrderState.COMPLETE)
+        self.assertEqual(self.lazy_order.total_price, self.order.total_price)
+        self.assertEqual(self.lazy_order.custom.fields, self.order.custom.fields)
+
+        line_item = self.lazy_order.line_items[0]
+        self.assertIsInstance(line_item, LineItem)
+        self.assertEqual(line_item.name, self.order.line_items[0].name)
+        self.assertEqual(line_item.state[0].state.obj.name, self.order.line_items[0].state[0].state.obj.name)
+
+    def test_fields_are_read_when_accessed(self):
+        self.assertNotIn('line_items', vars(self.lazy_order))
+
+        line_item = self.lazy_order.line_items[0]
+
+        self.assertIs(self.lazy_order.line_items[0], line_item)
+        self.assertIn('line_items', vars(self.lazy_order))
+        self.assertNotIn('variant', vars(line_item))
+
+    def test_fields_can_be_set(self):
+        self.lazy_order.version += 1  # pylint: disable=no-member
+
+        self.assertEqual(self.lazy_order.version, self.order.version + 1)  # pylint: disable=no-member
+
+    def test_unknown_attribute(self):
+        with self.assertRaises(AttributeError):
+            _ = self.lazy_order.not_a_field
+
+        self.assertFalse(hasattr(self.lazy_order, '_not_a_field'))
+
+    def test_hydrate(self):
+        self.assertEqual(self.lazy_order.hydrate(), self.order)
+
+    def test_order_history_conversion(self):
+        customer = gen_customer(email='test@example.com', un='test')
+        data = self.order.serialize()
+        data['version'] += 1  # So the converted line items of the eager order aren't reused
+
+        self.assertEqual(
+            order_dict_from_commercetools(LazyModel(Order, data), customer),
+            order_dict_from_commercetools(self.order, customer)
+        )
+
+
+class LazyPageTests(TestCase):
+    """ Tests for lazy_page """
+
+    def test_lazy_page(self):
+        order = gen_order(uuid4_str())
+        content = json.dumps({'limit': 1, 'offset': 0, 'count': 1, 'total': 2, 'results': [order.serialize()]})
+
+        page = lazy_page(content.encode(), Order)
+
+        self.assertEqual(page['total'], 2)
+        self.assertIsInstance(page['results'][0], LazyModel)
+        self.assertEqual(page['results'][0].id, order.id)
@@ -29,6 +29,7 @@ from commerce_coordinator.apps.commercetools.tests.conftest import (
     gen_retired_customer,
     gen_return_item
 )
+from commerce_coordinator.apps.core.circuit_breaker import CircuitOpenError
 from commerce_coordinator.apps.core.constants import ORDER_HISTORY_PER_SYSTEM_REQ_LIMIT, PipelineCommand
 from commerce_coordinator.apps.core.exceptions import InvalidFilterType
 from commerce_coordinator.apps.paypal.pipeline import RefundPayPalPayment
@@ -65,6 +66,34 @@ class PipelineTests(MonkeyPatchedGetOrderTestCase):
 
         self.assertEqual(len(ret['order_data']), len(self.orders))
 
+    @patch('commerce_coordinator.apps.commercetools.pipeline.is_redirect_to_commercetools_enabled_for_user')
+    @patch('commerce_coordinator.apps.commercetools.pipeline.CommercetoolsAPIClient.get_orders_for_customer')
+    def test_pipeline_circuit_open(self, get_orders_mock, is_redirect_mock):
+        """Ensure the orders are skipped, and resume at the same offset, while the breaker is open"""
+
+        is_redirect_mock.return_value = True
+        get_orders_mock.side_effect = CircuitOpenError('commercetools', retry_after=10)
+        pipe = GetCommercetoolsOrders("test_pipe", None)
+        ret = pipe.run_filter(
+            RequestFactory(),
+            {
+                "edx_lms_user_id": 127,
+                "customer_id": None,
+                "email": "test@example.com",
+                "username": "test",
+                "page_size": ORDER_HISTORY_PER_SYSTEM_REQ_LIMIT,
+                "page": 0,
+                "offsets": {COMMERCETOOLS_ORDER_MANAGEMENT_SYSTEM: 20},
+                "cutoff_in_days": None,
+            },
+            []
+        )
+
+        self.assertEqual(ret['order_data'], [{
+            'results': [], 'offset': 20, 'total': 20, 'unavailable': True,
+            'source_system': COMMERCETOOLS_ORDER_MANAGEMENT_SYSTEM,
+        }])
+
 
 class CommercetoolsOrLegacyEcommerceRefundPipelineTests(APITestCase):
     """
@@ -28,6 +28,7 @@ class FulfillOrderCompletedSendLineItemStateTest(CoordinatorSignalReceiverTestCa
         'entitlement_uuid': '',
         'order_id': 1,
         'line_item_id': 3,
+        'lms_user_id': 4,
     }
 
     def test_correct_arguments_passed_fulfillment_true(self, mock_task):
@@ -10,7 +10,8 @@ import stripe
 from commercetools import CommercetoolsError
 from commercetools.platform.models import Money, TransactionType
 from django.test import TestCase
-from requests.exceptions import RequestException
+from requests import Response
+from requests.exceptions import HTTPError, RequestException
 
 from commerce_coordinator.apps.commercetools.catalog_info.constants import EdXFieldNames
 from commerce_coordinator.apps.commercetools.catalog_info.edx_utils import get_line_item_lms_entitlement_id
@@ -23,6 +24,7 @@ from commerce_coordinator.apps.commercetools.tasks import (
     revoke_line_mobile_order_task
 )
 from commerce_coordinator.apps.commercetools.tests.conftest import (
+    gen_customer,
     gen_order,
     gen_order_multiple_line_items,
     gen_payment,
@@ -35,7 +37,6 @@ from commerce_coordinator.apps.commercetools.tests.constants import (
     EXAMPLE_UPDATE_LINE_ITEM_SIGNAL_PAYLOAD
 )
 from commerce_coordinator.apps.core.models import User
-from commerce_coordinator.apps.order_fulfillment.exceptions import OrderFulfillmentRevokeLineError
 
 # Log using module name.
 logger = logging.getLogger(__name__)
@@ -81,6 +82,30 @@ class UpdateLineItemStateOnFulfillmentCompletionTaskTest(TestCase):
         mock_client().update_line_item_on_fulfillment.assert_called_once_with(
             *EXAMPLE_UPDATE_LINE_ITEM_SIGNAL_PAYLOAD.values())
 
+    @patch('commerce_coordinator.apps.commercetools.tasks.bump_order_history_generation')
+    def test_order_history_invalidated(self, mock_bump, mock_client):
+        """Check the customer's cached order history is invalidated once the line item is updated."""
+        # pylint: disable=no-value-for-parameter
+        mock_client().get_order_by_id.return_value = gen_order(EXAMPLE_UPDATE_LINE_ITEM_SIGNAL_PAYLOAD['order_id'])
+        customer = gen_customer('test@example.com', 'test-user')
+        mock_client().get_customer_by_id.return_value = customer
+
+        fulfillment_uut(*self.unpack_for_uut(EXAMPLE_UPDATE_LINE_ITEM_SIGNAL_PAYLOAD))
+
+        mock_bump.assert_called_once_with(customer.custom.fields[EdXFieldNames.LMS_USER_ID])
+
+    @patch('commerce_coordinator.apps.commercetools.tasks.bump_order_history_generation')
+    def test_order_history_invalidated_for_given_user(self, mock_bump, mock_client):
+        """Check a known LMS user's order history is invalidated without looking up the customer."""
+        mock_client().get_order_by_id.return_value = gen_order(EXAMPLE_UPDATE_LINE_ITEM_SIGNAL_PAYLOAD['order_id'])
+
+        fulfillment_uut(  # pylint: disable=no-value-for-parameter
+            *self.unpack_for_uut(EXAMPLE_UPDATE_LINE_ITEM_SIGNAL_PAYLOAD), lms_user_id=4
+        )
+
+        mock_bump.assert_called_once_with(4)
+        mock_client().get_customer_by_id.assert_not_called()
+
 
 @patch('commerce_coordinator.apps.commercetools.tasks.CommercetoolsAPIClient')
 class ReturnedOrderfromStripeTaskTest(TestCase):
@@ -670,7 +695,7 @@ class RevokeLineMobileOrderTaskTest(TestCase):
         mock_ct_client.return_value.get_customer_by_id.return_value = mock_customer
 
         # Execute the task
-        result = revoke_line_mobile_order_task(self.payment_id)
+        result = revoke_line_mobile_order_task(self.payment_id)  # pylint: disable=no-value-for-parameter
 
         # Verify the OrderFulfillmentAPIClient was called with correct data
         mock_fulfillment_client.return_value.revoke_line.assert_called_once()
@@ -698,7 +723,7 @@ class RevokeLineMobileOrderTaskTest(TestCase):
 
         # Execute the task and verify it raises the exception
         with self.assertRaises(CommercetoolsError):
-            revoke_line_mobile_order_task(self.payment_id)
+            revoke_line_mobile_order_task(self.payment_id)  # pylint: disable=no-value-for-parameter
 
         # Verify the fulfillment client was not called
         mock_fulfillment_client.return_value.revoke_line.assert_not_called()
@@ -747,7 +772,7 @@ class RevokeLineItemsTaskTest(TestCase):
         mock_ct_client.return_value.get_customer_by_id.return_value = self._mock_customer()
         mock_fulfillment_client.return_value.revoke_line.return_value = {"ok": True}
 
-        result = revoke_line_items_task(mock_order.id, return_items)
+        result = revoke_line_items_task(mock_order.id, return_items)  # pylint: disable=no-value-for-parameter
 
         self.assertTrue(result)
         mock_fulfillment_client.assert_called_once()
@@ -778,7 +803,7 @@ class RevokeLineItemsTaskTest(TestCase):
         mock_ct_client.return_value.get_customer_by_id.return_value = self._mock_customer()
         mock_fulfillment_client.return_value.revoke_line.return_value = {"ok": True}
 
-        result = revoke_line_items_task(mock_order.id, return_items)
+        result = revoke_line_items_task(mock_order.id, return_items)  # pylint: disable=no-value-for-parameter
 
         self.assertTrue(result)
         mock_fulfillment_client.return_value.revoke_line.assert_called_once()
@@ -789,14 +814,18 @@ class RevokeLineItemsTaskTest(TestCase):
         json.dumps(payload)
         self.assertIsInstance(expected_entitlement, str)
 
+    @patch("commerce_coordinator.apps.commercetools.tasks.revoke_line_items_task.retry")
+    @patch("commerce_coordinator.apps.commercetools.tasks.revoke_line_items_task.apply_async")
     @patch("commerce_coordinator.apps.commercetools.tasks.get_line_item_attribute")
-    def test_raises_when_revoke_line_returns_none(
+    def test_rejected_revoke_is_not_retried(
         self,
         mock_get_attribute,
+        mock_apply_async,
+        mock_retry,
         mock_ct_client,
         mock_fulfillment_client,
     ):
-        """None from OF client after retries must fail the task so Celery can retry."""
+        """None from the OF client is a rejection a retry can't fix, it's logged and neither it nor the task retried."""
         mock_get_attribute.return_value = "verified"
         mock_order = gen_order("order-revoke-items-none")
         mock_order.customer_id = "customer-123"
@@ -807,10 +836,14 @@ class RevokeLineItemsTaskTest(TestCase):
         mock_ct_client.return_value.get_customer_by_id.return_value = self._mock_customer()
         mock_fulfillment_client.return_value.revoke_line.return_value = None
 
-        with self.assertRaises(OrderFulfillmentRevokeLineError):
-            revoke_line_items_task(mock_order.id, return_items)
+        with self.assertLogs("commerce_coordinator.apps.commercetools.tasks", level="ERROR") as log_ctx:
+            result = revoke_line_items_task(mock_order.id, return_items)  # pylint: disable=no-value-for-parameter
 
+        self.assertFalse(result)
         mock_fulfillment_client.return_value.revoke_line.assert_called_once()
+        mock_retry.assert_not_called()
+        mock_apply_async.assert_not_called()
+        self.assertTrue(any("rejected by the service" in rec.message for rec in log_ctx.records))
 
     @patch("commerce_coordinator.apps.commercetools.tasks.get_line_item_attribute")
     def test_no_revoke_when_line_item_id_not_on_order(
@@ -828,7 +861,7 @@ class RevokeLineItemsTaskTest(TestCase):
         mock_ct_client.return_value.get_order_by_id.return_value = mock_order
         mock_ct_client.return_value.get_customer_by_id.return_value = self._mock_customer()
 
-        result = revoke_line_items_task(mock_order.id, return_items)
+        result = revoke_line_items_task(mock_order.id, return_items)  # pylint: disable=no-value-for-parameter
 
         self.assertTrue(result)
         mock_fulfillment_client.return_value.revoke_line.assert_not_called()
@@ -850,7 +883,7 @@ class RevokeLineItemsTaskTest(TestCase):
         mock_ct_client.return_value.get_customer_by_id.return_value = self._mock_customer()
         mock_fulfillment_client.return_value.revoke_line.return_value = {"ok": True}
 
-        result = revoke_line_items_task(mock_order.id, return_items)
+        result = revoke_line_items_task(mock_order.id, return_items)  # pylint: disable=no-value-for-parameter
 
         self.assertTrue(result)
         mock_fulfillment_client.assert_called_once()
@@ -875,7 +908,7 @@ class RevokeLineItemsTaskTest(TestCase):
         with self.assertLogs(
             "commerce_coordinator.apps.commercetools.tasks", level="WARNING"
         ) as log_ctx:
-            result = revoke_line_items_task(mock_order.id, return_items)
+            result = revoke_line_items_task(mock_order.id, return_items)  # pylint: disable=no-value-for-parameter
 
         self.assertTrue(result)
         mock_fulfillment_client.return_value.revoke_line.assert_not_called()
@@ -908,7 +941,7 @@ class RevokeLineItemsTaskTest(TestCase):
         with self.assertLogs(
             "commerce_coordinator.apps.commercetools.tasks", level="WARNING"
         ) as log_ctx:
-            result = revoke_line_items_task(mock_order.id, return_items)
+            result = revoke_line_items_task(mock_order.id, return_items)  # pylint: disable=no-value-for-parameter
 
         self.assertTrue(result)
         mock_fulfillment_client.return_value.revoke_line.assert_called_once()
@@ -916,6 +949,116 @@ class RevokeLineItemsTaskTest(TestCase):
             any("Skipping return item with no lineItemId" in rec.message for rec in log_ctx.records),
         )
 
+    @patch("commerce_coordinator.apps.commercetools.tasks.set_custom_attribute")
+    @patch("commerce_coordinator.apps.commercetools.tasks.revoke_line_items_task.apply_async")
+    @patch("commerce_coordinator.apps.commercetools.tasks.get_line_item_attribute")
+    def test_partial_failure_retries_failed_line_items_only(
+        self,
+        mock_get_attribute,
+        mock_apply_async,
+        mock_set_custom_attribute,
+        mock_ct_client,
+        mock_fulfillment_client,
+    ):
+        """Line items that failed are retried in their own task while the revoked ones are not revoked again."""
+        mock_get_attribute.return_value = "professional"
+        mock_order = gen_order_multiple_line_items("order-revoke-partial")
+        mock_order.customer_id = "customer-123"
+        return_items = [self._ct_return_item(li.id, return_id=f"ret-{i}") for i, li in enumerate(mock_order.line_items)]
+        failed_line_item_id = mock_order.line_items[0].id
+
+        mock_ct_client.return_value.get_order_by_id.return_value = mock_order
+        mock_ct_client.return_value.get_customer_by_id.return_value = self._mock_customer()
+
+        def revoke_line(payload, logging_data):  # pylint: disable=unused-argument
+            if logging_data["line_item_id"] == failed_line_item_id:
+                raise RequestException("connection reset")
+            return {"ok": True}
+
+        mock_fulfillment_client.return_value.revoke_line.side_effect = revoke_line
+
+        result = revoke_line_items_task(mock_order.id, return_items)  # pylint: disable=no-value-for-parameter
+
+        self.assertFalse(result)
+        self.assertEqual(mock_fulfillment_client.return_value.revoke_line.call_count, len(mock_order.line_items))
+        mock_apply_async.assert_called_once()
+        self.assertEqual(
+            mock_apply_async.call_args[1]["kwargs"],
+            {"order_id": mock_order.id, "return_items": [return_items[0]]},
+        )
+        mock_set_custom_attribute.assert_has_calls([
+            call("revoke_line_items_revoked", len(mock_order.line_items) - 1),
+            call("revoke_line_items_failed", 1),
+        ])
+
+    @patch("commerce_coordinator.apps.commercetools.tasks.revoke_line_items_task.retry")
+    @patch("commerce_coordinator.apps.commercetools.tasks.revoke_line_items_task.apply_async")
+    @patch("commerce_coordinator.apps.commercetools.tasks.get_line_item_attribute")
+    def test_all_failed_retries_whole_task(
+        self,
+        mock_get_attribute,
+        mock_apply_async,
+        mock_retry,
+        mock_ct_client,
+        mock_fulfillment_client,
+    ):
+        """When no line item could be revoked, the task itself is retried instead of one task per line item."""
+        mock_get_attribute.return_value = "professional"
+        mock_retry.side_effect = RuntimeError("retry scheduled")
+        mock_order = gen_order_multiple_line_items("order-revoke-all-failed")
+        mock_order.customer_id = "customer-123"
+        return_items = [self._ct_return_item(li.id, return_id=f"ret-{i}") for i, li in enumerate(mock_order.line_items)]
+
+        mock_ct_client.return_value.get_order_by_id.return_value = mock_order
+        mock_ct_client.return_value.get_customer_by_id.return_value = self._mock_customer()
+        mock_fulfillment_client.return_value.revoke_line.side_effect = RequestException("connection reset")
+
+        with self.assertRaises(RuntimeError):
+            revoke_line_items_task(mock_order.id, return_items)  # pylint: disable=no-value-for-parameter
+
+        mock_retry.assert_called_once()
+        mock_apply_async.assert_not_called()
+
+    @patch("commerce_coordinator.apps.commercetools.tasks.revoke_line_items_task.retry")
+    @patch("commerce_coordinator.apps.commercetools.tasks.revoke_line_items_task.apply_async")
+    @patch("commerce_coordinator.apps.commercetools.tasks.get_line_item_attribute")
+    def test_non_retryable_failures_are_not_retried(
+        self,
+        mock_get_attribute,
+        mock_apply_async,
+        mock_retry,
+        mock_ct_client,
+        mock_fulfillment_client,
+    ):
+        """Line items that failed with errors a retry can't fix are logged, and neither they nor the task retried."""
+        mock_get_attribute.return_value = "professional"
+        mock_order = gen_order_multiple_line_items("order-revoke-non-retryable")
+        mock_order.customer_id = "customer-123"
+        return_items = [self._ct_return_item(li.id, return_id=f"ret-{i}") for i, li in enumerate(mock_order.line_items)]
+        retryable_line_item_id = mock_order.line_items[0].id
+        response = Response()
+        response.status_code = 400
+
+        mock_ct_client.return_value.get_order_by_id.return_value = mock_order
+        mock_ct_client.return_value.get_customer_by_id.return_value = self._mock_customer()
+
+        def revoke_line(payload, logging_data):  # pylint: disable=unused-argument
+            if logging_data["line_item_id"] == retryable_line_item_id:
+                raise RequestException("connection reset")
+            raise HTTPError("400 Error", response=response)
+
+        mock_fulfillment_client.return_value.revoke_line.side_effect = revoke_line
+
+        with self.assertLogs("commerce_coordinator.apps.commercetools.tasks", level="WARNING") as log_ctx:
+            result = revoke_line_items_task(mock_order.id, return_items)  # pylint: disable=no-value-for-parameter
+
+        self.assertFalse(result)
+        mock_retry.assert_not_called()
+        # Only the line item whose failure was transient is retried, in its own task
+        mock_apply_async.assert_called_once()
+        self.assertEqual(mock_apply_async.call_args[1]["kwargs"]["return_items"], [return_items[0]])
+        self.assertTrue(any("non-retryable errors" in rec.message for rec in log_ctx.records))
+
     def test_commercetools_error_propagates(self, mock_ct_client, mock_fulfillment_client):
         """CommercetoolsError from get_order_by_id is raised and revoke_line is not called."""
         mock_ct_client.return_value.get_order_by_id.side_effect = CommercetoolsError(
@@ -926,6 +1069,8 @@ class RevokeLineItemsTaskTest(TestCase):
         )
 
         with self.assertRaises(CommercetoolsError):
-            revoke_line_items_task("missing-order", [{"id": "r1", "lineItemId": "any"}])
+            revoke_line_items_task(  # pylint: disable=no-value-for-parameter
+                "missing-order", [{"id": "r1", "lineItemId": "any"}]
+            )
 
         mock_fulfillment_client.return_value.revoke_line.assert_not_called()
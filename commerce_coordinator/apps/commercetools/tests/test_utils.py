@@ -31,6 +31,7 @@ from commerce_coordinator.apps.commercetools.utils import (
     calculate_total_discount_on_order,
     convert_ct_cent_amount_to_localized_price,
     create_retired_fields,
+    ct_datetime,
     extract_ct_order_information_for_braze_canvas,
     extract_ct_product_information_for_braze_canvas,
     find_latest_refund,
@@ -628,3 +629,14 @@ class TestCurrencyFormattingUtils(unittest.TestCase):
         self.assertIn("XYZ", result)
         self.assertTrue(result.startswith("XYZ "))
         self.assertEqual(result, "XYZ 10.99")
+
+
+class TestCtDatetime(unittest.TestCase):
+    """Tests for ct_datetime"""
+
+    def test_aware_datetime_is_converted_to_utc(self):
+        value = datetime.fromisoformat("2025-03-01T12:30:45.123456+02:00")
+        self.assertEqual(ct_datetime(value), "2025-03-01T10:30:45.123Z")
+
+    def test_naive_datetime_is_treated_as_utc(self):
+        self.assertEqual(ct_datetime(datetime(2025, 3, 1, 12, 30, 45)), "2025-03-01T12:30:45.000Z")
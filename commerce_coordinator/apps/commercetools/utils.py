@@ -5,6 +5,7 @@ Helpers for the commercetools app.
 import hashlib
 import logging
 import re
+from datetime import datetime, timezone
 from decimal import Decimal, InvalidOperation
 
 from babel.numbers import format_currency, get_currency_symbol
@@ -59,6 +60,19 @@ def handle_commercetools_error(context_prefix, err: CommercetoolsError, context:
         logger.error(error_message)
 
 
+def is_concurrent_modification_error(err: CommercetoolsError) -> bool:
+    """ Whether commercetools refused an update because the resource's version had moved on (409). """
+    return any(error.get('code') == 'ConcurrentModification' for error in err.errors or [])
+
+
+def get_current_version_from_error(err: CommercetoolsError):
+    """ The resource's current version from a ConcurrentModification error, None if it doesn't say. """
+    for error in err.errors or []:
+        if error.get('code') == 'ConcurrentModification' and error.get('currentVersion') is not None:
+            return error['currentVersion']
+    return None
+
+
 def send_order_confirmation_email(
     lms_user_id, lms_user_email, canvas_entry_properties
 ):
@@ -481,3 +495,10 @@ def format_iso_like_currency_spacing(value: Decimal, currency_code: str, locale_
         return re.sub(r'^([A-Z]{3})(.+)$', r'\1 \2', formatted)
 
     return formatted
+
+
+def ct_datetime(value: datetime) -> str:
+    """Format a datetime the way Commercetools query predicates expect it."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
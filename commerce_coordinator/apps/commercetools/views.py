@@ -22,8 +22,13 @@ from commerce_coordinator.apps.commercetools.sub_messages.signals_dispatch impor
 )
 from commerce_coordinator.apps.core.memcache import safe_key
 from commerce_coordinator.apps.core.tasks import acquire_task_lock
+from commerce_coordinator.apps.core.tracing import annotate_span, traced_ingress
 from commerce_coordinator.apps.core.views import SingleInvocationAPIView
-from commerce_coordinator.apps.rollout.waffle import is_order_fulfillment_service_forwarding_enabled
+from commerce_coordinator.apps.rollout.waffle import (
+    is_bulk_fulfillment_enabled,
+    is_bundle_fulfillment_chord_enabled,
+    is_order_fulfillment_service_forwarding_enabled
+)
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +40,7 @@ class OrderFulfillView(SingleInvocationAPIView):
     authentication_classes = [JwtBearerAuthentication, SessionAuthentication]
     permission_classes = [IsAdminUser]
 
+    @traced_ingress
     def post(self, request):
         """Receive a message from commerce tools forwarded by aws event bridge"""
 
@@ -45,6 +51,8 @@ class OrderFulfillView(SingleInvocationAPIView):
         }
 
         is_order_fulfillment_forwarding_enabled = is_order_fulfillment_service_forwarding_enabled(request)
+        is_bundle_chord_enabled = is_bundle_fulfillment_chord_enabled(request)
+        is_bulk_enabled = is_bulk_fulfillment_enabled(request)
 
         logger.info(f'[CT-{tag}] Message received from commercetools with details: {input_data}')
 
@@ -54,6 +62,7 @@ class OrderFulfillView(SingleInvocationAPIView):
         order_id = message_details.data['order_id']
         line_item_state_id = message_details.data['to_state']['id']
         message_id = message_details.data['message_id']
+        annotate_span(order_id=order_id, message_id=message_id)
 
         task_key = safe_key(key=order_id, key_prefix=tag, version='1')
 
@@ -69,7 +78,9 @@ class OrderFulfillView(SingleInvocationAPIView):
             line_item_state_id=line_item_state_id,
             source_system=SOURCE_SYSTEM,
             message_id=message_id,
-            is_order_fulfillment_forwarding_enabled=is_order_fulfillment_forwarding_enabled
+            is_order_fulfillment_forwarding_enabled=is_order_fulfillment_forwarding_enabled,
+            is_bundle_fulfillment_chord_enabled=is_bundle_chord_enabled,
+            is_bulk_fulfillment_enabled=is_bulk_enabled
         )
 
         return Response(status=status.HTTP_200_OK)
@@ -82,6 +93,7 @@ class OrderSanctionedView(SingleInvocationAPIView):
     authentication_classes = [JwtBearerAuthentication, SessionAuthentication]
     permission_classes = [IsAdminUser]
 
+    @traced_ingress
     def post(self, request):
         """
         Receive a message from commerce tools forwarded by aws event bridge
@@ -100,6 +112,7 @@ class OrderSanctionedView(SingleInvocationAPIView):
 
         order_id = message_details.data['order_id']
         message_id = message_details.data['message_id']
+        annotate_span(order_id=order_id, message_id=message_id)
 
         if self._is_running(tag, order_id):  # pragma no cover
             self.meta_should_mark_not_running = False
@@ -123,6 +136,7 @@ class OrderReturnedView(SingleInvocationAPIView):
     authentication_classes = [JwtBearerAuthentication, SessionAuthentication]
     permission_classes = [IsAdminUser]
 
+    @traced_ingress
     def post(self, request):
         """
         Receive a message from commerce tools forwarded by aws event bridge to return an order and revoke the
@@ -143,6 +157,7 @@ class OrderReturnedView(SingleInvocationAPIView):
 
         return_items = message_details.get_return_line_items()
         message_id = message_details.data['message_id']
+        annotate_span(order_id=order_id, message_id=message_id)
 
         fulfill_order_returned_signal.send_robust(
             sender=self,
@@ -1,10 +1,15 @@
 """
 Core Cache utils.
 """
+import time
 
 from django.conf import settings
+from django.core.cache import cache
 from edx_django_utils.cache import TieredCache, get_cache_key
 
+from commerce_coordinator.apps.core.constants import ORDER_HISTORY_CACHE_TTL_SECS
+from commerce_coordinator.apps.core.memcache import safe_key
+
 
 class CacheBase:
     """
@@ -49,3 +54,59 @@ class CacheBase:
             serializer.is_valid(raise_exception=True)
             return serializer.validated_data
         return None
+
+
+def _order_history_generation_key(lms_user_id):
+    return safe_key(key=lms_user_id, key_prefix='order_history_generation', version='1')
+
+
+def _order_history_page_key(lms_user_id, generation, variant):
+    return safe_key(key=f'{lms_user_id}:{generation}:{variant}', key_prefix='order_history_first_page', version='1')
+
+
+def get_order_history_generation(lms_user_id):
+    """
+    Current generation of a user's order history, it changes whenever one of their orders does.
+
+    A missing counter (never set, or evicted) starts at the current time in nanoseconds rather than 0, so it can't
+    come back as a generation that a now stale page was cached under.
+    """
+    key = _order_history_generation_key(lms_user_id)
+    generation = cache.get(key)
+
+    if generation is None:
+        generation = time.time_ns()
+        if not cache.add(key, generation, timeout=None):
+            generation = cache.get(key, generation)
+
+    return generation
+
+
+def bump_order_history_generation(lms_user_id):
+    """
+    Invalidate a user's cached order history, call this after placing, fulfilling or returning one of their orders.
+    """
+    key = _order_history_generation_key(lms_user_id)
+
+    try:
+        cache.incr(key)
+    except ValueError:
+        # No counter to increment, start a fresh one (see get_order_history_generation)
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def get_cached_order_history(lms_user_id, generation, variant=''):
+    """
+    The first page of a user's order history cached by `set_cached_order_history`, or None.
+
+    Args:
+        lms_user_id: The user whose order history it is
+        generation: From `get_order_history_generation`
+        variant: Anything else the page depends on, e.g. which order management systems were asked
+    """
+    return cache.get(_order_history_page_key(lms_user_id, generation, variant))
+
+
+def set_cached_order_history(lms_user_id, generation, page, variant='', timeout=ORDER_HISTORY_CACHE_TTL_SECS):
+    """ Cache the first page of a user's order history, see `get_cached_order_history`. """
+    cache.set(_order_history_page_key(lms_user_id, generation, variant), page, timeout)
@@ -0,0 +1,246 @@
+"""
+Circuit breakers for outbound API calls, so a service that's down fails calls at once instead of after a timeout.
+
+A breaker counts the calls to its service, and those that fail (connection errors, timeouts and 5xx responses),
+over windows of ``FAILURE_WINDOW_SECONDS``. Once a window has at least ``MINIMUM_CALLS`` calls and a
+``FAILURE_RATE_THRESHOLD`` share of them failed, the breaker opens, and every call raises `CircuitOpenError` without
+being made. Responses with a status code in ``IGNORED_STATUS_CODES`` aren't counted: for a service behind a rate
+limiter, throttling (429 and 503) is the limiter's to back off from, not a sign the service is down. After
+``RESET_TIMEOUT_SECONDS`` the breaker is half open: one call is let through as a probe, and the breaker closes if it
+succeeds or opens again if it fails.
+
+State is kept in the same stores as the rate limits of core.rate_limit, so with the cache backend a breaker opened by
+one process is open for every process. Breakers are configured per service in ``settings.CIRCUIT_BREAKERS``, use
+``get_circuit_breaker`` for a service's breaker and ``mount_circuit_breaker`` to apply it to a requests Session.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Iterable
+
+from django.conf import settings
+from requests import Session
+from requests.adapters import BaseAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import RequestException
+
+from commerce_coordinator.apps.core.rate_limit import is_wrapped_by, mounted_adapter, store_from_config
+
+logger = logging.getLogger(__name__)
+
+# Responses counted as failures of the service, on top of errors raised before a response was received
+FAILURE_STATUS_CODES = frozenset({500, 502, 503, 504})
+
+
+class CircuitOpenError(RequestsConnectionError):
+    """
+    A call wasn't made, as the circuit breaker of its service is open.
+
+    It's a ConnectionError without a response, so it's handled like the error the call would most likely have failed
+    with, except RetryPolicy doesn't retry it: waiting out the breaker is what it's there to prevent.
+    """
+
+    def __init__(self, name: str, retry_after: float, **kwargs):
+        super().__init__(f"Circuit breaker of {name} is open, calls resume in {retry_after:.0f} seconds", **kwargs)
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """ A circuit breaker for a service, see the module docstring """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(
+        self,
+        name: str,
+        store,
+        failure_rate_threshold: float = 0.5,
+        minimum_calls: int = 20,
+        failure_window_seconds: float = 30,
+        reset_timeout_seconds: float = 30,
+        ignored_status_codes: Iterable[int] = (),
+    ):
+        """
+        Args:
+            name (str): Name of the service, the store keys are prefixed with it.
+            store: InMemoryRateLimitStore or CacheRateLimitStore.
+            failure_rate_threshold (float): Share of a window's calls that failed which opens the breaker.
+            minimum_calls (int): Calls a window needs before its failure rate opens the breaker.
+            failure_window_seconds (float): Seconds the calls are counted over.
+            reset_timeout_seconds (float): Seconds the breaker stays open before a call probes the service.
+            ignored_status_codes (list): Status codes of responses that are counted neither as calls nor failures.
+        """
+        self.name = name
+        self.store = store
+        self.failure_rate_threshold = failure_rate_threshold
+        self.minimum_calls = minimum_calls
+        self.failure_window_seconds = failure_window_seconds
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self.ignored_status_codes = frozenset(ignored_status_codes)
+
+    def _key(self, part: str):
+        return f'circuit_breaker:{self.name}:{part}'
+
+    def _window_keys(self, now: float):
+        # Keyed by window, so the calls and failures of a window are counted from the same start
+        window = int(now // self.failure_window_seconds)
+        return self._key(f'calls:{window}'), self._key(f'failures:{window}')
+
+    def _opened_at(self):
+        return self.store.get(self._key('opened_at'))
+
+    def _open(self, now: float):
+        # Kept for a second timeout, so a breaker whose probe never reports back (a killed worker) closes by itself
+        self.store.set(self._key('opened_at'), now, timeout=2 * self.reset_timeout_seconds)
+        self.store.set(self._key('probe'), 0, timeout=2 * self.reset_timeout_seconds)
+
+    def state(self, now: float = None) -> str:
+        opened_at = self._opened_at()
+        if opened_at is None:
+            return self.CLOSED
+        return self.OPEN if (now or time.time()) - opened_at < self.reset_timeout_seconds else self.HALF_OPEN
+
+    def before_call(self, **error_kwargs) -> bool:
+        """
+        Check a call may be made.
+
+        Returns:
+            bool: Whether the call is the probe of a half open breaker, to pass on to `record_success` or
+            `record_failure`.
+        Raises:
+            CircuitOpenError: The breaker is open, or half open with a probe in flight.
+        """
+        opened_at = self._opened_at()
+        if opened_at is None:
+            return False
+
+        retry_after = opened_at + self.reset_timeout_seconds - time.time()
+        if retry_after > 0:
+            raise CircuitOpenError(self.name, retry_after, **error_kwargs)
+
+        # Half open, the first call probes the service, the others fail until it's answered
+        if self.store.incr(self._key('probe'), 1, timeout=self.reset_timeout_seconds) > 1:
+            raise CircuitOpenError(self.name, self.reset_timeout_seconds, **error_kwargs)
+
+        return True
+
+    def record_success(self, probe: bool = False):
+        """ Record a call that succeeded, which closes the breaker if it was the probe """
+        calls_key, failures_key = self._window_keys(time.time())
+        if not probe:
+            self.store.incr(calls_key, 1, timeout=self.failure_window_seconds)
+            return
+
+        self.store.set(self._key('opened_at'), None, timeout=self.reset_timeout_seconds)
+        # The calls that opened it aren't counted again
+        self.store.set(calls_key, 0, timeout=self.failure_window_seconds)
+        self.store.set(failures_key, 0, timeout=self.failure_window_seconds)
+        logger.info(f"[CircuitBreaker] {self.name} answered the probe call, closing its circuit breaker")
+
+    def record_failure(self, probe: bool = False):
+        """ Record a call that failed, which opens the breaker at its window's failure rate, or if it was the probe """
+        now = time.time()
+
+        if probe:
+            self._open(now)
+            logger.warning(f"[CircuitBreaker] {self.name} failed the probe call, its circuit breaker stays open")
+            return
+
+        calls_key, failures_key = self._window_keys(now)
+        calls = self.store.incr(calls_key, 1, timeout=self.failure_window_seconds)
+        failures = self.store.incr(failures_key, 1, timeout=self.failure_window_seconds)
+        if (calls >= self.minimum_calls and failures >= self.failure_rate_threshold * calls
+                and self._opened_at() is None):
+            self._open(now)
+            logger.warning(f"[CircuitBreaker] {failures} of {calls} calls to {self.name} failed within "
+                           f"{self.failure_window_seconds} seconds, opening its circuit breaker for "
+                           f"{self.reset_timeout_seconds} seconds")
+
+
+class CircuitBreakerAdapter(BaseAdapter):
+    """ Transport adapter that makes the requests of the adapter it wraps through a CircuitBreaker """
+
+    def __init__(self, adapter: BaseAdapter, breaker: CircuitBreaker):
+        super().__init__()
+        self.adapter = adapter
+        self.breaker = breaker
+
+    def send(self, request, *args, **kwargs):  # pylint: disable=arguments-differ
+        probe = self.breaker.before_call(request=request)
+
+        try:
+            response = self.adapter.send(request, *args, **kwargs)
+        except RequestException:
+            self.breaker.record_failure(probe)
+            raise
+
+        if response.status_code in self.breaker.ignored_status_codes:
+            # Not counted, but an ignored answer to the probe still shows the service is up
+            if probe:
+                self.breaker.record_success(probe)
+        elif response.status_code in FAILURE_STATUS_CODES:
+            self.breaker.record_failure(probe)
+        else:
+            self.breaker.record_success(probe)
+
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+def mount_circuit_breaker(session: Session, prefix: str, breaker: CircuitBreaker):
+    """
+    Break the requests `session` makes to URLs starting with `prefix`, wrapping the adapter that makes them now. Mount
+    it after any rate limiter, so calls failed by the breaker don't wait for budget. Does nothing if they're already
+    broken.
+    """
+    if is_wrapped_by(session.adapters.get(prefix), CircuitBreakerAdapter):
+        return
+
+    session.mount(prefix, CircuitBreakerAdapter(mounted_adapter(session, prefix), breaker))
+
+
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """
+    Return the process-wide breaker of ``settings.CIRCUIT_BREAKERS[name]``, creating it on first use.
+    """
+    breaker = _circuit_breakers.get(name)
+    if breaker is None:
+        with _circuit_breakers_lock:
+            breaker = _circuit_breakers.get(name)
+            if breaker is None:
+                config = settings.CIRCUIT_BREAKERS[name]
+                breaker = CircuitBreaker(
+                    name,
+                    store_from_config(config),
+                    failure_rate_threshold=config['FAILURE_RATE_THRESHOLD'],
+                    minimum_calls=config['MINIMUM_CALLS'],
+                    failure_window_seconds=config['FAILURE_WINDOW_SECONDS'],
+                    reset_timeout_seconds=config['RESET_TIMEOUT_SECONDS'],
+                    ignored_status_codes=config.get('IGNORED_STATUS_CODES', ()),
+                )
+                _circuit_breakers[name] = breaker
+    return breaker
+
+
+def reset_circuit_breakers():
+    """
+    Forget all breakers, so the next ones are built from the current settings.
+
+    Runs in every forked child (e.g. Celery prefork workers) so they don't share locks with the parent.
+    """
+    global _circuit_breakers_lock  # pylint: disable=global-statement
+    _circuit_breakers.clear()
+    _circuit_breakers_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=reset_circuit_breakers)
@@ -1,11 +1,21 @@
 """
 API client logic shared between plugins.
 """
+import datetime
 import logging
+import os
+import threading
+import time
 from urllib.parse import urljoin
 
 from django.conf import settings
-from edx_rest_api_client.client import OAuthAPIClient
+from edx_rest_api_client.client import ACCESS_TOKEN_EXPIRED_THRESHOLD_SECONDS, OAuthAPIClient, get_oauth_access_token
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+
+from commerce_coordinator.apps.core.circuit_breaker import get_circuit_breaker, mount_circuit_breaker
+from commerce_coordinator.apps.core.instrumentation import instrument_session
+from commerce_coordinator.apps.core.retry import RetryPolicy
 
 logger = logging.getLogger(__name__)
 
@@ -52,6 +62,9 @@ class Client:
     Base class for API clients.
     """
 
+    # How failed calls made by this client should be classified and backed off. Subclasses may override.
+    retry_policy = RetryPolicy()
+
     @property
     def normal_timeout(self):
         """
@@ -78,18 +91,151 @@ class Client:
             f"{exc.response.status_code if exc.response else ''}. Reason: {exc}.")
 
 
+class SharedOAuthAPIClient(OAuthAPIClient):
+    """
+    OAuthAPIClient meant to be shared by every client of a process that uses the same credentials.
+
+    The access token is kept in memory instead of being looked up in TieredCache before each request, and it is
+    refreshed ``BACKEND_SERVICE_EDX_OAUTH2_TOKEN_REFRESH_MARGIN_SECONDS`` before it expires. Only one thread
+    refreshes at a time: while the current token is still valid the others keep using it, and once it has expired
+    they wait for the refreshing thread instead of each requesting a token of their own.
+
+    Use :func:`get_oauth_api_client` rather than instantiating this class directly.
+    """
+
+    def __init__(self, base_url, client_id, client_secret, **kwargs):
+        super().__init__(base_url, client_id, client_secret, **kwargs)
+
+        # Keep connections to each host open across clients and concurrent requests.
+        adapter = HTTPAdapter(pool_maxsize=settings.BACKEND_SERVICE_EDX_OAUTH2_POOL_MAXSIZE)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        # Calls are recorded per host, as one client calls every service that shares its credentials
+        instrument_session(self)
+
+        self._token_lock = threading.Lock()
+        self._token_refresh_at = 0
+        self._token_expires_at = 0
+
+    def _ensure_authentication(self):
+        """
+        Ensures that the Session's auth.token is set with an unexpired token, refreshing it ahead of expiry.
+
+        Raises:
+            requests.RequestException if there is no valid token and a new one can't be retrieved.
+        """
+        now = time.monotonic()
+        if now < self._token_refresh_at:
+            return
+
+        if now < self._token_expires_at:
+            if not self._token_lock.acquire(blocking=False):
+                # Another thread is already refreshing the token, which is still valid meanwhile.
+                return
+        else:
+            self._token_lock.acquire()  # pylint: disable=consider-using-with
+
+        try:
+            if time.monotonic() < self._token_refresh_at:
+                # Refreshed by another thread while this one waited for the lock.
+                return
+            self._refresh_token()
+        finally:
+            self._token_lock.release()
+
+    def _refresh_token(self):
+        """
+        Retrieve a new access token and schedule its refresh.
+        """
+        oauth_url = self._base_url if not self.oauth_uri else self._base_url + self.oauth_uri
+        requested_at = time.monotonic()
+
+        try:
+            token, expires_at = get_oauth_access_token(
+                oauth_url,
+                self._client_id,
+                self._client_secret,
+                grant_type='client_credentials',
+                timeout=self._timeout,
+            )
+        except RequestException as exc:
+            if requested_at < self._token_expires_at:
+                logger.warning(f"[SharedOAuthAPIClient] Failed to refresh access token for {oauth_url}, "
+                               f"using the current one until it expires. Reason: {exc}.")
+                return
+            raise
+
+        # get_oauth_access_token returns a naive UTC datetime.
+        utc_now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        lifetime = (expires_at - utc_now).total_seconds() - ACCESS_TOKEN_EXPIRED_THRESHOLD_SECONDS
+        refresh_margin = min(settings.BACKEND_SERVICE_EDX_OAUTH2_TOKEN_REFRESH_MARGIN_SECONDS, lifetime / 2)
+
+        self.auth.token = token
+        self._token_expires_at = requested_at + lifetime
+        self._token_refresh_at = requested_at + lifetime - refresh_margin
+
+
+_shared_oauth_api_clients = {}
+_shared_oauth_api_clients_lock = threading.Lock()
+
+
+def get_oauth_api_client(base_url, client_id, client_secret, timeout):
+    """
+    Return the process-wide SharedOAuthAPIClient for ``(base_url, client_id)``, creating it on first use.
+
+    Args:
+        base_url (str): Base URL of the OAuth provider.
+        client_id (str): OAuth client ID.
+        client_secret (str): OAuth client secret.
+        timeout (tuple(float,float)): Timeout for access token requests.
+    """
+    key = (base_url, client_id)
+    client = _shared_oauth_api_clients.get(key)
+    if client is None:
+        with _shared_oauth_api_clients_lock:
+            client = _shared_oauth_api_clients.get(key)
+            if client is None:
+                client = SharedOAuthAPIClient(base_url, client_id, client_secret, timeout=timeout)
+                _shared_oauth_api_clients[key] = client
+    return client
+
+
+def reset_oauth_api_clients():
+    """
+    Forget all shared OAuth API clients, so the next clients get a new session and access token.
+
+    Runs in every forked child (e.g. Celery prefork workers) so they don't share sockets or locks with the parent.
+    """
+    global _shared_oauth_api_clients_lock  # pylint: disable=global-statement
+    _shared_oauth_api_clients.clear()
+    _shared_oauth_api_clients_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=reset_oauth_api_clients)
+
+
 class BaseEdxOAuthClient(Client):
     """
     API client for calls to the other edX services.
+
+    Clients using the same OAuth credentials share one session, so its access token and connections are reused
+    across client instances.
     """
 
+    # Name of the service's breaker in settings.CIRCUIT_BREAKERS, applied to calls to circuit_breaker_url. Subclasses
+    # may set both.
+    circuit_breaker = None
+    circuit_breaker_url = None
+
     def __init__(self):
-        self.client = OAuthAPIClient(
+        self.client = get_oauth_api_client(
             settings.BACKEND_SERVICE_EDX_OAUTH2_PROVIDER_URL.strip('/'),
             self.oauth2_client_id,
             self.oauth2_client_secret,
             timeout=self.normal_timeout
         )
+        if self.circuit_breaker:
+            mount_circuit_breaker(self.client, self.circuit_breaker_url, get_circuit_breaker(self.circuit_breaker))
 
     @property
     def oauth2_client_id(self):
@@ -0,0 +1,63 @@
+"""
+Helpers for running independent outbound calls concurrently with a bounded number of threads.
+"""
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, List, NamedTuple, Optional
+
+from django.conf import settings
+
+
+class ConcurrentResult(NamedTuple):
+    """
+    Outcome of calling a function on one item: either its return value or the exception it raised.
+    """
+    item: Any
+    value: Any = None
+    error: Optional[BaseException] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def map_concurrently(
+    func: Callable[[Any], Any],
+    items: Iterable[Any],
+    max_workers: Optional[int] = None,
+) -> List[ConcurrentResult]:
+    """
+    Call ``func`` on every item using at most ``max_workers`` threads.
+
+    Exceptions are captured per item instead of cancelling the other calls, so callers can retry or report
+    partial failures individually. ``func`` should only do I/O that is safe from a worker thread (HTTP calls);
+    Django ORM access from the pool would open a database connection per thread.
+
+    Args:
+        func: Callable taking a single item.
+        items: The items to process.
+        max_workers (int): Upper bound on concurrent calls. Defaults to ``settings.FULFILLMENT_MAX_CONCURRENCY``.
+
+    Returns:
+        List[ConcurrentResult]: One result per item, in the order of ``items``.
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    max_workers = min(max_workers or settings.FULFILLMENT_MAX_CONCURRENCY, len(items))
+
+    def call(item):
+        try:
+            return ConcurrentResult(item, value=func(item))
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            return ConcurrentResult(item, error=exc)
+
+    if max_workers == 1:
+        return [call(item) for item in items]
+
+    # Each call runs in a copy of the caller's context, so its outbound calls keep the caller's priority and are added
+    # to the caller's outbound timings
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, call, item) for item in items]
+        return [future.result() for future in futures]
@@ -94,6 +94,10 @@ class HttpHeadersNames(Enum):
 ORDER_HISTORY_PER_SYSTEM_REQ_CUTOFF_IN_DAYS = 180
 ORDER_HISTORY_PER_SYSTEM_REQ_LIMIT = 200
 """The number of Order History items to pull per Catalog/Ordering System"""
+ORDER_HISTORY_CACHE_TTL_SECS = 60 * 60 * 24
+"""How long a cached first page of Order History may live, it's invalidated by order messages well before that"""
+ORDER_HISTORY_LEGACY_CACHE_TTL_SECS = 60
+"""How long a cached first page that includes legacy ecommerce orders may live, as they send no order messages"""
 
 UNIFIED_ORDER_HISTORY_RECEIPT_URL_KEY = 'receipt_url'
 UNIFIED_ORDER_HISTORY_SOURCE_SYSTEM_KEY = 'source_system'
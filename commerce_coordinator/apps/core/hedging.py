@@ -0,0 +1,290 @@
+"""
+Hedged reads, to cut the tail latency of idempotent outbound calls.
+
+Most responses of an endpoint arrive within a few tens of milliseconds, but now and then one takes seconds, and that
+one decides the p99 of every view waiting on it. When a GET to an endpoint is still unanswered after the endpoint's
+usual slowest latency (a running percentile, p95 by default), a `RequestHedger` sends the same request again, and
+whichever response arrives first is returned. The other one is closed when it arrives.
+
+Hedges are extra load on the service, so they're capped at a share of its calls (``MAX_EXTRA_LOAD``): each call earns
+that share of a hedge, and a hedge is only sent when a whole one has been earned. Endpoints aren't hedged until enough
+of their latencies (``MIN_SAMPLES``) are known.
+
+Hedging is configured per service in ``settings.HEDGED_READS``, use ``get_hedger`` for a service's hedger and
+``mount_hedging`` to apply it to a requests Session. Attempts are made on the hedger's thread pool, with the context
+(e.g. the outbound priority) of the calling thread. A rate limiter under the hedging is applied on the calling thread
+instead of the pool's: a call waits for budget before its attempts are sent, and a hedge is only sent if there's budget
+for it right away, so pool threads only ever wait on the network and the latencies recorded are the network's.
+"""
+import contextvars
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Optional
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from requests import Session
+from requests.adapters import BaseAdapter
+
+from commerce_coordinator.apps.core.rate_limit import (
+    AdaptiveRateLimiter,
+    RateLimitedAdapter,
+    is_wrapped_by,
+    mounted_adapter
+)
+
+logger = logging.getLogger(__name__)
+
+# Methods that are safe to send twice
+IDEMPOTENT_READ_METHODS = frozenset({'GET', 'HEAD'})
+
+# Path segments that are IDs or numbers, so e.g. every order's /orders/<id> is one endpoint
+_ID_SEGMENT = re.compile(r'^(?:[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9a-f]{16,}|\d+)$', re.I)
+
+
+def endpoint_of(method: str, url: str) -> str:
+    """ The endpoint a request is to, e.g. "GET /project/orders/{id}", or "GET /project/orders/key={}" for keys """
+    segments = []
+    for segment in urlsplit(url).path.split('/'):
+        if _ID_SEGMENT.match(segment):
+            segment = '{id}'
+        elif '=' in segment:
+            segment = segment.split('=', 1)[0] + '={}'
+        segments.append(segment)
+    return f"{method} {'/'.join(segments)}"
+
+
+class LatencyTracker:
+    """ The last `window` latencies of each endpoint, and a percentile of them """
+
+    def __init__(self, percentile: float = 95, min_samples: int = 50, window: int = 500):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float):
+        with self._lock:
+            self._samples[endpoint].append(seconds)
+
+    def quantile(self, endpoint: str) -> Optional[float]:
+        """ The `percentile` latency of the endpoint in seconds, None until it has `min_samples` latencies """
+        with self._lock:
+            samples = sorted(self._samples.get(endpoint, ()))
+
+        if not samples or len(samples) < self.min_samples:
+            return None
+
+        return samples[max(0, math.ceil(len(samples) * self.percentile / 100) - 1)]
+
+
+class HedgeBudget:
+    """ Hedges allowed as a share of calls: each call earns `ratio` of a hedge, with at most `burst` hedges saved """
+
+    def __init__(self, ratio: float, burst: float = 10):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def earn(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def available(self) -> bool:
+        with self._lock:
+            return self._tokens >= 1
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+def _close_response(future):
+    if future.exception() is None:
+        future.result().close()
+
+
+class RequestHedger:
+    """ Sends a second copy of slow idempotent requests, see the module docstring """
+
+    def __init__(
+        self,
+        name: str,
+        max_extra_load: float = 0.05,
+        percentile: float = 95,
+        min_samples: int = 50,
+        window: int = 500,
+        min_delay_seconds: float = 0.05,
+        max_workers: int = 32,
+    ):
+        """
+        Args:
+            name (str): Name of the service, for logs and thread names.
+            max_extra_load (float): Largest share of calls that may be hedged.
+            percentile (float): Latency percentile of an endpoint after which a call to it is hedged.
+            min_samples (int): Latencies an endpoint needs before its calls are hedged.
+            window (int): Latencies of an endpoint kept for the percentile.
+            min_delay_seconds (float): Least time a call is given before it's hedged.
+            max_workers (int): Threads making the hedged calls, and the calls they hedge.
+        """
+        self.name = name
+        self.min_delay_seconds = min_delay_seconds
+        self.tracker = LatencyTracker(percentile, min_samples, window)
+        self.budget = HedgeBudget(max_extra_load)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'hedge-{name}')
+
+    def hedge_delay(self, endpoint: str) -> Optional[float]:
+        """ Seconds after which a call to the endpoint is hedged, None if it isn't """
+        quantile = self.tracker.quantile(endpoint)
+        return None if quantile is None else max(quantile, self.min_delay_seconds)
+
+    def _attempt(self, send, request, endpoint, record, kwargs):
+        started = time.monotonic()
+        response = send(request, **kwargs)
+        if record:
+            self.tracker.record(endpoint, time.monotonic() - started)
+        return response
+
+    def _submit(self, send, request, endpoint, record, kwargs):
+        # Each attempt runs in a copy of the caller's context, one context can't be entered by two threads at once
+        context = contextvars.copy_context()
+        return self.executor.submit(context.run, self._attempt, send, request, endpoint, record, kwargs)
+
+    def send(self, send, request, limiter: Optional[AdaptiveRateLimiter] = None, **kwargs):
+        """
+        Send `request` with `send` (a transport adapter's send), hedging it if it's an idempotent read that's slow.
+
+        The caller holds any wait for `limiter`'s budget for the request itself, a hedge is only sent if `limiter` has
+        budget for it without waiting.
+
+        Returns:
+            The first response that arrived.
+        Raises:
+            The error of the original request, if it and its hedge both failed.
+        """
+        if request.method not in IDEMPOTENT_READ_METHODS or kwargs.get('stream'):
+            return send(request, **kwargs)
+
+        endpoint = endpoint_of(request.method, request.url)
+        self.budget.earn()
+        delay = self.hedge_delay(endpoint)
+
+        # Nothing to hedge with, so there's no need for a pool thread either
+        if delay is None or not self.budget.available():
+            return self._attempt(send, request, endpoint, True, kwargs)
+
+        original = self._submit(send, request, endpoint, True, kwargs)
+        done, _ = wait([original], timeout=delay)
+
+        if done or not self.budget.try_spend() or (limiter is not None and not limiter.try_acquire()):
+            return original.result()
+
+        logger.debug(f"[RequestHedger] {endpoint} of {self.name} unanswered after {delay:.3f} seconds, hedging it")
+        hedge = self._submit(send, request.copy(), endpoint, False, kwargs)
+        pending = {original, hedge}
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((future for future in done if future.exception() is None), None)
+
+            if winner is not None:
+                for future in (original, hedge):
+                    if future is not winner:
+                        future.add_done_callback(_close_response)
+                return winner.result()
+
+        return original.result()
+
+
+class HedgedAdapter(BaseAdapter):
+    """
+    Transport adapter that makes the requests of the adapter it wraps through a RequestHedger.
+
+    If it wraps a RateLimitedAdapter, it applies the rate limit itself on the calling thread, and the hedger's attempts
+    are made with the adapter the limiter wraps.
+    """
+
+    def __init__(self, adapter: BaseAdapter, hedger: RequestHedger):
+        super().__init__()
+        self.adapter = adapter
+        self.hedger = hedger
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        if not isinstance(self.adapter, RateLimitedAdapter):
+            return self.hedger.send(self.adapter.send, request, **kwargs)
+
+        limiter = self.adapter.limiter
+        with limiter.limit():
+            response = self.hedger.send(self.adapter.adapter.send, request, limiter=limiter, **kwargs)
+
+        limiter.report(response.status_code)
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+def mount_hedging(session: Session, prefix: str, hedger: Optional[RequestHedger]):
+    """
+    Hedge the reads `session` makes from URLs starting with `prefix`, wrapping the adapter that makes them now. Mount it
+    right after any rate limiter, so hedges are limited too without pool threads waiting for budget, and before any
+    circuit breaker. Does nothing if `hedger` is None or they're already hedged.
+    """
+    if hedger is None or is_wrapped_by(session.adapters.get(prefix), HedgedAdapter):
+        return
+
+    session.mount(prefix, HedgedAdapter(mounted_adapter(session, prefix), hedger))
+
+
+_hedgers = {}
+_hedgers_lock = threading.Lock()
+
+
+def get_hedger(name: str) -> Optional[RequestHedger]:
+    """
+    Return the process-wide hedger of ``settings.HEDGED_READS[name]``, creating it on first use. None if it's disabled.
+    """
+    config = settings.HEDGED_READS[name]
+    if not config['ENABLED']:
+        return None
+
+    hedger = _hedgers.get(name)
+    if hedger is None:
+        with _hedgers_lock:
+            hedger = _hedgers.get(name)
+            if hedger is None:
+                hedger = RequestHedger(
+                    name,
+                    max_extra_load=config['MAX_EXTRA_LOAD'],
+                    percentile=config['PERCENTILE'],
+                    min_samples=config['MIN_SAMPLES'],
+                    window=config['WINDOW'],
+                    min_delay_seconds=config['MIN_DELAY_SECONDS'],
+                    max_workers=config['MAX_WORKERS'],
+                )
+                _hedgers[name] = hedger
+    return hedger
+
+
+def reset_hedgers():
+    """
+    Forget all hedgers, so the next ones are built from the current settings.
+
+    Runs in every forked child (e.g. Celery prefork workers), which don't have the threads of the parent's pools.
+    """
+    global _hedgers_lock  # pylint: disable=global-statement
+    _hedgers.clear()
+    _hedgers_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=reset_hedgers)
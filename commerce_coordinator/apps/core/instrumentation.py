@@ -0,0 +1,331 @@
+"""
+Instrumentation of outbound calls: latency, status code, retry attempt and payload sizes of every call, per service
+and endpoint.
+
+Calls are recorded at the transport of each client, so they're measured the same way whatever SDK makes them:
+``instrument_session`` for requests Sessions (commercetools, the OAuth clients, Stripe and PayPal),
+``instrument_httplib2`` for httplib2 (Google APIs), and ``timed_call`` around calls whose transport can't be reached
+(the App Store validator, which calls requests' module functions).
+
+Each call is an `OutboundCall`, sent to the sinks of ``settings.OUTBOUND_METRICS_SINKS``: `MonitoringMetricsSink`
+adds them up per service and endpoint in the custom attributes of the current New Relic transaction,
+`InMemoryMetricsSink` keeps them and a latency histogram per endpoint, for tests. The calls of a web request are also
+added up per service for its ``Server-Timing`` header, see ``collect_outbound_timings``.
+"""
+import contextvars
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from typing import NamedTuple, Optional
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from edx_django_utils.monitoring import accumulate, increment
+from requests import Session
+from requests.adapters import BaseAdapter
+
+from commerce_coordinator.apps.core.hedging import endpoint_of
+from commerce_coordinator.apps.core.rate_limit import is_wrapped_by
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in milliseconds of the buckets of latency histograms, the last bucket has no bound
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class OutboundCall(NamedTuple):
+    """
+    One outbound call. `status_code` and `response_bytes` are None if no response was received (or its size isn't
+    known), `error` is the name of the exception the call raised, if any.
+    """
+    service: str
+    endpoint: str
+    status_code: Optional[int]
+    duration: float
+    request_bytes: int
+    response_bytes: Optional[int]
+    attempt: int = 0
+    error: Optional[str] = None
+
+
+_attempt = contextvars.ContextVar('outbound_attempt', default=0)
+
+
+def current_attempt() -> int:
+    """ Attempt of the outbound calls made in the current context, 0 for a first attempt and n for the nth retry """
+    return _attempt.get()
+
+
+def set_attempt(attempt: int) -> contextvars.Token:
+    """ Set the attempt of the outbound calls made in the current context, returns a token for `reset_attempt` """
+    return _attempt.set(attempt)
+
+
+def reset_attempt(token: contextvars.Token):
+    _attempt.reset(token)
+
+
+@contextmanager
+def outbound_attempt(attempt: int):
+    """ Record the outbound calls in the block as retry number `attempt` (0 for the first attempt) """
+    token = set_attempt(attempt)
+    try:
+        yield
+    finally:
+        reset_attempt(token)
+
+
+class LatencyHistogram:
+    """ Counts of latencies per bucket of `buckets` (upper bounds in milliseconds), their count and their sum """
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+
+
+class EndpointMetrics:
+    """ Metrics of the calls to one endpoint of a service """
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.status_codes = Counter()
+        self.errors = Counter()
+        self.retries = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+    def add(self, call: OutboundCall):
+        self.latency.observe(call.duration * 1000)
+        if call.status_code is not None:
+            self.status_codes[call.status_code] += 1
+        if call.error:
+            self.errors[call.error] += 1
+        if call.attempt:
+            self.retries += 1
+        self.request_bytes += call.request_bytes
+        self.response_bytes += call.response_bytes or 0
+
+
+class InMemoryMetricsSink:
+    """ Keeps every call, and the metrics of each (service, endpoint) in `endpoints`. Meant for tests. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = []
+        self.endpoints = defaultdict(EndpointMetrics)
+
+    def record(self, call: OutboundCall):
+        with self._lock:
+            self.calls.append(call)
+            self.endpoints[(call.service, call.endpoint)].add(call)
+
+    def clear(self):
+        with self._lock:
+            self.calls = []
+            self.endpoints = defaultdict(EndpointMetrics)
+
+
+class MonitoringMetricsSink:
+    """
+    Adds up the calls to each service in custom attributes of the current transaction, e.g.
+    ``outbound.commercetools.calls`` and ``outbound.commercetools.duration_ms``, and the calls to each of its endpoints,
+    e.g. ``outbound.commercetools.GET /project/orders/{id}.duration_ms`` and ``...status.404``. A call without a
+    response is counted under the name of its error, e.g. ``...status.ConnectTimeout``. See
+    edx_django_utils.monitoring.
+    """
+
+    def record(self, call: OutboundCall):
+        prefix = f'outbound.{call.service}'
+        duration_ms = round(call.duration * 1000, 1)
+        increment(f'{prefix}.calls')
+        accumulate(f'{prefix}.duration_ms', duration_ms)
+        accumulate(f'{prefix}.request_bytes', call.request_bytes)
+        accumulate(f'{prefix}.response_bytes', call.response_bytes or 0)
+        if call.attempt:
+            increment(f'{prefix}.retries')
+        if call.error or (call.status_code or 0) >= 500:
+            increment(f'{prefix}.errors')
+
+        endpoint = f'{prefix}.{call.endpoint}'
+        increment(f'{endpoint}.calls')
+        accumulate(f'{endpoint}.duration_ms', duration_ms)
+        increment(f'{endpoint}.status.{call.status_code or call.error}')
+        if call.attempt:
+            increment(f'{endpoint}.retries')
+
+
+_sinks = {}
+
+
+def get_metrics_sinks() -> list:
+    """ The sinks of ``settings.OUTBOUND_METRICS_SINKS``, created on first use """
+    paths = tuple(settings.OUTBOUND_METRICS_SINKS)
+    sinks = _sinks.get(paths)
+    if sinks is None:
+        sinks = _sinks.setdefault(paths, [import_string(path)() for path in paths])
+    return sinks
+
+
+class OutboundTimings:
+    """ Count and total duration of the outbound calls to each service, made while handling one request """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.services = {}
+
+    def add(self, call: OutboundCall):
+        with self._lock:
+            calls, duration = self.services.get(call.service, (0, 0.0))
+            self.services[call.service] = (calls + 1, duration + call.duration)
+
+    def server_timing(self) -> str:
+        """
+        The timings as a ``Server-Timing`` header value, e.g. ``commercetools;dur=84.2;desc="3 calls"``. Durations of
+        concurrent calls are summed, so a service's can be longer than the request.
+        """
+        with self._lock:
+            services = sorted(self.services.items())
+        return ', '.join(
+            f'{service};dur={duration * 1000:.1f};desc="{calls} call{"s" if calls > 1 else ""}"'
+            for service, (calls, duration) in services
+        )
+
+
+_timings = contextvars.ContextVar('outbound_timings', default=None)
+
+
+@contextmanager
+def collect_outbound_timings():
+    """
+    Add up the outbound calls made in the block, and in threads running copies of its context, in the yielded
+    OutboundTimings.
+    """
+    timings = OutboundTimings()
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def record_call(call: OutboundCall):
+    """ Send `call` to the sinks, and add it to the timings being collected, if any """
+    timings = _timings.get()
+    if timings is not None:
+        timings.add(call)
+
+    for sink in get_metrics_sinks():
+        try:
+            sink.record(call)
+        except Exception:  # pylint: disable=broad-exception-caught
+            # Metrics are never worth failing the call over
+            logger.exception(f"[Instrumentation] {type(sink).__name__} failed to record a call to {call.service}")
+
+
+@contextmanager
+def timed_call(service: str, endpoint: str, request_bytes: int = 0):
+    """
+    Record the outbound call made in the block. Set ``'status_code'`` and ``'response_bytes'`` of the yielded dict
+    once the response is received.
+    """
+    outcome = {'status_code': None, 'response_bytes': None}
+    error = None
+    started = time.monotonic()
+    try:
+        yield outcome
+    except BaseException as exc:
+        error = type(exc).__name__
+        raise
+    finally:
+        record_call(OutboundCall(
+            service,
+            endpoint,
+            outcome['status_code'],
+            time.monotonic() - started,
+            request_bytes,
+            outcome['response_bytes'],
+            current_attempt(),
+            error,
+        ))
+
+
+def _body_size(body) -> int:
+    if isinstance(body, str):
+        return len(body.encode())
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    return 0
+
+
+class InstrumentedAdapter(BaseAdapter):
+    """
+    Transport adapter that records the calls of the adapter it wraps as calls to `service`, or to the host of their
+    URL if `service` is None.
+    """
+
+    def __init__(self, adapter: BaseAdapter, service: Optional[str] = None):
+        super().__init__()
+        self.adapter = adapter
+        self.service = service
+
+    def send(self, request, *args, **kwargs):  # pylint: disable=arguments-differ
+        service = self.service or urlsplit(request.url).hostname
+        with timed_call(service, endpoint_of(request.method, request.url), _body_size(request.body)) as outcome:
+            response = self.adapter.send(request, *args, **kwargs)
+            outcome['status_code'] = response.status_code
+            # A streamed body isn't read here, its size is only known from the header
+            length = response.headers.get('Content-Length')
+            if length and length.isdigit():
+                outcome['response_bytes'] = int(length)
+            elif not kwargs.get('stream'):
+                outcome['response_bytes'] = len(response.content or b'')
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+def instrument_session(session: Session, service: Optional[str] = None):
+    """
+    Record every call `session` sends, including redirects, as a call to `service`, or to the host of its URL if
+    `service` is None, wrapping the adapters mounted now. Instrument it after mounting any rate limiter, hedging or
+    circuit breaker, so a call that was rate limited, hedged or failed by a breaker is recorded as the caller saw it.
+    Adapters that are already instrumented are left as they are.
+    """
+    for prefix, adapter in list(session.adapters.items()):
+        if not is_wrapped_by(adapter, InstrumentedAdapter):
+            session.mount(prefix, InstrumentedAdapter(adapter, service))
+
+
+def instrument_httplib2(http, service: str):
+    """
+    Record every call the httplib2.Http `http` makes as a call to `service`, and return it. Does nothing if it's
+    already instrumented.
+    """
+    request = http.request
+    if getattr(request, 'instrumented', False) is True:
+        return http
+
+    @wraps(request)
+    def instrumented_request(uri, method='GET', body=None, headers=None, **kwargs):
+        with timed_call(service, endpoint_of(method, uri), _body_size(body)) as outcome:
+            response, content = request(uri, method, body=body, headers=headers, **kwargs)
+            outcome['status_code'] = response.status
+            outcome['response_bytes'] = len(content or b'')
+        return response, content
+
+    instrumented_request.instrumented = True
+    http.request = instrumented_request
+    return http
@@ -2,18 +2,34 @@
 Middleware for Commerce Coordinator.
 """
 import logging
+import math
 
+from rest_framework.response import Response
+from rest_framework.status import HTTP_503_SERVICE_UNAVAILABLE
 from rest_framework.views import exception_handler
 
+from commerce_coordinator.apps.core.circuit_breaker import CircuitOpenError
+from commerce_coordinator.apps.core.instrumentation import collect_outbound_timings
+
 logger = logging.getLogger(__name__)
 
 
 def log_drf_exceptions(exc, context):
     """
     Log Django REST Framework exceptions.
+
+    A CircuitOpenError a view didn't handle is answered with a 503, and a Retry-After of when the breaker lets calls
+    through again.
     """
     response = exception_handler(exc, context)
 
+    if response is None and isinstance(exc, CircuitOpenError):
+        response = Response(
+            {'detail': 'A service this request depends on is unavailable, try again later.'},
+            status=HTTP_503_SERVICE_UNAVAILABLE,
+            headers={'Retry-After': str(math.ceil(exc.retry_after))},
+        )
+
     status_code = None
     if response:
         status_code = response.status_code
@@ -49,3 +65,24 @@ def log_drf_exceptions(exc, context):
     )
 
     return response
+
+
+class ServerTimingMiddleware:
+    """
+    Add the count and total duration of the outbound calls to each service made while handling a request to its
+    ``Server-Timing`` header. See core.instrumentation.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with collect_outbound_timings() as timings:
+            response = self.get_response(request)
+
+        server_timing = timings.server_timing()
+        if server_timing:
+            existing = response.get('Server-Timing')
+            response['Server-Timing'] = f'{existing}, {server_timing}' if existing else server_timing
+
+        return response
@@ -0,0 +1,349 @@
+"""
+Rate limits and bulkheads for outbound API calls, shared by every web and Celery worker process.
+
+Each limited service has a budget of requests per second, kept as a counter per one second window in a shared store
+(the Django cache), so every process draws from the same budget; in effect a token bucket refilled once a second.
+Calls are made with a priority, and each priority class may only use up its share of a window's budget, which keeps
+headroom for the classes above it: batch commands and Celery retries are held back before web requests a user is
+waiting on are.
+
+When the service answers 429 (Too Many Requests) or 503, the budget is cut for every process, and grows back
+linearly after that. A bulkhead per priority class also caps the calls a process has in flight at once, so batch
+work can't take every pooled connection.
+
+Limits are configured per service in ``settings.OUTBOUND_RATE_LIMITS``, use ``get_rate_limiter`` for a service's
+limiter and ``mount_rate_limiter`` to apply it to a requests Session.
+"""
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from requests import Session
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Responses telling us the service is over its limit, or overloaded
+THROTTLE_STATUS_CODES = frozenset({429, 503})
+
+
+class Priority:
+    """ Priority classes of outbound calls, highest first """
+
+    # Web requests a user is waiting on, the default
+    INTERACTIVE = 'interactive'
+    # First attempts of Celery tasks
+    TASK = 'task'
+    # Management commands and Celery retries
+    BATCH = 'batch'
+
+
+_priority = contextvars.ContextVar('outbound_priority', default=Priority.INTERACTIVE)
+
+
+def current_priority() -> str:
+    """ Priority of the outbound calls made in the current context """
+    return _priority.get()
+
+
+def set_priority(priority: str) -> contextvars.Token:
+    """ Set the priority of the outbound calls made in the current context, returns a token for `reset_priority` """
+    return _priority.set(priority)
+
+
+def reset_priority(token: contextvars.Token):
+    _priority.reset(token)
+
+
+@contextmanager
+def outbound_priority(priority: str):
+    """ Make the outbound calls in the block with `priority` """
+    token = set_priority(priority)
+    try:
+        yield
+    finally:
+        reset_priority(token)
+
+
+class InMemoryRateLimitStore:
+    """ Keeps limiter state in the process, so each process has a budget of its own. Meant for tests. """
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _purge(self, now):
+        self._values = {key: item for key, item in self._values.items() if item[1] > now}
+
+    def incr(self, key: str, delta: int, timeout: float) -> int:
+        with self._lock:
+            now = time.time()
+            value, expires_at = self._values.get(key, (0, 0))
+
+            if expires_at <= now:
+                self._purge(now)
+                value, expires_at = 0, now + timeout
+
+            self._values[key] = (value + delta, expires_at)
+            return value + delta
+
+    def get(self, key: str):
+        item = self._values.get(key)
+        return item[0] if item and item[1] > time.time() else None
+
+    def set(self, key: str, value, timeout: float):
+        with self._lock:
+            self._values[key] = (value, time.time() + timeout)
+
+
+class CacheRateLimitStore:
+    """ Keeps limiter state in a Django cache, shared by every process using the same cache (Redis, Memcached) """
+
+    def __init__(self, alias: str = 'default'):
+        self.cache = caches[alias]
+
+    def incr(self, key: str, delta: int, timeout: float) -> int:
+        self.cache.add(key, 0, timeout)
+        try:
+            return self.cache.incr(key, delta)
+        except ValueError:  # Expired between add and incr
+            self.cache.add(key, 0, timeout)
+            return self.cache.incr(key, delta)
+
+    def get(self, key: str):
+        return self.cache.get(key)
+
+    def set(self, key: str, value, timeout: float):
+        self.cache.set(key, value, timeout)
+
+
+class AdaptiveRateLimiter:
+    """
+    A shared requests per second budget for a service, with priority classes, that shrinks when the service
+    throttles us. See the module docstring.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_second: float,
+        store,
+        priority_shares: Optional[Dict[str, float]] = None,
+        max_concurrency: Optional[Dict[str, Optional[int]]] = None,
+        max_wait_seconds: Optional[Dict[str, Optional[float]]] = None,
+        min_factor: float = 0.1,
+        recovery_seconds: float = 60,
+    ):
+        """
+        Args:
+            name (str): Name of the service, the store keys are prefixed with it.
+            requests_per_second (float): Budget when the service isn't throttling us.
+            store: InMemoryRateLimitStore or CacheRateLimitStore.
+            priority_shares (dict): Share of a window's budget (0 - 1) each priority class may use up. Defaults to 1.
+            max_concurrency (dict): Calls a process may have in flight per priority class, None for no limit.
+            max_wait_seconds (dict): Seconds a call of a priority class waits for budget before it's made anyway,
+                None to wait as long as it takes.
+            min_factor (float): Lowest share of `requests_per_second` that throttling can cut the budget to.
+            recovery_seconds (float): Seconds for the budget to grow back to `requests_per_second` from nothing.
+        """
+        self.name = name
+        self.requests_per_second = requests_per_second
+        self.store = store
+        self.priority_shares = priority_shares or {}
+        self.max_wait_seconds = max_wait_seconds or {}
+        self.min_factor = min_factor
+        self.recovery_seconds = recovery_seconds
+        self._bulkheads = {
+            priority: threading.BoundedSemaphore(limit)
+            for priority, limit in (max_concurrency or {}).items() if limit
+        }
+
+    @property
+    def _factor_key(self):
+        return f'outbound_rate_limit:{self.name}:factor'
+
+    def _window_key(self, window: int):
+        return f'outbound_rate_limit:{self.name}:{window}'
+
+    def factor(self, now: Optional[float] = None) -> float:
+        """ Share of `requests_per_second` currently budgeted, below 1 after the service throttled us """
+        state = self.store.get(self._factor_key)
+        if not state:
+            return 1.0
+
+        factor, throttled_at = state
+        return min(1.0, factor + ((now or time.time()) - throttled_at) / self.recovery_seconds)
+
+    def _try_acquire(self, priority: str, now: float) -> bool:
+        budget = max(1, int(self.requests_per_second * self.factor(now) * self.priority_shares.get(priority, 1)))
+        key = self._window_key(int(now))
+
+        if self.store.incr(key, 1, timeout=2) <= budget:
+            return True
+
+        # Give it back, so calls we didn't make don't use up the headroom of the classes above
+        self.store.incr(key, -1, timeout=2)
+        return False
+
+    def acquire(self, priority: Optional[str] = None) -> float:
+        """
+        Wait until the budget allows another call, see `max_wait_seconds`.
+
+        Returns:
+            float: Seconds waited
+        """
+        priority = priority or current_priority()
+        max_wait = self.max_wait_seconds.get(priority)
+        start = time.monotonic()
+
+        while not self._try_acquire(priority, time.time()):
+            waited = time.monotonic() - start
+
+            if max_wait is not None and waited >= max_wait:
+                logger.warning(f"[AdaptiveRateLimiter] {self.name} budget exhausted for {priority} calls, making "
+                               f"one anyway after waiting {waited:.2f} seconds")
+                return waited
+
+            # Sleep until the next window, spread out a little so waiting processes don't all wake at once
+            delay = 1 - time.time() % 1 + random.uniform(0, 0.05)
+            time.sleep(delay if max_wait is None else min(delay, max_wait - waited))
+
+        return time.monotonic() - start
+
+    def try_acquire(self, priority: Optional[str] = None) -> bool:
+        """ Take budget for a call if there's some left in this window, without waiting for it """
+        return self._try_acquire(priority or current_priority(), time.time())
+
+    @contextmanager
+    def limit(self, priority: Optional[str] = None):
+        """ Hold a place in the priority class's bulkhead and wait for budget, for the call made in the block """
+        priority = priority or current_priority()
+        bulkhead = self._bulkheads.get(priority) or nullcontext()
+
+        with bulkhead:
+            self.acquire(priority)
+            yield
+
+    def report(self, status_code: int):
+        """
+        Record a response of the service, a throttling one halves the budget for every process.
+
+        Throttling responses within a second of the last cut are taken to be from the same burst, and ignored.
+        """
+        if status_code not in THROTTLE_STATUS_CODES:
+            return
+
+        now = time.time()
+        state = self.store.get(self._factor_key)
+
+        if state and now - state[1] < 1:
+            return
+
+        factor = max(self.min_factor, self.factor(now) / 2)
+        self.store.set(self._factor_key, (factor, now), timeout=self.recovery_seconds)
+
+        logger.warning(f"[AdaptiveRateLimiter] {self.name} answered {status_code}, cutting its budget to "
+                       f"{self.requests_per_second * factor:.0f} requests per second")
+
+
+class RateLimitedAdapter(BaseAdapter):
+    """ Transport adapter that makes the requests of the adapter it wraps within an AdaptiveRateLimiter """
+
+    def __init__(self, adapter: BaseAdapter, limiter: AdaptiveRateLimiter):
+        super().__init__()
+        self.adapter = adapter
+        self.limiter = limiter
+
+    def send(self, request, *args, **kwargs):  # pylint: disable=arguments-differ
+        with self.limiter.limit():
+            response = self.adapter.send(request, *args, **kwargs)
+
+        self.limiter.report(response.status_code)
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+def mounted_adapter(session: Session, prefix: str) -> BaseAdapter:
+    """ The adapter `session` makes requests to URLs starting with `prefix` with now, for a wrapping adapter """
+    # Not session.get_adapter, which requests_mock patches while it's active
+    current = next(
+        (adapter for mounted, adapter in session.adapters.items() if prefix.lower().startswith(mounted.lower())),
+        None
+    )
+    return current or HTTPAdapter()
+
+
+def is_wrapped_by(adapter: Optional[BaseAdapter], wrapper_type: type) -> bool:
+    """ Whether `adapter`, or an adapter it wraps, is a `wrapper_type` """
+    while isinstance(adapter, BaseAdapter):
+        if isinstance(adapter, wrapper_type):
+            return True
+        adapter = getattr(adapter, 'adapter', None)
+    return False
+
+
+def mount_rate_limiter(session: Session, prefix: str, limiter: AdaptiveRateLimiter):
+    """
+    Limit the requests `session` makes to URLs starting with `prefix`, wrapping the adapter that makes them now (so
+    its retries, or a fake transport, are kept). Does nothing if they're limited already.
+    """
+    if is_wrapped_by(session.adapters.get(prefix), RateLimitedAdapter):
+        return
+
+    session.mount(prefix, RateLimitedAdapter(mounted_adapter(session, prefix), limiter))
+
+
+def store_from_config(config: dict):
+    """ The store a limiter (or circuit breaker) configured by `config` keeps its state in, see its BACKEND """
+    if config['BACKEND'] == 'memory':
+        return InMemoryRateLimitStore()
+    return CacheRateLimitStore(config.get('CACHE_ALIAS', 'default'))
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str) -> AdaptiveRateLimiter:
+    """
+    Return the process-wide limiter of ``settings.OUTBOUND_RATE_LIMITS[name]``, creating it on first use.
+    """
+    limiter = _rate_limiters.get(name)
+    if limiter is None:
+        with _rate_limiters_lock:
+            limiter = _rate_limiters.get(name)
+            if limiter is None:
+                config = settings.OUTBOUND_RATE_LIMITS[name]
+                limiter = AdaptiveRateLimiter(
+                    name,
+                    config['REQUESTS_PER_SECOND'],
+                    store_from_config(config),
+                    priority_shares=config.get('PRIORITY_SHARES'),
+                    max_concurrency=config.get('MAX_CONCURRENCY'),
+                    max_wait_seconds=config.get('MAX_WAIT_SECONDS'),
+                )
+                _rate_limiters[name] = limiter
+    return limiter
+
+
+def reset_rate_limiters():
+    """
+    Forget all limiters, so the next ones are built from the current settings.
+
+    Runs in every forked child (e.g. Celery prefork workers) so they don't share bulkhead semaphores with the parent.
+    """
+    global _rate_limiters_lock  # pylint: disable=global-statement
+    _rate_limiters.clear()
+    _rate_limiters_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=reset_rate_limiters)
@@ -0,0 +1,158 @@
+"""
+Retry policy shared by outbound API clients and the Celery tasks that call them.
+"""
+import logging
+import random
+import time
+
+from requests.exceptions import InvalidHeader, InvalidSchema, InvalidURL, MissingSchema, RequestException
+
+from commerce_coordinator.apps.core.circuit_breaker import CircuitOpenError
+from commerce_coordinator.apps.core.instrumentation import outbound_attempt
+
+logger = logging.getLogger(__name__)
+
+# Status codes that indicate a transient condition on the remote end (or in front of it) and are worth retrying.
+RETRYABLE_STATUS_CODES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+# Request errors that will fail the same way no matter how many times they are retried.
+NON_RETRYABLE_EXCEPTIONS = (InvalidHeader, InvalidSchema, InvalidURL, MissingSchema)
+
+
+class RetryPolicy:
+    """
+    Classifies failed outbound requests and computes exponential backoff with jitter.
+
+    Celery tasks should use :meth:`retry_task_or_raise`, which hands the wait back to the broker so the worker
+    slot is free while the remote service recovers. Callers outside of Celery (views, management commands) can
+    use :meth:`call`, which retries in-process.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        base_backoff: float = 1,
+        max_backoff: float = 60,
+        retryable_status_codes: frozenset = RETRYABLE_STATUS_CODES,
+    ):
+        """
+        Args:
+            max_retries (int): Number of retries after the first attempt.
+            base_backoff (float): Delay in seconds before the first retry; doubled for each subsequent retry.
+            max_backoff (float): Upper bound in seconds for any single delay.
+            retryable_status_codes (frozenset): HTTP status codes considered transient.
+        """
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.retryable_status_codes = retryable_status_codes
+
+    def is_retryable(self, exc: BaseException) -> bool:
+        """
+        Whether the failure is transient and the same request may succeed later.
+
+        Errors raised before a response was received (connection resets, timeouts) are retryable. Errors carrying
+        a response are only retryable when its status code is in ``retryable_status_codes``.
+        """
+        if not isinstance(exc, RequestException) or isinstance(exc, NON_RETRYABLE_EXCEPTIONS):
+            return False
+
+        response = getattr(exc, 'response', None)
+        if response is None:
+            return True
+
+        return response.status_code in self.retryable_status_codes
+
+    def backoff(self, retries: int, exc: BaseException = None) -> float:
+        """
+        Seconds to wait before retry number ``retries + 1``.
+
+        Uses exponential backoff with equal jitter, so concurrent callers that failed together spread out instead
+        of retrying in lockstep. A ``Retry-After`` header on the failed response takes precedence when present.
+        """
+        retry_after = self._retry_after(exc)
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+
+        ceiling = min(self.max_backoff, self.base_backoff * (2 ** retries))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    @staticmethod
+    def _retry_after(exc: BaseException = None):
+        """
+        Seconds requested by a ``Retry-After`` header on the failed response, or until an open circuit breaker lets
+        calls through again, if any.
+        """
+        if isinstance(exc, CircuitOpenError):
+            return exc.retry_after
+
+        response = getattr(exc, 'response', None)
+        headers = getattr(response, 'headers', None) or {}
+        try:
+            return float(headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            return None
+
+    def call(self, func, on_retry=None):
+        """
+        Call ``func`` until it succeeds, raises a non-retryable error, or ``max_retries`` is exhausted.
+
+        This blocks the calling thread between attempts; Celery tasks should use ``retry_task_or_raise`` instead.
+        A CircuitOpenError isn't retried here, as waiting out the breaker is what it's there to prevent.
+
+        Args:
+            func: Zero-argument callable performing a single attempt.
+            on_retry: Optional callable ``(exc, next_attempt, delay)`` invoked before each wait, e.g. for logging.
+
+        Returns:
+            Whatever ``func`` returns on the successful attempt.
+
+        Raises:
+            The last exception raised by ``func`` when it is not retryable or retries are exhausted.
+        """
+        attempt = 0
+        while True:
+            try:
+                with outbound_attempt(attempt):
+                    return func()
+            except RequestException as exc:
+                if attempt >= self.max_retries or not self.is_retryable(exc) or isinstance(exc, CircuitOpenError):
+                    raise
+
+                delay = self.backoff(attempt, exc)
+                attempt += 1
+                if on_retry:
+                    on_retry(exc, attempt, delay)
+                time.sleep(delay)
+
+    def can_retry_task(self, task, exc: BaseException) -> bool:
+        """
+        Whether ``retry_task_or_raise`` would reschedule ``task`` rather than let ``exc`` propagate.
+
+        Args:
+            task: A bound Celery task (``self`` inside a ``bind=True`` task).
+            exc: The exception raised by the failed attempt.
+        """
+        return self.is_retryable(exc) and task.request.retries < self.max_retries
+
+    def retry_task_or_raise(self, task, exc: BaseException):
+        """
+        Reschedule ``task`` through Celery if ``exc`` is retryable, otherwise re-raise ``exc``.
+
+        The countdown grows with ``task.request.retries``, so the worker is released immediately instead of
+        sleeping through the backoff. Once ``max_retries`` is reached Celery re-raises ``exc``, which lets the
+        task's ``on_failure`` handler run as usual.
+
+        Args:
+            task: A bound Celery task (``self`` inside a ``bind=True`` task).
+            exc: The exception raised by the failed attempt.
+        """
+        if not self.is_retryable(exc):
+            raise exc
+
+        countdown = self.backoff(task.request.retries, exc)
+        logger.warning(
+            f"[RetryPolicy] Task {task.name} failed with retryable error: {exc}. "
+            f"Scheduling retry #{task.request.retries + 1} in {countdown:.1f} seconds."
+        )
+        raise task.retry(exc=exc, countdown=countdown, max_retries=self.max_retries)
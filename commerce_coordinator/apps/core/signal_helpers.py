@@ -6,15 +6,24 @@ import traceback
 
 from django.dispatch import Signal
 
+from commerce_coordinator.apps.core.tracing import child_span
+
 
 class CoordinatorSignal(Signal):
+    """
+    Signal whose receivers must be called with send_robust.
+
+    Receivers are called on the sender's thread, so they see its current trace (see core.tracing) without it being
+    passed to them.
+    """
+
     def send(self, *args, **kwargs):
         raise NotImplementedError("Coordinator Signals do not implement the send method. Use send_robust instead.")
 
 
 def log_receiver(logger):
     """
-    Return a decorated function with log messages.
+    Return a decorated function with log messages, traced as a span of the current trace, if any.
     """
     def decorator(func):
         @functools.wraps(func)
@@ -25,7 +34,8 @@ def log_receiver(logger):
             try:
                 # Django's signal dispatcher will give the sender as a keyword argument
                 sender = kwargs['sender']
-                result = func(*args, **kwargs)
+                with child_span(func.__name__, 'signal'):
+                    result = func(*args, **kwargs)
                 logger.info(f"{func.__name__} CALLED with sender '{sender}' and {kwargs}, starting task {result}")
                 return result
             except Exception as e:
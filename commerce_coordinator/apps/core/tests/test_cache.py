@@ -1 +1,60 @@
 """Test core.cache"""
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from commerce_coordinator.apps.core.cache import (
+    bump_order_history_generation,
+    get_cached_order_history,
+    get_order_history_generation,
+    set_cached_order_history
+)
+
+
+class OrderHistoryCacheTests(TestCase):
+    """ Tests for the generational order history cache """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_generation_is_stable_until_bumped(self):
+        generation = get_order_history_generation(127)
+
+        self.assertEqual(get_order_history_generation(127), generation)
+
+        bump_order_history_generation(127)
+
+        self.assertNotEqual(get_order_history_generation(127), generation)
+
+    def test_bump_invalidates_cached_page(self):
+        generation = get_order_history_generation(127)
+        set_cached_order_history(127, generation, (['order'], None))
+
+        self.assertEqual(get_cached_order_history(127, get_order_history_generation(127)), (['order'], None))
+
+        bump_order_history_generation(127)
+
+        self.assertIsNone(get_cached_order_history(127, get_order_history_generation(127)))
+
+    def test_bump_is_per_user(self):
+        generation = get_order_history_generation(127)
+
+        bump_order_history_generation(128)
+
+        self.assertEqual(get_order_history_generation(127), generation)
+
+    def test_evicted_generation_does_not_serve_stale_page(self):
+        generation = get_order_history_generation(127)
+        set_cached_order_history(127, generation, (['order'], None))
+
+        cache.delete('order_history_generation:1:127')
+        bump_order_history_generation(127)
+
+        self.assertIsNone(get_cached_order_history(127, get_order_history_generation(127)))
+
+    def test_variants_are_cached_separately(self):
+        generation = get_order_history_generation(127)
+        set_cached_order_history(127, generation, (['order'], None), 'ct-True')
+
+        self.assertIsNone(get_cached_order_history(127, generation, 'ct-False'))
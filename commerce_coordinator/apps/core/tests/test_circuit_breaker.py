@@ -0,0 +1,221 @@
+"""Test core.circuit_breaker."""
+from unittest.mock import Mock, patch
+
+import ddt
+from django.test import TestCase, override_settings
+from requests import PreparedRequest, Response, Session
+from requests.exceptions import ConnectTimeout
+
+from commerce_coordinator.apps.core.circuit_breaker import (
+    CircuitBreaker,
+    CircuitBreakerAdapter,
+    CircuitOpenError,
+    get_circuit_breaker,
+    mount_circuit_breaker,
+    reset_circuit_breakers
+)
+from commerce_coordinator.apps.core.rate_limit import InMemoryRateLimitStore, RateLimitedAdapter, mount_rate_limiter
+
+NOW = 1_700_000_000.0
+
+
+def response(status_code):
+    resp = Response()
+    resp.status_code = status_code
+    return resp
+
+
+@patch('time.time', Mock(return_value=NOW))
+class CircuitBreakerTests(TestCase):
+    """Tests of the CircuitBreaker class."""
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(
+            'test',
+            InMemoryRateLimitStore(),
+            failure_rate_threshold=0.5,
+            minimum_calls=4,
+            failure_window_seconds=60,
+            reset_timeout_seconds=10,
+        )
+
+    def _open(self):
+        with self.assertLogs('commerce_coordinator.apps.core.circuit_breaker', level='WARNING'):
+            for _ in range(4):
+                self.breaker.record_failure()
+
+    def test_opens_at_failure_rate_once_minimum_calls_are_made(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state(), CircuitBreaker.CLOSED)
+        self.assertFalse(self.breaker.before_call())
+
+        self._open()
+
+        self.assertEqual(self.breaker.state(), CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError) as ctx:
+            self.breaker.before_call()
+        self.assertEqual(ctx.exception.retry_after, 10)
+
+    def test_stays_closed_below_failure_rate(self):
+        for _ in range(6):
+            self.breaker.record_success()
+        for _ in range(5):
+            self.breaker.record_failure()
+
+        self.assertEqual(self.breaker.state(), CircuitBreaker.CLOSED)
+
+        with self.assertLogs('commerce_coordinator.apps.core.circuit_breaker', level='WARNING'):
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state(), CircuitBreaker.OPEN)
+
+    def test_calls_are_counted_per_window(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+
+        # NOW is 20 seconds into its 60 second window
+        with patch('time.time', return_value=NOW + 40):
+            self.breaker.record_failure()
+
+            self.assertEqual(self.breaker.state(), CircuitBreaker.CLOSED)
+
+    def test_half_open_lets_one_probe_through(self):
+        self._open()
+
+        with patch('time.time', return_value=NOW + 10):
+            self.assertEqual(self.breaker.state(), CircuitBreaker.HALF_OPEN)
+            self.assertTrue(self.breaker.before_call())
+            with self.assertRaises(CircuitOpenError):
+                self.breaker.before_call()
+
+    def test_successful_probe_closes(self):
+        self._open()
+
+        with patch('time.time', return_value=NOW + 10):
+            probe = self.breaker.before_call()
+            self.breaker.record_success(probe)
+
+            self.assertEqual(self.breaker.state(), CircuitBreaker.CLOSED)
+            self.assertFalse(self.breaker.before_call())
+
+            # The failures that opened it aren't counted again
+            for _ in range(3):
+                self.breaker.record_failure()
+            self.assertEqual(self.breaker.state(), CircuitBreaker.CLOSED)
+
+    def test_failed_probe_opens_again(self):
+        self._open()
+
+        with patch('time.time', return_value=NOW + 10):
+            probe = self.breaker.before_call()
+            with self.assertLogs('commerce_coordinator.apps.core.circuit_breaker', level='WARNING'):
+                self.breaker.record_failure(probe)
+
+            self.assertEqual(self.breaker.state(), CircuitBreaker.OPEN)
+
+        with patch('time.time', return_value=NOW + 20):
+            self.assertTrue(self.breaker.before_call())
+
+
+@ddt.ddt
+class CircuitBreakerAdapterTests(TestCase):
+    """Tests of CircuitBreakerAdapter and mount_circuit_breaker."""
+
+    def setUp(self):
+        self.breaker = Mock(spec=CircuitBreaker)
+        self.breaker.before_call.return_value = False
+        self.breaker.ignored_status_codes = frozenset()
+        self.wrapped = Mock()
+        self.adapter = CircuitBreakerAdapter(self.wrapped, self.breaker)
+        self.request = PreparedRequest()
+
+    def test_success(self):
+        self.wrapped.send.return_value = response(404)
+
+        self.assertEqual(self.adapter.send(self.request, timeout=5).status_code, 404)
+
+        self.wrapped.send.assert_called_once_with(self.request, timeout=5)
+        self.breaker.record_success.assert_called_once_with(False)
+
+    @ddt.data(502, 503)
+    def test_server_error(self, status_code):
+        self.wrapped.send.return_value = response(status_code)
+
+        self.adapter.send(self.request)
+
+        self.breaker.record_failure.assert_called_once_with(False)
+
+    @ddt.data(429, 503)
+    def test_ignored_status_codes_are_not_recorded(self, status_code):
+        self.breaker.ignored_status_codes = frozenset({429, 503})
+        self.wrapped.send.return_value = response(status_code)
+
+        self.adapter.send(self.request)
+
+        self.breaker.record_failure.assert_not_called()
+        self.breaker.record_success.assert_not_called()
+
+    def test_ignored_answer_to_probe_is_a_success(self):
+        self.breaker.ignored_status_codes = frozenset({429, 503})
+        self.breaker.before_call.return_value = True
+        self.wrapped.send.return_value = response(429)
+
+        self.adapter.send(self.request)
+
+        self.breaker.record_success.assert_called_once_with(True)
+
+    def test_transport_error(self):
+        self.breaker.before_call.return_value = True
+        self.wrapped.send.side_effect = ConnectTimeout()
+
+        with self.assertRaises(ConnectTimeout):
+            self.adapter.send(self.request)
+
+        self.breaker.record_failure.assert_called_once_with(True)
+
+    def test_open_breaker_fails_fast(self):
+        self.breaker.before_call.side_effect = CircuitOpenError('test', 5)
+
+        with self.assertRaises(CircuitOpenError):
+            self.adapter.send(self.request)
+
+        self.wrapped.send.assert_not_called()
+
+    def test_mount_wraps_the_rate_limiter(self):
+        session = Session()
+
+        mount_rate_limiter(session, 'https://api.example.com/', Mock())
+        mount_circuit_breaker(session, 'https://api.example.com/', self.breaker)
+        mount_circuit_breaker(session, 'https://api.example.com/', self.breaker)
+        mount_rate_limiter(session, 'https://api.example.com/', Mock())
+
+        adapter = session.get_adapter('https://api.example.com/orders')
+        self.assertIsInstance(adapter, CircuitBreakerAdapter)
+        self.assertIsInstance(adapter.adapter, RateLimitedAdapter)
+        self.assertNotIsInstance(adapter.adapter.adapter, RateLimitedAdapter)
+
+    @override_settings(CIRCUIT_BREAKERS={'test': {
+        'BACKEND': 'memory',
+        'FAILURE_RATE_THRESHOLD': 0.25,
+        'MINIMUM_CALLS': 5,
+        'FAILURE_WINDOW_SECONDS': 10,
+        'RESET_TIMEOUT_SECONDS': 20,
+    }})
+    def test_get_circuit_breaker(self):
+        reset_circuit_breakers()
+        breaker = get_circuit_breaker('test')
+
+        self.assertIs(get_circuit_breaker('test'), breaker)
+        self.assertEqual(breaker.failure_rate_threshold, 0.25)
+        self.assertEqual(breaker.minimum_calls, 5)
+        self.assertEqual(breaker.reset_timeout_seconds, 20)
+        self.assertIsInstance(breaker.store, InMemoryRateLimitStore)
+        reset_circuit_breakers()
+
+    @ddt.data(('commercetools', True), ('lms', False), ('ecommerce', False))
+    @ddt.unpack
+    def test_503_is_ignored_only_behind_a_rate_limiter(self, name, ignored):
+        reset_circuit_breakers()
+
+        self.assertEqual(503 in get_circuit_breaker(name).ignored_status_codes, ignored)
+        reset_circuit_breakers()
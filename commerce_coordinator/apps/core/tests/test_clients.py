@@ -1,9 +1,16 @@
 """Test core.clients."""
+import datetime
+import threading
+import time
+from unittest import mock
 
 import ddt
 from django.test import TestCase
+from requests.exceptions import RequestException
 
-from commerce_coordinator.apps.core.clients import urljoin_directory
+from commerce_coordinator.apps.core.clients import get_oauth_api_client, reset_oauth_api_clients, urljoin_directory
+from commerce_coordinator.apps.ecommerce.clients import EcommerceAPIClient
+from commerce_coordinator.apps.lms.clients import LMSAPIClient
 
 
 @ddt.ddt
@@ -26,3 +33,83 @@ class ClientTests(TestCase):
         output = urljoin_directory(base, suffix)
         expected = "http://localhost:18130/directory/subdirectory"
         self.assertRegex(output, expected + r"/?")
+
+
+@mock.patch('commerce_coordinator.apps.core.clients.get_oauth_access_token')
+class SharedOAuthAPIClientTests(TestCase):
+    """Tests of the process-wide OAuth API clients."""
+
+    def setUp(self):
+        super().setUp()
+        reset_oauth_api_clients()
+        self.addCleanup(reset_oauth_api_clients)
+
+    @staticmethod
+    def token_response(token, expires_in=3600):
+        return token, datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) + \
+            datetime.timedelta(seconds=expires_in)
+
+    def test_clients_share_session_and_token(self, mock_get_token):
+        mock_get_token.return_value = self.token_response('token-1')
+
+        first = LMSAPIClient().client
+        second = EcommerceAPIClient().client
+        first.get_jwt_access_token()
+        second.get_jwt_access_token()
+
+        self.assertIs(first, second)
+        self.assertEqual(second.auth.token, 'token-1')
+        mock_get_token.assert_called_once()
+
+    def test_clients_are_keyed_by_base_url_and_client_id(self, _mock_get_token):
+        client = get_oauth_api_client('http://lms', 'client-a', 'secret', timeout=1)
+
+        self.assertIs(get_oauth_api_client('http://lms', 'client-a', 'other-secret', timeout=1), client)
+        self.assertIsNot(get_oauth_api_client('http://lms', 'client-b', 'secret', timeout=1), client)
+        self.assertIsNot(get_oauth_api_client('http://other-lms', 'client-a', 'secret', timeout=1), client)
+
+        reset_oauth_api_clients()
+        self.assertIsNot(get_oauth_api_client('http://lms', 'client-a', 'secret', timeout=1), client)
+
+    def test_token_refreshed_before_expiry(self, mock_get_token):
+        # With a 30 second lifetime the token is refreshed halfway through instead of 60 seconds early.
+        mock_get_token.side_effect = [self.token_response('token-1', 30), self.token_response('token-2')]
+        client = get_oauth_api_client('http://lms', 'client-a', 'secret', timeout=1)
+
+        self.assertEqual(client.get_jwt_access_token(), 'token-1')
+        self.assertEqual(client.get_jwt_access_token(), 'token-1')
+
+        with mock.patch('commerce_coordinator.apps.core.clients.time.monotonic', return_value=time.monotonic() + 15):
+            self.assertEqual(client.get_jwt_access_token(), 'token-2')
+
+        self.assertEqual(mock_get_token.call_count, 2)
+
+    def test_failed_refresh_keeps_valid_token(self, mock_get_token):
+        mock_get_token.side_effect = [self.token_response('token-1', 30), RequestException('refresh failed')]
+        client = get_oauth_api_client('http://lms', 'client-a', 'secret', timeout=1)
+        client.get_jwt_access_token()
+
+        with mock.patch('commerce_coordinator.apps.core.clients.time.monotonic', return_value=time.monotonic() + 15):
+            self.assertEqual(client.get_jwt_access_token(), 'token-1')
+
+        mock_get_token.side_effect = RequestException('refresh failed')
+        with mock.patch('commerce_coordinator.apps.core.clients.time.monotonic', return_value=time.monotonic() + 60):
+            with self.assertRaises(RequestException):
+                client.get_jwt_access_token()
+
+    def test_single_refresh_under_concurrency(self, mock_get_token):
+        def slow_token(*_args, **_kwargs):
+            time.sleep(0.05)
+            return self.token_response('token-1')
+
+        mock_get_token.side_effect = slow_token
+        client = get_oauth_api_client('http://lms', 'client-a', 'secret', timeout=1)
+
+        threads = [threading.Thread(target=client.get_jwt_access_token) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        mock_get_token.assert_called_once()
+        self.assertEqual(client.auth.token, 'token-1')
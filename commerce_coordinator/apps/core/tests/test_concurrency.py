@@ -0,0 +1,65 @@
+"""Test core.concurrency."""
+import contextvars
+import threading
+import time
+
+from django.test import TestCase, override_settings
+
+from commerce_coordinator.apps.core.concurrency import ConcurrentResult, map_concurrently
+
+request_id = contextvars.ContextVar('request_id', default=None)
+
+
+class MapConcurrentlyTests(TestCase):
+    """Tests of map_concurrently."""
+
+    def test_results_keep_input_order_and_capture_errors(self):
+        def func(item):
+            if item == 2:
+                raise ValueError(item)
+            time.sleep(0.01 * (5 - item))
+            return item * 10
+
+        results = map_concurrently(func, [1, 2, 3, 4], max_workers=4)
+
+        self.assertEqual([result.item for result in results], [1, 2, 3, 4])
+        self.assertEqual([result.value for result in results], [10, None, 30, 40])
+        self.assertIsInstance(results[1].error, ValueError)
+        self.assertEqual([result.ok for result in results], [True, False, True, True])
+
+    @override_settings(FULFILLMENT_MAX_CONCURRENCY=2)
+    def test_concurrency_is_bounded(self):
+        lock = threading.Lock()
+        in_flight = []
+        peak = []
+
+        def func(item):
+            with lock:
+                in_flight.append(item)
+                peak.append(len(in_flight))
+            time.sleep(0.02)
+            with lock:
+                in_flight.remove(item)
+            return item
+
+        results = map_concurrently(func, range(6))
+
+        self.assertEqual([result.value for result in results], list(range(6)))
+        self.assertLessEqual(max(peak), 2)
+
+    def test_empty_input(self):
+        self.assertEqual(map_concurrently(lambda item: item, []), [])
+
+    def test_single_worker_runs_inline(self):
+        results = map_concurrently(lambda _: threading.get_ident(), [None], max_workers=1)
+
+        self.assertEqual(results, [ConcurrentResult(None, value=threading.get_ident())])
+
+    def test_calls_run_in_the_callers_context(self):
+        token = request_id.set('abc')
+        try:
+            results = map_concurrently(lambda _: request_id.get(), range(4), max_workers=4)
+        finally:
+            request_id.reset(token)
+
+        self.assertEqual([result.value for result in results], ['abc'] * 4)
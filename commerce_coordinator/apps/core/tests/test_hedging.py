@@ -0,0 +1,322 @@
+"""Test core.hedging."""
+import threading
+import time
+from contextlib import contextmanager
+from unittest.mock import MagicMock, Mock
+
+from django.test import TestCase, override_settings
+from requests import Request, Response, Session
+from requests.exceptions import ConnectTimeout
+
+from commerce_coordinator.apps.core.hedging import (
+    HedgeBudget,
+    HedgedAdapter,
+    LatencyTracker,
+    RequestHedger,
+    endpoint_of,
+    get_hedger,
+    mount_hedging,
+    reset_hedgers
+)
+from commerce_coordinator.apps.core.rate_limit import (
+    AdaptiveRateLimiter,
+    Priority,
+    RateLimitedAdapter,
+    current_priority,
+    outbound_priority
+)
+
+URL = 'https://api.example.com/project/orders/0b9a3b8e-8f6b-4c77-a5a4-7c5cb2f1b0a1'
+ENDPOINT = 'GET /project/orders/{id}'
+
+
+def prepared(method='GET', url=URL):
+    return Request(method, url).prepare()
+
+
+class FakeAdapter:
+    """
+    Sends requests with scripted latencies: each call waits for the next of `latencies`, an Event the test sets when
+    the response should arrive, raises it if it's an exception, or waits for the Event of an (Event, exception) pair
+    and then raises the exception.
+    """
+
+    def __init__(self, *latencies):
+        self.latencies = list(latencies)
+        self.responses = []
+        self.priorities = []
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):  # pylint: disable=unused-argument
+        with self._lock:
+            latency = self.latencies.pop(0)
+            response = Mock(spec=Response, status_code=200)
+            self.responses.append(response)
+            self.priorities.append(current_priority())
+
+        if isinstance(latency, Exception):
+            raise latency
+        if isinstance(latency, tuple):
+            latency[0].wait(5)
+            raise latency[1]
+        latency.wait(5)
+        return response
+
+
+def arrived():
+    event = threading.Event()
+    event.set()
+    return event
+
+
+class EndpointTests(TestCase):
+    """Tests of endpoint_of."""
+
+    def test_ids_and_keys(self):
+        self.assertEqual(endpoint_of('GET', URL + '?expand=state'), ENDPOINT)
+        self.assertEqual(endpoint_of('GET', 'https://x/p/orders/order-number=2U-123'), 'GET /p/orders/order-number={}')
+        self.assertEqual(endpoint_of('GET', 'https://x/p/customers/123'), 'GET /p/customers/{id}')
+        self.assertEqual(endpoint_of('GET', 'https://x/p/cart-discounts'), 'GET /p/cart-discounts')
+
+
+class LatencyTrackerTests(TestCase):
+    """Tests of the LatencyTracker class."""
+
+    def test_quantile(self):
+        tracker = LatencyTracker(percentile=95, min_samples=20, window=100)
+
+        for i in range(19):
+            tracker.record(ENDPOINT, (i + 1) / 100)
+        self.assertIsNone(tracker.quantile(ENDPOINT))
+
+        tracker.record(ENDPOINT, 0.2)
+        self.assertEqual(tracker.quantile(ENDPOINT), 0.19)
+        self.assertIsNone(tracker.quantile('GET /other'))
+
+    def test_window(self):
+        tracker = LatencyTracker(percentile=50, min_samples=1, window=2)
+
+        for seconds in (5, 1, 1):
+            tracker.record(ENDPOINT, seconds)
+
+        self.assertEqual(tracker.quantile(ENDPOINT), 1)
+
+
+class HedgeBudgetTests(TestCase):
+    """Tests of the HedgeBudget class."""
+
+    def test_hedges_are_a_share_of_calls(self):
+        budget = HedgeBudget(ratio=0.25, burst=2)
+
+        spent = 0
+        for _ in range(100):
+            budget.earn()
+            spent += budget.try_spend()
+
+        self.assertEqual(spent, 25)
+
+    def test_burst(self):
+        budget = HedgeBudget(ratio=0.5, burst=2)
+
+        for _ in range(100):
+            budget.earn()
+
+        self.assertEqual([budget.try_spend() for _ in range(3)], [True, True, False])
+
+
+class RequestHedgerTests(TestCase):
+    """Tests of the RequestHedger class, with latencies injected by FakeAdapter."""
+
+    def setUp(self):
+        self.hedger = RequestHedger('test', max_extra_load=1, min_samples=5, min_delay_seconds=0)
+        self.addCleanup(self.hedger.executor.shutdown)
+
+    def _learn(self, seconds=0.01):
+        for _ in range(5):
+            self.hedger.tracker.record(ENDPOINT, seconds)
+
+    def test_not_hedged_until_latencies_are_known(self):
+        adapter = FakeAdapter(arrived())
+
+        response = self.hedger.send(adapter.send, prepared())
+
+        self.assertIs(response, adapter.responses[0])
+        self.assertEqual(self.hedger.tracker.quantile(ENDPOINT), None)
+        self.assertEqual(len(self.hedger.tracker._samples[ENDPOINT]), 1)  # pylint: disable=protected-access
+
+    def test_fast_response_is_not_hedged(self):
+        self._learn(seconds=5)
+        adapter = FakeAdapter(arrived())
+
+        response = self.hedger.send(adapter.send, prepared())
+
+        self.assertIs(response, adapter.responses[0])
+        self.assertEqual(len(adapter.responses), 1)
+
+    def test_slow_response_is_hedged(self):
+        self._learn()
+        slow = threading.Event()
+        adapter = FakeAdapter(slow, arrived())
+
+        response = self.hedger.send(adapter.send, prepared())
+
+        self.assertIs(response, adapter.responses[1])
+        adapter.responses[0].close.assert_not_called()
+
+        slow.set()
+        self.hedger.executor.shutdown(wait=True)
+        adapter.responses[0].close.assert_called_once()
+        adapter.responses[1].close.assert_not_called()
+
+    def test_original_wins_if_it_arrives_first(self):
+        self._learn()
+        slow, slower = threading.Event(), threading.Event()
+        adapter = FakeAdapter(slow, slower)
+
+        threading.Timer(0.05, slow.set).start()
+        response = self.hedger.send(adapter.send, prepared())
+
+        self.assertIs(response, adapter.responses[0])
+        slower.set()
+        self.hedger.executor.shutdown(wait=True)
+        adapter.responses[1].close.assert_called_once()
+
+    def test_failed_attempt_loses(self):
+        self._learn()
+        slow = threading.Event()
+        adapter = FakeAdapter(slow, ConnectTimeout())
+
+        threading.Timer(0.05, slow.set).start()
+        response = self.hedger.send(adapter.send, prepared())
+
+        self.assertIs(response, adapter.responses[0])
+
+    def test_original_error_when_both_fail(self):
+        self._learn()
+        slow = threading.Event()
+        adapter = FakeAdapter((slow, ConnectTimeout('original')), ConnectTimeout('hedge'))
+
+        threading.Timer(0.05, slow.set).start()
+        with self.assertRaisesRegex(ConnectTimeout, 'original'):
+            self.hedger.send(adapter.send, prepared())
+
+    def test_hedges_are_capped(self):
+        self.hedger.budget = HedgeBudget(ratio=0)
+        self._learn()
+        slow = threading.Event()
+        adapter = FakeAdapter(slow)
+
+        threading.Timer(0.05, slow.set).start()
+        response = self.hedger.send(adapter.send, prepared())
+
+        self.assertIs(response, adapter.responses[0])
+        self.assertEqual(len(adapter.responses), 1)
+
+    def test_hedges_need_rate_limit_budget(self):
+        self._learn()
+        limiter = Mock(spec=AdaptiveRateLimiter)
+        limiter.try_acquire.return_value = False
+        slow = threading.Event()
+        adapter = FakeAdapter(slow)
+
+        threading.Timer(0.05, slow.set).start()
+        response = self.hedger.send(adapter.send, prepared(), limiter=limiter)
+
+        self.assertIs(response, adapter.responses[0])
+        self.assertEqual(len(adapter.responses), 1)
+        limiter.try_acquire.assert_called_once_with()
+
+    def test_no_pool_thread_without_hedge_budget(self):
+        self.hedger.budget = HedgeBudget(ratio=0)
+        self._learn()
+        adapter = FakeAdapter(arrived())
+        self.hedger.executor = Mock()
+
+        self.assertIs(self.hedger.send(adapter.send, prepared()), adapter.responses[0])
+        self.hedger.executor.submit.assert_not_called()
+
+    def test_writes_are_not_hedged(self):
+        self.hedger.tracker.min_samples = 0
+        adapter = FakeAdapter(arrived())
+
+        self.hedger.send(adapter.send, prepared('POST'))
+
+        self.assertEqual(len(adapter.responses), 1)
+        self.assertIsNone(self.hedger.tracker.quantile('POST /project/orders/{id}'))
+
+    def test_attempts_keep_the_callers_context(self):
+        self._learn()
+        slow = threading.Event()
+        adapter = FakeAdapter(slow, arrived())
+
+        with outbound_priority(Priority.BATCH):
+            self.hedger.send(adapter.send, prepared())
+
+        slow.set()
+        self.hedger.executor.shutdown(wait=True)
+        self.assertEqual(adapter.priorities, [Priority.BATCH, Priority.BATCH])
+
+
+class HedgedAdapterTests(TestCase):
+    """Tests of HedgedAdapter and mount_hedging."""
+
+    def test_mount(self):
+        session = Session()
+        hedger = Mock(spec=RequestHedger)
+
+        mount_hedging(session, 'https://api.example.com/', None)
+        self.assertNotIsInstance(session.get_adapter(URL), HedgedAdapter)
+
+        session.mount('https://api.example.com/', RateLimitedAdapter(session.get_adapter(URL), MagicMock()))
+        mount_hedging(session, 'https://api.example.com/', hedger)
+        mount_hedging(session, 'https://api.example.com/', hedger)
+
+        adapter = session.get_adapter(URL)
+        self.assertIsInstance(adapter, HedgedAdapter)
+        self.assertIsInstance(adapter.adapter, RateLimitedAdapter)
+
+        request = prepared()
+        adapter.send(request, timeout=3)
+        hedger.send.assert_called_once_with(
+            adapter.adapter.adapter.send, request, limiter=adapter.adapter.limiter, timeout=3
+        )
+
+    def test_rate_limit_is_waited_for_on_the_calling_thread(self):
+        waits = []
+
+        @contextmanager
+        def limit():
+            waits.append(threading.current_thread())
+            time.sleep(0.1)
+            yield
+
+        limiter = Mock(spec=AdaptiveRateLimiter, limit=limit)
+        hedger = RequestHedger('test', max_extra_load=1, min_samples=1, min_delay_seconds=0)
+        self.addCleanup(hedger.executor.shutdown)
+        hedger.tracker.record(ENDPOINT, 1)
+        adapter = HedgedAdapter(RateLimitedAdapter(FakeAdapter(arrived()), limiter), hedger)
+
+        adapter.send(prepared())
+
+        self.assertEqual(waits, [threading.current_thread()])
+        limiter.report.assert_called_once_with(200)
+        # The wait for budget isn't part of the latency recorded
+        self.assertLess(hedger.tracker._samples[ENDPOINT][-1], 0.1)  # pylint: disable=protected-access
+
+    @override_settings(HEDGED_READS={'test': {
+        'ENABLED': True, 'PERCENTILE': 90, 'MIN_SAMPLES': 10, 'WINDOW': 100, 'MIN_DELAY_SECONDS': 0.1,
+        'MAX_EXTRA_LOAD': 0.1, 'MAX_WORKERS': 2,
+    }})
+    def test_get_hedger(self):
+        reset_hedgers()
+        hedger = get_hedger('test')
+
+        self.assertIs(get_hedger('test'), hedger)
+        self.assertEqual(hedger.tracker.percentile, 90)
+        self.assertEqual(hedger.min_delay_seconds, 0.1)
+
+        with override_settings(HEDGED_READS={'test': {'ENABLED': False}}):
+            self.assertIsNone(get_hedger('test'))
+
+        hedger.executor.shutdown()
+        reset_hedgers()
@@ -0,0 +1,265 @@
+"""Test core.instrumentation."""
+import contextvars
+import threading
+from unittest.mock import Mock, call, patch
+
+import requests_mock
+from django.test import TestCase, override_settings
+from requests import Response, Session
+from requests.adapters import BaseAdapter
+from requests.exceptions import ConnectTimeout
+
+from commerce_coordinator.apps.core.instrumentation import (
+    InMemoryMetricsSink,
+    LatencyHistogram,
+    MonitoringMetricsSink,
+    OutboundCall,
+    collect_outbound_timings,
+    current_attempt,
+    get_metrics_sinks,
+    instrument_httplib2,
+    instrument_session,
+    outbound_attempt,
+    record_call,
+    timed_call
+)
+
+URL = 'https://api.example.com/project/orders/0b9a3b8e-8f6b-4c77-a5a4-7c5cb2f1b0a1'
+ENDPOINT = 'GET /project/orders/{id}'
+
+
+class FakeAdapter(BaseAdapter):
+    """ Answers every request with `status_code` and `content`, or raises `error` """
+
+    def __init__(self, status_code=200, content=b'{"id": 1}', error=None):
+        super().__init__()
+        self.status_code = status_code
+        self.content = content
+        self.error = error
+
+    def send(self, request, *args, **kwargs):  # pylint: disable=arguments-differ
+        if self.error:
+            raise self.error
+        response = Response()
+        response.status_code = self.status_code
+        response._content = self.content  # pylint: disable=protected-access
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+def outbound_call(service='test', endpoint=ENDPOINT, status_code=200, duration=0.02, attempt=0, error=None):
+    return OutboundCall(service, endpoint, status_code, duration, 10, 100, attempt, error)
+
+
+class InstrumentationTestCase(TestCase):
+    """ Clears the in-memory sink of the test settings before each test """
+
+    def setUp(self):
+        self.sink = get_metrics_sinks()[0]
+        self.sink.clear()
+
+
+class AttemptTests(TestCase):
+    """Tests of the outbound attempt."""
+
+    def test_outbound_attempt(self):
+        self.assertEqual(current_attempt(), 0)
+
+        with outbound_attempt(2):
+            self.assertEqual(current_attempt(), 2)
+
+        self.assertEqual(current_attempt(), 0)
+
+
+class MetricsTests(TestCase):
+    """Tests of LatencyHistogram and InMemoryMetricsSink."""
+
+    def test_histogram_buckets(self):
+        histogram = LatencyHistogram(buckets=(10, 100))
+
+        for ms in (1, 10, 11, 100, 1000):
+            histogram.observe(ms)
+
+        self.assertEqual(histogram.counts, [2, 2, 1])
+        self.assertEqual(histogram.count, 5)
+        self.assertEqual(histogram.total_ms, 1122)
+
+    def test_in_memory_sink(self):
+        sink = InMemoryMetricsSink()
+
+        sink.record(outbound_call())
+        sink.record(outbound_call(status_code=503, attempt=0))
+        sink.record(outbound_call(status_code=None, attempt=1, error='ConnectTimeout'))
+
+        metrics = sink.endpoints[('test', ENDPOINT)]
+        self.assertEqual(len(sink.calls), 3)
+        self.assertEqual(metrics.latency.count, 3)
+        self.assertEqual(metrics.status_codes, {200: 1, 503: 1})
+        self.assertEqual(metrics.errors, {'ConnectTimeout': 1})
+        self.assertEqual(metrics.retries, 1)
+        self.assertEqual(metrics.request_bytes, 30)
+        self.assertEqual(metrics.response_bytes, 300)
+
+        sink.clear()
+        self.assertEqual(sink.calls, [])
+
+    @patch('commerce_coordinator.apps.core.instrumentation.increment')
+    @patch('commerce_coordinator.apps.core.instrumentation.accumulate')
+    def test_monitoring_sink(self, mock_accumulate, mock_increment):
+        MonitoringMetricsSink().record(outbound_call(service='lms', status_code=502, attempt=1))
+
+        self.assertEqual(mock_increment.call_args_list, [
+            call('outbound.lms.calls'),
+            call('outbound.lms.retries'),
+            call('outbound.lms.errors'),
+            call(f'outbound.lms.{ENDPOINT}.calls'),
+            call(f'outbound.lms.{ENDPOINT}.status.502'),
+            call(f'outbound.lms.{ENDPOINT}.retries'),
+        ])
+        self.assertEqual(mock_accumulate.call_args_list, [
+            call('outbound.lms.duration_ms', 20.0),
+            call('outbound.lms.request_bytes', 10),
+            call('outbound.lms.response_bytes', 100),
+            call(f'outbound.lms.{ENDPOINT}.duration_ms', 20.0),
+        ])
+
+    @patch('commerce_coordinator.apps.core.instrumentation.increment')
+    @patch('commerce_coordinator.apps.core.instrumentation.accumulate')
+    def test_monitoring_sink_call_without_response(self, mock_accumulate, mock_increment):
+        MonitoringMetricsSink().record(outbound_call(status_code=None, duration=5, error='ConnectTimeout'))
+
+        self.assertEqual(mock_increment.call_args_list, [
+            call('outbound.test.calls'),
+            call('outbound.test.errors'),
+            call(f'outbound.test.{ENDPOINT}.calls'),
+            call(f'outbound.test.{ENDPOINT}.status.ConnectTimeout'),
+        ])
+        mock_accumulate.assert_any_call(f'outbound.test.{ENDPOINT}.duration_ms', 5000)
+
+    @override_settings(OUTBOUND_METRICS_SINKS=(
+        'commerce_coordinator.apps.core.instrumentation.MonitoringMetricsSink',
+        'commerce_coordinator.apps.core.instrumentation.InMemoryMetricsSink',
+    ))
+    def test_failing_sink_does_not_fail_the_call(self):
+        failing, in_memory = get_metrics_sinks()
+
+        with patch.object(failing, 'record', side_effect=ValueError):
+            with self.assertLogs('commerce_coordinator.apps.core.instrumentation', level='ERROR'):
+                record_call(outbound_call())
+
+        self.assertEqual(len(in_memory.calls), 1)
+        in_memory.clear()
+
+
+class InstrumentSessionTests(InstrumentationTestCase):
+    """Tests of instrument_session."""
+
+    def _session(self, adapter, service='test'):
+        session = Session()
+        session.mount('https://', adapter)
+        instrument_session(session, service)
+        return session
+
+    def test_call_is_recorded(self):
+        session = self._session(FakeAdapter(404, b'not found'))
+
+        session.post(URL, data=b'{"a": 1}')
+
+        [recorded] = self.sink.calls
+        self.assertEqual(recorded.service, 'test')
+        self.assertEqual(recorded.endpoint, 'POST /project/orders/{id}')
+        self.assertEqual(recorded.status_code, 404)
+        self.assertEqual(recorded.request_bytes, 8)
+        self.assertEqual(recorded.response_bytes, 9)
+        self.assertEqual(recorded.attempt, 0)
+        self.assertIsNone(recorded.error)
+
+    def test_service_defaults_to_the_host(self):
+        session = self._session(FakeAdapter(), service=None)
+
+        with outbound_attempt(1):
+            session.get(URL)
+
+        self.assertEqual(self.sink.calls[0].service, 'api.example.com')
+        self.assertEqual(self.sink.endpoints[('api.example.com', ENDPOINT)].retries, 1)
+
+    def test_error_is_recorded(self):
+        session = self._session(FakeAdapter(error=ConnectTimeout()))
+
+        with self.assertRaises(ConnectTimeout):
+            session.get(URL)
+
+        [recorded] = self.sink.calls
+        self.assertIsNone(recorded.status_code)
+        self.assertEqual(recorded.error, 'ConnectTimeout')
+
+    def test_instrumented_once(self):
+        session = self._session(FakeAdapter())
+        instrument_session(session, 'other')
+
+        session.get(URL)
+
+        self.assertEqual([recorded.service for recorded in self.sink.calls], ['test'])
+
+    def test_requests_mock_still_answers(self):
+        session = self._session(FakeAdapter())
+
+        with requests_mock.Mocker() as mocker:
+            mocker.get(URL, status_code=201)
+
+            self.assertEqual(session.get(URL).status_code, 201)
+
+
+class InstrumentHttplib2Tests(InstrumentationTestCase):
+    """Tests of instrument_httplib2."""
+
+    def test_call_is_recorded(self):
+        http = Mock()
+        http.request.return_value = (Mock(status=200), b'{"purchaseState": 0}')
+
+        instrument_httplib2(http, 'google')
+        response, content = http.request(URL, 'GET', headers={})
+
+        self.assertEqual((response.status, content), (200, b'{"purchaseState": 0}'))
+        [recorded] = self.sink.calls
+        self.assertEqual((recorded.service, recorded.endpoint), ('google', ENDPOINT))
+        self.assertEqual((recorded.status_code, recorded.response_bytes), (200, 20))
+
+
+class TimingsTests(InstrumentationTestCase):
+    """Tests of collect_outbound_timings and timed_call."""
+
+    def test_timings_of_the_block(self):
+        with timed_call('outside', ENDPOINT):
+            pass
+
+        with collect_outbound_timings() as timings:
+            with timed_call('lms', ENDPOINT) as outcome:
+                outcome['status_code'] = 200
+            record_call(outbound_call(service='commercetools', duration=0.05))
+            record_call(outbound_call(service='commercetools', duration=0.0255))
+
+        self.assertEqual(len(self.sink.calls), 4)
+        self.assertRegex(
+            timings.server_timing(),
+            r'^commercetools;dur=75\.5;desc="2 calls", lms;dur=\d+\.\d;desc="1 call"$'
+        )
+
+    def test_calls_of_threads_with_the_context(self):
+        with collect_outbound_timings() as timings:
+            context = contextvars.copy_context()
+            thread = threading.Thread(target=context.run, args=(record_call, outbound_call()))
+            thread.start()
+            thread.join(5)
+
+        self.assertEqual(timings.services, {'test': (1, 0.02)})
+
+    def test_no_calls(self):
+        with collect_outbound_timings() as timings:
+            pass
+
+        self.assertEqual(timings.server_timing(), '')
@@ -1,12 +1,15 @@
 """Tests for middleware.py"""
-from django.http import Http404
+from django.http import Http404, HttpResponse
+from django.test import RequestFactory, TestCase
 from rest_framework import serializers
 from rest_framework.decorators import api_view
 from rest_framework.exceptions import APIException
 from rest_framework.response import Response
 from rest_framework.test import APIRequestFactory, APITestCase
 
-from ..middleware import log_drf_exceptions
+from ..circuit_breaker import CircuitOpenError
+from ..instrumentation import timed_call
+from ..middleware import ServerTimingMiddleware, log_drf_exceptions
 from ..serializers import CoordinatorSerializer
 
 
@@ -83,3 +86,41 @@ class LogDRFExceptionsTests(APITestCase):
             mock_view_raises_generic_exception(request)
         print(log_manager.output)
         self.assertEqual(log_manager.records[0].funcName, self.uut.__name__)
+
+    def test_circuit_open_error_is_a_503(self):
+        """Check that an unhandled CircuitOpenError is answered with a 503 and a Retry-After."""
+
+        @api_view()
+        def mock_view_with_open_circuit(request):
+            """A mock view that calls a service whose circuit breaker is open."""
+            raise CircuitOpenError('lms', retry_after=12.5)
+
+        with self.assertLogs(self.uut.__module__, 'WARNING'):
+            response = mock_view_with_open_circuit(self.factory.get('/test'))
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '13')
+
+
+class ServerTimingMiddlewareTests(TestCase):
+    """Tests for ServerTimingMiddleware."""
+
+    def test_outbound_calls_are_added(self):
+        """Check that the outbound calls of a request are added to its Server-Timing header."""
+
+        def view(request):  # pylint: disable=unused-argument
+            with timed_call('lms', 'GET /api/enrollment/v1/enrollment'):
+                pass
+            response = HttpResponse()
+            response['Server-Timing'] = 'db;dur=1.0'
+            return response
+
+        response = ServerTimingMiddleware(view)(RequestFactory().get('/test'))
+
+        self.assertRegex(response['Server-Timing'], r'^db;dur=1\.0, lms;dur=\d+\.\d;desc="1 call"$')
+
+    def test_no_outbound_calls(self):
+        """Check that a request without outbound calls gets no Server-Timing header."""
+        response = ServerTimingMiddleware(lambda request: HttpResponse())(RequestFactory().get('/test'))
+
+        self.assertFalse(response.has_header('Server-Timing'))
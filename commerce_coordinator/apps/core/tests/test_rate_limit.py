@@ -0,0 +1,195 @@
+"""Test core.rate_limit."""
+import threading
+from unittest.mock import MagicMock, Mock, patch
+
+from django.test import TestCase, override_settings
+from requests import PreparedRequest, Response, Session
+
+from commerce_coordinator.apps.core.rate_limit import (
+    AdaptiveRateLimiter,
+    InMemoryRateLimitStore,
+    Priority,
+    RateLimitedAdapter,
+    current_priority,
+    get_rate_limiter,
+    mount_rate_limiter,
+    outbound_priority,
+    reset_rate_limiters
+)
+
+# The middle of a one second window, so a test's calls don't straddle two of them
+NOW = 1_700_000_000.5
+
+
+def response(status_code):
+    resp = Response()
+    resp.status_code = status_code
+    return resp
+
+
+@patch('time.time', Mock(return_value=NOW))
+class AdaptiveRateLimiterTests(TestCase):
+    """Tests of the AdaptiveRateLimiter class."""
+
+    def setUp(self):
+        self.limiter = AdaptiveRateLimiter(
+            'test',
+            requests_per_second=10,
+            store=InMemoryRateLimitStore(),
+            priority_shares={Priority.TASK: 0.5, Priority.BATCH: 0.2},
+            max_wait_seconds={Priority.INTERACTIVE: 0, Priority.TASK: 0, Priority.BATCH: 0},
+        )
+
+    def _acquired(self, priority, count):
+        return sum(self.limiter._try_acquire(priority, NOW) for _ in range(count))  # pylint: disable=protected-access
+
+    def test_priority_shares(self):
+        self.assertEqual(self._acquired(Priority.BATCH, 5), 2)
+        self.assertEqual(self._acquired(Priority.TASK, 5), 3)
+        self.assertEqual(self._acquired(Priority.INTERACTIVE, 10), 5)
+
+    def test_denied_calls_are_given_back(self):
+        self._acquired(Priority.BATCH, 100)
+
+        self.assertEqual(self._acquired(Priority.INTERACTIVE, 100), 8)
+
+    def test_windows_are_separate(self):
+        self._acquired(Priority.INTERACTIVE, 10)
+
+        self.assertTrue(self.limiter._try_acquire(Priority.INTERACTIVE, NOW + 1))  # pylint: disable=protected-access
+
+    def test_throttling_halves_the_budget(self):
+        self.limiter.report(200)
+        self.assertEqual(self.limiter.factor(), 1)
+
+        self.limiter.report(429)
+        self.assertEqual(self.limiter.factor(), 0.5)
+        self.assertEqual(self._acquired(Priority.INTERACTIVE, 10), 5)
+
+    def test_throttling_within_a_second_is_one_burst(self):
+        self.limiter.report(429)
+        self.limiter.report(503)
+
+        self.assertEqual(self.limiter.factor(), 0.5)
+
+        with patch('time.time', return_value=NOW + 1):
+            self.limiter.report(503)
+            self.assertAlmostEqual(self.limiter.factor(), 0.5 / 2 + 1 / 60 / 2)
+
+    def test_budget_recovers(self):
+        self.limiter.report(429)
+
+        self.assertAlmostEqual(self.limiter.factor(NOW + 15), 0.75)
+        self.assertEqual(self.limiter.factor(NOW + 60), 1)
+
+    def test_budget_is_never_cut_below_min_factor(self):
+        for i in range(10):
+            with patch('time.time', return_value=NOW + i * 1.5):
+                self.limiter.report(429)
+
+        self.assertGreaterEqual(self.limiter.factor(NOW + 13.5), 0.1)
+
+    @patch('time.sleep')
+    def test_acquire_waits_for_the_next_window(self, mock_sleep):
+        self.limiter.max_wait_seconds = {}
+        self._acquired(Priority.INTERACTIVE, 10)
+
+        with patch.object(self.limiter, '_try_acquire', side_effect=[False, False, True]):
+            self.limiter.acquire(Priority.INTERACTIVE)
+
+        self.assertEqual(mock_sleep.call_count, 2)
+        self.assertTrue(all(0.5 <= call.args[0] <= 0.55 for call in mock_sleep.call_args_list))
+
+    @patch('time.sleep')
+    def test_acquire_proceeds_after_max_wait(self, mock_sleep):
+        self._acquired(Priority.INTERACTIVE, 10)
+
+        with self.assertLogs('commerce_coordinator.apps.core.rate_limit', level='WARNING'):
+            self.limiter.acquire(Priority.INTERACTIVE)
+
+        mock_sleep.assert_not_called()
+
+    def test_acquire_uses_the_current_priority(self):
+        self._acquired(Priority.INTERACTIVE, 2)
+
+        with outbound_priority(Priority.BATCH):
+            with self.assertLogs('commerce_coordinator.apps.core.rate_limit', level='WARNING'):
+                self.limiter.acquire()
+
+    def test_bulkhead(self):
+        limiter = AdaptiveRateLimiter('test', 100, InMemoryRateLimitStore(), max_concurrency={Priority.BATCH: 1})
+        entered = threading.Event()
+        release = threading.Event()
+
+        def _hold():
+            with limiter.limit(Priority.BATCH):
+                entered.set()
+                release.wait(5)
+
+        thread = threading.Thread(target=_hold)
+        thread.start()
+        entered.wait(5)
+
+        # pylint: disable=protected-access
+        self.assertFalse(limiter._bulkheads[Priority.BATCH].acquire(blocking=False))
+        with limiter.limit(Priority.INTERACTIVE):
+            pass
+
+        release.set()
+        thread.join(5)
+        self.assertTrue(limiter._bulkheads[Priority.BATCH].acquire(blocking=False))
+
+
+class PriorityTests(TestCase):
+    """Tests of the outbound call priority."""
+
+    def test_outbound_priority(self):
+        self.assertEqual(current_priority(), Priority.INTERACTIVE)
+
+        with outbound_priority(Priority.BATCH):
+            self.assertEqual(current_priority(), Priority.BATCH)
+
+        self.assertEqual(current_priority(), Priority.INTERACTIVE)
+
+
+class RateLimitedAdapterTests(TestCase):
+    """Tests of RateLimitedAdapter and mount_rate_limiter."""
+
+    def setUp(self):
+        self.limiter = MagicMock(spec=AdaptiveRateLimiter)
+
+    def test_send_is_limited_and_reported(self):
+        wrapped = Mock()
+        wrapped.send.return_value = response(429)
+        request = PreparedRequest()
+
+        resp = RateLimitedAdapter(wrapped, self.limiter).send(request, timeout=5)
+
+        self.assertEqual(resp.status_code, 429)
+        wrapped.send.assert_called_once_with(request, timeout=5)
+        self.limiter.limit.assert_called_once_with()
+        self.limiter.report.assert_called_once_with(429)
+
+    def test_mount_keeps_the_existing_adapter(self):
+        session = Session()
+        existing = session.get_adapter('https://api.example.com/')
+
+        mount_rate_limiter(session, 'https://api.example.com/', self.limiter)
+        mount_rate_limiter(session, 'https://api.example.com/', self.limiter)
+
+        adapter = session.get_adapter('https://api.example.com/project/orders')
+        self.assertIsInstance(adapter, RateLimitedAdapter)
+        self.assertIs(adapter.adapter, existing)
+        self.assertNotIsInstance(session.get_adapter('https://auth.example.com/'), RateLimitedAdapter)
+
+    @override_settings(OUTBOUND_RATE_LIMITS={'test': {'BACKEND': 'memory', 'REQUESTS_PER_SECOND': 5}})
+    def test_get_rate_limiter(self):
+        reset_rate_limiters()
+        limiter = get_rate_limiter('test')
+
+        self.assertIs(get_rate_limiter('test'), limiter)
+        self.assertEqual(limiter.requests_per_second, 5)
+        self.assertIsInstance(limiter.store, InMemoryRateLimitStore)
+
+        reset_rate_limiters()
+        self.assertIsNot(get_rate_limiter('test'), limiter)
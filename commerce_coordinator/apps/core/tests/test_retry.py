@@ -0,0 +1,146 @@
+"""Test core.retry."""
+from unittest.mock import Mock, patch
+
+import ddt
+from celery.exceptions import Retry
+from django.test import TestCase
+from requests import Response
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import HTTPError, InvalidURL, Timeout
+
+from commerce_coordinator.apps.core.circuit_breaker import CircuitOpenError
+from commerce_coordinator.apps.core.instrumentation import current_attempt
+from commerce_coordinator.apps.core.retry import RetryPolicy
+
+
+def http_error(status_code, headers=None):
+    response = Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    return HTTPError(f"{status_code} Error", response=response)
+
+
+@ddt.ddt
+class RetryPolicyTests(TestCase):
+    """Tests of the RetryPolicy class."""
+
+    def setUp(self):
+        self.policy = RetryPolicy(max_retries=3, base_backoff=2, max_backoff=10)
+
+    @ddt.data(408, 429, 500, 502, 503, 504)
+    def test_retryable_status_codes(self, status_code):
+        self.assertTrue(self.policy.is_retryable(http_error(status_code)))
+
+    @ddt.data(400, 401, 403, 404, 409, 422)
+    def test_non_retryable_status_codes(self, status_code):
+        self.assertFalse(self.policy.is_retryable(http_error(status_code)))
+
+    @ddt.data(RequestsConnectionError(), Timeout())
+    def test_transport_errors_are_retryable(self, exc):
+        self.assertTrue(self.policy.is_retryable(exc))
+
+    @ddt.data(InvalidURL(), ValueError())
+    def test_permanent_errors_are_not_retryable(self, exc):
+        self.assertFalse(self.policy.is_retryable(exc))
+
+    @ddt.data(0, 1, 2, 3, 4)
+    def test_backoff_is_exponential_with_jitter(self, retries):
+        ceiling = min(10, 2 * 2 ** retries)
+        for _ in range(20):
+            delay = self.policy.backoff(retries)
+            self.assertGreaterEqual(delay, ceiling / 2)
+            self.assertLessEqual(delay, ceiling)
+
+    def test_backoff_honours_retry_after(self):
+        self.assertEqual(self.policy.backoff(0, http_error(429, {'Retry-After': '7'})), 7)
+        self.assertEqual(self.policy.backoff(0, http_error(429, {'Retry-After': '120'})), 10)
+
+    def test_backoff_waits_for_open_circuit_breaker(self):
+        self.assertEqual(self.policy.backoff(0, CircuitOpenError('lms', retry_after=8)), 8)
+
+    @patch('time.sleep')
+    def test_call_retries_until_success(self, mock_sleep):
+        func = Mock(side_effect=[http_error(503), Timeout(), 'ok'])
+        on_retry = Mock()
+
+        self.assertEqual(self.policy.call(func, on_retry=on_retry), 'ok')
+        self.assertEqual(func.call_count, 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+        self.assertEqual([c.args[1] for c in on_retry.call_args_list], [1, 2])
+
+    @patch('time.sleep')
+    def test_call_sets_the_outbound_attempt(self, _mock_sleep):
+        attempts = []
+
+        def func():
+            attempts.append(current_attempt())
+            if len(attempts) < 3:
+                raise Timeout()
+            return 'ok'
+
+        self.policy.call(func)
+
+        self.assertEqual(attempts, [0, 1, 2])
+        self.assertEqual(current_attempt(), 0)
+
+    @patch('time.sleep')
+    def test_call_gives_up_after_max_retries(self, mock_sleep):
+        func = Mock(side_effect=http_error(503))
+
+        with self.assertRaises(HTTPError):
+            self.policy.call(func)
+        self.assertEqual(func.call_count, 4)
+        self.assertEqual(mock_sleep.call_count, 3)
+
+    @patch('time.sleep')
+    def test_call_does_not_retry_permanent_errors(self, mock_sleep):
+        func = Mock(side_effect=http_error(400))
+
+        with self.assertRaises(HTTPError):
+            self.policy.call(func)
+        func.assert_called_once()
+        mock_sleep.assert_not_called()
+
+    @patch('time.sleep')
+    def test_call_does_not_wait_for_open_circuit_breaker(self, mock_sleep):
+        func = Mock(side_effect=CircuitOpenError('lms', retry_after=30))
+
+        with self.assertRaises(CircuitOpenError):
+            self.policy.call(func)
+        func.assert_called_once()
+        mock_sleep.assert_not_called()
+
+    def test_retry_task_or_raise_hands_retry_to_celery(self):
+        task = Mock()
+        task.request.retries = 1
+        task.retry.return_value = Retry()
+        exc = http_error(502)
+
+        with self.assertRaises(Retry):
+            self.policy.retry_task_or_raise(task, exc)
+
+        task.retry.assert_called_once()
+        kwargs = task.retry.call_args.kwargs
+        self.assertIs(kwargs['exc'], exc)
+        self.assertEqual(kwargs['max_retries'], 3)
+        self.assertTrue(2 <= kwargs['countdown'] <= 4)
+
+    def test_retry_task_or_raise_reraises_permanent_errors(self):
+        task = Mock()
+        exc = http_error(404)
+
+        with self.assertRaises(HTTPError):
+            self.policy.retry_task_or_raise(task, exc)
+        task.retry.assert_not_called()
+
+    @ddt.data(
+        (http_error(503), 2, True),
+        (http_error(503), 3, False),
+        (http_error(404), 0, False),
+    )
+    @ddt.unpack
+    def test_can_retry_task(self, exc, retries, expected):
+        task = Mock()
+        task.request.retries = retries
+
+        self.assertEqual(self.policy.can_retry_task(task, exc), expected)
@@ -0,0 +1,189 @@
+"""Test core.tracing."""
+import logging
+from types import SimpleNamespace
+
+from django.test import RequestFactory, TestCase
+
+from commerce_coordinator.apps.core.instrumentation import timed_call
+from commerce_coordinator.apps.core.signal_helpers import CoordinatorSignal, log_receiver
+from commerce_coordinator.apps.core.tracing import (
+    ENQUEUED_AT_HEADER,
+    TRACEPARENT_HEADER,
+    TraceContext,
+    annotate_span,
+    child_span,
+    current_trace,
+    get_span_exporters,
+    inject_task_headers,
+    start_span,
+    start_task_span,
+    traced_ingress
+)
+
+logger = logging.getLogger(__name__)
+
+TRACE_ID = '4bf92f3577b34da6a3ce929d0e0e4736'
+SPAN_ID = '00f067aa0ba902b7'
+TRACEPARENT = f'00-{TRACE_ID}-{SPAN_ID}-01'
+
+
+class TracingTestCase(TestCase):
+    """ Clears the in-memory exporter of the test settings before each test """
+
+    def setUp(self):
+        self.exporter = get_span_exporters()[0]
+        self.exporter.clear()
+
+    def span_named(self, name):
+        return next(span for span in self.exporter.spans if span.name == name)
+
+
+class TraceContextTests(TestCase):
+    """Tests of TraceContext."""
+
+    def test_traceparent(self):
+        context = TraceContext.from_traceparent(TRACEPARENT)
+
+        self.assertEqual(context, TraceContext(TRACE_ID, SPAN_ID))
+        self.assertEqual(context.traceparent(), TRACEPARENT)
+
+    def test_invalid_traceparent(self):
+        for value in (None, '', 'garbage', f'00-{TRACE_ID}-{SPAN_ID}', f'00-{TRACE_ID[:-1]}-{SPAN_ID}-01'):
+            self.assertIsNone(TraceContext.from_traceparent(value))
+
+
+class SpanTests(TracingTestCase):
+    """Tests of start_span and child_span."""
+
+    def test_nested_spans(self):
+        with start_span('root', 'ingress', order_id='1') as root:
+            with start_span('child') as child:
+                self.assertEqual(current_trace(), child.context)
+                annotate_span(line_items=2)
+            self.assertEqual(current_trace(), root.context)
+
+        self.assertIsNone(current_trace())
+        root_span, child_span_ = self.span_named('root'), self.span_named('child')
+        self.assertIsNone(root_span.parent_id)
+        self.assertEqual(root_span.attributes, {'order_id': '1'})
+        self.assertEqual(child_span_.trace_id, root_span.trace_id)
+        self.assertEqual(child_span_.parent_id, root_span.span_id)
+        self.assertEqual(child_span_.attributes, {'line_items': 2})
+
+    def test_continues_a_traceparent(self):
+        with start_span('remote', traceparent=TRACEPARENT):
+            pass
+
+        span = self.span_named('remote')
+        self.assertEqual((span.trace_id, span.parent_id), (TRACE_ID, SPAN_ID))
+
+    def test_error(self):
+        with self.assertRaises(ValueError):
+            with start_span('failing'):
+                raise ValueError()
+
+        self.assertEqual(self.span_named('failing').attributes, {'error': 'ValueError'})
+
+    def test_child_span_needs_a_trace(self):
+        with child_span('untraced') as span:
+            self.assertIsNone(span)
+
+        with child_span('traced', traceparent=TRACEPARENT) as span:
+            self.assertIsNotNone(span)
+
+        self.assertEqual([span.name for span in self.exporter.spans], ['traced'])
+
+
+class PropagationTests(TracingTestCase):
+    """Tests of the propagation of traces to signal receivers, Celery tasks and outbound calls."""
+
+    def test_signal_receivers(self):
+        received = []
+
+        @log_receiver(logger)
+        def receiver(**kwargs):
+            received.append((kwargs, current_trace()))
+
+        signal = CoordinatorSignal()
+        signal.connect(receiver, weak=False)
+
+        signal.send_robust(sender=self)
+        with start_span('view', 'ingress') as view:
+            signal.send_robust(sender=self, order_id='1')
+
+        self.assertEqual(received[0], ({'signal': signal, 'sender': self}, None))
+        self.assertEqual(received[1][0], {'signal': signal, 'sender': self, 'order_id': '1'})
+        receiver_span = self.span_named('receiver')
+        self.assertEqual(receiver_span.kind, 'signal')
+        self.assertEqual(receiver_span.parent_id, view.context.span_id)
+        self.assertEqual(received[1][1].span_id, receiver_span.span_id)
+
+    def test_strict_signature_signal_receiver(self):
+        received = []
+
+        def receiver(signal, sender, order_id):  # pylint: disable=unused-argument
+            received.append(order_id)
+
+        signal = CoordinatorSignal()
+        signal.connect(receiver, weak=False)
+
+        with start_span('view', 'ingress'):
+            [(_, response)] = signal.send_robust(sender=self, order_id='1')
+
+        self.assertIsNone(response)
+        self.assertEqual(received, ['1'])
+
+    def test_celery_tasks(self):
+        headers = {}
+        inject_task_headers(headers)
+        self.assertEqual(headers, {})
+
+        with start_span('receiver', 'signal') as publisher:
+            inject_task_headers(headers)
+
+        request = SimpleNamespace(id='task-1', retries=1, headers=None, **headers)
+        request.trace_enqueued_at -= 2
+        start_task_span(SimpleNamespace(name='tasks.fulfill', request=request)).finish(state='SUCCESS')
+
+        task_span = self.span_named('tasks.fulfill')
+        self.assertEqual(headers[TRACEPARENT_HEADER], publisher.context.traceparent())
+        self.assertEqual(task_span.parent_id, publisher.context.span_id)
+        self.assertEqual(task_span.kind, 'task')
+        self.assertGreaterEqual(task_span.attributes['queue_wait'], 2)
+        self.assertEqual(task_span.attributes['state'], 'SUCCESS')
+        self.assertIsNone(current_trace())
+
+    def test_celery_task_headers(self):
+        request = SimpleNamespace(id='task-1', retries=0, headers={TRACEPARENT_HEADER: TRACEPARENT})
+
+        start_task_span(SimpleNamespace(name='tasks.fulfill', request=request)).finish()
+
+        task_span = self.span_named('tasks.fulfill')
+        self.assertEqual((task_span.trace_id, task_span.parent_id), (TRACE_ID, SPAN_ID))
+        self.assertNotIn(ENQUEUED_AT_HEADER, task_span.attributes)
+
+    def test_outbound_calls(self):
+        with timed_call('lms', 'GET /api/enrollment/v1/enrollment'):
+            pass
+
+        with start_span('task', 'task') as task:
+            with timed_call('lms', 'POST /api/enrollment/v1/enrollment') as outcome:
+                outcome['status_code'] = 200
+
+        [call_span] = [span for span in self.exporter.spans if span.kind == 'outbound']
+        self.assertEqual(call_span.name, 'lms POST /api/enrollment/v1/enrollment')
+        self.assertEqual(call_span.parent_id, task.context.span_id)
+        self.assertEqual(call_span.attributes['status_code'], 200)
+
+    def test_ingress(self):
+        class View:
+            @traced_ingress
+            def post(self, request):  # pylint: disable=unused-argument
+                annotate_span(order_id='1')
+                return current_trace()
+
+        trace = View().post(RequestFactory().post('/fulfill', HTTP_TRACEPARENT=TRACEPARENT))
+
+        span = self.span_named('View')
+        self.assertEqual((span.trace_id, span.span_id, span.parent_id), (TRACE_ID, trace.span_id, SPAN_ID))
+        self.assertEqual(span.attributes, {'path': '/fulfill', 'order_id': '1'})
@@ -0,0 +1,273 @@
+"""
+Trace context, to follow one message (e.g. a commercetools order placed message) from the view receiving it through
+signals, Celery tasks and the outbound calls they make.
+
+A trace is a tree of spans, each an operation with a start and a duration. It starts at an ingress view
+(``traced_ingress``), or continues the trace of a W3C ``traceparent`` header the view received, and is carried
+
+- to signal receivers through the context, as ``CoordinatorSignal.send_robust`` calls them on the sender's thread
+  (see core.signal_helpers),
+- to Celery tasks in the ``traceparent`` header of their messages, with the time they were queued, so the span of a
+  task has its queue wait (see commerce_coordinator.celery),
+- to outbound calls through the context, which `OutboundSpanSink` records as spans (see core.instrumentation).
+
+Finished spans are sent to the exporters of ``settings.TRACE_EXPORTERS``: `LoggingSpanExporter` logs them, one line
+per span, `InMemorySpanExporter` keeps them, for tests.
+"""
+import contextvars
+import functools
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Celery message headers carrying the trace, and when the message was published
+TRACEPARENT_HEADER = 'traceparent'
+ENQUEUED_AT_HEADER = 'trace_enqueued_at'
+
+_TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+
+class TraceContext(NamedTuple):
+    """ A span of a trace, as carried between processes """
+    trace_id: str
+    span_id: str
+
+    def traceparent(self) -> str:
+        """ The context as a W3C traceparent value, sampled """
+        return f'00-{self.trace_id}-{self.span_id}-01'
+
+    @classmethod
+    def from_traceparent(cls, value: Optional[str]) -> Optional['TraceContext']:
+        """ The context of a W3C traceparent value, None if it's missing or invalid """
+        match = _TRACEPARENT.match((value or '').strip().lower())
+        return cls(*match.groups()) if match else None
+
+
+class SpanRecord(NamedTuple):
+    """ A finished span, as exported. `start` is seconds since the epoch, `duration` is seconds. """
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    name: str
+    kind: str
+    start: float
+    duration: float
+    attributes: dict
+
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+def current_trace() -> Optional[TraceContext]:
+    """ Context of the current span, None outside of a trace """
+    span = _current_span.get()
+    return span.context if span is not None else None
+
+
+def annotate_span(**attributes):
+    """ Add `attributes` to the current span, if any """
+    span = _current_span.get()
+    if span is not None:
+        span.attributes.update(attributes)
+
+
+class Span:
+    """ An operation of a trace, current in its context from `start` to `finish` """
+
+    def __init__(self, name: str, kind: str, parent: Optional[TraceContext] = None, **attributes):
+        """
+        Args:
+            name (str): What the operation is, e.g. a view or task name.
+            kind (str): ingress, signal, task, outbound or internal.
+            parent (TraceContext): Span this one is part of. A new trace is started if it's None.
+            attributes: Details of the operation, e.g. an order ID.
+        """
+        self.name = name
+        self.kind = kind
+        self.context = TraceContext(parent.trace_id if parent else uuid.uuid4().hex, uuid.uuid4().hex[:16])
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self._start = None
+        self._started = None
+        self._token = None
+
+    def start(self) -> 'Span':
+        self._start = time.time()
+        self._started = time.monotonic()
+        self._token = _current_span.set(self)
+        return self
+
+    def finish(self, **attributes):
+        """ Export the span, and make its parent's context current again """
+        self.attributes.update(attributes)
+        _current_span.reset(self._token)
+        export_span(SpanRecord(
+            self.context.trace_id,
+            self.context.span_id,
+            self.parent_id,
+            self.name,
+            self.kind,
+            self._start,
+            time.monotonic() - self._started,
+            self.attributes,
+        ))
+
+
+@contextmanager
+def start_span(name: str, kind: str = 'internal', traceparent: Optional[str] = None, **attributes):
+    """
+    Trace the block as a span, a child of `traceparent` if it's a valid traceparent value, else of the current span,
+    else the first span of a new trace. Yields the Span.
+    """
+    parent = TraceContext.from_traceparent(traceparent) or current_trace()
+    span = Span(name, kind, parent, **attributes).start()
+    try:
+        yield span
+    except BaseException as exc:
+        span.attributes['error'] = type(exc).__name__
+        raise
+    finally:
+        span.finish()
+
+
+@contextmanager
+def child_span(name: str, kind: str = 'internal', traceparent: Optional[str] = None, **attributes):
+    """ Like `start_span`, but the block isn't traced (and None is yielded) if there's no trace to continue """
+    if TraceContext.from_traceparent(traceparent) is None and current_trace() is None:
+        yield None
+        return
+
+    with start_span(name, kind, traceparent, **attributes) as span:
+        yield span
+
+
+def traced_ingress(method):
+    """
+    Decorate a view method to start a trace for each request, or continue the one of its ``traceparent`` header.
+    """
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        with start_span(type(self).__name__, 'ingress', request.headers.get('traceparent'), path=request.path):
+            return method(self, request, *args, **kwargs)
+    return wrapper
+
+
+def inject_task_headers(headers: Optional[dict]):
+    """ Add the current trace, and the time, to the headers of a Celery message being published """
+    trace = current_trace()
+    if trace is None or headers is None:
+        return
+
+    headers[TRACEPARENT_HEADER] = trace.traceparent()
+    headers[ENQUEUED_AT_HEADER] = time.time()
+
+
+def _task_header(request, name: str):
+    # Custom headers are attributes of the request, or in its headers with some message protocols
+    return getattr(request, name, None) or (getattr(request, 'headers', None) or {}).get(name)
+
+
+def start_task_span(task) -> Span:
+    """
+    Start the span of a Celery task, continuing the trace of its message (or the current one, for eager tasks). Its
+    ``queue_wait`` is the seconds between publishing the message and starting the task.
+    """
+    request = task.request
+    attributes = {'task_id': request.id, 'retries': request.retries or 0}
+
+    enqueued_at = _task_header(request, ENQUEUED_AT_HEADER)
+    if enqueued_at is not None:
+        attributes['queue_wait'] = round(max(0.0, time.time() - float(enqueued_at)), 3)
+
+    parent = TraceContext.from_traceparent(_task_header(request, TRACEPARENT_HEADER)) or current_trace()
+    return Span(task.name, 'task', parent, **attributes).start()
+
+
+class OutboundSpanSink:
+    """ Outbound metrics sink recording the calls made within a trace as its spans, see core.instrumentation """
+
+    def record(self, call):
+        parent = current_trace()
+        if parent is None:
+            return
+
+        span = Span(
+            f'{call.service} {call.endpoint}',
+            'outbound',
+            parent,
+            service=call.service,
+            status_code=call.status_code,
+            attempt=call.attempt,
+            error=call.error,
+            request_bytes=call.request_bytes,
+            response_bytes=call.response_bytes,
+        )
+        export_span(SpanRecord(
+            parent.trace_id,
+            span.context.span_id,
+            parent.span_id,
+            span.name,
+            span.kind,
+            time.time() - call.duration,
+            call.duration,
+            span.attributes,
+        ))
+
+
+class InMemorySpanExporter:
+    """ Keeps every span. Meant for tests. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans = []
+
+    def export(self, span: SpanRecord):
+        with self._lock:
+            self.spans.append(span)
+
+    def trace(self, trace_id: str) -> list:
+        """ The spans of a trace, in the order they finished """
+        with self._lock:
+            return [span for span in self.spans if span.trace_id == trace_id]
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+
+
+class LoggingSpanExporter:
+    """ Logs each span as one JSON line, prefixed by "[Trace]" """
+
+    def export(self, span: SpanRecord):
+        logger.info(f"[Trace] {json.dumps(span._asdict(), default=str)}")
+
+
+_exporters = {}
+
+
+def get_span_exporters() -> list:
+    """ The exporters of ``settings.TRACE_EXPORTERS``, created on first use """
+    paths = tuple(settings.TRACE_EXPORTERS)
+    exporters = _exporters.get(paths)
+    if exporters is None:
+        exporters = _exporters.setdefault(paths, [import_string(path)() for path in paths])
+    return exporters
+
+
+def export_span(span: SpanRecord):
+    for exporter in get_span_exporters():
+        try:
+            exporter.export(span)
+        except Exception:  # pylint: disable=broad-exception-caught
+            # Traces are never worth failing the traced operation over
+            logger.exception(f"[Tracing] {type(exporter).__name__} failed to export span {span.name}")
@@ -16,6 +16,11 @@ class EcommerceAPIClient(BaseEdxOAuthClient):
     API client for calls to the edX Ecommerce service.
     """
     api_base_url = ""
+    circuit_breaker = 'ecommerce'
+
+    @property
+    def circuit_breaker_url(self):
+        return settings.ECOMMERCE_URL
 
     def __init__(self):
         super().__init__()
@@ -6,6 +6,7 @@ from logging import getLogger
 from django.conf import settings
 from openedx_filters import PipelineStep
 
+from commerce_coordinator.apps.core.circuit_breaker import CircuitOpenError
 from commerce_coordinator.apps.core.constants import PipelineCommand
 from commerce_coordinator.apps.ecommerce.clients import EcommerceAPIClient
 from commerce_coordinator.apps.ecommerce.constants import ECOMMERCE_ORDER_MANAGEMENT_SYSTEM
@@ -40,15 +41,34 @@ class GetEcommerceOrders(PipelineStep):
             order_data: any preliminary orders (from an earlier pipeline step) we want to append to
         """
         new_params = params.copy()
+        new_params.pop('offsets', None)
+        offset = params.get('offsets', {}).get(ECOMMERCE_ORDER_MANAGEMENT_SYSTEM, params['page'] * params['page_size'])
+        # Ecommerce paginates by page, so fetch the page holding our offset and drop what comes before it.
         # Ecommerce starts pagination from 1, other systems from 0, since the invoker assumes 0, we're always 1 off.
-        new_params['page'] = params['page'] + 1
+        new_params['page'] = offset // params['page_size'] + 1
 
         try:
             ecommerce_api_client = EcommerceAPIClient()
             ecommerce_response = ecommerce_api_client.get_orders(new_params)
 
-            order_data.append(ecommerce_response)
+            order_data.append({
+                **ecommerce_response,
+                'results': ecommerce_response['results'][offset % params['page_size']:],
+                'offset': offset,
+                'total': ecommerce_response['count'],
+                'source_system': ECOMMERCE_ORDER_MANAGEMENT_SYSTEM,
+            })
 
+            return {
+                "order_data": order_data
+            }
+        except CircuitOpenError as ex:
+            log.warning("[GetEcommerceOrders] Skipping Ecommerce orders: %s", ex)
+            # An empty set, so the history is served without them and resumes from the same offset on the next page
+            order_data.append({
+                'results': [], 'offset': offset, 'total': offset, 'unavailable': True,
+                'source_system': ECOMMERCE_ORDER_MANAGEMENT_SYSTEM,
+            })
             return {
                 "order_data": order_data
             }
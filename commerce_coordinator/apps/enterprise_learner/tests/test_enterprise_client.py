@@ -70,7 +70,7 @@ class TestEnterpriseApiClient(TestCase):
     def test_check_user_is_enterprise_customer(self, username, response_data):
         """Successfully checks if user is enterprise"""
         with mock.patch('requests.Response.json') as mock_json:
-            with mock.patch('commerce_coordinator.apps.core.clients.OAuthAPIClient') as mock_oauth_client:
+            with mock.patch('commerce_coordinator.apps.core.clients.get_oauth_api_client') as mock_oauth_client:
                 mock_json.return_value = response_data
                 mock_oauth_client.return_value.get.return_value = Response()
                 mock_oauth_client.return_value.get.return_value.status_code = 200
@@ -99,7 +99,7 @@ class TestEnterpriseApiClient(TestCase):
     )
     @ddt.unpack
     def test_check_user_is_enterprise_customer_failure(self, username):
-        with mock.patch('commerce_coordinator.apps.core.clients.OAuthAPIClient') as mock_oauth_client:
+        with mock.patch('commerce_coordinator.apps.core.clients.get_oauth_api_client') as mock_oauth_client:
             mock_oauth_client.return_value.get.return_value = Response()
             mock_oauth_client.return_value.get.return_value.status_code = 400
             client = EnterpriseApiClient()
@@ -7,6 +7,7 @@ from unittest.mock import patch
 from django.contrib.auth import get_user_model
 from django.test import RequestFactory, TestCase
 
+from commerce_coordinator.apps.ecommerce.constants import ECOMMERCE_ORDER_MANAGEMENT_SYSTEM
 from commerce_coordinator.apps.frontend_app_ecommerce.filters import OrderHistoryRequested
 from commerce_coordinator.apps.frontend_app_ecommerce.tests import (
     ECOMMERCE_REQUEST_EXPECTED_RESPONSE,
@@ -41,4 +42,9 @@ class TestFrontendAppEcommerceFilters(TestCase):
             username='test', email='test@example.com', password='secret'
         )
         response = OrderHistoryRequested.run_filter(request, ORDER_HISTORY_GET_PARAMETERS)
-        self.assertEqual(response[0], ECOMMERCE_REQUEST_EXPECTED_RESPONSE)
+        self.assertEqual(response[0], {
+            **ECOMMERCE_REQUEST_EXPECTED_RESPONSE,
+            'offset': 20,
+            'total': ECOMMERCE_REQUEST_EXPECTED_RESPONSE['count'],
+            'source_system': ECOMMERCE_ORDER_MANAGEMENT_SYSTEM,
+        })
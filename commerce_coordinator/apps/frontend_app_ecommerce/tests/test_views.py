@@ -4,6 +4,7 @@ Tests for the frontend_app_ecommerce app views.
 
 import ddt
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase, override_settings
 from django.urls import reverse
 from mock import patch
@@ -11,6 +12,12 @@ from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 
 from commerce_coordinator.apps.commercetools.tests.conftest import gen_payment
+from commerce_coordinator.apps.core.cache import bump_order_history_generation
+from commerce_coordinator.apps.core.constants import (
+    ORDER_HISTORY_CACHE_TTL_SECS,
+    ORDER_HISTORY_LEGACY_CACHE_TTL_SECS,
+    PipelineCommand
+)
 from commerce_coordinator.apps.frontend_app_ecommerce.tests import (
     ECOMMERCE_REQUEST_EXPECTED_RESPONSE,
     ORDER_HISTORY_GET_PARAMETERS,
@@ -21,6 +28,12 @@ from commerce_coordinator.apps.frontend_app_ecommerce.tests.conftest import (
     gen_order_for_payment_intent,
     gen_payment_intent
 )
+from commerce_coordinator.apps.frontend_app_ecommerce.views import (
+    date_conv,
+    decode_order_history_cursor,
+    encode_order_history_cursor,
+    merge_order_history
+)
 
 User = get_user_model()
 
@@ -50,6 +63,7 @@ class OrdersViewTests(TestCase):
         """Create test user before test starts."""
 
         super().setUp()
+        cache.clear()
         User.objects.create_user(
             self.test_user_username,
             self.test_user_email,
@@ -126,6 +140,59 @@ class OrdersViewTests(TestCase):
         # Check username is passed to ecommerce client
         self.assertEqual(request_username, self.test_user_username)
 
+    def test_view_caches_first_page_until_orders_change(self, _mock_ctorders, mock_ecommerce_client):
+        """Check repeat visits are served from cache until one of the user's orders changes."""
+
+        # Login
+        self.client.login(username=self.test_user_username, password=self.test_user_password)
+
+        first = self.client.get(self.url, ORDER_HISTORY_GET_PARAMETERS)
+        second = self.client.get(self.url, ORDER_HISTORY_GET_PARAMETERS)
+
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(mock_ecommerce_client.call_count, 1)
+
+        bump_order_history_generation(127)
+        self.client.get(self.url, ORDER_HISTORY_GET_PARAMETERS)
+
+        self.assertEqual(mock_ecommerce_client.call_count, 2)
+
+    @patch('commerce_coordinator.apps.frontend_app_ecommerce.views.set_cached_order_history')
+    def test_view_caches_page_with_legacy_orders_briefly(self, mock_set_cache, _mock_ctorders, _mock_ecommerce_client):
+        """Check a page that asked legacy ecommerce, whose orders don't invalidate the cache, expires quickly."""
+
+        self.client.login(username=self.test_user_username, password=self.test_user_password)
+
+        self.client.get(self.url, ORDER_HISTORY_GET_PARAMETERS)
+
+        self.assertEqual(mock_set_cache.call_args.kwargs['timeout'], ORDER_HISTORY_LEGACY_CACHE_TTL_SECS)
+
+    @patch('commerce_coordinator.apps.frontend_app_ecommerce.views.set_cached_order_history')
+    @patch(
+        'commerce_coordinator.apps.ecommerce.pipeline.GetEcommerceOrders.run_filter',
+        return_value=PipelineCommand.CONTINUE.value
+    )
+    def test_view_caches_commercetools_only_page_until_orders_change(
+        self, _mock_ecommerce_step, mock_set_cache, _mock_ctorders, _mock_ecommerce_client
+    ):
+        """Check a page of only commercetools orders is kept until one of them changes."""
+
+        self.client.login(username=self.test_user_username, password=self.test_user_password)
+
+        self.client.get(self.url, ORDER_HISTORY_GET_PARAMETERS)
+
+        self.assertEqual(mock_set_cache.call_args.kwargs['timeout'], ORDER_HISTORY_CACHE_TTL_SECS)
+
+    def test_view_rejects_invalid_cursor(self, _mock_ctorders, _mock_ecommerce_client):
+        """Check a cursor we didn't issue is rejected."""
+
+        # Login
+        self.client.login(username=self.test_user_username, password=self.test_user_password)
+
+        response = self.client.get(self.url, {**ORDER_HISTORY_GET_PARAMETERS, 'cursor': 'not-a-cursor'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     @patch(
         'commerce_coordinator.apps.commercetools.pipeline.GetCommercetoolsOrders.run_filter',
         side_effect=Exception('Something went wrong')
@@ -146,6 +213,66 @@ class OrdersViewTests(TestCase):
         self.assertEqual(response.data, 'Something went wrong!')
 
 
+def _order_set(system, dates, offset=0, total=None):
+    return {
+        'results': [{'number': f'{system}-{i}', 'date_placed': d} for i, d in enumerate(dates, offset)],
+        'offset': offset,
+        'total': offset + len(dates) if total is None else total,
+        'source_system': system,
+    }
+
+
+class MergeOrderHistoryTests(TestCase):
+    """
+    Tests for merging the order history of several order management systems.
+    """
+
+    def test_merges_newest_first(self):
+        orders, next_offsets = merge_order_history([
+            _order_set('a', ['2024-05-01T00:00:00Z', '2024-03-01T00:00:00Z']),
+            _order_set('b', ['2024-04-01T00:00:00+00:00', '2024-02-01T00:00:00']),
+        ], page_size=10)
+
+        self.assertEqual([o['number'] for o in orders], ['a-0', 'b-0', 'a-1', 'b-1'])
+        self.assertIsNone(next_offsets)
+
+    def test_full_page_returns_offsets(self):
+        orders, next_offsets = merge_order_history([
+            _order_set('a', ['2024-05-01T00:00:00Z', '2024-03-01T00:00:00Z']),
+            _order_set('b', ['2024-04-01T00:00:00Z', '2024-02-01T00:00:00Z'], offset=5, total=10),
+        ], page_size=3)
+
+        self.assertEqual([o['number'] for o in orders], ['a-0', 'b-5', 'a-1'])
+        self.assertEqual(next_offsets, {'a': 2, 'b': 6})
+
+    def test_stops_when_system_with_more_runs_out(self):
+        orders, next_offsets = merge_order_history([
+            _order_set('a', ['2024-05-01T00:00:00Z'], total=3),
+            _order_set('b', ['2024-04-01T00:00:00Z']),
+        ], page_size=10)
+
+        # a's next order may be newer than b's, so b must wait for the next page
+        self.assertEqual([o['number'] for o in orders], ['a-0'])
+        self.assertEqual(next_offsets, {'a': 1, 'b': 0})
+
+    def test_cutoff_ends_history(self):
+        orders, next_offsets = merge_order_history([
+            _order_set('a', ['2024-05-01T00:00:00Z', '2020-01-01T00:00:00Z'], total=10),
+        ], page_size=10, cutoff_date=date_conv('2023-01-01T00:00:00Z'))
+
+        self.assertEqual([o['number'] for o in orders], ['a-0'])
+        self.assertIsNone(next_offsets)
+
+    def test_cursor_round_trip(self):
+        offsets = {'commercetools': 200, 'Ecommerce': 17}
+
+        self.assertEqual(decode_order_history_cursor(encode_order_history_cursor(offsets)), offsets)
+
+        for cursor in ['not-a-cursor', encode_order_history_cursor({'a': -1}), 'W10=']:
+            with self.assertRaises(ValueError):
+                decode_order_history_cursor(cursor)
+
+
 @ddt.ddt
 class ReceiptRedirectViewTests(APITestCase):
     """
@@ -1,9 +1,13 @@
 """
 Views for the frontend_app_ecommerce app
 """
+import base64
+import binascii
+import heapq
+import json
 import logging
 from datetime import datetime, timedelta, timezone
-from itertools import chain, takewhile
+from operator import itemgetter
 from typing import Union
 
 from dateutil import parser as dateparser
@@ -14,9 +18,18 @@ from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
 from rest_framework.status import HTTP_303_SEE_OTHER, HTTP_400_BAD_REQUEST
 from rest_framework.throttling import UserRateThrottle
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
 
+from commerce_coordinator.apps.commercetools.constants import COMMERCETOOLS_ORDER_MANAGEMENT_SYSTEM
+from commerce_coordinator.apps.core.cache import (
+    get_cached_order_history,
+    get_order_history_generation,
+    set_cached_order_history
+)
 from commerce_coordinator.apps.core.constants import (
+    ORDER_HISTORY_CACHE_TTL_SECS,
+    ORDER_HISTORY_LEGACY_CACHE_TTL_SECS,
     ORDER_HISTORY_PER_SYSTEM_REQ_CUTOFF_IN_DAYS,
     ORDER_HISTORY_PER_SYSTEM_REQ_LIMIT,
     HttpHeadersNames
@@ -25,16 +38,97 @@ from commerce_coordinator.apps.frontend_app_ecommerce.filters import (
     OrderHistoryRequested,
     OrderReceiptRedirectionUrlRequested
 )
+from commerce_coordinator.apps.rollout.waffle import is_redirect_to_commercetools_enabled_for_user
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
 
+ORDER_HISTORY_CURSOR_PARAM = 'cursor'
+
+
 def date_conv(dt: Union[datetime, str]) -> datetime:
+    """
+    Convert an order's date_placed to an aware datetime.
+
+    Both systems send ISO 8601, which `datetime.fromisoformat` reads far faster than `dateparser`; the latter is only
+    a fallback for anything else. Naive dates are taken as UTC.
+    """
     if isinstance(dt, str):
-        return dateparser.parse(dt)
-    else:
-        return dt
+        try:
+            dt = datetime.fromisoformat(dt)
+        except ValueError:
+            dt = dateparser.parse(dt)
+
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+
+    return dt
+
+
+def encode_order_history_cursor(offsets: dict) -> str:
+    """ Opaque continuation cursor holding how far into each order management system's history we are. """
+    return base64.urlsafe_b64encode(json.dumps(offsets, separators=(',', ':')).encode()).decode()
+
+
+def decode_order_history_cursor(cursor: str) -> dict:
+    """ Inverse of `encode_order_history_cursor`, raises ValueError if the cursor isn't one of ours. """
+    try:
+        offsets = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as exc:
+        raise ValueError(f"Invalid cursor {cursor}") from exc
+
+    if not isinstance(offsets, dict) or not all(isinstance(v, int) and v >= 0 for v in offsets.values()):
+        raise ValueError(f"Invalid cursor {cursor}")
+
+    return offsets
+
+
+def merge_order_history(order_sets, page_size, cutoff_date=None):
+    """
+    Merge each system's orders, newest first, into one page of up to `page_size` orders.
+
+    Every order set is already sorted by date_placed descending, so a heap merge over their pre-parsed dates is
+    enough. The page ends early once a system that has more orders than it returned runs out, since its next order
+    could be newer than anything left from the others.
+
+    Args:
+        order_sets: Order sets from the OrderHistoryRequested pipeline, each with `results`, `offset` (of its first
+            result), `total` and `source_system`
+        page_size: Maximum number of orders to return
+        cutoff_date: Orders placed before this end the history
+
+    Returns:
+        (list, dict|None): The orders, and the offsets to continue each system from, None if there are no more
+    """
+    def _stream(order_set):
+        for order in order_set["results"]:
+            yield date_conv(order["date_placed"]), order_set["source_system"], order
+
+    offsets = {order_set["source_system"]: order_set["offset"] for order_set in order_sets}
+    remaining = {order_set["source_system"]: len(order_set["results"]) for order_set in order_sets}
+    has_more = {
+        order_set["source_system"]: order_set["offset"] + len(order_set["results"]) < order_set["total"]
+        for order_set in order_sets
+    }
+
+    orders = []
+
+    for date_placed, system, order in heapq.merge(*map(_stream, order_sets), key=itemgetter(0), reverse=True):
+        if len(orders) == page_size:
+            return orders, offsets
+
+        if cutoff_date and date_placed < cutoff_date:
+            return orders, None
+
+        orders.append(order)
+        offsets[system] += 1
+        remaining[system] -= 1
+
+        if not remaining[system] and has_more[system]:
+            return orders, offsets
+
+    return orders, (offsets if any(has_more.values()) else None)
 
 
 # noinspection PyMethodMayBeStatic
@@ -128,30 +222,35 @@ class UserOrdersView(APIView):
             f"by user: {request.user.lms_user_id}"
         )
 
+        cursor = request.query_params.get(ORDER_HISTORY_CURSOR_PARAM)
+        if cursor:
+            try:
+                params["offsets"] = decode_order_history_cursor(cursor)
+            except ValueError:
+                return HttpResponseBadRequest("Invalid cursor supplied.")
+
+        cache_key = self._first_page_cache_key(request, params, cursor)
+        first_page = get_cached_order_history(*cache_key) if cache_key else None
+
         try:
-            order_data = OrderHistoryRequested.run_filter(request, params)
-            orders = chain.from_iterable(
-                order_set["results"] for order_set in order_data
-            )
-            orders = sorted(
-                orders,
-                key=lambda order: date_conv(order["date_placed"]),
-                reverse=True,
-            )
+            if first_page is not None:
+                orders, next_offsets = first_page
+            else:
+                orders, next_offsets = self._request_orders(request, params, cache_key)
 
-            if params["cutoff_in_days"]:
-                cutoff_date = datetime.now(timezone.utc) - timedelta(
-                    days=params["cutoff_in_days"]
-                )
-                orders = takewhile(
-                    lambda order: date_conv(order["date_placed"]) >= cutoff_date,
-                    orders,
+            next_url = None
+            if next_offsets:
+                # Keep the position of any system that didn't answer this time, so it resumes where it left off
+                next_offsets = {**params.get("offsets", {}), **next_offsets}
+                next_url = replace_query_param(
+                    request.build_absolute_uri(), ORDER_HISTORY_CURSOR_PARAM,
+                    encode_order_history_cursor(next_offsets)
                 )
 
             output = {
                 # This suppresses the ecomm mfe Order History Pagination control
                 "count": str(request.query_params.get('page_size', params["page_size"])),
-                "next": None,
+                "next": next_url,
                 "previous": None,
                 "results": orders
             }
@@ -164,3 +263,44 @@ class UserOrdersView(APIView):
                 exc,
             )
             return Response(status=HTTP_400_BAD_REQUEST, data='Something went wrong!')
+
+    def _first_page_cache_key(self, request, params, cursor):
+        """
+        The (lms_user_id, generation, variant) the page is cached under, or None if it isn't cached. The first page
+        of a learner's own history is cached until one of their orders changes.
+        """
+        if cursor or params["customer_id"] or params["edx_lms_user_id"] != request.user.lms_user_id:
+            return None
+
+        lms_user_id = params["edx_lms_user_id"]
+        # Whether commercetools is asked depends on the rollout flag, so it's part of the key
+        variant = f'ct-{is_redirect_to_commercetools_enabled_for_user(request)}'
+        return lms_user_id, get_order_history_generation(lms_user_id), variant
+
+    def _request_orders(self, request, params, cache_key):
+        """ Ask the order systems for a page of orders, and cache it under `cache_key` if there's one """
+        order_data = OrderHistoryRequested.run_filter(request, params)
+
+        cutoff_date = None
+        if params["cutoff_in_days"]:
+            cutoff_date = datetime.now(timezone.utc) - timedelta(
+                days=params["cutoff_in_days"]
+            )
+
+        orders, next_offsets = merge_order_history(order_data, params["page_size"], cutoff_date)
+
+        # A page missing the orders of a system whose circuit breaker was open isn't kept
+        partial = any(isinstance(order_set, dict) and order_set.get("unavailable") for order_set in order_data)
+        if cache_key and not partial:
+            lms_user_id, generation, variant = cache_key
+            # Only commercetools orders bump the generation when they change, so a page that also asked
+            # legacy ecommerce could miss a newly placed order there and is only kept briefly
+            legacy = any(
+                order_set["source_system"] != COMMERCETOOLS_ORDER_MANAGEMENT_SYSTEM for order_set in order_data
+            )
+            set_cached_order_history(
+                lms_user_id, generation, (orders, next_offsets), variant,
+                timeout=ORDER_HISTORY_LEGACY_CACHE_TTL_SECS if legacy else ORDER_HISTORY_CACHE_TTL_SECS
+            )
+
+        return orders, next_offsets
@@ -12,13 +12,19 @@ from typing import Any, Dict
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import build_http
 
 from commerce_coordinator.apps.commercetools.catalog_info.constants import ANDROID_IAP
+from commerce_coordinator.apps.core.instrumentation import instrument_httplib2
 
 logger = logging.getLogger(__name__)
 
+# Service of calls to the Google Play Developer API in outbound metrics
+GOOGLE_PLAY_METRICS_SERVICE_NAME = 'google_play'
+
 
 def get_consumable_android_sku(price: int) -> str:
     """
@@ -66,7 +72,9 @@ class GooglePlayValidator:
                 service_account_info,
                 scopes=[scope]
             )
-            service = build("androidpublisher", "v3", credentials=credentials)
+            # The transport build() would create, instrumented so its calls are recorded in the outbound metrics
+            http = AuthorizedHttp(credentials, http=instrument_httplib2(build_http(), GOOGLE_PLAY_METRICS_SERVICE_NAME))
+            service = build("androidpublisher", "v3", http=http)
 
             request = service.purchases().products().get(  # pylint: disable=no-member
                 packageName=bundle_id,
@@ -11,9 +11,13 @@ from django.conf import ImproperlyConfigured, settings
 from inapppy import AppStoreValidator, InAppPyValidationError
 
 from commerce_coordinator.apps.commercetools.catalog_info.constants import IOS_IAP
+from commerce_coordinator.apps.core.instrumentation import timed_call
 
 logger = logging.getLogger(__name__)
 
+# Service of calls to the App Store in outbound metrics
+APP_STORE_METRICS_SERVICE_NAME = 'app_store'
+
 
 class IOSValidator:
     """
@@ -44,10 +48,13 @@ class IOSValidator:
         validator = AppStoreValidator(bundle_id, auto_retry_wrong_env_request=True)
 
         try:
-            validation_result = validator.validate(
-                purchase_token,
-                exclude_old_transactions=True
-            )
+            # inapppy posts with requests' module functions, so there's no transport to instrument, and a receipt
+            # from the wrong environment is posted again to the other one within this call
+            with timed_call(APP_STORE_METRICS_SERVICE_NAME, 'POST /verifyReceipt', len(purchase_token or '')):
+                validation_result = validator.validate(
+                    purchase_token,
+                    exclude_old_transactions=True
+                )
         except InAppPyValidationError as ex:
             logger.error('Purchase validation failed %s', ex.raw_response)
             return {'error': ex.raw_response}
@@ -8,11 +8,16 @@ from django.conf import settings
 from requests.exceptions import RequestException
 
 from commerce_coordinator.apps.core.clients import BaseEdxOAuthClient, urljoin_directory
+from commerce_coordinator.apps.core.concurrency import map_concurrently
+from commerce_coordinator.apps.core.retry import RetryPolicy
 from commerce_coordinator.apps.lms.signals import fulfillment_completed_update_ct_line_item_signal
 
 # Use special Celery logger for tasks client calls.
 logger = get_task_logger(__name__)
 
+# LMS fulfillment calls are retried by their Celery tasks, so backoff here is a task countdown, not a sleep.
+LMS_RETRY_POLICY = RetryPolicy(max_retries=5, base_backoff=3, max_backoff=300)
+
 
 class FulfillmentType(enum.Enum):
     """Type of fulfillment."""
@@ -25,6 +30,13 @@ class LMSAPIClient(BaseEdxOAuthClient):
     API client for calls to the edX LMS service.
     """
 
+    retry_policy = LMS_RETRY_POLICY
+    circuit_breaker = 'lms'
+
+    @property
+    def circuit_breaker_url(self):
+        return settings.LMS_URL_ROOT
+
     @property
     def api_enrollment_base_url(self):
         """
@@ -79,12 +91,14 @@ class LMSAPIClient(BaseEdxOAuthClient):
             self,
             enrollment_data,
             line_item_state_payload,
-            fulfillment_logging_obj
+            fulfillment_logging_obj,
+            send_completion_signal=True
     ):
         """
         Send a POST request to LMS Enrollment API endpoint.
         Arguments:
             enrollment_data: dictionary to send to the API resource.
+            send_completion_signal: whether to signal the line item state update to Commercetools.
         Returns:
             dict: Dictionary representation of JSON returned from API.
         """
@@ -94,19 +108,22 @@ class LMSAPIClient(BaseEdxOAuthClient):
             json=enrollment_data,
             line_item_state_payload=line_item_state_payload,
             logging_obj=fulfillment_logging_obj,
-            timeout=settings.FULFILLMENT_TIMEOUT
+            timeout=settings.FULFILLMENT_TIMEOUT,
+            send_completion_signal=send_completion_signal
         )
 
     def entitle_user_to_course(
             self,
             entitlement_data,
             line_item_state_payload,
-            fulfillment_logging_obj
+            fulfillment_logging_obj,
+            send_completion_signal=True
     ):
         """
         Send a POST request to LMS Entitlement API endpoint.
         Arguments:
             entitlement_data: dictionary to send to the API resource.
+            send_completion_signal: whether to signal the line item state update to Commercetools.
         Returns:
             dict: Dictionary representation of JSON returned from API.
         """
@@ -116,9 +133,44 @@ class LMSAPIClient(BaseEdxOAuthClient):
             json=entitlement_data,
             line_item_state_payload=line_item_state_payload,
             logging_obj=fulfillment_logging_obj,
-            timeout=settings.FULFILLMENT_TIMEOUT
+            timeout=settings.FULFILLMENT_TIMEOUT,
+            send_completion_signal=send_completion_signal
         )
 
+    def fulfill_line_items(self, fulfillments, max_workers=None, send_completion_signal=True):
+        """
+        Fulfill several line items of one order.
+
+        The LMS Enrollment and Entitlement APIs take one course per request, so the requests are made
+        concurrently, with at most ``max_workers`` in flight, instead of one after the other.
+
+        Arguments:
+            fulfillments: list of dicts with the ``fulfillment_type`` (a FulfillmentType value), ``data`` sent to
+                the API, ``line_item_state_payload`` and ``logging_obj`` of each line item.
+            max_workers: upper bound on concurrent requests, defaults to settings.FULFILLMENT_MAX_CONCURRENCY.
+            send_completion_signal: whether to signal each line item state update to Commercetools.
+        Returns:
+            List[ConcurrentResult]: one result per line item, in order, holding either the JSON returned from the
+            API or the RequestException raised for that line item.
+        """
+        def fulfill(fulfillment):
+            fulfillment_type = fulfillment['fulfillment_type']
+            url = (
+                self.api_entitlement_base_url if fulfillment_type == FulfillmentType.ENTITLEMENT.value
+                else self.api_enrollment_base_url
+            )
+            return self.post(
+                fulfillment_type=fulfillment_type,
+                url=url,
+                json=fulfillment['data'],
+                line_item_state_payload=fulfillment['line_item_state_payload'],
+                logging_obj=fulfillment['logging_obj'],
+                timeout=settings.FULFILLMENT_TIMEOUT,
+                send_completion_signal=send_completion_signal
+            )
+
+        return map_concurrently(fulfill, fulfillments, max_workers)
+
     def post(
         self,
         fulfillment_type,
@@ -127,9 +179,13 @@ class LMSAPIClient(BaseEdxOAuthClient):
         line_item_state_payload,
         logging_obj,
         timeout=None,
+        send_completion_signal=True,
     ):
         """
         Send a POST request to a URL with JSON payload.
+
+        Unless ``send_completion_signal`` is False, the outcome is signalled so the Commercetools line item
+        state is updated. Callers that batch those updates themselves (bundle fulfillment chords) opt out.
         """
         if not timeout:   # pragma no cover
             timeout = self.normal_timeout
@@ -164,10 +220,11 @@ class LMSAPIClient(BaseEdxOAuthClient):
             if fulfillment_type == FulfillmentType.ENTITLEMENT.value:
                 payload['entitlement_uuid'] = response_json.get('uuid')
 
-            fulfillment_completed_update_ct_line_item_signal.send_robust(
-                sender=self.__class__,
-                **payload
-            )
+            if send_completion_signal:
+                fulfillment_completed_update_ct_line_item_signal.send_robust(
+                    sender=self.__class__,
+                    **payload
+                )
 
             return response_json
         except RequestException as exc:
@@ -178,13 +235,14 @@ class LMSAPIClient(BaseEdxOAuthClient):
             )
             self.log_request_exception(context_prefix, logger, exc)
 
-            payload = {
-                **line_item_state_payload,
-                'is_fulfilled': False
-            }
+            if send_completion_signal:
+                payload = {
+                    **line_item_state_payload,
+                    'is_fulfilled': False
+                }
 
-            fulfillment_completed_update_ct_line_item_signal.send_robust(
-                sender=self.__class__,
-                **payload
-            )
+                fulfillment_completed_update_ct_line_item_signal.send_robust(
+                    sender=self.__class__,
+                    **payload
+                )
             raise
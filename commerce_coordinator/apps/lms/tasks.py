@@ -4,6 +4,7 @@ LMS Celery tasks
 
 import json
 from datetime import datetime
+from functools import partial
 
 from celery import Task, shared_task
 from celery.utils.log import get_task_logger
@@ -12,7 +13,7 @@ from django.contrib.auth import get_user_model
 from edx_django_utils.cache import TieredCache
 from requests import RequestException
 
-from commerce_coordinator.apps.commercetools.catalog_info.constants import CourseModes, TwoUKeys
+from commerce_coordinator.apps.commercetools.catalog_info.constants import CourseModes, OrderReadProfiles, TwoUKeys
 from commerce_coordinator.apps.commercetools.clients import CommercetoolsAPIClient
 from commerce_coordinator.apps.commercetools.constants import (
     CT_ORDER_PRODUCT_TYPE_FOR_BRAZE,
@@ -20,7 +21,8 @@ from commerce_coordinator.apps.commercetools.constants import (
 )
 from commerce_coordinator.apps.commercetools.utils import send_fulfillment_error_email
 from commerce_coordinator.apps.core.memcache import safe_key
-from commerce_coordinator.apps.lms.clients import LMSAPIClient
+from commerce_coordinator.apps.lms.clients import LMS_RETRY_POLICY, FulfillmentType, LMSAPIClient
+from commerce_coordinator.apps.lms.signals import fulfillment_completed_update_ct_line_item_signal
 
 # Use the special Celery logger for our tasks
 logger = get_task_logger(__name__)
@@ -130,43 +132,15 @@ class CourseEntitlementTaskAfterReturn(Task):  # pylint: disable=abstract-method
             send_fulfillment_error_email(edx_lms_user_id, user_email, canvas_entry_properties)
 
 
-@shared_task(
-    bind=True,
-    autoretry_for=(RequestException, CommercetoolsError),
-    retry_kwargs={'max_retries': 5, 'countdown': 3},
-    base=CourseEnrollTaskAfterReturn,
-)
-def fulfill_order_placed_send_enroll_in_course_task(
-    self,
-    course_id,
-    course_mode,
-    date_placed,
-    edx_lms_user_id,
-    email_opt_in,
-    order_number,
-    order_id,
-    order_version,
-    provider_id,
-    source_system,
-    line_item_id,
-    item_quantity,
-    line_item_state_id,
-    message_id,
-    user_first_name,    # pylint: disable=unused-argument
-    user_last_name,    # pylint: disable=unused-argument
-    user_email,         # pylint: disable=unused-argument
-    product_title,       # pylint: disable=unused-argument
-    product_type        # pylint: disable=unused-argument
+def build_enrollment_data(
+    username, course_id, course_mode, email_opt_in, order_number, order_id, line_item_id, date_placed, source_system,
+    provider_id
 ):
     """
-    Celery task for enrollment fulfillment via LMS Enrollment API.
+    Request body for the LMS Enrollment API for one order line item.
     """
-    tag = "fulfill_order_placed_send_enroll_in_course_task"
-    logger.info(f"{tag} Starting task with details: {locals()}.")
-    user = User.objects.get(lms_user_id=edx_lms_user_id)
-
     enrollment_data = {
-        'user': user.username,
+        'user': username,
         'mode': course_mode,
         'is_active': True,
         'course_details': {
@@ -209,15 +183,107 @@ def fulfill_order_placed_send_enroll_in_course_task(
             'value': provider_id,
         })
 
+    return enrollment_data
+
+
+def build_entitlement_data(username, course_id, course_mode, email_opt_in, order_number):
+    """
+    Request body for the LMS Entitlement API for one order line item.
+    """
+    return {
+        'user': username,
+        'mode': course_mode,
+        'course_uuid': course_id,
+        'order_number': order_number,
+        'email_opt_in': email_opt_in,
+    }
+
+
+def fulfillment_outcome(line_item_state_payload, is_fulfilled, entitlement_uuid=None):
+    """
+    Result of a deferred fulfillment task, gathered by the bundle fulfillment chord callback.
+    """
+    return {
+        'line_item_id': line_item_state_payload['line_item_id'],
+        'item_quantity': line_item_state_payload['item_quantity'],
+        'is_fulfilled': is_fulfilled,
+        'entitlement_uuid': entitlement_uuid,
+    }
+
+
+def _fulfill_line_item(task, fulfill, line_item_state_payload, defer_completion_update, is_entitlement=False):
+    """
+    Run one LMS fulfillment call on behalf of ``task``, handing transient failures back to Celery.
+
+    With ``defer_completion_update`` the task is part of a bundle fulfillment chord, and the Commercetools line
+    item update is left to the chord callback. The outcome is returned instead of the LMS response, and a
+    failure that will not be retried is reported through ``task.on_failure`` and returned as an unfulfilled
+    outcome, so the callback still runs for the rest of the bundle.
+    """
+    try:
+        response_json = fulfill(send_completion_signal=False) if defer_completion_update else fulfill()
+    except RequestException as exc:
+        if defer_completion_update and not LMS_RETRY_POLICY.can_retry_task(task, exc):
+            task.on_failure(exc, task.request.id, task.request.args, task.request.kwargs, None)
+            return fulfillment_outcome(line_item_state_payload, is_fulfilled=False)
+        return LMS_RETRY_POLICY.retry_task_or_raise(task, exc)
+
+    if defer_completion_update:
+        entitlement_uuid = response_json.get('uuid') if is_entitlement else None
+        return fulfillment_outcome(line_item_state_payload, is_fulfilled=True, entitlement_uuid=entitlement_uuid)
+    return response_json
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(CommercetoolsError,),
+    retry_kwargs={'max_retries': 5, 'countdown': 3},
+    base=CourseEnrollTaskAfterReturn,
+)
+def fulfill_order_placed_send_enroll_in_course_task(
+    self,
+    course_id,
+    course_mode,
+    date_placed,
+    edx_lms_user_id,
+    email_opt_in,
+    order_number,
+    order_id,
+    order_version,
+    provider_id,
+    source_system,
+    line_item_id,
+    item_quantity,
+    line_item_state_id,
+    message_id,
+    user_first_name,    # pylint: disable=unused-argument
+    user_last_name,    # pylint: disable=unused-argument
+    user_email,         # pylint: disable=unused-argument
+    product_title,       # pylint: disable=unused-argument
+    product_type,        # pylint: disable=unused-argument
+    defer_completion_update=False
+):
+    """
+    Celery task for enrollment fulfillment via LMS Enrollment API.
+    """
+    tag = "fulfill_order_placed_send_enroll_in_course_task"
+    logger.info(f"{tag} Starting task with details: {locals()}.")
+    user = User.objects.get(lms_user_id=edx_lms_user_id)
+
+    enrollment_data = build_enrollment_data(
+        user.username, course_id, course_mode, email_opt_in, order_number, order_id, line_item_id, date_placed,
+        source_system, provider_id
+    )
+
     # Updating the order version and stateID after the transition to 'Fulfillment Failure'
-    if self.request.retries > 0:
+    if self.request.retries > 0 and not defer_completion_update:
         logger.warning(f"{tag} "
                        f"Task retry count# {self.request.retries} for CT order ID {order_id}.")
         client = CommercetoolsAPIClient()
         # A retry means the current line item state on the order would be a failure state
         line_item_state_id = client.get_state_by_key(TwoUKeys.FAILURE_FULFILMENT_STATE).id
         start_time = datetime.now()
-        order_version = client.get_order_by_id(order_id).version
+        order_version = client.get_order_by_id(order_id, expand=OrderReadProfiles.MINIMAL).version
         duration = (datetime.now() - start_time).total_seconds()
         logger.info(f"[Performance Check] get_order_by_id call took {duration} seconds")
 
@@ -227,6 +293,7 @@ def fulfill_order_placed_send_enroll_in_course_task(
         'line_item_id': line_item_id,
         'item_quantity': item_quantity,
         'line_item_state_id': line_item_state_id,
+        'lms_user_id': edx_lms_user_id,
     }
 
     fulfillment_logging_obj = {
@@ -238,12 +305,18 @@ def fulfill_order_placed_send_enroll_in_course_task(
         'celery_task_id': self.request.id
     }
 
-    return LMSAPIClient().enroll_user_in_course(enrollment_data, line_item_state_payload, fulfillment_logging_obj)
+    return _fulfill_line_item(
+        self,
+        partial(LMSAPIClient().enroll_user_in_course, enrollment_data, line_item_state_payload,
+                fulfillment_logging_obj),
+        line_item_state_payload,
+        defer_completion_update
+    )
 
 
 @shared_task(
     bind=True,
-    autoretry_for=(RequestException, CommercetoolsError),
+    autoretry_for=(CommercetoolsError,),
     retry_kwargs={'max_retries': 5, 'countdown': 3},
     base=CourseEntitlementTaskAfterReturn,
 )
@@ -264,7 +337,8 @@ def fulfill_order_placed_send_entitlement_task(
     user_last_name,    # pylint: disable=unused-argument
     user_email,         # pylint: disable=unused-argument
     product_title,      # pylint: disable=unused-argument
-    product_type        # pylint: disable=unused-argument
+    product_type,       # pylint: disable=unused-argument
+    defer_completion_update=False
 ):
     """
     Celery task for entitlement fulfillment via LMS Entitlement API.
@@ -273,21 +347,16 @@ def fulfill_order_placed_send_entitlement_task(
     logger.info(f"{tag} Starting task with details: {locals()}.")
     user = User.objects.get(lms_user_id=edx_lms_user_id)
 
-    entitlement_data = {
-        'user': user.username,
-        'mode': course_mode,
-        'course_uuid': course_id,
-        'order_number': order_number,
-        'email_opt_in': email_opt_in,
-    }
+    entitlement_data = build_entitlement_data(user.username, course_id, course_mode, email_opt_in, order_number)
 
-    if self.request.retries > 0:
+    # Deferred tasks leave the line item state untouched until the chord callback runs
+    if self.request.retries > 0 and not defer_completion_update:
         logger.warning(f"{tag} "
                        f"Task retry count# {self.request.retries} for CT order ID {order_id}.")
         client = CommercetoolsAPIClient()
         # A retry means the current line item state on the order would be a failure state
         line_item_state_id = client.get_state_by_key(TwoUKeys.FAILURE_FULFILMENT_STATE).id
-        order_version = client.get_order_by_id(order_id).version
+        order_version = client.get_order_by_id(order_id, expand=OrderReadProfiles.MINIMAL).version
 
     line_item_state_payload = {
         'order_id': order_id,
@@ -295,6 +364,7 @@ def fulfill_order_placed_send_entitlement_task(
         'line_item_id': line_item_id,
         'item_quantity': item_quantity,
         'line_item_state_id': line_item_state_id,
+        'lms_user_id': edx_lms_user_id,
     }
 
     fulfillment_logging_obj = {
@@ -306,6 +376,109 @@ def fulfill_order_placed_send_entitlement_task(
         'celery_task_id': self.request.id
     }
 
-    return LMSAPIClient().entitle_user_to_course(
-        entitlement_data, line_item_state_payload, fulfillment_logging_obj
+    return _fulfill_line_item(
+        self,
+        partial(LMSAPIClient().entitle_user_to_course, entitlement_data, line_item_state_payload,
+                fulfillment_logging_obj),
+        line_item_state_payload,
+        defer_completion_update,
+        is_entitlement=True
     )
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(CommercetoolsError,),
+    retry_kwargs={'max_retries': 5, 'countdown': 3},
+)
+def fulfill_order_placed_send_line_items_task(self, enrollments, entitlements):
+    """
+    Celery task fulfilling several line items of one order via the LMS Enrollment and Entitlement APIs together.
+
+    Arguments:
+        enrollments: keyword arguments of fulfill_order_placed_send_enroll_in_course_task, one per line item.
+        entitlements: keyword arguments of fulfill_order_placed_send_entitlement_task, one per line item.
+
+    The LMS calls are made concurrently. Each fulfilled line item is signalled for its Commercetools update as
+    usual; a line item whose call failed with a transient error is handed to its single line item task, so only
+    that line item is retried.
+    """
+    tag = "fulfill_order_placed_send_line_items_task"
+    users = {}
+    fulfillments = []
+
+    for task, fulfillment_type, task_kwargs in (
+        *((fulfill_order_placed_send_enroll_in_course_task, FulfillmentType.ENROLLMENT, kwargs)
+          for kwargs in enrollments),
+        *((fulfill_order_placed_send_entitlement_task, FulfillmentType.ENTITLEMENT, kwargs)
+          for kwargs in entitlements),
+    ):
+        lms_user_id = task_kwargs['edx_lms_user_id']
+        if lms_user_id not in users:
+            users[lms_user_id] = User.objects.get(lms_user_id=lms_user_id)
+        user = users[lms_user_id]
+
+        if fulfillment_type == FulfillmentType.ENTITLEMENT:
+            data = build_entitlement_data(
+                user.username, task_kwargs['course_id'], task_kwargs['course_mode'], task_kwargs['email_opt_in'],
+                task_kwargs['order_number']
+            )
+        else:
+            data = build_enrollment_data(
+                user.username, task_kwargs['course_id'], task_kwargs['course_mode'], task_kwargs['email_opt_in'],
+                task_kwargs['order_number'], task_kwargs['order_id'], task_kwargs['line_item_id'],
+                task_kwargs['date_placed'], task_kwargs['source_system'], task_kwargs['provider_id']
+            )
+
+        fulfillments.append({
+            'task': task,
+            'task_kwargs': task_kwargs,
+            'fulfillment_type': fulfillment_type.value,
+            'data': data,
+            'line_item_state_payload': {
+                **{
+                    key: task_kwargs[key]
+                    for key in ('order_id', 'order_version', 'line_item_id', 'item_quantity', 'line_item_state_id')
+                },
+                'lms_user_id': lms_user_id,
+            },
+            'logging_obj': {
+                'user': user.username,
+                'lms_user_id': user.lms_user_id,
+                'order_id': task_kwargs['order_id'],
+                'course_id': task_kwargs['course_id'],
+                'message_id': task_kwargs['message_id'],
+                'celery_task_id': self.request.id
+            },
+        })
+
+    logger.info(f"{tag} Fulfilling {len(fulfillments)} line items concurrently, celery task ID: {self.request.id}.")
+
+    # Signals and retries are sent from this thread, once every LMS call has finished.
+    results = LMSAPIClient().fulfill_line_items(fulfillments, send_completion_signal=False)
+
+    rescheduled = 0
+    for result in results:
+        fulfillment = result.item
+
+        if not result.ok and LMS_RETRY_POLICY.is_retryable(result.error):
+            rescheduled += 1
+            fulfillment['task'].apply_async(
+                kwargs=fulfillment['task_kwargs'],
+                countdown=LMS_RETRY_POLICY.backoff(0, result.error),
+            )
+            continue
+
+        payload = {**fulfillment['line_item_state_payload'], 'is_fulfilled': result.ok}
+        if result.ok and fulfillment['fulfillment_type'] == FulfillmentType.ENTITLEMENT.value:
+            payload['entitlement_uuid'] = result.value.get('uuid')
+
+        fulfillment_completed_update_ct_line_item_signal.send_robust(sender=LMSAPIClient, **payload)
+
+        if not result.ok:
+            fulfillment['task'].on_failure(result.error, None, (), fulfillment['task_kwargs'], None)
+
+    logger.info(f"{tag} Fulfilled {sum(result.ok for result in results)} of {len(results)} line items, "
+                f"{rescheduled} rescheduled individually, celery task ID: {self.request.id}.")
+
+    return [result.ok for result in results]
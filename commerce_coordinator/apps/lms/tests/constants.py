@@ -13,6 +13,7 @@ EXAMPLE_LINE_ITEM_STATE_PAYLOAD = {
     'line_item_id': '822d77c4-00a6-4fb9-909b-094ef0b8c4b9',
     'item_quantity': 1,
     'line_item_state_id': '8f2e888e-9777-4557-9a7f-c649153770c2',
+    'lms_user_id': 4,
 }
 
 EXAMPLE_FULFILLMENT_SIGNAL_PAYLOAD: Dict[str, Union[str, bool, int, None]] = {
@@ -9,7 +9,7 @@ from requests.exceptions import HTTPError
 
 from commerce_coordinator.apps.core.clients import urljoin_directory
 from commerce_coordinator.apps.core.tests.utils import CoordinatorOAuthClientTestCase
-from commerce_coordinator.apps.lms.clients import LMSAPIClient
+from commerce_coordinator.apps.lms.clients import FulfillmentType, LMSAPIClient
 from commerce_coordinator.apps.lms.tests.constants import (
     EXAMPLE_ENROLLMENT_FULFILLMENT_REQUEST_PAYLOAD,
     EXAMPLE_FULFILLMENT_LOGGING_OBJ,
@@ -106,3 +106,27 @@ class LMSAPIClientTests(CoordinatorOAuthClientTestCase):
                 mock_url=self.deactivate_user_url.format(username='test_user', ct_message_id='mock_message_id'),
                 mock_status=400,
             )
+
+    def test_fulfill_line_items(self):
+        """Check each line item is posted to its API, with per-item results in order."""
+        fulfillments = [
+            {
+                'fulfillment_type': fulfillment_type.value,
+                'data': EXAMPLE_ENROLLMENT_FULFILLMENT_REQUEST_PAYLOAD,
+                'line_item_state_payload': EXAMPLE_LINE_ITEM_STATE_PAYLOAD,
+                'logging_obj': EXAMPLE_FULFILLMENT_LOGGING_OBJ,
+            }
+            for fulfillment_type in (FulfillmentType.ENROLLMENT, FulfillmentType.ENTITLEMENT)
+        ]
+        error = HTTPError('503 Error')
+
+        with patch.object(self.client, 'post', side_effect=[EXAMPLE_FULFILLMENT_RESPONSE_PAYLOAD, error]) as mock_post:
+            results = self.client.fulfill_line_items(fulfillments, max_workers=1, send_completion_signal=False)
+
+        self.assertEqual(
+            [call.kwargs['url'] for call in mock_post.call_args_list],
+            [self.url, urljoin_directory(TEST_LMS_URL_ROOT, '/api/entitlements/v1/entitlements/')]
+        )
+        self.assertFalse(mock_post.call_args.kwargs['send_completion_signal'])
+        self.assertEqual(results[0].value, EXAMPLE_FULFILLMENT_RESPONSE_PAYLOAD)
+        self.assertIs(results[1].error, error)
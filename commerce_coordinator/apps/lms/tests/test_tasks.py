@@ -3,18 +3,21 @@ LMS app Task Tests
 """
 
 import logging
-from unittest.mock import Mock, patch, sentinel
+from unittest.mock import ANY, Mock, patch, sentinel
 
 from django.test import TestCase
-from requests import RequestException
+from requests import RequestException, Response
+from requests.exceptions import HTTPError
 
-from commerce_coordinator.apps.commercetools.catalog_info.constants import CourseModes, TwoUKeys
+from commerce_coordinator.apps.commercetools.catalog_info.constants import CourseModes, OrderReadProfiles, TwoUKeys
 from commerce_coordinator.apps.commercetools.constants import CT_ORDER_PRODUCT_TYPE_FOR_BRAZE
 from commerce_coordinator.apps.commercetools.tests.conftest import gen_line_item_state, gen_order
+from commerce_coordinator.apps.core.concurrency import ConcurrentResult
 from commerce_coordinator.apps.core.models import User
 from commerce_coordinator.apps.lms.tasks import (
     fulfill_order_placed_send_enroll_in_course_task,
-    fulfill_order_placed_send_entitlement_task
+    fulfill_order_placed_send_entitlement_task,
+    fulfill_order_placed_send_line_items_task
 )
 from commerce_coordinator.apps.lms.tests.constants import (
     EXAMPLE_ENROLLMENT_FULFILLMENT_REQUEST_PAYLOAD,
@@ -140,7 +143,9 @@ class FulfillOrderPlacedSendEnrollInCourseTaskTest(TestCase):
         expected_state_payload['order_version'] = 2
 
         mock_ct_get_state.assert_called_with(TwoUKeys.FAILURE_FULFILMENT_STATE)
-        mock_ct_get_order.assert_called_with(EXAMPLE_FULFILLMENT_SIGNAL_PAYLOAD.get('order_id'))
+        mock_ct_get_order.assert_called_with(
+            EXAMPLE_FULFILLMENT_SIGNAL_PAYLOAD.get('order_id'), expand=OrderReadProfiles.MINIMAL
+        )
 
     @patch('commerce_coordinator.apps.lms.tasks.send_fulfillment_error_email')
     @patch.object(fulfill_order_placed_send_enroll_in_course_task, 'max_retries', 5)
@@ -185,6 +190,39 @@ class FulfillOrderPlacedSendEnrollInCourseTaskTest(TestCase):
             }
         )
 
+    def test_deferred_completion_update_returns_outcome(self, mock_client):
+        """
+        Check that a task in a bundle fulfillment chord returns its outcome and leaves the CT update to the chord.
+        """
+        res = uut(*self.unpack_for_uut(EXAMPLE_FULFILLMENT_SIGNAL_PAYLOAD), True)
+
+        mock_client().enroll_user_in_course.assert_called_once_with(
+            ANY,
+            EXAMPLE_LINE_ITEM_STATE_PAYLOAD,
+            EXAMPLE_FULFILLMENT_LOGGING_OBJ,
+            send_completion_signal=False
+        )
+        self.assertEqual(res, {
+            'line_item_id': EXAMPLE_LINE_ITEM_STATE_PAYLOAD['line_item_id'],
+            'item_quantity': EXAMPLE_LINE_ITEM_STATE_PAYLOAD['item_quantity'],
+            'is_fulfilled': True,
+            'entitlement_uuid': None,
+        })
+
+    @patch.object(fulfill_order_placed_send_enroll_in_course_task, 'on_failure')
+    def test_deferred_completion_update_permanent_failure(self, mock_on_failure, mock_client):
+        """
+        Check that a permanent failure in a bundle fulfillment chord is reported and returned, not raised.
+        """
+        response = Response()
+        response.status_code = 400
+        mock_client().enroll_user_in_course.side_effect = HTTPError(response=response)
+
+        res = uut(*self.unpack_for_uut(EXAMPLE_FULFILLMENT_SIGNAL_PAYLOAD), True)
+
+        self.assertFalse(res['is_fulfilled'])
+        mock_on_failure.assert_called_once()
+
 
 @patch('commerce_coordinator.apps.lms.tasks.LMSAPIClient')
 class FulfillOrderPlacedSendEntitlementTaskTest(TestCase):
@@ -256,7 +294,9 @@ class FulfillOrderPlacedSendEntitlementTaskTest(TestCase):
         expected_state_payload['order_version'] = 2
 
         mock_ct_get_state.assert_called_with(TwoUKeys.FAILURE_FULFILMENT_STATE)
-        mock_ct_get_order.assert_called_with(EXAMPLE_FULFILLMENT_SIGNAL_PAYLOAD.get('order_id'))
+        mock_ct_get_order.assert_called_with(
+            EXAMPLE_FULFILLMENT_SIGNAL_PAYLOAD.get('order_id'), expand=OrderReadProfiles.MINIMAL
+        )
 
     @patch('commerce_coordinator.apps.lms.tasks.send_fulfillment_error_email')
     @patch.object(fulfill_order_placed_send_entitlement_task, 'max_retries', 5)
@@ -350,3 +390,57 @@ class FulfillOrderPlacedSendEntitlementTaskTest(TestCase):
             mock_tiered_cache.get_cached_response.return_value.is_found = True
 
             mock_send_email.assert_not_called()
+
+
+@patch('commerce_coordinator.apps.lms.tasks.fulfillment_completed_update_ct_line_item_signal.send_robust')
+@patch('commerce_coordinator.apps.lms.tasks.LMSAPIClient')
+class FulfillOrderPlacedSendLineItemsTaskTest(TestCase):
+    """ Fulfill Order Placed Send Line Items Task Test """
+
+    def setUp(self):
+        User.objects.create(username='test-user', lms_user_id=4)
+        entitlement_kwargs = {
+            key: value for key, value in EXAMPLE_FULFILLMENT_SIGNAL_PAYLOAD.items()
+            if key not in ('date_placed', 'provider_id', 'source_system')
+        }
+        self.enrollments = [{**EXAMPLE_FULFILLMENT_SIGNAL_PAYLOAD, 'line_item_id': 'enrollment-line'}]
+        self.entitlements = [
+            {**entitlement_kwargs, 'line_item_id': 'retryable-line'},
+            {**entitlement_kwargs, 'line_item_id': 'failed-line'},
+        ]
+
+    @staticmethod
+    def fake_fulfill_line_items(fulfillments, **_kwargs):
+        return [
+            ConcurrentResult(fulfillments[0], value={}),
+            ConcurrentResult(fulfillments[1], error=HTTPError(response=Mock(status_code=503, headers={}))),
+            ConcurrentResult(fulfillments[2], error=HTTPError(response=Mock(status_code=400, headers={}))),
+        ]
+
+    @patch.object(fulfill_order_placed_send_entitlement_task, 'on_failure')
+    @patch.object(fulfill_order_placed_send_entitlement_task, 'apply_async')
+    def test_partial_failures(self, mock_apply_async, mock_on_failure, mock_client, mock_signal):
+        mock_client().fulfill_line_items.side_effect = self.fake_fulfill_line_items
+
+        res = fulfill_order_placed_send_line_items_task(  # pylint: disable=no-value-for-parameter
+            self.enrollments, self.entitlements
+        )
+
+        self.assertEqual(res, [True, False, False])
+
+        fulfillments = mock_client().fulfill_line_items.call_args[0][0]
+        self.assertEqual(fulfillments[0]['data']['course_details']['course_id'],
+                         EXAMPLE_FULFILLMENT_SIGNAL_PAYLOAD['course_id'])
+        self.assertEqual(fulfillments[1]['data']['course_uuid'], EXAMPLE_FULFILLMENT_SIGNAL_PAYLOAD['course_id'])
+        self.assertFalse(mock_client().fulfill_line_items.call_args.kwargs['send_completion_signal'])
+
+        # The fulfilled and the permanently failed line items are signalled, the transient failure is retried alone
+        self.assertEqual(
+            [(call.kwargs['line_item_id'], call.kwargs['is_fulfilled']) for call in mock_signal.call_args_list],
+            [('enrollment-line', True), ('failed-line', False)]
+        )
+        self.assertEqual({call.kwargs['lms_user_id'] for call in mock_signal.call_args_list}, {4})
+        mock_apply_async.assert_called_once()
+        self.assertEqual(mock_apply_async.call_args.kwargs['kwargs'], self.entitlements[0])
+        mock_on_failure.assert_called_once()
+        self.assertEqual(mock_on_failure.call_args[0][3], self.entitlements[1])
@@ -3,7 +3,7 @@
 import re
 from typing import List
 
-from commerce_coordinator.apps.commercetools.catalog_info.constants import TwoUKeys
+from commerce_coordinator.apps.commercetools.catalog_info.constants import OrderReadProfiles, TwoUKeys
 from commerce_coordinator.apps.commercetools.clients import CommercetoolsAPIClient
 from commerce_coordinator.apps.lms.constants import CT_ABSOLUTE_DISCOUNT_TYPE, DEFAULT_BUNDLE_DISCOUNT_KEY
 
@@ -21,7 +21,7 @@ def get_order_line_item_info_from_entitlement_uuid(order_number: str, entitlemen
         otherwise an empty string).
     """
     ct_api_client = CommercetoolsAPIClient()
-    ct_order = ct_api_client.get_order_by_number(order_number=order_number)
+    ct_order = ct_api_client.get_order_by_number(order_number=order_number, expand=OrderReadProfiles.MINIMAL)
 
     order_id = ct_order.id
     order_line_item_id = ''
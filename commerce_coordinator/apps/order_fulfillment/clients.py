@@ -1,16 +1,20 @@
 """
 API client for communication with the Order Fulfillment service.
 """
-import time
-
 from celery.utils.log import get_task_logger
 from django.conf import settings
 from requests.exceptions import RequestException
 
 from commerce_coordinator.apps.core.clients import BaseEdxOAuthClient, urljoin_directory
+from commerce_coordinator.apps.core.concurrency import map_concurrently
+from commerce_coordinator.apps.core.retry import RetryPolicy
+from commerce_coordinator.apps.order_fulfillment.exceptions import OrderFulfillmentRejectedError
 
 logger = get_task_logger(__name__)
 
+# Order Fulfillment calls are retried by their Celery tasks, so backoff here is a task countdown, not a sleep.
+ORDER_FULFILLMENT_RETRY_POLICY = RetryPolicy(max_retries=5, base_backoff=2, max_backoff=300)
+
 
 class OrderFulfillmentAPIClient(BaseEdxOAuthClient):
     """
@@ -19,6 +23,8 @@ class OrderFulfillmentAPIClient(BaseEdxOAuthClient):
 
     ORDER_FULFILLMENT_SERVICE_TIMEOUT = 10  # seconds
 
+    retry_policy = ORDER_FULFILLMENT_RETRY_POLICY
+
     @property
     def api_order_fulfillment_post_base_url(self):
         """
@@ -57,6 +63,29 @@ class OrderFulfillmentAPIClient(BaseEdxOAuthClient):
             timeout=self.ORDER_FULFILLMENT_SERVICE_TIMEOUT,
         )
 
+    def fulfill_order_bulk(self, fulfillments, max_workers=None):
+        """
+        Sends fulfillment requests for several line items of one order to the Order Fulfillment service.
+
+        Each line item is posted to the fulfill-order endpoint, concurrently.
+
+        Args:
+            fulfillments (list): ``(payload, logging_data)`` pairs, one per line item.
+            max_workers (int, optional): Upper bound on concurrent requests.
+
+        Returns:
+            List[ConcurrentResult]: One result per line item, in order. ``value`` is the service response for the
+            line item and ``error`` the exception raised by its request, an OrderFulfillmentRejectedError if the
+            service rejected it.
+        """
+        def fulfill(fulfillment):
+            response = self.fulfill_order(*fulfillment)
+            if response is None:
+                raise OrderFulfillmentRejectedError(f"Fulfillment request rejected | {fulfillment[1]}")
+            return response
+
+        return map_concurrently(fulfill, fulfillments, max_workers)
+
     def revoke_line(self, payload, logging_data):
         """
         Sends a POST request to the Order Fulfillment service to revoke course line item.
@@ -84,11 +113,9 @@ class OrderFulfillmentAPIClient(BaseEdxOAuthClient):
         log_context: dict,
         request_usage: str,
         timeout: int = None,
-        total_retries: int = 3,
-        base_backoff: int = 1,
     ) -> dict | None:
         """
-        Sends a POST request to the Order Fulfillment service with retry logic.
+        Sends a single POST request to the Order Fulfillment service.
 
         Args:
             url (str): The endpoint to which the request is sent.
@@ -96,15 +123,15 @@ class OrderFulfillmentAPIClient(BaseEdxOAuthClient):
             log_context (dict): Context for structured logging (e.g., user, order ID).
             request_usage (str): A description of what the request is used for (e.g., "Fulfillment" or "Revoke Line").
             timeout (int, optional): Timeout in seconds for the request. Defaults to self.normal_timeout.
-            total_retries (int): Number of retry attempts on failure. Defaults to 3.
-            base_backoff (int): Base backoff time in seconds, increasing linearly with each attempt. Defaults to 1.
 
         Returns:
-            dict | None: The response from the fulfillment service as a JSON dict if successful, otherwise None.
+            dict | None: The response from the fulfillment service as a JSON dict if successful, or None if the
+            service rejected the request with a non-retryable error.
 
-        Notes:
-            This method logs structured messages and retries with linear backoff. After exhausting retries,
-            it logs the error and returns None instead of raising, so calling tasks must handle this gracefully.
+        Raises:
+            RequestException: If the failure is transient according to ``self.retry_policy``. This method does not
+                wait or retry in-process; calling tasks should hand the exception to
+                ``self.retry_policy.retry_task_or_raise`` so Celery reschedules them with backoff.
         """
         timeout = timeout or self.normal_timeout
 
@@ -113,38 +140,30 @@ class OrderFulfillmentAPIClient(BaseEdxOAuthClient):
             'Content-Type': 'application/json',
         }
 
-        def attempt(attempt_number):
-            try:
-                response = self.client.post(
-                    url,
-                    headers=headers,
-                    json=payload,
-                    timeout=timeout,
-                )
-                response.raise_for_status()
-
-                logger.info(
-                    f"[OrderFulfillmentAPIClient] {request_usage} request succeeded | {log_context}",
-                )
-                return response.json()
-
-            except RequestException as err:
-                if attempt_number >= total_retries:
-                    context_str = (
-                        f"[OrderFulfillmentAPIClient] {request_usage} request failed "
-                        f"after {total_retries} attempts. URL: {url} | Error: {err} | {log_context}"
-                    )
-                    self.log_request_exception(context_str, logger, err)
-                    return None  # since we have already retried, we dont want to retry task by raising exception here
-
-                next_attempt = attempt_number + 1
-                next_backoff = base_backoff * next_attempt
+        try:
+            response = self.client.post(
+                url,
+                headers=headers,
+                json=payload,
+                timeout=timeout,
+            )
+            response.raise_for_status()
+        except RequestException as err:
+            if self.retry_policy.is_retryable(err):
                 logger.warning(
                     f"[OrderFulfillmentAPIClient] {request_usage} request failed for URL: {url} "
-                    f"with error: {err}. {log_context}"
-                    f"Retrying attempt #{next_attempt} in {next_backoff} seconds...",
+                    f"with retryable error: {err} | {log_context}"
                 )
-                time.sleep(next_backoff)
-                return attempt(next_attempt)
+                raise
 
-        return attempt(0)
+            context_str = (
+                f"[OrderFulfillmentAPIClient] {request_usage} request failed "
+                f"with non-retryable error. URL: {url} | Error: {err} | {log_context}"
+            )
+            self.log_request_exception(context_str, logger, err)
+            return None
+
+        logger.info(
+            f"[OrderFulfillmentAPIClient] {request_usage} request succeeded | {log_context}",
+        )
+        return response.json()
@@ -7,6 +7,15 @@ class OrderFulfillmentRevokeLineError(Exception):
     """
     Raised when the Order Fulfillment revoke-line POST does not return a response.
 
-    The client retries transient failures internally and returns None after exhausting
-    retries, so callers should treat this as a failed revoke and allow Celery to retry.
+    The client raises transient failures so the calling task can be rescheduled with backoff, and returns None
+    when the service rejects the request outright, so callers should treat this as a failed revoke and allow
+    Celery to retry.
+    """
+
+
+class OrderFulfillmentRejectedError(Exception):
+    """
+    Error of a line item of a bulk fulfillment the Order Fulfillment service rejected with a non-retryable error.
+
+    The rejection itself is logged by the client, this only marks the line item as failed in the bulk results.
     """
@@ -0,0 +1,64 @@
+"""
+Order Fulfillment Celery tasks
+"""
+
+from celery import shared_task
+from celery.utils.log import get_task_logger
+from requests import RequestException
+
+from commerce_coordinator.apps.order_fulfillment.clients import (
+    ORDER_FULFILLMENT_RETRY_POLICY,
+    OrderFulfillmentAPIClient
+)
+
+# Use the special Celery logger for our tasks
+logger = get_task_logger(__name__)
+
+
+@shared_task(bind=True, max_retries=ORDER_FULFILLMENT_RETRY_POLICY.max_retries)
+def fulfill_order_task(self, payload, logging_data):
+    """
+    Celery task forwarding one order line item to the Order Fulfillment service.
+
+    Transient failures are rescheduled through Celery with exponential backoff, so a slow fulfillment
+    service doesn't hold a worker asleep between attempts.
+    """
+    try:
+        return OrderFulfillmentAPIClient().fulfill_order(payload, logging_data)
+    except RequestException as exc:
+        return ORDER_FULFILLMENT_RETRY_POLICY.retry_task_or_raise(self, exc)
+
+
+@shared_task(bind=True, max_retries=ORDER_FULFILLMENT_RETRY_POLICY.max_retries)
+def fulfill_order_bulk_task(self, fulfillments):
+    """
+    Celery task forwarding all line items of one order to the Order Fulfillment service together.
+
+    Args:
+        fulfillments (list): ``(payload, logging_data)`` pairs, one per line item.
+
+    Line items whose own request failed with a transient error are handed to ``fulfill_order_task`` one by one,
+    so a partial failure only retries the line items that need it.
+    """
+    results = OrderFulfillmentAPIClient().fulfill_order_bulk(fulfillments)
+
+    retried = 0
+    for result in results:
+        if result.ok:
+            continue
+
+        if not ORDER_FULFILLMENT_RETRY_POLICY.is_retryable(result.error):
+            logger.error(f"[fulfill_order_bulk_task] Fulfillment failed with non-retryable error: {result.error} "
+                         f"| {result.item[1]}")
+            continue
+
+        retried += 1
+        fulfill_order_task.apply_async(
+            args=list(result.item),
+            countdown=ORDER_FULFILLMENT_RETRY_POLICY.backoff(0, result.error),
+        )
+
+    logger.info(f"[fulfill_order_bulk_task] Forwarded {len(results)} line items, {retried} rescheduled individually "
+                f"| celery task ID: {self.request.id}")
+
+    return [result.value for result in results]
@@ -1,12 +1,15 @@
 """
 Tests for the Order Fulfillment API client.
 """
+from unittest.mock import patch
+
 from django.test import override_settings
-from requests.exceptions import HTTPError, RequestException
+from requests.exceptions import HTTPError
 
 from commerce_coordinator.apps.core.clients import urljoin_directory
 from commerce_coordinator.apps.core.tests.utils import CoordinatorOAuthClientTestCase
 from commerce_coordinator.apps.order_fulfillment.clients import OrderFulfillmentAPIClient
+from commerce_coordinator.apps.order_fulfillment.exceptions import OrderFulfillmentRejectedError
 
 TEST_ORDER_FULFILLMENT_URL_ROOT = 'https://testserver.com'
 
@@ -134,14 +137,43 @@ class OrderFulfillmentAPIClientTests(CoordinatorOAuthClientTestCase):
         )
 
     def test_revoke_line_request_exception(self):
-        """Test request exception during revoke line."""
-        self.assertJSONClientResponse(
-            uut=self.client.revoke_line,
-            input_kwargs={
-                'payload': self.revoke_payload,
-                'logging_data': self.revoke_logging_obj,
-            },
-            mock_url=self.revoke_url,
-            mock_status=500,  # Using a different status code from the failure test
-            expected_output=None
-        )
+        """Test that a transient error during revoke line is raised for the calling task to retry."""
+        with self.assertRaises(HTTPError):
+            self.assertJSONClientResponse(
+                uut=self.client.revoke_line,
+                input_kwargs={
+                    'payload': self.revoke_payload,
+                    'logging_data': self.revoke_logging_obj,
+                },
+                mock_url=self.revoke_url,
+                mock_status=500,  # Using a different status code from the failure test
+            )
+
+    def test_fulfill_order_retryable_error_is_raised_without_sleeping(self):
+        """Test that a transient fulfillment error is raised immediately instead of retried in-process."""
+        with patch('time.sleep') as mock_sleep, self.assertRaises(HTTPError):
+            self.assertJSONClientResponse(
+                uut=self.client.fulfill_order,
+                input_kwargs={
+                    'payload': self.payload,
+                    'logging_data': self.logging_obj,
+                },
+                mock_url=self.url,
+                mock_status=503,
+            )
+        mock_sleep.assert_not_called()
+
+    def test_fulfill_order_bulk_per_item_requests(self):
+        """Test that line items are sent one request each, with per-item errors."""
+        error = HTTPError('503 Error')
+        with patch.object(
+            self.client, 'fulfill_order', side_effect=[EXAMPLE_FULFILLMENT_RESPONSE_PAYLOAD, error, None]
+        ) as mock_fulfill:
+            results = self.client.fulfill_order_bulk([(self.payload, self.logging_obj)] * 3, max_workers=1)
+
+        self.assertEqual(mock_fulfill.call_count, 3)
+        self.assertEqual(results[0].value, EXAMPLE_FULFILLMENT_RESPONSE_PAYLOAD)
+        self.assertIs(results[1].error, error)
+        # A line item the service rejected is a failure, not a fulfillment without a response
+        self.assertFalse(results[2].ok)
+        self.assertIsInstance(results[2].error, OrderFulfillmentRejectedError)
@@ -0,0 +1,120 @@
+"""
+Tests for the Order Fulfillment Celery tasks.
+"""
+from unittest.mock import patch
+
+import requests_mock
+from celery.exceptions import Retry
+from django.test import TestCase, override_settings
+from requests import Response
+from requests.exceptions import HTTPError
+
+from commerce_coordinator.apps.core.clients import urljoin_directory
+from commerce_coordinator.apps.core.concurrency import ConcurrentResult
+from commerce_coordinator.apps.order_fulfillment.tasks import fulfill_order_bulk_task, fulfill_order_task
+from commerce_coordinator.apps.order_fulfillment.tests.test_clients import (
+    EXAMPLE_FULFILLMENT_LOGGING_OBJ,
+    EXAMPLE_FULFILLMENT_REQUEST_PAYLOAD,
+    EXAMPLE_FULFILLMENT_RESPONSE_PAYLOAD,
+    TEST_ORDER_FULFILLMENT_URL_ROOT
+)
+
+
+def http_error(status_code):
+    response = Response()
+    response.status_code = status_code
+    return HTTPError(f"{status_code} Error", response=response)
+
+
+@patch('commerce_coordinator.apps.order_fulfillment.tasks.OrderFulfillmentAPIClient')
+class FulfillOrderTaskTests(TestCase):
+    """Tests for fulfill_order_task."""
+
+    def test_passes_through_client_return(self, mock_client):
+        mock_client().fulfill_order.return_value = EXAMPLE_FULFILLMENT_RESPONSE_PAYLOAD
+
+        result = fulfill_order_task(  # pylint: disable=no-value-for-parameter
+            EXAMPLE_FULFILLMENT_REQUEST_PAYLOAD, EXAMPLE_FULFILLMENT_LOGGING_OBJ
+        )
+
+        self.assertEqual(result, EXAMPLE_FULFILLMENT_RESPONSE_PAYLOAD)
+        mock_client().fulfill_order.assert_called_with(
+            EXAMPLE_FULFILLMENT_REQUEST_PAYLOAD, EXAMPLE_FULFILLMENT_LOGGING_OBJ
+        )
+
+    @patch.object(fulfill_order_task, 'retry', side_effect=Retry())
+    def test_retryable_error_is_rescheduled(self, mock_retry, mock_client):
+        exc = http_error(503)
+        mock_client().fulfill_order.side_effect = exc
+
+        with self.assertRaises(Retry):
+            fulfill_order_task(  # pylint: disable=no-value-for-parameter
+                EXAMPLE_FULFILLMENT_REQUEST_PAYLOAD, EXAMPLE_FULFILLMENT_LOGGING_OBJ
+            )
+
+        mock_retry.assert_called_once()
+        self.assertIs(mock_retry.call_args.kwargs['exc'], exc)
+        self.assertGreater(mock_retry.call_args.kwargs['countdown'], 0)
+
+
+@override_settings(
+    ORDER_FULFILLMENT_URL_ROOT=TEST_ORDER_FULFILLMENT_URL_ROOT,
+    BACKEND_SERVICE_EDX_OAUTH2_PROVIDER_URL='https://testserver.com/auth'
+)
+class FulfillOrderTaskHTTPTests(TestCase):
+    """Tests for fulfill_order_task against responses of the Order Fulfillment service."""
+
+    url = urljoin_directory(TEST_ORDER_FULFILLMENT_URL_ROOT, '/api/fulfill-order/')
+
+    def _run(self, mocker, status_code):
+        mocker.post('https://testserver.com/auth/oauth2/access_token', json={
+            'access_token': 'a1b2c3d4', 'expires_in': 1000,
+        })
+        mocker.post(self.url, status_code=status_code, json={'detail': 'error'})
+
+        return fulfill_order_task(  # pylint: disable=no-value-for-parameter
+            EXAMPLE_FULFILLMENT_REQUEST_PAYLOAD, EXAMPLE_FULFILLMENT_LOGGING_OBJ
+        )
+
+    @patch.object(fulfill_order_task, 'retry')
+    def test_non_retryable_error_is_not_retried(self, mock_retry):
+        with requests_mock.Mocker() as mocker:
+            result = self._run(mocker, 400)
+
+        self.assertIsNone(result)
+        self.assertEqual(mocker.request_history[-1].url, self.url)
+        mock_retry.assert_not_called()
+
+    @patch.object(fulfill_order_task, 'retry', side_effect=Retry())
+    def test_retryable_error_is_rescheduled(self, mock_retry):
+        with requests_mock.Mocker() as mocker:
+            with self.assertRaises(Retry):
+                self._run(mocker, 503)
+
+        self.assertIsInstance(mock_retry.call_args.kwargs['exc'], HTTPError)
+        self.assertEqual(mock_retry.call_args.kwargs['exc'].response.status_code, 503)
+
+
+@patch('commerce_coordinator.apps.order_fulfillment.tasks.fulfill_order_task')
+@patch('commerce_coordinator.apps.order_fulfillment.tasks.OrderFulfillmentAPIClient')
+class FulfillOrderBulkTaskTests(TestCase):
+    """Tests for fulfill_order_bulk_task."""
+
+    fulfillments = [
+        [EXAMPLE_FULFILLMENT_REQUEST_PAYLOAD, EXAMPLE_FULFILLMENT_LOGGING_OBJ],
+        [EXAMPLE_FULFILLMENT_REQUEST_PAYLOAD, EXAMPLE_FULFILLMENT_LOGGING_OBJ],
+        [EXAMPLE_FULFILLMENT_REQUEST_PAYLOAD, EXAMPLE_FULFILLMENT_LOGGING_OBJ],
+    ]
+
+    def test_only_transient_failures_are_rescheduled(self, mock_client, mock_single_task):
+        mock_client().fulfill_order_bulk.return_value = [
+            ConcurrentResult(self.fulfillments[0], value=EXAMPLE_FULFILLMENT_RESPONSE_PAYLOAD),
+            ConcurrentResult(self.fulfillments[1], error=http_error(503)),
+            ConcurrentResult(self.fulfillments[2], error=http_error(400)),
+        ]
+
+        result = fulfill_order_bulk_task(self.fulfillments)  # pylint: disable=no-value-for-parameter
+
+        self.assertEqual(result, [EXAMPLE_FULFILLMENT_RESPONSE_PAYLOAD, None, None])
+        mock_single_task.apply_async.assert_called_once()
+        self.assertEqual(mock_single_task.apply_async.call_args.kwargs['args'], self.fulfillments[1])
@@ -8,6 +8,11 @@ from paypalserversdk.controllers.payments_controller import PaymentsController
 from paypalserversdk.http.auth.o_auth_2 import ClientCredentialsAuthCredentials
 from paypalserversdk.paypal_serversdk_client import PaypalServersdkClient
 
+from commerce_coordinator.apps.core.instrumentation import instrument_session
+
+# Service of calls to PayPal in outbound metrics
+PAYPAL_METRICS_SERVICE_NAME = 'paypal'
+
 
 class PayPalClient:
     """
@@ -25,6 +30,8 @@ class PayPalClient:
                 else Environment.PRODUCTION
             ),
         )
+        # The SDK makes its calls through a requests Session, record them in the outbound metrics.
+        instrument_session(self.paypal_client.config.http_client.session, PAYPAL_METRICS_SERVICE_NAME)
 
     def refund_order(self, capture_id, amount):
         """
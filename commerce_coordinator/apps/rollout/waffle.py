@@ -12,6 +12,10 @@ PROGRAM_REDIRECT_TO_COMMERCETOOLS_CHECKOUT = f'{WAFFLE_FLAG_NAMESPACE}.program_r
 
 ORDER_FULFILLMENT_SERVICE_FORWARDING_ENABLED = f'{WAFFLE_FLAG_NAMESPACE}.order_fulfillment_service_forwarding_enabled'
 
+BUNDLE_FULFILLMENT_CHORD_ENABLED = f'{WAFFLE_FLAG_NAMESPACE}.bundle_fulfillment_chord_enabled'
+
+BULK_FULFILLMENT_ENABLED = f'{WAFFLE_FLAG_NAMESPACE}.bulk_fulfillment_enabled'
+
 REDIRECT_TO_LEGACY_ENABLED = 'redirect_to_legacy_enabled'
 
 
@@ -37,6 +41,20 @@ def is_order_fulfillment_service_forwarding_enabled(request):
     return waffle.flag_is_active(request, ORDER_FULFILLMENT_SERVICE_FORWARDING_ENABLED)
 
 
+def is_bundle_fulfillment_chord_enabled(request):
+    """
+    Check if fulfill_order_placed_message_signal_task fulfills program bundles with a Celery chord
+    """
+    return waffle.flag_is_active(request, BUNDLE_FULFILLMENT_CHORD_ENABLED)
+
+
+def is_bulk_fulfillment_enabled(request):
+    """
+    Check if fulfill_order_placed_message_signal_task fulfills the line items of multi-item orders in one task
+    """
+    return waffle.flag_is_active(request, BULK_FULFILLMENT_ENABLED)
+
+
 def is_redirect_to_legacy_enabled(request):
     """
     Check if redirect to legacy is enabled.
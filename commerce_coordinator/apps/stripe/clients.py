@@ -3,17 +3,31 @@ API clients for Stripe.
 """
 from typing import Optional
 
+import requests
 import stripe
 from celery.utils.log import get_task_logger
 from django.conf import settings
 from stripe import Refund
 
 from commerce_coordinator.apps.core import serializers
+from commerce_coordinator.apps.core.instrumentation import instrument_session
 from commerce_coordinator.apps.stripe.constants import StripeRefundStatus
 
 # Use special Celery logger for tasks client calls.
 logger = get_task_logger(__name__)
 
+# Service of calls to Stripe in outbound metrics
+STRIPE_METRICS_SERVICE_NAME = 'stripe'
+
+
+def _instrumented_http_client(proxy):
+    """ Stripe HTTP client sending its requests through a session instrumented by core.instrumentation """
+    session = requests.Session()
+    instrument_session(session, STRIPE_METRICS_SERVICE_NAME)
+    http_client = stripe.RequestsClient(session=session, proxy=proxy)
+    http_client.instrumented = True
+    return http_client
+
 
 # noinspection PyMethodMayBeStatic
 class StripeAPIClient:
@@ -37,6 +51,9 @@ class StripeAPIClient:
         stripe.max_network_retries = configuration['max_network_retries']
         # Send requests somewhere else instead of Stripe. May be useful for testing.
         stripe.proxy = configuration['proxy']
+        # Record Stripe calls in the outbound metrics, with one client shared by every StripeAPIClient.
+        if not getattr(stripe.default_http_client, 'instrumented', False):
+            stripe.default_http_client = _instrumented_http_client(configuration['proxy'])
 
     def create_payment_intent(self, order_uuid, amount_in_cents, currency):
         """
@@ -10,6 +10,10 @@ import os
 import celery
 import django.conf
 
+from commerce_coordinator.apps.core.instrumentation import reset_attempt, set_attempt
+from commerce_coordinator.apps.core.rate_limit import Priority, reset_priority, set_priority
+from commerce_coordinator.apps.core.tracing import inject_task_headers, start_task_span
+
 # Set the default configuration module, if one is not aleady defined.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'commerce_coordinator.settings.local')
 
@@ -29,3 +33,41 @@ def on_after_setup_task_logger(**kwargs):
     if django.conf.settings.DEBUG:  # pragma no cover
         logger = kwargs["logger"]
         logger.setLevel(logging.DEBUG)
+
+
+_task_context_tokens = {}
+
+
+@celery.signals.before_task_publish.connect
+def on_before_task_publish(headers=None, **kwargs):
+    """
+    Carry the current trace to the task being published, with the time it's queued. See core.tracing.
+    """
+    inject_task_headers(headers)
+
+
+@celery.signals.task_prerun.connect
+def on_task_prerun(task_id=None, task=None, **kwargs):
+    """
+    Make the outbound calls of a task's first attempt with task priority, and of its retries with batch priority, so
+    web requests are served first when a rate limited service is busy. See core.rate_limit.
+
+    The calls of a retry are also recorded as retries in the outbound metrics, see core.instrumentation, and the task
+    is traced as a span of the trace it was published in, see core.tracing.
+    """
+    retries = task.request.retries or 0
+    _task_context_tokens[task_id] = (
+        set_priority(Priority.BATCH if retries else Priority.TASK),
+        set_attempt(retries),
+        start_task_span(task),
+    )
+
+
+@celery.signals.task_postrun.connect
+def on_task_postrun(task_id=None, state=None, **kwargs):
+    tokens = _task_context_tokens.pop(task_id, None)
+    if tokens is not None:
+        priority_token, attempt_token, span = tokens
+        span.finish(state=state)
+        reset_attempt(attempt_token)
+        reset_priority(priority_token)
@@ -95,6 +95,8 @@ MIDDLEWARE = (
     'waffle.middleware.WaffleMiddleware',
     # Outputs monitoring metrics for a request.
     'edx_rest_framework_extensions.middleware.RequestCustomAttributesMiddleware',
+    # Adds the outbound calls made for a request to its Server-Timing header.
+    'commerce_coordinator.apps.core.middleware.ServerTimingMiddleware',
     # Ensures proper DRF permissions in support of JWTs
     'edx_rest_framework_extensions.auth.jwt.middleware.EnsureJWTAuthSettingsMiddleware',
 
@@ -141,6 +143,9 @@ DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 CELERY_TASK_DEFAULT_EXCHANGE = 'commerce_coordinator'
 CELERY_TASK_DEFAULT_QUEUE = 'commerce_coordinator.default'
 CELERY_TASK_DEFAULT_ROUTING_KEY = 'commerce_coordinator'
+# Chords (bundle fulfillment) gather the results of their header tasks in the result backend, e.g. the Redis broker.
+# Bundles are fulfilled per line item when it isn't set, whatever bundle_fulfillment_chord_enabled is.
+CELERY_RESULT_BACKEND = None
 
 # Internationalization
 # https://docs.djangoproject.com/en/dev/topics/i18n/
@@ -244,6 +249,11 @@ SOCIAL_AUTH_EDX_OAUTH2_LOGOUT_URL = 'replace-me'
 BACKEND_SERVICE_EDX_OAUTH2_PROVIDER_URL = 'replace-me'
 BACKEND_SERVICE_EDX_OAUTH2_KEY = 'replace-me'
 BACKEND_SERVICE_EDX_OAUTH2_SECRET = 'replace-me'
+# Access tokens for calls to other edX services are shared by all clients of a process and refreshed this many
+# seconds before they expire.
+BACKEND_SERVICE_EDX_OAUTH2_TOKEN_REFRESH_MARGIN_SECONDS = 60
+# Upper bound on pooled connections kept per host by the shared edX service sessions.
+BACKEND_SERVICE_EDX_OAUTH2_POOL_MAXSIZE = 10
 
 JWT_AUTH = {
     'JWT_AUTH_HEADER_PREFIX': 'JWT',
@@ -348,6 +358,74 @@ REQUEST_READ_TIMEOUT_SECONDS = 12
 # Special timeout for fulfillment
 FULFILLMENT_TIMEOUT = 7
 
+# Upper bound on concurrent fulfillment calls made for the line items of a single order
+FULFILLMENT_MAX_CONCURRENCY = 5
+
+# Outbound rate limits per service, see core.rate_limit. A budget is shared by every process using the same cache, so
+# with a per process cache (LocMemCache), or the 'memory' backend, each process has a budget of its own.
+OUTBOUND_RATE_LIMITS = {
+    'commercetools': {
+        'BACKEND': 'cache',
+        'CACHE_ALIAS': 'default',
+        'REQUESTS_PER_SECOND': 300,
+        # Share of each second's budget a priority class may use up, the rest is kept for the classes above it
+        'PRIORITY_SHARES': {'interactive': 1.0, 'task': 0.7, 'batch': 0.4},
+        # Calls a process may have in flight per priority class, None for no limit
+        'MAX_CONCURRENCY': {'interactive': None, 'task': 10, 'batch': 4},
+        # Seconds a call waits for budget before it's made anyway, None to wait as long as it takes
+        'MAX_WAIT_SECONDS': {'interactive': 1, 'task': 10, 'batch': None},
+    },
+}
+
+# Circuit breakers per outbound service, see core.circuit_breaker. Like the rate limits, the 'cache' backend shares a
+# breaker's state between processes. A breaker opens once FAILURE_RATE_THRESHOLD of the calls within
+# FAILURE_WINDOW_SECONDS failed, if there were at least MINIMUM_CALLS of them, and it lets a probe call through after
+# RESET_TIMEOUT_SECONDS. Responses with a status in IGNORED_STATUS_CODES aren't counted, which is only meant for the
+# throttling of services behind a rate limiter (see OUTBOUND_RATE_LIMITS): elsewhere a 503 is the service being down.
+_CIRCUIT_BREAKER_DEFAULTS = {
+    'BACKEND': 'cache',
+    'CACHE_ALIAS': 'default',
+    'FAILURE_RATE_THRESHOLD': 0.5,
+    'MINIMUM_CALLS': 20,
+    'FAILURE_WINDOW_SECONDS': 30,
+    'RESET_TIMEOUT_SECONDS': 30,
+    'IGNORED_STATUS_CODES': [],
+}
+CIRCUIT_BREAKERS = {
+    'commercetools': {**_CIRCUIT_BREAKER_DEFAULTS, 'IGNORED_STATUS_CODES': [429, 503]},
+    'lms': _CIRCUIT_BREAKER_DEFAULTS,
+    'ecommerce': {**_CIRCUIT_BREAKER_DEFAULTS, 'MINIMUM_CALLS': 10},
+}
+
+# Hedged reads per outbound service, see core.hedging. A GET still unanswered after the PERCENTILE latency of its
+# endpoint (out of its last WINDOW latencies, once it has MIN_SAMPLES) is sent again, and the first response is used.
+# Hedges are at most MAX_EXTRA_LOAD of a process's calls to the service. Hedging is off unless a deployment enables
+# it, as hedges are duplicate calls and every process that hedges runs a pool of MAX_WORKERS threads.
+HEDGED_READS = {
+    'commercetools': {
+        'ENABLED': False,
+        'PERCENTILE': 95,
+        'MIN_SAMPLES': 50,
+        'WINDOW': 500,
+        'MIN_DELAY_SECONDS': 0.05,
+        'MAX_EXTRA_LOAD': 0.05,
+        # Threads per process making the hedged calls, and the calls they hedge
+        'MAX_WORKERS': 32,
+    },
+}
+
+# Sinks of the metrics of every outbound call, see core.instrumentation
+OUTBOUND_METRICS_SINKS = (
+    'commerce_coordinator.apps.core.instrumentation.MonitoringMetricsSink',
+    # Records the calls made within a trace as its spans
+    'commerce_coordinator.apps.core.tracing.OutboundSpanSink',
+)
+
+# Exporters of the spans of traces, see core.tracing
+TRACE_EXPORTERS = (
+    'commerce_coordinator.apps.core.tracing.LoggingSpanExporter',
+)
+
 # API URLs
 COMMERCE_COORDINATOR_URL = 'http://localhost:8140'
 ECOMMERCE_URL = 'http://localhost:18130'
@@ -62,6 +62,8 @@ JWT_AUTH.update({
 
 # Use edx.devstack.redis for queue.
 CELERY_BROKER_URL = "redis://:password@edx.devstack.redis:6379/0"
+# Chords (bundle fulfillment) need a result backend to gather their header results.
+CELERY_RESULT_BACKEND = CELERY_BROKER_URL
 
 # Application URLs in devstack.
 ECOMMERCE_URL = "http://edx.devstack.ecommerce:18130"
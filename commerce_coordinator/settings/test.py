@@ -100,3 +100,27 @@ COMMERCETOOLS_CONFIG = {
     'authUrl': "https://localhost/oauth/token",
     'projectKey': "test",
 }
+
+OUTBOUND_RATE_LIMITS = {
+    'commercetools': {
+        **OUTBOUND_RATE_LIMITS['commercetools'],
+        'BACKEND': 'memory',
+    },
+}
+
+# Breakers don't open in tests, so the failures one test mocks don't fail the calls of the next
+CIRCUIT_BREAKERS = {
+    name: {**config, 'BACKEND': 'memory', 'MINIMUM_CALLS': 10 ** 6} for name, config in CIRCUIT_BREAKERS.items()
+}
+
+# Latencies are mocked in tests, so there's nothing to hedge
+HEDGED_READS = {name: {**config, 'ENABLED': False} for name, config in HEDGED_READS.items()}
+
+# Outbound calls are kept in memory, so tests can check what was recorded
+OUTBOUND_METRICS_SINKS = (
+    'commerce_coordinator.apps.core.instrumentation.InMemoryMetricsSink',
+    'commerce_coordinator.apps.core.tracing.OutboundSpanSink',
+)
+
+# Spans are kept in memory, so tests can check traces
+TRACE_EXPORTERS = ('commerce_coordinator.apps.core.tracing.InMemorySpanExporter',)